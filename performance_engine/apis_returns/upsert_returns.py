@@ -1,17 +1,24 @@
+from datetime import datetime
 from typing import Dict
 
+import pytz
+
 from apis_returns.upsert_returns_models import (
     PerformanceDataPointResponse,
     PerformanceDataSetRequest,
     PerformanceDataSetResponse,
     UpsertReturnsResponse,
 )
+from chunking import ChunkingPolicy
 from interfaces import IBlockStore
+from misc import as_date
 from pds import PerformanceDataSet
+import block_ops
 
 
 def upsert_portfolio_returns(performance_scope: str, portfolio_scope: str, portfolio_code: str,
-                             request_body: Dict[str, PerformanceDataSetRequest], block_store: IBlockStore):
+                             request_body: Dict[str, PerformanceDataSetRequest], block_store: IBlockStore,
+                             chunking: ChunkingPolicy = None):
     """
     Upsert returns into a block store for a given portfolio.
 
@@ -22,6 +29,9 @@ def upsert_portfolio_returns(performance_scope: str, portfolio_scope: str, portf
     :param Dict[str, PerformanceDataSetRequest] request_body: The body of the request containing the PerformanceDataSets
     to persist as blocks
     :param IBlockStore block_store: The block store to use to persist the blocks
+    :param ChunkingPolicy chunking: How the blocks are split into chunks, defaults to the BlockChunking configuration
+    item. When the blocks are chunked the returns are linked onto the returns already stored for the portfolio, and
+    returns which start part way through a chunk are appended to the returns already stored in that chunk.
 
     :return: UpsertReturnsResponse: The response to the Upsert request
     """
@@ -32,6 +42,9 @@ def upsert_portfolio_returns(performance_scope: str, portfolio_scope: str, portf
 
     # 3) Cast to PerformanceDataSets
     pds = {}
+    chunking = ChunkingPolicy.from_config(chunking)
+    # The correlation id of the request each chunk belongs to, keyed by the correlation id of the chunk
+    chunk_ids = {}
 
     # For each PerformanceDataSet
     for correlation_id, performance_data_set_request in request_body.items():
@@ -51,29 +64,45 @@ def upsert_portfolio_returns(performance_scope: str, portfolio_scope: str, portf
         if end_date is None:
             end_date = performance_data_point_chronological[-1].date
 
+        dates = [pdp.date for pdp in performance_data_point_chronological]
+        weights = [getattr(pdp, "weight", 0) for pdp in performance_data_point_chronological]
+        rors = [pdp.ror for pdp in performance_data_point_chronological]
+        previous = None
+
+        if chunking is not None:
+            # Start from the beginning of the chunk, keeping the returns already stored before the start date
+            start_date, previous, stored = _open_chunk(
+                performance_scope, portfolio_scope, portfolio_code, as_date(start_date), chunking, block_store)
+            dates = [p.date for p in stored] + dates
+            weights = [p.weight for p in stored] + weights
+            rors = [p.ror for p in stored] + rors
+
         # Create a new PerformanceDataSet
         pd = PerformanceDataSet(
             from_date=start_date,
-            to_date=end_date
+            to_date=end_date,
+            previous=previous
         )
 
         # Add the returns to the PerformanceDataSet in the form of a number of PerformanceDataPoint
-        [
-            pd.add_returns(
-                date=pdp.date, weight=getattr(pdp, "weight", 0), ror=pdp.ror
-            ) for pdp in performance_data_point_chronological
-         ]
-
-        pds[correlation_id] = pd
-
-    # 4) Persist each PerformanceDataSet in the BlockStore
-    pds = {
-        correlation_id: block_store.add_block(
-            entity_scope=portfolio_scope,
-            entity_code=portfolio_code,
-            block=pd,
-            performance_scope=performance_scope) for correlation_id, pd in pds.items()
-    }
+        pd.add_returns_batch(dates=dates, weights=weights, rors=rors)
+
+        if chunking is None:
+            pds[correlation_id] = pd
+        else:
+            for i, chunk in enumerate(chunking.split(pd)):
+                chunk_ids[f"{correlation_id}/{i}"] = correlation_id
+                pds[f"{correlation_id}/{i}"] = chunk
+
+    # 4) Persist the PerformanceDataSets in the BlockStore as a single batch
+    pds, failures = block_store.add_blocks(
+        entity_scope=portfolio_scope,
+        entity_code=portfolio_code,
+        blocks=pds,
+        performance_scope=performance_scope)
+
+    if chunking is not None:
+        pds, failures = _join_chunks(chunk_ids, pds, failures)
 
     # 5) Cast to Response objects
     pd_responses = {}
@@ -94,4 +123,72 @@ def upsert_portfolio_returns(performance_scope: str, portfolio_scope: str, portf
 
         pd_responses[correlation_id] = pd
 
-    return UpsertReturnsResponse(pd_responses, {})
+    return UpsertReturnsResponse(pd_responses, failures)
+
+
+def _open_chunk(performance_scope: str, portfolio_scope: str, portfolio_code: str, start_date, chunking: ChunkingPolicy,
+                block_store: IBlockStore):
+    """
+    Finds the returns already stored in the chunk which holds the start date of a request
+
+    :param str performance_scope: The scope of the BlockStore
+    :param str portfolio_scope: The scope of the Portfolio
+    :param str portfolio_code: The code of the Portfolio
+    :param Timestamp start_date: The start date of the request
+    :param ChunkingPolicy chunking: The chunking policy
+    :param IBlockStore block_store: The block store
+
+    :return: The start of the chunk, the last record stored before it and the records stored in the chunk before the
+    start date
+    """
+    asat = datetime.now(pytz.UTC)
+    chunk_start = chunking.chunk_start(start_date)
+    previous = chunking.get_previous_record(
+        block_store, portfolio_scope, portfolio_code, chunk_start, asat, performance_scope)
+
+    if chunk_start == start_date:
+        return start_date, previous, []
+
+    end = start_date - block_ops.msec
+    blocks = block_store.find_blocks(portfolio_scope, portfolio_code, chunk_start, end, asat, performance_scope)
+    stored = list(block_ops.combine(blocks, False, chunk_start, end, asat))
+
+    if len(stored) == 0:
+        return start_date, chunking.get_previous_record(
+            block_store, portfolio_scope, portfolio_code, start_date, asat, performance_scope), []
+
+    return chunk_start, previous, stored
+
+
+def _join_chunks(chunk_ids: Dict[str, str], chunks: Dict[str, PerformanceDataSet], chunk_failures: Dict[str, str]):
+    """
+    Joins the chunks which were stored for each request back together. A request fails if any of its chunks failed.
+
+    :param Dict[str, str] chunk_ids: The correlation id of the request of each chunk in order, keyed by the
+    correlation id of the chunk
+    :param Dict[str, PerformanceDataSet] chunks: The chunks which were stored keyed by the correlation id of the chunk
+    :param Dict[str, str] chunk_failures: The reason each chunk could not be stored keyed by the correlation id of the
+    chunk
+
+    :return: The joined PerformanceDataSets and the reason for each request which failed, keyed by correlation id
+    """
+    failures = {}
+    grouped = {}
+
+    for chunk_id, correlation_id in chunk_ids.items():
+        if chunk_id in chunk_failures:
+            failures.setdefault(correlation_id, f"{chunk_id}: {chunk_failures[chunk_id]}")
+        else:
+            grouped.setdefault(correlation_id, []).append(chunks[chunk_id])
+
+    joined = {}
+
+    for correlation_id, group in grouped.items():
+        if correlation_id in failures:
+            continue
+        pd = PerformanceDataSet(
+            group[0].from_date, group[-1].to_date, max(c.asat for c in group), previous=group[0].previous)
+        pd.data_points = [p for c in group for p in c.data_points]
+        joined[correlation_id] = pd
+
+    return joined, failures
@@ -0,0 +1,39 @@
+"""
+Compares the size of block documents and the time to encode and decode them with jsonpickle and the columnar codec.
+
+Run from the performance_engine directory with:
+
+    python -m benchmarks.codec
+"""
+import jsonpickle
+
+from benchmarks.read_block import FrameSource, make_data, timed
+from block_stores.block_store_in_memory import InMemoryBlockStore
+from perf import Performance
+from serialiser import decode_columnar, encode_columnar
+
+
+def main(years: int = 10, keys: int = 50, repeat: int = 3):
+    df = make_data(years, keys)
+    from_date, to_date = df['date'].iloc[0], df['date'].iloc[-1]
+    block = Performance('bench', 'bench', FrameSource(df), InMemoryBlockStore()).read_block(from_date, to_date, to_date)
+    block.get_columns()
+
+    codecs = {
+        'jsonpickle': (jsonpickle.encode, jsonpickle.decode),
+        'columnar': (lambda b: encode_columnar(b, compress=False), decode_columnar),
+        'columnar+zlib': (lambda b: encode_columnar(b, compress=True), decode_columnar)
+    }
+
+    print(f"{len(df)} rows, {years} years and {keys} keys")
+    print(f"{'codec':<14}{'size (MB)':>12}{'encode (s)':>12}{'decode (s)':>12}")
+
+    for name, (encode, decode) in codecs.items():
+        encode_time, document = timed(lambda: encode(block), repeat)
+        decode_time, decoded = timed(lambda: decode(document), repeat)
+        assert decoded == block
+        print(f"{name:<14}{len(document) / 2 ** 20:>12.2f}{encode_time:>12.3f}{decode_time:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
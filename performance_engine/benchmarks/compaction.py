@@ -0,0 +1,69 @@
+"""
+Measures the blocks left and the time saved on a report by compacting a portfolio whose recent returns are restated
+every day.
+
+Run from the performance_engine directory with:
+
+    python -m benchmarks.compaction
+"""
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from benchmarks.read_block import timed
+from block_stores.block_store_in_memory import InMemoryBlockStore
+from block_stores.compaction import compact_blocks
+from interfaces import IPerformanceSource
+from perf import Performance
+
+
+class RestatingSource(IPerformanceSource):
+    """
+    A source of daily returns which restates the last few days every day
+    """
+
+    def __init__(self, df: DataFrame, restated_days: int):
+        """
+        :param DataFrame df: The returns with date, ror and wt columns
+        :param int restated_days: The number of days restated each day
+        """
+        self.df = df
+        self.restated = pd.Timedelta(days=restated_days)
+
+    def get_perf_data(self, entity_scope, entity_code, start_date, end_date, asat, **kwargs):
+        return self.df[(self.df['date'] >= start_date) & (self.df['date'] <= end_date)]
+
+    def get_changes(self, entity_scope, entity_code, last_date, last_asat, asat):
+        return last_date - self.restated
+
+
+def main(days: int = 720, restated_days: int = 5, repeat: int = 3):
+    dates = pd.date_range('2018-01-01', periods=days, tz='UTC')
+    df = DataFrame({'date': dates, 'ror': np.random.RandomState(0).normal(0.0002, 0.01, days), 'wt': 1.0})
+
+    store = InMemoryBlockStore()
+    performance = Performance('bench', 'bench', RestatingSource(df, restated_days), store, perf_start=dates[0])
+
+    # A daily unlocked report, each one adds a block restating the last few days
+    for i, date in enumerate(dates[30:]):
+        list(performance.get_performance(False, dates[0], date, dates[0] + pd.Timedelta(days=31 + i), create=True))
+
+    asat = dates[-1] + pd.Timedelta(days=1)
+
+    def report():
+        return performance.report(False, dates[0], dates[-1], asat, checkpoints=False)
+
+    before_time, before = timed(report, repeat)
+    metrics = compact_blocks(store, 'bench', 'bench', pd.Timedelta(days=30), asat=asat)
+    after_time, after = timed(report, repeat)
+    assert [r['date'] for r in after] == [r['date'] for r in before]
+
+    print(f"{days} days, restating the last {restated_days} days every day")
+    print(f"{'':<10}{'blocks':>10}{'report (s)':>12}")
+    print(f"{'before':<10}{metrics.blocks_before:>10}{before_time:>12.3f}")
+    print(f"{'after':<10}{metrics.blocks_after:>10}{after_time:>12.3f}")
+    print(f"compacted in {metrics.seconds:.3f}s, saving {before_time - after_time:.3f}s per report")
+
+
+if __name__ == '__main__':
+    main()
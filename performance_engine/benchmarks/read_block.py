@@ -0,0 +1,126 @@
+"""
+Compares building a block in Performance.read_block with the original per-date loop.
+
+Run from the performance_engine directory with:
+
+    python -m benchmarks.read_block
+"""
+import time
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from block_stores.block_store_in_memory import InMemoryBlockStore
+from interfaces import IPerformanceSource
+from pds import PerformanceDataSet
+from perf import Performance
+
+
+class FrameSource(IPerformanceSource):
+    """
+    A source of performance data which returns a fixed DataFrame
+    """
+
+    def __init__(self, df: DataFrame):
+        """
+        :param DataFrame df: The DataFrame to return
+        """
+        self.df = df
+
+    def get_perf_data(self, entity_scope, entity_code, start_date, end_date, asat, **kwargs):
+        return self.df
+
+
+def make_data(years: int = 10, keys: int = 50, seed: int = 0) -> DataFrame:
+    """
+    Creates daily market values and flows for a number of keys
+
+    :param int years: The number of years of data
+    :param int keys: The number of keys on each date
+    :param int seed: The seed for the random number generator
+
+    :return: DataFrame: The data with one row per date and key
+    """
+    rnd = np.random.RandomState(seed)
+    dates = pd.date_range('2010-01-01', periods=years * 365, tz='UTC')
+    names = [f'key-{i:03d}' for i in range(keys)]
+
+    # Small daily returns with an occasional flow
+    ror = rnd.normal(0.0002, 0.01, (len(dates), keys))
+    net = np.where(rnd.uniform(size=(len(dates), keys)) < 0.02, rnd.normal(0.0, 1000.0, (len(dates), keys)), 0.0)
+    mv = np.empty_like(ror)
+    mv[0] = 10000.0 + net[0]
+    for i in range(1, len(dates)):
+        mv[i] = mv[i - 1] * (1.0 + ror[i]) + net[i]
+
+    return DataFrame({
+        'date': np.repeat(dates, keys),
+        'key': np.tile(names, len(dates)),
+        'mv': mv.ravel(),
+        'net': net.ravel()
+    })
+
+
+def loop(df: DataFrame, b: PerformanceDataSet) -> PerformanceDataSet:
+    """
+    The original block builder, which adds each date in turn
+
+    :param DataFrame df: The performance data
+    :param PerformanceDataSet b: The block to add the performance data to
+
+    :return: PerformanceDataSet b: The block
+    """
+    for d, g in df.groupby('date'):
+        b.add_values(date=d, data_source=g.apply(lambda r: (r['key'], r['mv'], r['net']), axis=1))
+    return b
+
+
+def timed(func, repeat: int):
+    """
+    Runs a function a number of times
+
+    :param func: The function to run
+    :param int repeat: The number of times to run the function
+
+    :return: The best time in seconds and the result of the last run
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(years: int = 10, keys: int = 50, repeat: int = 3):
+    df = make_data(years, keys)
+    from_date, to_date = df['date'].iloc[0], df['date'].iloc[-1]
+    performance = Performance('bench', 'bench', FrameSource(df), InMemoryBlockStore())
+
+    def build():
+        # Read the columns so that the pending rows are linked
+        b = loop(df, PerformanceDataSet(from_date, to_date, to_date))
+        b.get_columns()
+        return b
+
+    def vectorised():
+        b = performance.read_block(from_date, to_date, to_date)
+        b.get_columns()
+        return b
+
+    loop_time, expected = timed(build, 1)
+    vectorised_time, actual = timed(vectorised, repeat)
+
+    for name, column in expected.get_columns().items():
+        np.testing.assert_array_equal(actual.get_columns()[name], column)
+
+    print(f"{len(df)} rows, {years} years and {keys} keys")
+    print(f"per-date loop : {loop_time:8.3f}s")
+    print(f"vectorised    : {vectorised_time:8.3f}s")
+    print(f"speed up      : {loop_time / vectorised_time:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
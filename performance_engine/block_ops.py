@@ -1,32 +1,41 @@
+import copy
 from pandas import Timestamp
-from typing import List, Iterator
+from typing import Any, Dict, Iterator, List, NamedTuple
 
-from pds import PerformanceDataPoint, PerformanceDataSet
+from pds import PerformanceDataPoint, PerformanceDataSet, chain, unchain
 from misc import *
 from datetime import timedelta
 
 msec = timedelta(microseconds=1)
 
 
-@as_dates
-def combine(blocks: List[PerformanceDataSet], locked: bool, from_date: Timestamp, to_date: Timestamp,
-            asat: Timestamp) -> Iterator[PerformanceDataPoint]:
+class Slice(NamedTuple):
     """
-    Takes a list of blocks which are combined together before returning each PerformanceDataPoint
+    The part of a block which is used when blocks are combined, the dates are inclusive
+    """
+    start: Timestamp
+    end: Timestamp
+    block: Any
 
 
-    :param List[PerformanceDataSet] blocks: The blocks to combine
+@as_dates
+def plan(blocks: List[Any], locked: bool, from_date: Timestamp, to_date: Timestamp) -> List[Slice]:
+    """
+    Works out which part of each block is used when the blocks are combined. Only the from_date, to_date and asat
+    of each block are used, so this can be run over block metadata before any blocks are retrieved. Blocks which do
+    not appear in the plan make no contribution.
+
+    :param List[Any] blocks: The blocks or block metadata, anything with a from_date, to_date and asat
     :param bool locked: Whether or not the period is locked
     :param Timestamp from_date: The effectiveAt from date of the performance period
     :param Timestamp to_date: The effectiveAt to date of the performance period
-    :param Timestamp asat: The asAt date for the performance period
 
-    :return: Iterator[PerformanceDataPoint] o:
+    :return: List[Slice]: The slices in the order in which they should be returned
     """
 
     # Sort by asat date to put the blocks in order
     # Chronological order if locked, reverse chronological order if not locked
-    blocks.sort(reverse=not locked, key=lambda b: b.asat)
+    blocks = sorted(blocks, reverse=not locked, key=lambda b: b.asat)
 
     if debug:
        import pandas as pd
@@ -35,19 +44,19 @@ def combine(blocks: List[PerformanceDataSet], locked: bool, from_date: Timestamp
                columns=['from_date','to_date','asat','block'])
        print(nicer(df[['from_date','to_date','asat']]))
 
+    slices = []
+
     if locked:
         # Combine blocks at their lock-down points
 
-        # Blocks are sorted in forward direction
-        # Iterate over blocks returning pruned records
+        # Each block follows on from the end of the block before it
         limit_date = from_date-msec
 
         for b in blocks:
-            for o in b.get_data_points():
-                if o.date > to_date:
-                   return # found every record
-                if o.date > limit_date:
-                   yield o
+            # A block which ends before its limit and the end of the period can neither contribute a record
+            # nor end the period early, so it is not required
+            if b.to_date > limit_date or b.to_date > to_date:
+               slices.append(Slice(limit_date + msec, to_date, b))
             limit_date = b.to_date
     else:
         # combine blocks to give a continuous up-to-date return
@@ -55,27 +64,156 @@ def combine(blocks: List[PerformanceDataSet], locked: bool, from_date: Timestamp
         # Blocks are in reverse asat order
         # 'later' over-riding blocks appear first
         # Go through the blocks and figure out the slices required from each block
-        slices = []
-        limit_date = as_date('2050-12-31')
+        # The ranges of dates which are not covered by a later block
+        free = [(from_date, to_date)]
 
         for b in blocks:
-            slice_start_date = max(from_date,b.from_date)
-            slice_end_date = min(to_date,b.to_date,limit_date)
-            if slice_start_date <= slice_end_date:
-               limit_date=slice_start_date - msec
-               slices.append((slice_start_date,slice_end_date,b))
-            if slice_start_date == from_date:
-               #We have found all the blocks that cover our required range
-               #We can terminate the loop here
+            covered = [(max(start,b.from_date), min(end,b.to_date)) for start, end in free]
+            covered = [(start, end) for start, end in covered if start <= end]
+            slices.extend(Slice(start,end,b) for start, end in covered)
+
+            if b.relative:
+               # A relative block only replaces its own dates, the later records of earlier blocks are chained
+               # onto it
+               free = [(start, end) for lower, upper in free
+                       for start, end in [(lower, min(upper,b.from_date - msec)), (max(lower,b.to_date + msec), upper)]
+                       if start <= end]
+            else:
+               # The later records of earlier blocks were linked from the records this block replaces
+               if len(covered) > 0:
+                  limit_date = covered[0][0] - msec
+                  free = [(start, min(end,limit_date)) for start, end in free if start <= limit_date]
+               if max(from_date,b.from_date) == from_date:
+                  #We have found all the blocks that cover our required range
+                  #We can terminate the loop here
+                  break
+
+            if len(free) == 0:
                break
 
-        # Return valid items from each slice
-        # slices are in reverse order so process from the back
-        for slice_start_date,slice_end_date,b in slices[::-1]:
-            for o in b.get_data_points():
-                if o.date > slice_end_date:
-                   # We have reported all the items for this slice
-                   # So we can terminate the loop here
-                   break
-                if o.date >= slice_start_date:
-                   yield o
+        # slices are in the order of the blocks so put them in date order
+        slices.sort(key=lambda s: s.start)
+
+    return slices
+
+
+def linked(point: PerformanceDataPoint) -> Dict:
+    """
+    Gets the linked fields of a PerformanceDataPoint
+
+    :param PerformanceDataPoint point: The data point, may be None
+
+    :return: Dict: The linked fields or None if there is no data point
+    """
+    if point is None:
+        return None
+    return {name: getattr(point, name) for name in PerformanceDataSet.linked_columns}
+
+
+def covers_block(s: Slice) -> bool:
+    """
+    Whether a slice uses the whole of its block, in which case only the last data point of the block is needed to
+    chain the blocks after it. This is held in the metadata of a block, so the block does not need to be retrieved.
+
+    :param Slice s: The slice
+
+    :return: bool: True if the slice covers the whole block
+    """
+    return s.start <= s.block.from_date and s.end >= s.block.to_date
+
+
+def offset(slices: List[Slice]) -> Dict:
+    """
+    Works out the linked fields at the end of a plan of slices without returning each PerformanceDataPoint. Relative
+    blocks which follow the slices are chained onto these.
+
+    :param List[Slice] slices: The slices, the block of each slice which does not cover its whole block must be a
+    PerformanceDataSet, the others may be block metadata with the last data point of the block
+
+    :return: Dict: The linked fields or None if there are no data points
+    """
+    base = None
+
+    for s in slices:
+        if covers_block(s):
+            if isinstance(s.block, PerformanceDataSet):
+                points = s.block.get_data_points()
+                last = points[-1] if len(points) > 0 else None
+            else:
+                last = s.block.last
+            before = None
+        else:
+            last = s.block.get_data_point_before(min(s.end, s.block.to_date) + msec)
+            before = s.block.get_data_point_before(s.start)
+
+        if last is None or last.date < s.start:
+            continue
+
+        if s.block.relative:
+            base = chain(base, unchain(linked(last), linked(before)), last.pnl is None)
+        else:
+            base = linked(last)
+
+    return base
+
+
+def combine_slices(slices: List[Slice], locked: bool, base: Dict = None) -> Iterator[PerformanceDataPoint]:
+    """
+    Returns each PerformanceDataPoint from a plan of slices created by plan. The data points of a relative block are
+    chained onto the data point before them.
+
+    :param List[Slice] slices: The slices, each block must be a PerformanceDataSet
+    :param bool locked: Whether or not the period is locked
+    :param Dict base: The linked fields of the data point before the first slice, see offset. None if the slices
+    start at the beginning of the performance.
+
+    :return: Iterator[PerformanceDataPoint] o:
+    """
+    last = None
+
+    for s in slices:
+        if s.block.relative:
+            # The data points are chained on from the end of the previous slice
+            start = base if last is None else linked(last)
+            before = linked(s.block.get_data_point_before(s.start))
+
+        for o in s.block.get_data_points():
+            if o.date > s.end:
+               if locked:
+                  return # found every record
+               # We have reported all the items for this slice
+               # So we can move on to the next slice
+               break
+            if o.date >= s.start:
+               if s.block.relative:
+                  o = copy.copy(o)
+                  o.__dict__.update(chain(start, unchain(linked(o), before), o.pnl is None))
+               last = o
+               yield o
+
+
+@as_dates
+def combine(blocks: List[PerformanceDataSet], locked: bool, from_date: Timestamp, to_date: Timestamp,
+            asat: Timestamp) -> Iterator[PerformanceDataPoint]:
+    """
+    Takes a list of blocks which are combined together before returning each PerformanceDataPoint
+
+
+    :param List[PerformanceDataSet] blocks: The blocks to combine
+    :param bool locked: Whether or not the period is locked
+    :param Timestamp from_date: The effectiveAt from date of the performance period
+    :param Timestamp to_date: The effectiveAt to date of the performance period
+    :param Timestamp asat: The asAt date for the performance period
+
+    :return: Iterator[PerformanceDataPoint] o:
+    """
+    slices = plan(blocks, locked, from_date, to_date)
+    base = None
+
+    if any(s.block.relative for s in slices):
+        # The relative blocks are chained onto the data points before the from date
+        first_date = min(b.from_date for b in blocks)
+        if first_date < from_date:
+            base = offset(plan(blocks, locked, first_date, from_date - msec))
+
+    return combine_slices(slices, locked, base)
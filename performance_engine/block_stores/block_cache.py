@@ -0,0 +1,120 @@
+from collections import OrderedDict
+import threading
+from typing import Callable, Hashable, Tuple
+
+from config.config import PerformanceConfiguration
+from pds import PerformanceDataSet
+
+
+class BlockCache:
+    """
+    A least recently used cache of deserialised blocks.
+
+    The cache is bounded both by the number of blocks and by the total size of the documents the blocks were
+    deserialised from. When either limit is exceeded the least recently used blocks are evicted. The cache may be
+    shared by threads, every read and change of the blocks is made under a lock.
+    """
+
+    def __init__(self, max_blocks: int = None, max_bytes: int = None):
+        """
+        :param int max_blocks: The maximum number of blocks to hold, defaults to the BlockCacheMaxBlocks configuration
+        item. Zero disables the cache.
+        :param int max_bytes: The maximum total size in bytes of the documents of the blocks to hold, defaults to the
+        BlockCacheMaxBytes configuration item
+        """
+        self.max_blocks = max_blocks if max_blocks is not None else int(
+            PerformanceConfiguration.item('BlockCacheMaxBlocks', 1024))
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            PerformanceConfiguration.item('BlockCacheMaxBytes', 256 * 1024 * 1024))
+
+        # The cached blocks and their size in most recently used order (last)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key: Hashable) -> PerformanceDataSet:
+        """
+        Gets a block from the cache, marking it as the most recently used
+
+        :param Hashable key: The key of the block
+
+        :return: PerformanceDataSet: The block or None if it is not in the cache
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, block: PerformanceDataSet, nbytes: int) -> None:
+        """
+        Adds a block to the cache, evicting the least recently used blocks if required
+
+        :param Hashable key: The key of the block
+        :param PerformanceDataSet block: The block
+        :param int nbytes: The size of the block in bytes
+        """
+        with self._lock:
+            self._remove(key)
+
+            # A block that could never fit is not cached, it would only evict everything else
+            if self.max_blocks <= 0 or nbytes > self.max_bytes:
+                return
+
+            self._entries[key] = (block, nbytes)
+            self.nbytes += nbytes
+
+            while len(self._entries) > self.max_blocks or self.nbytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_nbytes
+                self.evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        """
+        Removes a block from the cache if it is present, the lock must be held by the caller
+
+        :param Hashable key: The key of the block
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+    def invalidate(self, predicate: Callable[[Tuple], bool]) -> int:
+        """
+        Removes every block whose key matches a predicate
+
+        :param Callable[[Tuple], bool] predicate: The function to call with each key, returning True if the block
+        should be removed
+
+        :return: int: The number of blocks removed
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        """
+        Removes every block from the cache
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
@@ -0,0 +1,299 @@
+import json
+import os
+from typing import Dict, List, Tuple
+
+from pandas import Timestamp
+
+from block_stores.checkpoint_index import extract_checkpoints
+from config.config import PerformanceConfiguration
+from misc import as_date
+from pds import PerformanceDataPoint, PerformanceDataSet
+from serialiser import point_from_dict, point_to_dict
+
+
+class BlockCatalogueEntry:
+    """
+    The metadata of a single stored block. This is enough to select blocks and to find the record preceding a block
+    without reading the block itself.
+    """
+
+    def __init__(self, code: str, from_date: Timestamp, to_date: Timestamp, asat: Timestamp, version: str,
+                 last: PerformanceDataPoint = None, checkpoints: Dict[Timestamp, PerformanceDataPoint] = None,
+                 relative: bool = False):
+        """
+        :param str code: The id of the block in the store
+        :param Timestamp from_date: The effectiveAt start date of the block
+        :param Timestamp to_date: The effectiveAt end date of the block
+        :param Timestamp asat: The asAt date at which the block was stored
+        :param str version: The version of the document holding the block
+        :param PerformanceDataPoint last: The last PerformanceDataPoint in the block, None if the block is empty
+        :param Dict[Timestamp, PerformanceDataPoint] checkpoints: The period end checkpoints of the block, None if they
+        are unknown
+        :param bool relative: Whether the linked fields of the block are relative to its start
+        """
+        self.code = code
+        self.from_date = from_date
+        self.to_date = to_date
+        self.asat = asat
+        self.version = version
+        self.last = last
+        self.checkpoints = checkpoints
+        self.relative = relative
+
+    @classmethod
+    def from_block(cls, code: str, block: PerformanceDataSet, asat: Timestamp) -> 'BlockCatalogueEntry':
+        """
+        Creates the entry for a block
+
+        :param str code: The id of the block in the store
+        :param PerformanceDataSet block: The block
+        :param Timestamp asat: The asAt date at which the block was stored
+
+        :return: BlockCatalogueEntry: The entry for the block
+        """
+        data_points = block.get_data_points()
+        return cls(
+            code=code,
+            from_date=block.from_date,
+            to_date=block.to_date,
+            asat=as_date(asat),
+            version=block.version,
+            last=data_points[-1] if len(data_points) > 0 else None,
+            # The linked fields of a relative block depend on the blocks before it
+            checkpoints=None if block.relative else extract_checkpoints(block),
+            relative=block.relative)
+
+    def to_dict(self) -> Dict:
+        """
+        Converts the entry into a dictionary which can be written as JSON
+
+        :return: Dict: The entry
+        """
+        return {
+            'code': self.code,
+            'from_date': self.from_date.isoformat(),
+            'to_date': self.to_date.isoformat(),
+            'asat': self.asat.isoformat(),
+            'version': self.version,
+            'last': point_to_dict(self.last),
+            'checkpoints': None if self.checkpoints is None else {
+                date.isoformat(): point_to_dict(point) for date, point in self.checkpoints.items()
+            },
+            'relative': self.relative
+        }
+
+    @classmethod
+    def from_dict(cls, entry: Dict) -> 'BlockCatalogueEntry':
+        """
+        Creates an entry from a dictionary created by to_dict
+
+        :param Dict entry: The entry
+
+        :return: BlockCatalogueEntry: The entry
+        """
+        return cls(
+            code=entry['code'],
+            from_date=as_date(entry['from_date']),
+            to_date=as_date(entry['to_date']),
+            asat=as_date(entry['asat']),
+            version=entry['version'],
+            last=point_from_dict(entry['last']),
+            # Catalogues written before checkpoints were kept have none
+            checkpoints=None if entry.get('checkpoints') is None else {
+                as_date(date): point_from_dict(point) for date, point in entry['checkpoints'].items()
+            },
+            relative=entry.get('relative', False))
+
+
+class BlockCatalogue:
+    """
+    The catalogue of the blocks held for each entity in a block store, held in memory
+    """
+    version = "0.0.1"
+
+    def __init__(self):
+        # The entries of each performance scope and entity
+        self._entries = {}
+
+    @classmethod
+    def from_config(cls, catalogue: 'BlockCatalogue' = None) -> 'BlockCatalogue':
+        """
+        Gets the block catalogue to use
+
+        :param BlockCatalogue catalogue: The catalogue provided by the caller, if any
+
+        :return: BlockCatalogue: The catalogue provided, otherwise a LocalBlockCatalogue if the BlockCataloguePath
+        configuration item is set or an in memory catalogue if it is not
+        """
+        if catalogue is not None:
+            return catalogue
+
+        path = PerformanceConfiguration.item('BlockCataloguePath', None)
+        return cls() if path in (None, '') else LocalBlockCatalogue(path)
+
+    def _load(self, key: Tuple[str, str, str]) -> List[BlockCatalogueEntry]:
+        """
+        Reads the persisted entries of an entity, the in memory catalogue has none
+
+        :param Tuple[str, str, str] key: The performance scope, scope and code of the entity
+
+        :return: List[BlockCatalogueEntry]: The entries or None if none are persisted
+        """
+        return None
+
+    def _save(self, key: Tuple[str, str, str]) -> None:
+        """
+        Persists the entries of an entity, the in memory catalogue has nothing to do
+
+        :param Tuple[str, str, str] key: The performance scope, scope and code of the entity
+        """
+        pass
+
+    @staticmethod
+    def to_document(entries: List[BlockCatalogueEntry]) -> str:
+        """
+        Serialises the catalogue of an entity
+
+        :param List[BlockCatalogueEntry] entries: The entries of the entity
+
+        :return: str: The serialised catalogue
+        """
+        return json.dumps([entry.to_dict() for entry in entries])
+
+    @staticmethod
+    def from_document(document: str) -> List[BlockCatalogueEntry]:
+        """
+        De-serialises the catalogue of an entity
+
+        :param str document: The serialised catalogue
+
+        :return: List[BlockCatalogueEntry]: The entries of the entity
+        """
+        return [BlockCatalogueEntry.from_dict(entry) for entry in json.loads(document)]
+
+    @staticmethod
+    def merge(*catalogues: List[BlockCatalogueEntry]) -> List[BlockCatalogueEntry]:
+        """
+        Merges the catalogues of an entity held by different writers. Where more than one catalogue has an entry with
+        the same code the one stored latest is kept, as the store only holds the latest version of each block.
+
+        :param List[BlockCatalogueEntry] catalogues: The entries of each catalogue
+
+        :return: List[BlockCatalogueEntry]: The merged entries in the order the blocks were stored
+        """
+        latest = {}
+        for entries in catalogues:
+            for entry in entries:
+                if entry.code not in latest or entry.asat > latest[entry.code].asat:
+                    latest[entry.code] = entry
+
+        return sorted(latest.values(), key=lambda entry: entry.asat)
+
+    def get_entries(self, performance_scope: str, entity_scope: str, entity_code: str) -> List[BlockCatalogueEntry]:
+        """
+        Gets the entries of an entity, reading them from where they are persisted if they are not already in memory
+
+        :param str performance_scope: The scope of the block store
+        :param str entity_scope: The scope of the entity
+        :param str entity_code: The code of the entity
+
+        :return: List[BlockCatalogueEntry]: The entries in the order the blocks were stored or None if the catalogue
+        for the entity is unknown
+        """
+        key = (performance_scope, entity_scope, entity_code)
+
+        if key not in self._entries:
+            entries = self._load(key)
+            if entries is None:
+                return None
+            self._entries[key] = entries
+
+        return self._entries[key]
+
+    def set_entries(self, performance_scope: str, entity_scope: str, entity_code: str,
+                    entries: List[BlockCatalogueEntry]) -> None:
+        """
+        Replaces the entries of an entity and persists them
+
+        :param str performance_scope: The scope of the block store
+        :param str entity_scope: The scope of the entity
+        :param str entity_code: The code of the entity
+        :param List[BlockCatalogueEntry] entries: The entries in the order the blocks were stored
+        """
+        key = (performance_scope, entity_scope, entity_code)
+        self._entries[key] = list(entries)
+        self._save(key)
+
+    def add_entries(self, performance_scope: str, entity_scope: str, entity_code: str,
+                    entries: List[BlockCatalogueEntry]) -> None:
+        """
+        Adds the entries for newly stored blocks and persists the catalogue. Any existing entry with the same code as
+        a new entry is replaced as the store only holds the latest version of each block.
+
+        :param str performance_scope: The scope of the block store
+        :param str entity_scope: The scope of the entity
+        :param str entity_code: The code of the entity
+        :param List[BlockCatalogueEntry] entries: The entries in the order the blocks were stored
+        """
+        # Where the same code is stored more than once in the batch only the last is kept
+        latest = {entry.code: entry for entry in entries}
+        new_entries = [entry for entry in entries if latest[entry.code] is entry]
+
+        existing = self.get_entries(performance_scope, entity_scope, entity_code) or []
+        existing = [e for e in existing if e.code not in latest]
+        self.set_entries(performance_scope, entity_scope, entity_code, existing + new_entries)
+
+    def add_entry(self, performance_scope: str, entity_scope: str, entity_code: str,
+                  entry: BlockCatalogueEntry) -> None:
+        """
+        Adds the entry for a newly stored block and persists the catalogue. Any existing entry with the same code is
+        replaced as the store only holds the latest version of each block.
+
+        :param str performance_scope: The scope of the block store
+        :param str entity_scope: The scope of the entity
+        :param str entity_code: The code of the entity
+        :param BlockCatalogueEntry entry: The entry
+        """
+        self.add_entries(performance_scope, entity_scope, entity_code, [entry])
+
+
+class LocalBlockCatalogue(BlockCatalogue):
+    """
+    The catalogue of the blocks held for each entity in a block store, held in memory and persisted to the local file
+    system with one file for each performance scope and entity
+    """
+
+    def __init__(self, path: str = None):
+        """
+        :param str path: The folder to persist the catalogue in, defaults to the BlockCataloguePath configuration item
+        """
+        super().__init__()
+        self.path = path or PerformanceConfiguration.item('BlockCataloguePath', 'catalogue')
+
+    def _file(self, performance_scope: str, entity_scope: str, entity_code: str) -> str:
+        """
+        Gets the file which the catalogue of an entity is persisted in
+
+        :param str performance_scope: The scope of the block store
+        :param str entity_scope: The scope of the entity
+        :param str entity_code: The code of the entity
+
+        :return: str: The path of the file
+        """
+        return os.path.join(self.path, performance_scope, entity_scope, f'{entity_code}.json')
+
+    def _load(self, key: Tuple[str, str, str]) -> List[BlockCatalogueEntry]:
+        try:
+            with open(self._file(*key), 'r') as fp:
+                return self.from_document(fp.read())
+        except FileNotFoundError:
+            return None
+
+    def _save(self, key: Tuple[str, str, str]) -> None:
+        filename = self._file(*key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        # Write to a temporary file first so that a failure can not leave a partial catalogue behind
+        with open(f'{filename}.tmp', 'w') as fp:
+            fp.write(self.to_document(self._entries[key]))
+        os.replace(f'{filename}.tmp', filename)
@@ -0,0 +1,202 @@
+from bisect import bisect_left, bisect_right
+from typing import List
+
+import numpy as np
+import pandas as pd
+from pandas import Timestamp
+
+from pds import PerformanceDataSet
+
+
+class BlockIndex:
+    """
+    A bi-temporal index over the blocks of a single entity.
+
+    The blocks are held in asAt order (blocks with the same asAt keep the order in which they were added) alongside
+    a segment tree holding the earliest from_date and latest to_date of each range of blocks. Restricting the asAt is
+    then a binary search for a prefix of the blocks and the effectiveAt conditions are answered by descending the tree
+    and skipping any range of blocks which can not match.
+    """
+
+    # The values used for the empty leaves of the segment tree
+    _no_from_date = np.iinfo(np.int64).max
+    _no_to_date = np.iinfo(np.int64).min
+
+    def __init__(self, blocks: List[PerformanceDataSet] = None):
+        """
+        :param List[PerformanceDataSet] blocks: The blocks to index, each must have an asAt date
+        """
+        # The blocks, their insertion sequence and their bi-temporal coordinates as nanoseconds, all in asAt order
+        self._blocks = []
+        self._sequence = []
+        self._from_dates = []
+        self._to_dates = []
+        self._asats = []
+
+        self._size = 0
+        self._min_from_date = None
+        self._max_to_date = None
+        self._stale = True
+
+        for block in blocks or []:
+            self.add(block)
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+    @staticmethod
+    def _as_nanoseconds(date) -> int:
+        """
+        Converts a date into nanoseconds since the epoch
+
+        :param date: The date to convert
+
+        :return: int: The date in nanoseconds since the epoch
+        """
+        return pd.Timestamp(date).value
+
+    def add(self, block: PerformanceDataSet) -> None:
+        """
+        Adds a block to the index
+
+        :param PerformanceDataSet block: The block to add, it must have an asAt date
+        """
+        asat = self._as_nanoseconds(block.asat)
+        position = bisect_right(self._asats, asat)
+
+        self._blocks.insert(position, block)
+        self._sequence.insert(position, len(self._sequence))
+        self._from_dates.insert(position, self._as_nanoseconds(block.from_date))
+        self._to_dates.insert(position, self._as_nanoseconds(block.to_date))
+        self._asats.insert(position, asat)
+
+        # Blocks are usually added in asAt order, in which case only the path to the new leaf needs updating
+        if self._stale or position != len(self._blocks) - 1 or position >= self._size:
+            self._stale = True
+            return
+
+        node = self._size + position
+        self._min_from_date[node] = self._from_dates[position]
+        self._max_to_date[node] = self._to_dates[position]
+
+        node //= 2
+        while node > 0:
+            self._min_from_date[node] = min(self._min_from_date[2 * node], self._min_from_date[2 * node + 1])
+            self._max_to_date[node] = max(self._max_to_date[2 * node], self._max_to_date[2 * node + 1])
+            node //= 2
+
+    def _build(self) -> None:
+        """
+        Rebuilds the segment tree, leaving room for the number of blocks to double before it needs rebuilding again
+        """
+        self._size = 1
+        while self._size < 2 * max(len(self._blocks), 1):
+            self._size *= 2
+
+        self._min_from_date = np.full(2 * self._size, self._no_from_date, dtype=np.int64)
+        self._max_to_date = np.full(2 * self._size, self._no_to_date, dtype=np.int64)
+        self._min_from_date[self._size:self._size + len(self._blocks)] = self._from_dates
+        self._max_to_date[self._size:self._size + len(self._blocks)] = self._to_dates
+
+        # Fill in each level of the tree from the level below it
+        width = self._size // 2
+        while width >= 1:
+            self._min_from_date[width:2 * width] = np.minimum(
+                self._min_from_date[2 * width:4 * width:2], self._min_from_date[2 * width + 1:4 * width:2])
+            self._max_to_date[width:2 * width] = np.maximum(
+                self._max_to_date[2 * width:4 * width:2], self._max_to_date[2 * width + 1:4 * width:2])
+            width //= 2
+
+        self._stale = False
+
+    def _refresh(self) -> None:
+        """
+        Ensures that the segment tree is up to date
+        """
+        if self._stale:
+            self._build()
+
+    def find_blocks(self, from_date: Timestamp, to_date: Timestamp, asat: Timestamp) -> List[PerformanceDataSet]:
+        """
+        Finds the blocks which overlap an effectiveAt period and were added at or before an asAt date
+
+        :param Timestamp from_date: The effectiveAt start date of the period
+        :param Timestamp to_date: The effectiveAt end date of the period
+        :param Timestamp asat: The asAt date of the period
+
+        :return: List[PerformanceDataSet]: The blocks in the order in which they were added
+        """
+        self._refresh()
+
+        start, end = self._as_nanoseconds(from_date), self._as_nanoseconds(to_date)
+        limit = bisect_right(self._asats, self._as_nanoseconds(asat))
+
+        matches = []
+        # Each node on the stack covers the blocks in [low, high)
+        stack = [(1, 0, self._size)]
+
+        while stack:
+            node, low, high = stack.pop()
+            if low >= limit or self._min_from_date[node] > end or self._max_to_date[node] < start:
+                continue
+            if high - low == 1:
+                matches.append(low)
+                continue
+            middle = (low + high) // 2
+            stack.append((2 * node + 1, middle, high))
+            stack.append((2 * node, low, middle))
+
+        return [self._blocks[i] for i in sorted(matches, key=lambda i: self._sequence[i])]
+
+    def _search(self, low: int, high: int, before: int, last: bool) -> int:
+        """
+        Finds the first or last block in [low, high) of the asAt ordered blocks with a from_date before a date
+
+        :param int low: The first block to consider
+        :param int high: The block after the last block to consider
+        :param int before: The date in nanoseconds which the from_date must be before
+        :param bool last: Whether to find the last rather than the first block
+
+        :return: int: The position of the block or None if there is no such block
+        """
+        stack = [(1, 0, self._size)]
+
+        while stack:
+            node, node_low, node_high = stack.pop()
+            if node_high <= low or node_low >= high or self._min_from_date[node] >= before:
+                continue
+            if node_high - node_low == 1:
+                return node_low
+            middle = (node_low + node_high) // 2
+            # The child searched first is pushed last
+            if last:
+                stack.append((2 * node, node_low, middle))
+                stack.append((2 * node + 1, middle, node_high))
+            else:
+                stack.append((2 * node + 1, middle, node_high))
+                stack.append((2 * node, node_low, middle))
+
+        return None
+
+    def get_previous_block(self, date: Timestamp, asat: Timestamp) -> PerformanceDataSet:
+        """
+        Finds the block with the latest asAt date at or before an asAt date which starts before an effectiveAt date.
+        Where several blocks share that asAt date the first one added is used.
+
+        :param Timestamp date: The effectiveAt date
+        :param Timestamp asat: The asAt date
+
+        :return: PerformanceDataSet: The block or None if there is no such block
+        """
+        self._refresh()
+
+        before = self._as_nanoseconds(date)
+        limit = bisect_right(self._asats, self._as_nanoseconds(asat))
+
+        latest = self._search(0, limit, before, last=True)
+        if latest is None:
+            return None
+
+        # Blocks with the same asAt date are in the order in which they were added
+        first = self._search(bisect_left(self._asats, self._asats[latest]), latest + 1, before, last=False)
+        return self._blocks[first]
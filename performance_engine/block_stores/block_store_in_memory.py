@@ -1,10 +1,13 @@
 from collections import defaultdict
 from datetime import datetime
+import threading
 from typing import Dict, List
 
 from pandas import Timestamp
 import pytz
 
+from block_stores.block_index import BlockIndex
+from block_stores.checkpoint_index import Checkpoint, CheckpointIndex
 from interfaces import IBlockStore
 from misc import as_dates
 from pds import PerformanceDataPoint, PerformanceDataSet
@@ -13,13 +16,20 @@ from pds import PerformanceDataPoint, PerformanceDataSet
 class InMemoryBlockStore(IBlockStore):
     """
     This acts an in memory Block Store. The block store is responsible for storing and finding
-    each PerformanceDataSet block.
+    each PerformanceDataSet block. The store may be shared by threads, the blocks and their indexes are read and
+    changed under a lock.
     """
     def __init__(self, blocks: Dict[str, List] = None):
         """
         :param blocks: The blocks contained in the InMemoryBlockStore
         """
         self._blocks = defaultdict(list)
+        # The bi-temporal index over the blocks of each entity
+        self._indexes = {}
+        # The period end checkpoints of the blocks of each entity
+        self._checkpoint_indexes = {}
+        # Held while the blocks or their indexes are read or changed, and by compaction while it replaces blocks
+        self.lock = threading.RLock()
 
         if blocks is not None:
             self._blocks.update(blocks)
@@ -44,6 +54,53 @@ class InMemoryBlockStore(IBlockStore):
         """
         return f"{scope}_{code}"
 
+    def _get_index(self, entity_scope: str, entity_code: str, performance_scope: str = None) -> BlockIndex:
+        """
+        Gets the bi-temporal index over the blocks of an entity. The index is rebuilt if the blocks have been
+        replaced or changed other than through add_block.
+
+        :param str entity_scope: The scope of the entity
+        :param str entity_code: The code of the entity
+        :param str performance_scope: The scope to use in the BlockStore
+
+        :return: BlockIndex: The index over the blocks of the entity
+        """
+        with self.lock:
+            blocks = self.get_blocks(entity_scope, entity_code, performance_scope)
+            key = (self._create_id_from_scope_code(entity_scope, entity_code), performance_scope)
+            source, index = self._indexes.get(key, (None, None))
+
+            if source is not blocks or len(index) != len(blocks):
+                index = BlockIndex(blocks)
+                self._indexes[key] = (blocks, index)
+
+            return index
+
+    def _get_checkpoint_index(self, entity_scope: str, entity_code: str,
+                              performance_scope: str = None) -> CheckpointIndex:
+        """
+        Gets the period end checkpoints of the blocks of an entity. As with the bi-temporal index the checkpoints are
+        rebuilt if the blocks have been replaced or changed other than through add_block.
+
+        :param str entity_scope: The scope of the entity
+        :param str entity_code: The code of the entity
+        :param str performance_scope: The scope to use in the BlockStore
+
+        :return: CheckpointIndex: The checkpoints of the blocks of the entity
+        """
+        with self.lock:
+            blocks = self.get_blocks(entity_scope, entity_code, performance_scope)
+            key = (self._create_id_from_scope_code(entity_scope, entity_code), performance_scope)
+            source, index = self._checkpoint_indexes.get(key, (None, None))
+
+            if source is not blocks or len(index) != len(blocks):
+                index = CheckpointIndex()
+                for block in blocks:
+                    index.add_block(block)
+                self._checkpoint_indexes[key] = (blocks, index)
+
+            return index
+
     def get_blocks(self, entity_scope: str, entity_code: str, performance_scope: str = None) -> List[PerformanceDataSet]:
         """
         This is used to get all blocks from the BlockStore for the specified entity.
@@ -72,13 +129,40 @@ class InMemoryBlockStore(IBlockStore):
         :param str performance_scope: The scope to use in the BlockStore. This has no meaning and is not implemented in
         the InMemory implementation.
         """
-        entity_id = self._create_id_from_scope_code(entity_scope, entity_code)
-        self.blocks[entity_id].append(block)
         if block.asat is None:
             # If the block has no asAt time, add one
             block.asat = datetime.now(pytz.UTC)
+
+        with self.lock:
+            # Bring the index up to date before adding so that it only needs to add the new block
+            index = self._get_index(entity_scope, entity_code, performance_scope)
+            checkpoints = self._get_checkpoint_index(entity_scope, entity_code, performance_scope)
+
+            entity_id = self._create_id_from_scope_code(entity_scope, entity_code)
+            self.blocks[entity_id].append(block)
+            index.add(block)
+            checkpoints.add_block(block)
         return block
 
+    def remove_blocks(self, entity_scope: str, entity_code: str, blocks: List[PerformanceDataSet],
+                      performance_scope: str = None) -> None:
+        """
+        Removes blocks from the BlockStore for the specified entity.
+
+        :param str entity_scope: The scope of the entity to remove blocks for.
+        :param str entity_code: The code of the entity to remove blocks for. Together with the entity_scope this
+        uniquely identifies the entity.
+        :param List[PerformanceDataSet] blocks: The blocks to remove
+        :param str performance_scope: The scope to use in the BlockStore. This has no meaning and is not implemented in
+        the InMemory implementation.
+        """
+        removed = set(map(id, blocks))
+        entity_id = self._create_id_from_scope_code(entity_scope, entity_code)
+
+        # The list is replaced rather than changed so that the indexes are rebuilt
+        with self.lock:
+            self.blocks[entity_id] = [b for b in self.blocks[entity_id] if id(b) not in removed]
+
     @as_dates
     def find_blocks(self, entity_scope: str, entity_code: str, from_date: Timestamp, to_date: Timestamp, asat: Timestamp,
                     performance_scope: str = None) -> List[PerformanceDataSet]:
@@ -96,21 +180,30 @@ class InMemoryBlockStore(IBlockStore):
 
         :return: List[PerformanceDataSet]: The list of relevant PerformanceDataSet blocks
         """
+        with self.lock:
+            return self._get_index(entity_scope, entity_code, performance_scope).find_blocks(from_date, to_date, asat)
 
-        def in_scope(block: PerformanceDataSet):
-            """
-            Checks whether or not a block exists inside a relevant bi-temporal window
-
-            :param PerformanceDataSet block: The block to check if it exists inside the window
-
-            :return: bool: Whether or not a block exists inside the relevant bi-temporal window
-            """
+    @as_dates
+    def get_checkpoints(self, entity_scope: str, entity_code: str, dates: List[Timestamp], asat: Timestamp,
+                        locked: bool, performance_scope: str = None) -> Dict[Timestamp, Checkpoint]:
+        """
+        Finds the cumulative state of an entity at period ends for the specified entity. The checkpoints of a block
+        are taken the first time that a date is answered from it.
 
-            return (block.to_date >= from_date and 
-                    block.from_date <= to_date and 
-                    block.asat <= asat)
+        :param str entity_scope: The scope of the entity to get checkpoints for.
+        :param str entity_code: The code of the entity to get checkpoints for. Together with the entity_scope this
+        uniquely identifies the entity.
+        :param List[Timestamp] dates: The dates of the checkpoints
+        :param Timestamp asat: The asAt date
+        :param bool locked: Whether or not the period is locked
+        :param str performance_scope: The scope to use in the BlockStore. This has no meaning and is not implemented in
+        the InMemory implementation.
 
-        return [b for b in self.get_blocks(entity_scope, entity_code, performance_scope) if in_scope(b)]
+        :return: Dict[Timestamp, Checkpoint]: The checkpoint of each date which can be answered
+        """
+        with self.lock:
+            index = self._get_checkpoint_index(entity_scope, entity_code, performance_scope)
+            return index.get(dates, asat, locked)
 
     # Find the record that precedes the given date point
     @as_dates
@@ -130,27 +223,14 @@ class InMemoryBlockStore(IBlockStore):
         :return: PerformanceDataPoint latest: The latest performance data point in the preceding block
         """
 
-        match = None
+        with self.lock:
+            match = self._get_index(entity_scope, entity_code, performance_scope).get_previous_block(date, asat)
 
-        # Loop over all possible blocks
-        for candidate in self.get_blocks(entity_scope, entity_code, performance_scope):
-            # Check if block is viable
-            if candidate.asat <= asat and candidate.from_date < date:
-               # If so, choose the best match
-               if match is None or candidate.asat > match.asat:
-                  match = candidate
-
-        latest = None
-        # If we have a matching block ...
-        if match:
-           # Find the last data_point prior to our date, assuming data points are in chronological order
-           for o in match.get_data_points():
-               # Have gone past date we are interested in finding the previous data point for
-               if o.date >= date:
-                  break
-               latest = o
+        # If we have a matching block find the last data point prior to our date
+        if match is None:
+            return None
 
-        return latest
+        return match.get_data_point_before(date)
 
     def get_first_date(self, entity_scope: str, entity_code: str, performance_scope: str = None) -> Timestamp:
         """
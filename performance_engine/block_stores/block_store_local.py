@@ -1,3 +1,5 @@
+from typing import Dict, List, Tuple
+
 import pandas as pd
 import pickle
 import os
@@ -9,19 +11,23 @@ from config.config import PerformanceConfiguration
 
 class LocalBlockStore(InMemoryBlockStore):
     """
-    This class is responsible for persisting performance blocks in the local file system
+    This class is responsible for persisting performance blocks in the local file system. Each block is saved in a
+    file of its own which is never reused, so that a block which has not been loaded yet can always be loaded.
     """
     def __init__(self, scope, portfolio):
         super().__init__()
         self.scope = scope
         self.portfolio = portfolio
         self.path = os.path.join(PerformanceConfiguration.item('LocalStorePath', 'blocks'), scope, portfolio)
+        # The number of the file each block is saved in, and the number of the next file to save
+        self._files = {}
+        self._next_file = 1
         # Load existing blocks (if any)
 
         # Create a loader function for a block
-        def wrap(idx):
+        def wrap(number):
             def loader():
-                return pd.read_pickle(f'{self.path}.block-{idx+1}')
+                return pd.read_pickle(self._file(number))
             return loader
 
         try:
@@ -30,12 +36,20 @@ class LocalBlockStore(InMemoryBlockStore):
             return # File doesn't exist. Not a problem at this stage
 
         for i, r in df.iterrows():
+            # Indexes saved before blocks kept their file have the blocks numbered in order
+            number = int(r.get('file', i + 1))
             block = PerformanceDataSet(
                        r['from_date'],
                        r['to_date'],
-                       r['asat'],loader = wrap(i)
+                       r['asat'],loader = wrap(number),
+                       relative = bool(r.get('relative', False))
                     )
             super().add_block(self.scope, self.portfolio, block)
+            self._files[id(block)] = number
+            self._next_file = max(self._next_file, number + 1)
+
+    def _file(self, number: int) -> str:
+        return f'{self.path}.block-{number}'
 
     def add_block(self, entity_scope: str, entity_code: str, block: PerformanceDataSet,
                   performance_scope: str = None) -> PerformanceDataSet:
@@ -52,10 +66,82 @@ class LocalBlockStore(InMemoryBlockStore):
         :return: PerformanceDataSet block: The block that was added to the BlockStore along with the asAt time of
         the operation
         """
-        super().add_block(entity_scope, entity_code, block)
-        entity_id = self._create_id_from_scope_code(self.scope, self.portfolio)
+        with self.lock:
+            self._add_block(entity_scope, entity_code, block)
+            self._save_index()
+        return block
+
+    def add_blocks(self, entity_scope: str, entity_code: str, blocks: Dict[str, PerformanceDataSet],
+                   performance_scope: str = None) -> Tuple[Dict[str, PerformanceDataSet], Dict[str, str]]:
+        """
+        This adds a batch of blocks to the BlockStore, saving the index once all the blocks have been saved.
+
+        :param str entity_scope: The scope of the entity to get blocks for. The meaning of this is dependent upon
+        the implementation
+        :param str entity_code: The code of the entity to get blocks for. Together with the entity_scope this uniquely
+        identifies the entity.
+        :param Dict[str, PerformanceDataSet] blocks: The blocks to add to the BlockStore keyed by a correlation id
+        :param str performance_scope: The scope of the BlockStore to use, the meaning of this depends on the implementation
+
+        :return: Tuple[Dict[str, PerformanceDataSet], Dict[str, str]]: The blocks which were added along with the asAt
+        time of the operation and the reason for each block which could not be added, both keyed by correlation id
+        """
+        values = {}
+        failed = {}
+
+        with self.lock:
+            for correlation_id, block in blocks.items():
+                try:
+                    values[correlation_id] = self._add_block(entity_scope, entity_code, block)
+                except Exception as e:
+                    failed[correlation_id] = str(e)
+
+            if len(values) > 0:
+                self._save_index()
+
+        return values, failed
+
+    def remove_blocks(self, entity_scope: str, entity_code: str, blocks: List[PerformanceDataSet],
+                      performance_scope: str = None) -> None:
+        """
+        Removes blocks from the BlockStore. The files of the removed blocks are deleted once the index no longer
+        refers to them, the files of the remaining blocks are unchanged.
+
+        :param str entity_scope: The scope of the entity to remove blocks for.
+        :param str entity_code: The code of the entity to remove blocks for. Together with the entity_scope this
+        uniquely identifies the entity.
+        :param List[PerformanceDataSet] blocks: The blocks to remove
+        :param str performance_scope: The scope of the BlockStore to use, the meaning of this depends on the implementation
+        """
+        with self.lock:
+            super().remove_blocks(entity_scope, entity_code, blocks, performance_scope)
+
+            removed = []
+            for block in blocks:
+                number = self._files.pop(id(block), None)
+                if number is not None:
+                    # Load the block before its file is deleted, for anyone who found it before it was removed
+                    block.get_data_points()
+                    removed.append(number)
+
+            self._save_index()
+
+            for number in removed:
+                os.remove(self._file(number))
+
+    def _add_block(self, entity_scope: str, entity_code: str, block: PerformanceDataSet) -> PerformanceDataSet:
+        """
+        Saves a block to the file-system without updating the index
+
+        :param str entity_scope: The scope of the entity
+        :param str entity_code: The code of the entity
+        :param PerformanceDataSet block: The block to add to the BlockStore
+
+        :return: PerformanceDataSet block: The block that was added to the BlockStore
+        """
         # Save block to the file-system
-        fn = f'{self.path}.block-{len(self.blocks[entity_id])}'
+        number = self._next_file
+        fn = self._file(number)
 
         def save():
             with open(fn,'wb') as fp:
@@ -67,11 +153,21 @@ class LocalBlockStore(InMemoryBlockStore):
             os.makedirs(os.path.dirname(self.path), exist_ok=True)
             save()
 
-        # Block save succeeded, now save the index
-        df = pd.DataFrame.from_records([
-                (b.from_date,b.to_date,b.asat) for b in self.blocks[entity_id]],
-                columns=['from_date','to_date','asat'])
+        # Only record the block once it has been saved
+        self._next_file = number + 1
+        super().add_block(entity_scope, entity_code, block)
+        self._files[id(block)] = number
+        return block
 
-        df.to_csv(f'{self.path}.idx',index=False)
+    def _save_index(self) -> None:
+        """
+        Saves the index of the blocks to the file-system, writing to a temporary file first so that a failure can not
+        leave a partial index behind
+        """
+        entity_id = self._create_id_from_scope_code(self.scope, self.portfolio)
+        df = pd.DataFrame.from_records([
+                (b.from_date,b.to_date,b.asat,b.relative,self._files[id(b)]) for b in self.blocks[entity_id]],
+                columns=['from_date','to_date','asat','relative','file'])
 
-        return block
+        df.to_csv(f'{self.path}.idx.tmp',index=False)
+        os.replace(f'{self.path}.idx.tmp', f'{self.path}.idx')
@@ -1,4 +1,6 @@
-from typing import List
+import logging
+import time
+from typing import Dict, List, Tuple
 
 from lusid.api import StructuredResultDataApi
 from lusid.models import (
@@ -10,9 +12,14 @@ from lusid.utilities import ApiClientFactory
 from lusidtools.cocoon.utilities import make_code_lusid_friendly
 from pandas import Timestamp
 
+from config.config import PerformanceConfiguration
+from block_stores.block_cache import BlockCache
+from block_stores.block_catalogue import BlockCatalogue, BlockCatalogueEntry
+from block_stores.block_index import BlockIndex
 from block_stores.block_store_in_memory import InMemoryBlockStore
-from pds import PerformanceDataSet
-from misc import as_dates
+from block_stores.checkpoint_index import Checkpoint, CheckpointIndex
+from pds import PerformanceDataPoint, PerformanceDataSet
+from misc import as_date, as_dates
 from serialiser import deserialise, serialise
 
 
@@ -24,15 +31,46 @@ class BlockStoreStructuredResults(InMemoryBlockStore):
     Currently there is no validation to check that the Portfolio blocks are being stored against actually exists inside
     LUSID.
     """
-    def __init__(self, api_factory: ApiClientFactory):
+    # The effectiveAt date of the catalogue documents, the catalogue is versioned along the asAt axis only
+    catalogue_effective_at = as_date('1900-01-01')
+
+    def __init__(self, api_factory: ApiClientFactory, cache: BlockCache = None, catalogue: BlockCatalogue = None,
+                 catalogue_refresh: float = None, catalogue_flush_size: int = None,
+                 catalogue_flush_seconds: float = None):
         """
         :param ApiClientFactory api_factory: The api factory to use to connect to the Structured Result Data API
+        :param BlockCache cache: The cache of deserialised blocks, keyed by (performance_scope, result id, asat). If not
+        provided a cache is created with the limits from the configuration.
+        :param BlockCatalogue catalogue: The catalogue of the stored blocks. If not provided the catalogue is persisted
+        in the folder from the BlockCataloguePath configuration item, or held in memory if it is not set.
+        :param float catalogue_refresh: The number of seconds the local catalogue of an entity is used for before the
+        catalogue document is read again to pick up blocks stored by other writers, defaults to the
+        BlockCatalogueRefreshSeconds configuration item
+        :param int catalogue_flush_size: The number of entries added to the catalogue of an entity at which they are
+        written to its catalogue document, defaults to the BlockCatalogueFlushSize configuration item
+        :param float catalogue_flush_seconds: The number of seconds after an entry is added to the catalogue of an
+        entity at which the entries added since are written to its catalogue document by the next add, defaults to the
+        BlockCatalogueFlushSeconds configuration item
         """
         super().__init__()
         self.api_factory = api_factory
+        self.cache = cache if cache is not None else BlockCache()
+        self.catalogue = BlockCatalogue.from_config(catalogue)
+        self.catalogue_refresh = float(catalogue_refresh if catalogue_refresh is not None else
+                                       PerformanceConfiguration.item('BlockCatalogueRefreshSeconds', 60))
+        self.catalogue_flush_size = int(catalogue_flush_size if catalogue_flush_size is not None else
+                                        PerformanceConfiguration.item('BlockCatalogueFlushSize', 200))
+        self.catalogue_flush_seconds = float(catalogue_flush_seconds if catalogue_flush_seconds is not None else
+                                             PerformanceConfiguration.item('BlockCatalogueFlushSeconds', 60))
+        # The time each catalogue was last read from its catalogue document
+        self._catalogue_read = {}
+        # The time the first entry of each catalogue which is not in its catalogue document yet was added, and the
+        # codes of those entries
+        self._unsaved = {}
         # These are used in the id of documents stored in the structured result data store
         self.source = "client"
         self.result_type = "PerformanceDataSet"
+        self.catalogue_result_type = "PerformanceBlockCatalogue"
 
     @staticmethod
     def _create_result_id(entity_scope: str, entity_code: str, from_date: Timestamp, to_date: Timestamp) -> str:
@@ -53,6 +91,18 @@ class BlockStoreStructuredResults(InMemoryBlockStore):
         code = make_code_lusid_friendly(code)
         return code
 
+    @staticmethod
+    def _create_catalogue_id(entity_scope: str, entity_code: str) -> str:
+        """
+        Create the result id of the catalogue document of an entity
+
+        :param str entity_scope: The scope of the entity
+        :param str entity_code: The code of the entity
+
+        :return: str: The result id of the catalogue document
+        """
+        return make_code_lusid_friendly(f"catalogue_{entity_scope}_{entity_code}")
+
     @staticmethod
     def _split_result_id(result_id: str):
         """
@@ -64,6 +114,176 @@ class BlockStoreStructuredResults(InMemoryBlockStore):
         """
         return result_id.split("_")
 
+    def _catalogue_document_id(self, entity_scope: str, entity_code: str) -> StructuredResultDataId:
+        """
+        Creates the id of the catalogue document of an entity in the Structured Result Data Store
+
+        :param str entity_scope: The scope of the entity
+        :param str entity_code: The code of the entity
+
+        :return: StructuredResultDataId: The id of the catalogue document
+        """
+        return StructuredResultDataId(
+            source=self.source,
+            code=self._create_catalogue_id(entity_scope, entity_code),
+            effective_at=self.catalogue_effective_at,
+            result_type=self.catalogue_result_type)
+
+    def _read_catalogue(self, entity_scope: str, entity_code: str, performance_scope: str,
+                        requeue: bool = True) -> List[BlockCatalogueEntry]:
+        """
+        Reads the catalogue of an entity from its catalogue document in the Structured Result Data Store and merges it
+        into the local catalogue
+
+        :param str entity_scope: The scope of the entity
+        :param str entity_code: The code of the entity
+        :param str performance_scope: The scope of the BlockStore to use
+        :param bool requeue: Whether to write the local entries missing from the document with the next flush, which
+        is not needed when the merged catalogue is about to be written
+
+        :return: List[BlockCatalogueEntry]: The merged entries in the order the blocks were stored
+        """
+        structured_results_api = StructuredResultDataApi(self.api_factory.build(StructuredResultDataApi))
+        document_id = self._catalogue_document_id(entity_scope, entity_code)
+
+        response = structured_results_api.get_structured_result_data(
+            scope=performance_scope,
+            request_body={document_id.code: document_id}
+        )
+
+        # If there is no catalogue document nothing has been stored for the entity
+        document = response.values.get(document_id.code)
+        stored = [] if document is None else BlockCatalogue.from_document(document.document)
+        local = self.catalogue.get_entries(performance_scope, entity_scope, entity_code)
+
+        entries = BlockCatalogue.merge(local or [], stored)
+        key = (performance_scope, entity_scope, entity_code)
+        self._catalogue_read[key] = time.monotonic()
+
+        # Entries missing from the document were either not written yet or were lost to another writer upserting the
+        # document at the same time, either way they are written with the next flush
+        missing = {e.code for e in local or []} - {e.code for e in stored}
+        if requeue and len(missing) > 0:
+            self._queue_unsaved(key, missing)
+
+        # The local catalogue is only replaced if another writer has stored blocks, so that the indexes over it are kept
+        if local is None or [(e.code, e.asat) for e in entries] != [(e.code, e.asat) for e in local]:
+            self.catalogue.set_entries(performance_scope, entity_scope, entity_code, entries)
+
+        return self.catalogue.get_entries(performance_scope, entity_scope, entity_code)
+
+    def _get_entries(self, entity_scope: str, entity_code: str, performance_scope: str) -> List[BlockCatalogueEntry]:
+        """
+        Gets the catalogue entries of an entity. The local catalogue is used while it was read from the catalogue
+        document held in the Structured Result Data Store within the refresh interval, otherwise the document is read
+        again so that blocks stored by other writers are found. On a cold start, when there is no local catalogue for
+        the entity, the catalogue is rebuilt from the document.
+
+        :param str entity_scope: The scope of the entity
+        :param str entity_code: The code of the entity
+        :param str performance_scope: The scope of the BlockStore to use
+
+        :return: List[BlockCatalogueEntry]: The entries in the order the blocks were stored
+        """
+        entries = self.catalogue.get_entries(performance_scope, entity_scope, entity_code)
+        read = self._catalogue_read.get((performance_scope, entity_scope, entity_code))
+
+        if entries is not None and read is not None and time.monotonic() - read < self.catalogue_refresh:
+            return entries
+
+        return self._read_catalogue(entity_scope, entity_code, performance_scope)
+
+    def _get_index(self, entity_scope: str, entity_code: str, performance_scope: str = None) -> BlockIndex:
+        """
+        Gets the bi-temporal index over the catalogue entries of an entity
+
+        :param str entity_scope: The scope of the entity
+        :param str entity_code: The code of the entity
+        :param str performance_scope: The scope of the BlockStore to use
+
+        :return: BlockIndex: The index over the catalogue entries of the entity
+        """
+        entries = self._get_entries(entity_scope, entity_code, performance_scope)
+        key = (self._create_id_from_scope_code(entity_scope, entity_code), performance_scope)
+        source, index = self._indexes.get(key, (None, None))
+
+        if source is not entries:
+            index = BlockIndex(entries)
+            self._indexes[key] = (entries, index)
+
+        return index
+
+    def _get_checkpoint_index(self, entity_scope: str, entity_code: str,
+                              performance_scope: str = None) -> CheckpointIndex:
+        """
+        Gets the period end checkpoints of an entity from its catalogue entries. Blocks stored before checkpoints were
+        kept in the catalogue do not answer any date.
+
+        :param str entity_scope: The scope of the entity
+        :param str entity_code: The code of the entity
+        :param str performance_scope: The scope of the BlockStore to use
+
+        :return: CheckpointIndex: The checkpoints of the blocks of the entity
+        """
+        entries = self._get_entries(entity_scope, entity_code, performance_scope)
+        key = (self._create_id_from_scope_code(entity_scope, entity_code), performance_scope)
+        source, index = self._checkpoint_indexes.get(key, (None, None))
+
+        if source is not entries:
+            index = CheckpointIndex()
+            for entry in entries:
+                index.add(entry.from_date, entry.to_date, entry.asat, checkpoints=entry.checkpoints)
+            self._checkpoint_indexes[key] = (entries, index)
+
+        return index
+
+    def _fetch_blocks(self, performance_scope: str, entries: List[BlockCatalogueEntry]) -> List[PerformanceDataSet]:
+        """
+        Gets the blocks for a set of catalogue entries, reading through the cache of deserialised blocks
+
+        :param str performance_scope: The scope of the BlockStore to use
+        :param List[BlockCatalogueEntry] entries: The entries of the blocks to get
+
+        :return: List[PerformanceDataSet]: The blocks in the same order as the entries
+        """
+        if len(entries) == 0:
+            return []
+
+        cache_keys = {entry.code: (performance_scope, entry.code, entry.asat) for entry in entries}
+        blocks = {code: self.cache.get(key) for code, key in cache_keys.items()}
+        missing = [code for code, block in blocks.items() if block is None]
+
+        if len(missing) > 0:
+            structured_results_api = StructuredResultDataApi(self.api_factory.build(StructuredResultDataApi))
+
+            # Retrieve the blocks which are not cached from the Structured Result Data Store
+            response = structured_results_api.get_structured_result_data(
+                scope=performance_scope,
+                request_body={
+                    code: StructuredResultDataId(
+                        source=self.source,
+                        code=code,
+                        effective_at=self._split_result_id(code)[1],
+                        result_type=self.result_type)
+                    for code in missing
+                }
+            )
+
+            # Ensure that there were no failures
+            if len(response.failed) > 0:
+                raise ValueError("Some blocks could not be retrieved")
+
+            # De-serialise each block into a PerformanceDataSet
+            for code, block in response.values.items():
+                blocks[code] = deserialise(block.document, block.version)
+                self.cache.put(cache_keys[code], blocks[code], len(block.document))
+
+        for entry in entries:
+            if blocks[entry.code].asat is None:
+                blocks[entry.code].asat = entry.asat
+
+        return [blocks[entry.code] for entry in entries]
+
     def get_blocks(self, entity_scope: str, entity_code: str, performance_scope: str = None) -> List[PerformanceDataSet]:
         """
         This is used to get all blocks from the BlockStore for the specified entity.
@@ -77,51 +297,158 @@ class BlockStoreStructuredResults(InMemoryBlockStore):
 
         :return: List[PerformanceDataSet]: The blocks contained in the BlockStore
         """
-        structured_results_api = StructuredResultDataApi(self.api_factory.build(StructuredResultDataApi))
+        if performance_scope is None:
+            performance_scope = "PerformanceBlockStore"
 
+        return self._fetch_blocks(performance_scope, self._get_entries(entity_scope, entity_code, performance_scope))
+
+    @as_dates
+    def find_blocks(self, entity_scope: str, entity_code: str, from_date: Timestamp, to_date: Timestamp,
+                    asat: Timestamp, performance_scope: str = None) -> List[PerformanceDataSet]:
+        """
+        Returns all the PerformanceDataSet blocks in a given bi-temporal period for the specified entity. The blocks
+        are selected using the catalogue so that only the relevant blocks are retrieved.
+
+        :param str entity_scope: The scope of the entity to get blocks for.
+        :param str entity_code: The code of the entity to get blocks for. Together with the entity_scope this uniquely
+        identifies the entity.
+        :param Timestamp from_date: The effectiveAt start date of the period
+        :param Timestamp to_date: The effectiveAt end date of the period
+        :param Timestamp asat: The asAt date of the period
+        :param str performance_scope: The scope of the BlockStore to use, this is the scope in LUSID to use when adding
+        the block to the Structured Result Store
+
+        :return: List[PerformanceDataSet]: The list of relevant PerformanceDataSet blocks
+        """
         if performance_scope is None:
             performance_scope = "PerformanceBlockStore"
 
-        entity_id = self._create_id_from_scope_code(entity_scope, entity_code)
+        entries = self.find_block_metadata(entity_scope, entity_code, from_date, to_date, asat, performance_scope)
+        return self._fetch_blocks(performance_scope, entries)
 
-        eligible_blocks = [code for code in self.blocks[entity_id] if code[2] == performance_scope]
+    @as_dates
+    def find_block_metadata(self, entity_scope: str, entity_code: str, from_date: Timestamp, to_date: Timestamp,
+                            asat: Timestamp, performance_scope: str = None) -> List[BlockCatalogueEntry]:
+        """
+        Returns the catalogue entries of the blocks in a given bi-temporal period for the specified entity without
+        retrieving the blocks
 
-        if len(eligible_blocks) == 0:
-            return []
+        :param str entity_scope: The scope of the entity to get blocks for.
+        :param str entity_code: The code of the entity to get blocks for. Together with the entity_scope this uniquely
+        identifies the entity.
+        :param Timestamp from_date: The effectiveAt start date of the period
+        :param Timestamp to_date: The effectiveAt end date of the period
+        :param Timestamp asat: The asAt date of the period
+        :param str performance_scope: The scope of the BlockStore to use, this is the scope in LUSID to use when adding
+        the block to the Structured Result Store
 
-        # Retrieve the blocks from the Structured Result Data Store
-        response = structured_results_api.get_structured_result_data(
-            scope=performance_scope,
-            request_body={
-                code[0]: StructuredResultDataId(
-                    source=self.source,
-                    code=code[0],
-                    effective_at=self._split_result_id(code[0])[1],
-                    result_type=self.result_type)
-                for code in eligible_blocks
-            }
-        )
+        :return: List[BlockCatalogueEntry]: The catalogue entries of the relevant blocks
+        """
+        if performance_scope is None:
+            performance_scope = "PerformanceBlockStore"
+
+        return self._get_index(entity_scope, entity_code, performance_scope).find_blocks(from_date, to_date, asat)
+
+    def fetch_blocks(self, entity_scope: str, entity_code: str, metadata: List[BlockCatalogueEntry],
+                     performance_scope: str = None) -> List[PerformanceDataSet]:
+        """
+        Retrieves the blocks for catalogue entries returned by find_block_metadata
+
+        :param str entity_scope: The scope of the entity to get blocks for.
+        :param str entity_code: The code of the entity to get blocks for. Together with the entity_scope this uniquely
+        identifies the entity.
+        :param List[BlockCatalogueEntry] metadata: The catalogue entries of the blocks to retrieve
+        :param str performance_scope: The scope of the BlockStore to use, this is the scope in LUSID to use when adding
+        the block to the Structured Result Store
+
+        :return: List[PerformanceDataSet]: The blocks in the same order as the catalogue entries
+        """
+        if performance_scope is None:
+            performance_scope = "PerformanceBlockStore"
+
+        return self._fetch_blocks(performance_scope, metadata)
+
+    @as_dates
+    def get_checkpoints(self, entity_scope: str, entity_code: str, dates: List[Timestamp], asat: Timestamp,
+                        locked: bool, performance_scope: str = None) -> Dict[Timestamp, Checkpoint]:
+        """
+        Finds the cumulative state of an entity at period ends using the catalogue, without retrieving any blocks
+
+        :param str entity_scope: The scope of the entity to get checkpoints for.
+        :param str entity_code: The code of the entity to get checkpoints for. Together with the entity_scope this
+        uniquely identifies the entity.
+        :param List[Timestamp] dates: The dates of the checkpoints
+        :param Timestamp asat: The asAt date
+        :param bool locked: Whether or not the period is locked
+        :param str performance_scope: The scope of the BlockStore to use, this is the scope in LUSID to use when adding
+        the block to the Structured Result Store
+
+        :return: Dict[Timestamp, Checkpoint]: The checkpoint of each date which can be answered
+        """
+        if performance_scope is None:
+            performance_scope = "PerformanceBlockStore"
+
+        return self._get_checkpoint_index(entity_scope, entity_code, performance_scope).get(dates, asat, locked)
 
-        # Ensure that there were no failures
-        if len(response.failed) > 0:
-            raise ValueError("Some blocks could not be retrieved")
+    @as_dates
+    def get_previous_record(self, entity_scope: str, entity_code: str, date: Timestamp,
+                            asat: Timestamp, performance_scope: str = None) -> PerformanceDataPoint:
+        """
+        Find the block that precedes the given bi-temporal date for the specified entity. If every data point of the
+        block is before the date the summary of the last data point is used from the catalogue, otherwise the block
+        is retrieved.
+
+        :param str entity_scope: The scope of the entity to get blocks for.
+        :param str entity_code: The code of the entity to get blocks for. Together with the entity_scope this uniquely
+        identifies the entity.
+        :param Timestamp date: The effectiveAt date
+        :param Timestamp asat: The asAt date
+        :param str performance_scope: The scope of the BlockStore to use, this is the scope in LUSID to use when adding
+        the block to the Structured Result Store
+
+        :return: PerformanceDataPoint latest: The latest performance data point in the preceding block
+        """
+        if performance_scope is None:
+            performance_scope = "PerformanceBlockStore"
+
+        match = self._get_index(entity_scope, entity_code, performance_scope).get_previous_block(date, asat)
+
+        # If the block is empty or is entirely before the date there is no need to retrieve it
+        if match is None or match.last is None:
+            return None
+
+        if match.last.date < date:
+            return match.last
+
+        return self._fetch_blocks(performance_scope, [match])[0].get_data_point_before(date)
+
+    def get_first_date(self, entity_scope: str, entity_code: str, performance_scope: str = None) -> Timestamp:
+        """
+        Finds the earliest state in a set of blocks for the specified entity using the catalogue
+
+        :param str entity_scope: The scope of the entity to get blocks for.
+        :param str entity_code: The code of the entity to get blocks for. Together with the entity_scope this uniquely
+        identifies the entity.
+        :param str performance_scope: The scope of the BlockStore to use, this is the scope in LUSID to use when adding
+        the block to the Structured Result Store
+
+        :return: Timestamp: The earliest date or None of this can not be determined
+        """
+        if performance_scope is None:
+            performance_scope = "PerformanceBlockStore"
 
-        # De-serialise each block into a PerformanceDataSet
-        blocks = {
-            code: deserialise(block.document, block.version) for code, block in response.values.items()
-        }
+        entries = self._get_entries(entity_scope, entity_code, performance_scope)
 
-        for code in self.blocks[entity_id]:
-            if blocks[code[0]].asat is None:
-                blocks[code[0]].asat = code[1]
+        if len(entries) == 0:
+            return None
 
-        return list(blocks.values())
+        return min([entry.from_date for entry in entries])
 
     @as_dates
     def add_block(self, entity_scope: str, entity_code: str, block: PerformanceDataSet,
                   performance_scope: str = None) -> PerformanceDataSet:
         """
-        This adds a block to the BlockStore for the specified entity.
+        This adds a block to the BlockStore for the specified entity and records it in the catalogue.
 
         :param str entity_scope: The scope of the entity to add the block for.
         :param str entity_code: The code of the entity to get blocks for. Together with the entity_scope this uniquely
@@ -133,40 +460,189 @@ class BlockStoreStructuredResults(InMemoryBlockStore):
         :return: PerformanceDataSet block: The block that was added to the BlockStore along with the asAt time of
         the operation
         """
+        values, failed = self.add_blocks(entity_scope, entity_code, {"block": block}, performance_scope)
+
+        if len(failed) > 0:
+            raise ValueError(f"The block could not be added: {failed['block']}")
+
+        return values["block"]
+
+    def add_blocks(self, entity_scope: str, entity_code: str, blocks: Dict[str, PerformanceDataSet],
+                   performance_scope: str = None) -> Tuple[Dict[str, PerformanceDataSet], Dict[str, str]]:
+        """
+        This adds a batch of blocks to the BlockStore for the specified entity and records them in the catalogue. The
+        blocks are upserted in as few requests as the StructuredResultBatchSize configuration item allows.
+
+        :param str entity_scope: The scope of the entity to add the blocks for.
+        :param str entity_code: The code of the entity to get blocks for. Together with the entity_scope this uniquely
+        identifies the entity.
+        :param Dict[str, PerformanceDataSet] blocks: The blocks to add to the BlockStore keyed by a correlation id
+        :param str performance_scope: The scope of the BlockStore to use, this is the scope in LUSID to use when adding
+        the block to the Structured Result Store
+
+        :return: Tuple[Dict[str, PerformanceDataSet], Dict[str, str]]: The blocks which were added along with the asAt
+        time of the operation and the reason for each block which could not be added, both keyed by correlation id
+        """
         if performance_scope is None:
             performance_scope = "PerformanceBlockStore"
 
-        serialised_block = serialise(block)
-        code = self._create_result_id(entity_scope, entity_code, block.from_date, block.to_date)
-        effective_at = block.to_date
+        # Make sure the existing catalogue is known before the blocks are added to it
+        self._get_entries(entity_scope, entity_code, performance_scope)
+
+        batch_size = int(PerformanceConfiguration.item('StructuredResultBatchSize', 200))
+        structured_results_api = StructuredResultDataApi(self.api_factory.build(StructuredResultDataApi))
+
+        values = {}
+        failed = {}
+        entries = []
+
+        # Group the blocks into requests, a block with the same id as one already in a request (i.e. with the same
+        # date range) must go in a later request so that the latest one is kept
+        requests = [{}]
+        for correlation_id, block in blocks.items():
+            code = self._create_result_id(entity_scope, entity_code, block.from_date, block.to_date)
+            if len(requests[-1]) >= batch_size or code in requests[-1]:
+                requests.append({})
+            requests[-1][code] = (correlation_id, block)
+
+        for request in requests:
+            if len(request) == 0:
+                continue
+
+            try:
+                response = structured_results_api.upsert_structured_result_data(
+                    scope=performance_scope,
+                    request_body={
+                        code: UpsertStructuredResultDataRequest(
+                            id=StructuredResultDataId(
+                                source=self.source,
+                                code=code,
+                                effective_at=block.to_date,
+                                result_type=self.result_type),
+                            data=StructuredResultData(
+                                document_format="Json",
+                                version=block.version,
+                                name="PerformanceDataSet",
+                                document=serialise(block)
+                            )
+                        )
+                        for code, (correlation_id, block) in request.items()
+                    }
+                )
+            except Exception as e:
+                # The whole request failed
+                failed.update({correlation_id: str(e) for correlation_id, _ in request.values()})
+                continue
+
+            for code, (correlation_id, block) in request.items():
+                if code not in response.values:
+                    failed[correlation_id] = str(response.failed.get(code, "The block was not upserted"))
+                    continue
+
+                as_at_time = response.values[code]
+
+                entity_id = self._create_id_from_scope_code(entity_scope, entity_code)
+                self.blocks[entity_id].append((code, as_at_time, performance_scope))
+
+                # The upsert replaces any earlier version of the document
+                self.cache.invalidate(lambda key: key[:2] == (performance_scope, code))
+
+                if block.asat is None:
+                    block.asat = as_at_time
+
+                entries.append(BlockCatalogueEntry.from_block(code, block, block.asat))
+                values[correlation_id] = block
+
+        if len(entries) > 0:
+            self.catalogue.add_entries(performance_scope, entity_scope, entity_code, entries)
+
+            # The catalogue document is written once enough entries have been added or they have waited long enough
+            key = (performance_scope, entity_scope, entity_code)
+            since, codes = self._queue_unsaved(key, {entry.code for entry in entries})
+            if len(codes) >= self.catalogue_flush_size or time.monotonic() - since >= self.catalogue_flush_seconds:
+                self.flush_catalogue(entity_scope, entity_code, performance_scope)
+
+        return values, failed
+
+    def _queue_unsaved(self, key: Tuple[str, str, str], codes: set) -> Tuple[float, set]:
+        """
+        Records entries of a catalogue which are not in its catalogue document
+
+        :param Tuple[str, str, str] key: The performance scope, scope and code of the entity
+        :param set codes: The codes of the entries
+
+        :return: Tuple[float, set]: The time the first entry not in the document was added and the codes of all of them
+        """
+        with self.lock:
+            since, unsaved = self._unsaved.setdefault(key, (time.monotonic(), set()))
+            unsaved.update(codes)
+            return since, unsaved
+
+    def flush_catalogue(self, entity_scope: str = None, entity_code: str = None,
+                        performance_scope: str = None) -> Dict[Tuple[str, str, str], str]:
+        """
+        Writes the entries added to the catalogues since they were last written to their catalogue documents, so that
+        the blocks can be found on a cold start or by other writers. This should be called before the store is
+        discarded. A catalogue which can not be written is logged and written again by the next flush.
+
+        :param str entity_scope: The scope of the entity to write the catalogue of, all catalogues if not provided
+        :param str entity_code: The code of the entity to write the catalogue of, all catalogues if not provided
+        :param str performance_scope: The scope of the BlockStore to use
+
+        :return: Dict[Tuple[str, str, str], str]: The reason each catalogue which could not be written failed, keyed
+        by the performance scope, scope and code of its entity
+        """
+        with self.lock:
+            keys = [key for key in self._unsaved if entity_scope is None or
+                    key == (performance_scope or "PerformanceBlockStore", entity_scope, entity_code)]
+
+        failed = {}
+
+        for key in keys:
+            with self.lock:
+                _, codes = self._unsaved.pop(key, (None, set()))
+            if len(codes) == 0:
+                continue
+
+            try:
+                self._upsert_catalogue(key[1], key[2], key[0])
+            except Exception as e:
+                logging.warning(f"Failed to write the block catalogue document of {key}: {e}")
+                self._queue_unsaved(key, codes)
+                failed[key] = str(e)
+
+        return failed
+
+    def _upsert_catalogue(self, entity_scope: str, entity_code: str, performance_scope: str) -> None:
+        """
+        Stores the catalogue of an entity in the Structured Result Data Store so that it can be rebuilt on a cold start.
+        The catalogue document is read first and merged with the local catalogue by code, so that the entries of
+        blocks stored by other writers are kept. An entry lost to a writer upserting in between is found to be missing
+        the next time the document is read and is written again by the next flush.
+
+        :param str entity_scope: The scope of the entity
+        :param str entity_code: The code of the entity
+        :param str performance_scope: The scope of the BlockStore to use
+        """
+        entries = self._read_catalogue(entity_scope, entity_code, performance_scope, requeue=False)
 
         structured_results_api = StructuredResultDataApi(self.api_factory.build(StructuredResultDataApi))
+        document_id = self._catalogue_document_id(entity_scope, entity_code)
 
         response = structured_results_api.upsert_structured_result_data(
             scope=performance_scope,
             request_body={
-                code: UpsertStructuredResultDataRequest(
-                    id=StructuredResultDataId(
-                        source=self.source,
-                        code=code,
-                        effective_at=effective_at,
-                        result_type=self.result_type),
+                document_id.code: UpsertStructuredResultDataRequest(
+                    id=document_id,
                     data=StructuredResultData(
                         document_format="Json",
-                        version=block.version,
-                        name="PerformanceDataSet",
-                        document=serialised_block
+                        version=BlockCatalogue.version,
+                        name="PerformanceBlockCatalogue",
+                        document=BlockCatalogue.to_document(entries)
                     )
                 )
             }
         )
 
-        as_at_time = list(response.values.values())[0]
-
-        entity_id = self._create_id_from_scope_code(entity_scope, entity_code)
-        self.blocks[entity_id].append((code, as_at_time, performance_scope))
-
-        if block.asat is None:
-            block.asat = as_at_time
-
-        return block
+        if document_id.code not in response.values:
+            raise ValueError(response.failed.get(document_id.code, "The catalogue document was not upserted"))
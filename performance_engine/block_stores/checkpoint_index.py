@@ -0,0 +1,253 @@
+from bisect import bisect_right
+import copy
+from typing import Dict, Iterable, NamedTuple
+
+import numpy as np
+import pandas as pd
+from pandas import Timestamp
+
+from business_calendar import BusinessCalendar
+from config.config import PerformanceConfiguration
+from pds import PerformanceDataPoint, PerformanceDataSet
+
+
+class Checkpoint(NamedTuple):
+    """
+    The cumulative state of an entity at the end of a period
+    """
+    # The asAt date of the block the checkpoint was taken from
+    asat: Timestamp
+    # The PerformanceDataPoint at the end of the period, None if the block has no data point on that date
+    point: PerformanceDataPoint
+
+
+def period_ends(from_date: Timestamp, to_date: Timestamp, frequency: str = None) -> pd.DatetimeIndex:
+    """
+    Gets the ends of the periods between two dates
+
+    :param Timestamp from_date: The first date
+    :param Timestamp to_date: The last date
+    :param str frequency: The frequency of the periods, 'M' for months, 'Q' for quarters or 'A' for years. Defaults
+    to the CheckpointFrequency configuration item.
+
+    :return: pd.DatetimeIndex: The UTC dates at the end of each period. With a HolidayCalendarPath configuration item
+    a period which ends on a day other than a business day ends on the business day before it, as periods start there.
+    """
+    frequency = frequency or PerformanceConfiguration.item('CheckpointFrequency', 'M')
+    from_date, to_date = pd.Timestamp(from_date), pd.Timestamp(to_date)
+
+    ends = pd.date_range(
+        from_date.tz_convert(None).normalize() if from_date.tzinfo else from_date.normalize(),
+        to_date.tz_convert(None) if to_date.tzinfo else to_date,
+        freq=frequency, tz='UTC')
+
+    business_calendar = BusinessCalendar.from_config()
+    if business_calendar is None:
+        return ends
+
+    return pd.DatetimeIndex(np.unique(business_calendar.rollback(ends.asi8))).tz_localize('UTC')
+
+
+def extract_checkpoints(block: PerformanceDataSet, frequency: str = None) -> Dict[Timestamp, PerformanceDataPoint]:
+    """
+    Takes the checkpoints at the end of each period covered by a block. The attribution of each data point is not
+    kept, only its cumulative state.
+
+    :param PerformanceDataSet block: The block
+    :param str frequency: The frequency of the periods, defaults to the CheckpointFrequency configuration item
+
+    :return: Dict[Timestamp, PerformanceDataPoint]: The data point at the end of each period in the block, or None
+    where the block has no data point on that date
+    """
+    checkpoints = {}
+
+    for date in period_ends(block.from_date, block.to_date, frequency):
+        if date < block.from_date:
+            continue
+        point = block.get_data_point_before(date + pd.Timedelta(days=1))
+        if point is not None and date <= point.date:
+            # The point is kept under its own date, which may include a time of day
+            point = copy.copy(point)
+            point.data = None
+            checkpoints[point.date] = point
+        else:
+            checkpoints[date] = None
+
+    return checkpoints
+
+
+class CheckpointIndex:
+    """
+    The checkpoints of the blocks of a single entity.
+
+    Each date is answered from the block which combining the blocks would take that date from: the latest block (by
+    asAt) covering the date when unlocked, or the first block (by asAt) ending on or after the date when locked. The
+    checkpoints of a block are only taken when they are first needed, so blocks which are loaded lazily are only
+    loaded if they answer a date.
+
+    The records of the blocks are held in asAt order (blocks with the same asAt keep the order in which they were
+    added) so that restricting the asAt is a binary search, and the blocks answering each date are found by searching
+    the sorted dates rather than scanning the blocks for every date.
+    """
+
+    def __init__(self, frequency: str = None):
+        """
+        :param str frequency: The frequency of the checkpoints, defaults to the CheckpointFrequency configuration item
+        """
+        self.frequency = frequency or PerformanceConfiguration.item('CheckpointFrequency', 'M')
+        # The from_date, to_date and asAt date of each block with its checkpoints, or the block to take them from,
+        # in asAt order
+        self._records = []
+        # The bi-temporal coordinates of the records as nanoseconds
+        self._from_dates = []
+        self._to_dates = []
+        self._asats = []
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def add(self, from_date: Timestamp, to_date: Timestamp, asat: Timestamp,
+            checkpoints: Dict[Timestamp, PerformanceDataPoint] = None, block: PerformanceDataSet = None) -> None:
+        """
+        Adds the checkpoints of a block. Either the checkpoints or the block to take them from can be provided, if
+        neither is then the checkpoints of the block are unknown and no date is answered from it.
+
+        :param Timestamp from_date: The effectiveAt start date of the block
+        :param Timestamp to_date: The effectiveAt end date of the block
+        :param Timestamp asat: The asAt date of the block
+        :param Dict[Timestamp, PerformanceDataPoint] checkpoints: The checkpoints created by extract_checkpoints
+        :param PerformanceDataSet block: The block to take the checkpoints from when they are first needed
+        """
+        position = bisect_right(self._asats, pd.Timestamp(asat).value)
+
+        self._records.insert(position, [from_date, to_date, asat, checkpoints, block])
+        self._from_dates.insert(position, pd.Timestamp(from_date).value)
+        self._to_dates.insert(position, pd.Timestamp(to_date).value)
+        self._asats.insert(position, pd.Timestamp(asat).value)
+
+    def add_block(self, block: PerformanceDataSet) -> None:
+        """
+        Adds a block, its checkpoints are taken when they are first needed. The linked fields of a relative block
+        depend on the blocks before it, so no date is answered from it.
+
+        :param PerformanceDataSet block: The block, it must have an asAt date
+        """
+        self.add(block.from_date, block.to_date, block.asat, block=None if block.relative else block)
+
+    def _checkpoints(self, record) -> Dict[Timestamp, PerformanceDataPoint]:
+        """
+        Gets the checkpoints of a block, taking them from the block if they have not been taken yet
+
+        :param record: The record of the block
+
+        :return: Dict[Timestamp, PerformanceDataPoint]: The checkpoints or None if they are unknown
+        """
+        if record[3] is None and record[4] is not None:
+            record[3] = extract_checkpoints(record[4], self.frequency)
+            record[4] = None
+        return record[3]
+
+    def get(self, dates: Iterable[Timestamp], asat: Timestamp, locked: bool) -> Dict[Timestamp, Checkpoint]:
+        """
+        Finds the checkpoints for a set of dates
+
+        :param Iterable[Timestamp] dates: The dates
+        :param Timestamp asat: The asAt date, only blocks stored at or before this are used
+        :param bool locked: Whether or not the period is locked
+
+        :return: Dict[Timestamp, Checkpoint]: The checkpoint of each date which can be answered
+        """
+        dates = list(dates)
+        limit = bisect_right(self._asats, pd.Timestamp(asat).value)
+        if limit == 0 or len(dates) == 0:
+            return {}
+
+        from_dates = np.array(self._from_dates[:limit], dtype=np.int64)
+        to_dates = np.array(self._to_dates[:limit], dtype=np.int64)
+        values = np.array([pd.Timestamp(d).value for d in dates], dtype=np.int64)
+
+        # The position of the record answering each date, -1 where no record does
+        if locked:
+            positions = self._locked(values, from_dates, to_dates)
+        else:
+            positions = self._unlocked(values, from_dates, to_dates, np.array(self._asats[:limit], dtype=np.int64))
+
+        answers = {}
+
+        for date, position in zip(dates, positions):
+            if position < 0:
+                continue
+            record = self._records[position]
+            checkpoints = self._checkpoints(record)
+            if checkpoints is not None and date in checkpoints:
+                answers[date] = Checkpoint(record[2], checkpoints[date])
+
+        return answers
+
+    @staticmethod
+    def _locked(dates: np.ndarray, from_dates: np.ndarray, to_dates: np.ndarray) -> np.ndarray:
+        """
+        Finds the first record (by asAt) which ends on or after each date, as long as it also starts on or before it
+
+        :param np.ndarray dates: The dates as nanoseconds
+        :param np.ndarray from_dates: The from_date of each record in asAt order as nanoseconds
+        :param np.ndarray to_dates: The to_date of each record in asAt order as nanoseconds
+
+        :return: np.ndarray: The position of the record answering each date, -1 where none does
+        """
+        # The latest to_date of the records up to each one only increases, the first record reaching a date is the
+        # first one at which it does
+        reach = np.maximum.accumulate(to_dates)
+        positions = np.searchsorted(reach, dates, side='left')
+
+        found = positions < len(reach)
+        positions[~found] = 0
+        found &= from_dates[positions] <= dates
+        return np.where(found, positions, -1)
+
+    @staticmethod
+    def _unlocked(dates: np.ndarray, from_dates: np.ndarray, to_dates: np.ndarray, asats: np.ndarray) -> np.ndarray:
+        """
+        Finds the latest record (by asAt) which covers each date. Where several records share that asAt date the
+        first one added is used.
+
+        :param np.ndarray dates: The dates as nanoseconds
+        :param np.ndarray from_dates: The from_date of each record in asAt order as nanoseconds
+        :param np.ndarray to_dates: The to_date of each record in asAt order as nanoseconds
+        :param np.ndarray asats: The asAt date of each record in asAt order as nanoseconds
+
+        :return: np.ndarray: The position of the record answering each date, -1 where none does
+        """
+        order = np.argsort(dates, kind='stable')
+        sorted_dates = dates[order]
+        answered = np.full(len(dates), -1, dtype=np.int64)
+
+        # The range of the sorted dates covered by each record
+        starts = np.searchsorted(sorted_dates, from_dates, side='left')
+        ends = np.searchsorted(sorted_dates, to_dates, side='right')
+
+        # The first sorted date at or after each one which is not answered yet, so that each date is only visited once
+        following = list(range(len(dates) + 1))
+
+        def find(i: int) -> int:
+            root = i
+            while following[root] != root:
+                root = following[root]
+            while following[i] != root:
+                following[i], i = root, following[i]
+            return root
+
+        remaining = len(dates)
+
+        # The records take precedence latest asAt first, then in the order they were added
+        for position in np.lexsort((np.arange(len(asats)), -asats)):
+            i = find(starts[position])
+            while i < ends[position]:
+                answered[order[i]] = position
+                remaining -= 1
+                following[i] = i + 1
+                i = find(i + 1)
+            if remaining == 0:
+                break
+
+        return answered
@@ -0,0 +1,226 @@
+from contextlib import nullcontext
+import threading
+import time
+from typing import Iterable, List, NamedTuple, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import Timestamp
+
+import block_ops
+from chunking import ChunkingPolicy
+from config.config import PerformanceConfiguration
+from interfaces import IBlockStore
+from misc import as_dates, now
+from pds import PerformanceDataSet
+
+
+class CompactionMetrics(NamedTuple):
+    """
+    The outcome of compacting the blocks of a single entity
+    """
+    entity_scope: str
+    entity_code: str
+    # The number of blocks before and after compaction
+    blocks_before: int
+    blocks_after: int
+    # The number of superseded blocks which were removed (and archived if there is an archive)
+    removed: int
+    # The number of snapshot blocks which replaced them
+    snapshots: int
+    # The time taken in seconds
+    seconds: float
+
+
+def _snapshot(blocks: List[PerformanceDataSet], locked: bool, asat: Timestamp) -> PerformanceDataSet:
+    """
+    Combines blocks into a single block holding their combined view
+
+    :param List[PerformanceDataSet] blocks: The blocks
+    :param bool locked: Whether to take the locked or unlocked view
+    :param Timestamp asat: The asAt date of the snapshot
+
+    :return: PerformanceDataSet: The snapshot, its linked fields are not relative
+    """
+    from_date = min(b.from_date for b in blocks)
+    to_date = max(b.to_date for b in blocks)
+    # The first block is the one the combined view starts from
+    first = min(sorted(blocks, key=lambda b: b.asat, reverse=not locked), key=lambda b: b.from_date)
+
+    snapshot = PerformanceDataSet(from_date, to_date, asat, previous=None if first.relative else first.previous)
+    snapshot.data_points = list(block_ops.combine(blocks, locked, from_date, to_date, asat))
+    return snapshot
+
+
+def _same(a: PerformanceDataSet, b: PerformanceDataSet) -> bool:
+    """
+    Whether two snapshots hold the same performance
+
+    :param PerformanceDataSet a: The first snapshot
+    :param PerformanceDataSet b: The second snapshot
+
+    :return: bool: True if the data points of the snapshots are the same
+    """
+    columns_a, columns_b = a.get_columns(), b.get_columns()
+
+    if len(columns_a['date']) != len(columns_b['date']) or (columns_a['date'] != columns_b['date']).any():
+        return False
+
+    return all(np.allclose(columns_a[name], columns_b[name], equal_nan=True)
+               for name in ('tmv', 'flows', 'weight', 'ror', 'cum_fctr', 'cum_flow', 'cnt', 'sum_ror', 'sum_ror_sqr'))
+
+
+@as_dates
+def compact_blocks(block_store: IBlockStore, entity_scope: str, entity_code: str, retention: pd.Timedelta = None,
+                   asat: Timestamp = None, archive: IBlockStore = None, chunking: ChunkingPolicy = None,
+                   performance_scope: str = None) -> CompactionMetrics:
+    """
+    Compacts the blocks of an entity. The blocks stored before the retention window are replaced by snapshots of
+    their combined view, so that combining the blocks no longer has to work through every restatement. Queries with
+    an asAt date within the retention window are unchanged, while earlier asAt dates are no longer answered exactly.
+
+    The unlocked view of the superseded blocks is stored with the asAt date of the latest of them. Where the locked
+    view differs, because some of the blocks restated earlier ones, it is stored as well with the asAt date of the
+    earliest of them so that locked periods still see the performance as first reported. The locked view is exact
+    where each block ends no earlier than the blocks stored before it, as the blocks written by Performance do.
+
+    :param IBlockStore block_store: The block store, it must support remove_blocks
+    :param str entity_scope: The scope of the entity
+    :param str entity_code: The code of the entity
+    :param pd.Timedelta retention: How far back from the asAt date queries stay exact, defaults to the
+    CompactionRetentionDays configuration item
+    :param Timestamp asat: The asAt date the retention window ends at, defaults to now
+    :param IBlockStore archive: A block store to add the superseded blocks to before they are removed
+    :param ChunkingPolicy chunking: How the snapshots are split into chunks, defaults to the BlockChunking
+    configuration item
+    :param str performance_scope: The scope of the block store to use
+
+    :return: CompactionMetrics: The number of blocks before and after compaction
+    """
+    if type(block_store).remove_blocks is IBlockStore.remove_blocks:
+        raise NotImplementedError(f"{type(block_store).__name__} does not support removing blocks")
+
+    started = time.perf_counter()
+
+    if retention is None:
+        retention = pd.Timedelta(days=float(PerformanceConfiguration.item('CompactionRetentionDays', 30)))
+
+    # The blocks are not read or changed by anyone else while they are replaced, where the block store has a lock
+    with getattr(block_store, 'lock', None) or nullcontext():
+        cutoff = (asat or now()) - retention
+        blocks = list(block_store.get_blocks(entity_scope, entity_code, performance_scope))
+        superseded = [b for b in blocks if b.asat <= cutoff]
+
+        def metrics(removed: int = 0, snapshots: int = 0) -> CompactionMetrics:
+            return CompactionMetrics(entity_scope, entity_code, len(blocks), len(blocks) - removed + snapshots, removed,
+                                     snapshots, time.perf_counter() - started)
+
+        if len(superseded) < 2:
+            return metrics()
+
+        # The snapshots sit beneath every block in the retention window
+        unlocked = _snapshot(superseded, False, max(b.asat for b in superseded))
+        locked = _snapshot(superseded, True, min(b.asat for b in superseded))
+        snapshots = [unlocked] if _same(unlocked, locked) else [locked, unlocked]
+
+        chunking = ChunkingPolicy.from_config(chunking)
+        if chunking is not None:
+            snapshots = [c for s in snapshots for c in chunking.split(s)]
+
+        if len(snapshots) >= len(superseded):
+            return metrics()
+
+        if archive is not None:
+            _, failures = archive.add_blocks(entity_scope, entity_code, {str(i): b for i, b in enumerate(superseded)},
+                                             performance_scope)
+            if len(failures) > 0:
+                raise Exception(f"Failed to archive {len(failures)} of {len(superseded)} blocks: "
+                                f"{list(failures.values())[0]}")
+
+        _, failures = block_store.add_blocks(entity_scope, entity_code, {str(i): b for i, b in enumerate(snapshots)},
+                                             performance_scope)
+        if len(failures) > 0:
+            raise Exception(f"Failed to store {len(failures)} of {len(snapshots)} snapshots: "
+                            f"{list(failures.values())[0]}")
+
+        block_store.remove_blocks(entity_scope, entity_code, superseded, performance_scope)
+
+        return metrics(len(superseded), len(snapshots))
+
+
+class BlockCompactor:
+    """
+    Compacts the blocks of a set of entities in the background, at a fixed interval
+    """
+
+    def __init__(self, block_store: IBlockStore, entities: Iterable[Tuple[str, str]], interval: float = 3600.0,
+                 retention: pd.Timedelta = None, archive: IBlockStore = None, performance_scope: str = None):
+        """
+        :param IBlockStore block_store: The block store, it must support remove_blocks
+        :param Iterable[Tuple[str, str]] entities: The scope and code of each entity to compact
+        :param float interval: The number of seconds between compactions
+        :param pd.Timedelta retention: How far back from now queries stay exact, defaults to the
+        CompactionRetentionDays configuration item
+        :param IBlockStore archive: A block store to add the superseded blocks to before they are removed
+        :param str performance_scope: The scope of the block store to use
+        """
+        self.block_store = block_store
+        self.entities = list(entities)
+        self.interval = interval
+        self.retention = retention
+        self.archive = archive
+        self.performance_scope = performance_scope
+        # The metrics of the most recent compaction of each entity
+        self.metrics = {}
+        # The reason the most recent compaction of each entity failed
+        self.failures = {}
+        self._stop = threading.Event()
+        self._thread = None
+        # Only one compaction runs at a time, whether in the background or called directly
+        self._lock = threading.Lock()
+
+    def run_once(self) -> List[CompactionMetrics]:
+        """
+        Compacts the blocks of each entity once
+
+        :return: List[CompactionMetrics]: The metrics of each entity which was compacted
+        """
+        results = []
+
+        with self._lock:
+            for entity_scope, entity_code in self.entities:
+                try:
+                    result = compact_blocks(self.block_store, entity_scope, entity_code, self.retention,
+                                            archive=self.archive, performance_scope=self.performance_scope)
+                except Exception as e:
+                    self.failures[(entity_scope, entity_code)] = str(e)
+                    continue
+                self.failures.pop((entity_scope, entity_code), None)
+                self.metrics[(entity_scope, entity_code)] = result
+                results.append(result)
+
+        return results
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def start(self) -> None:
+        """
+        Starts compacting in a background thread
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="BlockCompactor", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = None) -> None:
+        """
+        Stops compacting, waiting for any compaction in progress to finish
+
+        :param float timeout: The number of seconds to wait
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,139 @@
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, Timestamp
+
+from config.config import PerformanceConfiguration
+from misc import DAY_NS
+
+# The calendars loaded from the configuration, keyed by their path and week mask
+_loaded = {}
+
+
+class BusinessCalendar:
+    """
+    The business days on which portfolios are valued: every day other than the weekend and a list of holidays.
+
+    The dates passed to the vectorised methods are int64 nanoseconds since the epoch, as used by PeriodCalendar, and
+    any time of day is carried over.
+    """
+
+    def __init__(self, holidays: Iterable = (), weekmask: str = '1111100'):
+        """
+        :param Iterable holidays: The holidays, anything which can be converted to a date
+        :param str weekmask: Which days of the week, starting on Monday, are business days
+        """
+        self.weekmask = weekmask
+        holidays = pd.DatetimeIndex(pd.to_datetime(list(holidays), utc=True)).tz_convert(None)
+        self.holidays = np.unique(holidays.values.astype('datetime64[D]'))
+        self._busdaycal = np.busdaycalendar(weekmask=weekmask, holidays=self.holidays)
+
+    @classmethod
+    def from_file(cls, path: str, weekmask: str = '1111100') -> 'BusinessCalendar':
+        """
+        Loads the holidays from a file with one date per line. Only the first comma separated field of each line is
+        used, and blank lines or lines starting with '#' are ignored.
+
+        :param str path: The path of the file
+        :param str weekmask: Which days of the week, starting on Monday, are business days
+
+        :return: BusinessCalendar: The calendar
+        """
+        with open(path) as fp:
+            lines = [line.split(',')[0].strip() for line in fp]
+
+        return cls([line for line in lines if line != '' and not line.startswith('#')], weekmask)
+
+    @classmethod
+    def from_config(cls, calendar: 'BusinessCalendar' = None) -> 'BusinessCalendar':
+        """
+        Gets the business calendar to use
+
+        :param BusinessCalendar calendar: The calendar provided by the caller, if any
+
+        :return: BusinessCalendar: The calendar provided, otherwise one loaded from the HolidayCalendarPath
+        configuration item (with the weekend from the BusinessWeekMask item) or None if every day is a business day
+        """
+        if calendar is not None:
+            return calendar
+
+        path = PerformanceConfiguration.item('HolidayCalendarPath', None)
+        if path in (None, ''):
+            return None
+
+        key = (path, PerformanceConfiguration.item('BusinessWeekMask', '1111100'))
+        if key not in _loaded:
+            _loaded[key] = cls.from_file(*key)
+        return _loaded[key]
+
+    def _days(self, ns: np.ndarray) -> np.ndarray:
+        return (ns // DAY_NS).astype('datetime64[D]')
+
+    def is_business_day(self, dates) -> np.ndarray:
+        """
+        Whether each of a set of dates is a business day
+
+        :param dates: The dates as an array of datetime64[ns] or int64 nanoseconds since the epoch
+
+        :return: np.ndarray: True for each business day
+        """
+        return np.is_busday(self._days(np.asarray(dates).astype(np.int64)), busdaycal=self._busdaycal)
+
+    def rollback(self, dates) -> np.ndarray:
+        """
+        Moves each date which is not a business day back to the business day before it
+
+        :param dates: The dates as an array of datetime64[ns] or int64 nanoseconds since the epoch
+
+        :return: np.ndarray: The dates as int64 nanoseconds since the epoch
+        """
+        return self._roll(dates, 'backward')
+
+    def rollforward(self, dates) -> np.ndarray:
+        """
+        Moves each date which is not a business day forward to the business day after it
+
+        :param dates: The dates as an array of datetime64[ns] or int64 nanoseconds since the epoch
+
+        :return: np.ndarray: The dates as int64 nanoseconds since the epoch
+        """
+        return self._roll(dates, 'forward')
+
+    def _roll(self, dates, roll: str) -> np.ndarray:
+        ns = np.asarray(dates).astype(np.int64)
+        days = self._days(ns)
+        rolled = np.busday_offset(days, 0, roll=roll, busdaycal=self._busdaycal)
+        return ns + (rolled - days).astype(np.int64) * DAY_NS
+
+    def business_days(self, from_date: Timestamp, to_date: Timestamp) -> pd.DatetimeIndex:
+        """
+        Finds the business days in a range of dates
+
+        :param Timestamp from_date: The first date
+        :param Timestamp to_date: The last date
+
+        :return: pd.DatetimeIndex: The business days, at the same time of day as the first date
+        """
+        days = pd.date_range(from_date, to_date, freq='D')
+        return days[self.is_business_day(days.asi8)]
+
+    def to_business_days(self, df: DataFrame) -> DataFrame:
+        """
+        Keeps the rows of performance data which are on business days. The flows on other days are added to the
+        next business day, and any rows after the last business day are dropped.
+
+        :param DataFrame df: The performance data with date, key, mv and net columns
+
+        :return: DataFrame: The performance data on business days
+        """
+        if len(df) == 0:
+            return df
+
+        dates = pd.to_datetime(df['date'], utc=True)
+        rolled = pd.to_datetime(self.rollforward(dates.values), utc=True)
+
+        result = df.assign(date=rolled).groupby(['date', 'key'], sort=True).agg({'mv': 'last', 'net': 'sum'})
+        result = result.reset_index()
+
+        return result[result['date'] <= dates.max()][list(df.columns)].reset_index(drop=True)
@@ -0,0 +1,124 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple
+
+from lusidtools.lpt import lpt
+from pandas import Timestamp
+
+from misc import as_dates, now
+
+
+class ScopeChanges(NamedTuple):
+    """
+    The changes to the portfolios of a scope, fetched once from get_portfolio_changes
+    """
+    # The asAt date the changes were fetched since
+    since: Timestamp
+    # The time the changes were fetched, every change made before this is included
+    fetched: Timestamp
+    # The earliest effectiveAt date of the corrections to each portfolio, keyed by portfolio code
+    corrections: Dict[str, Timestamp]
+
+
+class ChangeFeed:
+    """
+    Fetches the changes to the portfolios of a scope once and answers get_changes for every portfolio in the scope
+    from them, rather than each portfolio fetching the changes to the whole scope.
+
+    A fetch of the changes since an asAt date, made at a later time, answers a query for the changes to a portfolio
+    between two asAt dates if the window is within the one fetched. The fetched changes may include corrections made
+    before the start of the window, so the correction date reported is never later than the true one.
+    """
+
+    def __init__(self, api, max_entries: int = 1024):
+        """
+        :param api: The LUSID api
+        :param int max_entries: The maximum number of scope and effectiveAt dates to keep the changes of, the least
+        recently used are dropped first
+        """
+        self.api = api
+        self.max_entries = max_entries
+        # The latest changes fetched for each scope and effectiveAt date, the least recently used first
+        self._changes = OrderedDict()
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hits = 0
+
+    def _find(self, key, last_asat: Timestamp, curr_asat: Timestamp) -> ScopeChanges:
+        # The latest fetch, if its window holds the window of the query
+        with self._lock:
+            changes = self._changes.get(key)
+            if changes is not None:
+                self._changes.move_to_end(key)
+
+        return changes if changes is not None and changes.since <= last_asat and curr_asat <= changes.fetched else None
+
+    def _keep(self, key, changes: ScopeChanges) -> None:
+        with self._lock:
+            self._changes[key] = changes
+            self._changes.move_to_end(key)
+
+            while len(self._changes) > self.max_entries:
+                evicted, _ = self._changes.popitem(last=False)
+                self._locks.pop(evicted, None)
+
+    def _fetch(self, scope: str, effective_at: Timestamp, since: Timestamp) -> ScopeChanges:
+        """
+        Fetches the changes to the portfolios of a scope
+
+        :param str scope: The scope of the portfolios
+        :param Timestamp effective_at: The effectiveAt date of the portfolios
+        :param Timestamp since: The asAt date to fetch the changes since
+
+        :return: ScopeChanges: The changes indexed by portfolio code
+        """
+        fetched = now()
+
+        def success(result) -> ScopeChanges:
+            return ScopeChanges(since, fetched,
+                                {c.entity_id.code: c.correction_effective_at for c in result.content.values})
+
+        def failure(error):
+            lpt.display_error(error)
+            exit()
+
+        self.calls += 1
+        return self.api.call.get_portfolio_changes(
+                  scope=scope,
+                  effective_at=effective_at,
+                  as_at=since
+               ).match(failure, success)
+
+    @as_dates
+    def get_changes(self, entity_scope: str, entity_code: str, last_date: Timestamp, last_asat: Timestamp,
+                    curr_asat: Timestamp) -> Timestamp:
+        """
+        Finds the earliest effectiveAt date a portfolio has changed on between two asAt dates
+
+        :param str entity_scope: The scope of the portfolio
+        :param str entity_code: The code of the portfolio
+        :param Timestamp last_date: The effectiveAt date of the portfolio to find the changes for
+        :param Timestamp last_asat: The asAt date to find the changes since
+        :param Timestamp curr_asat: The asAt date to find the changes up to
+
+        :return: Timestamp: The earliest date which changed, or None if the portfolio has not changed
+        """
+        if curr_asat <= last_asat:
+            return None
+
+        key = (entity_scope, last_date)
+
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+
+        # Portfolios waiting on the same fetch are answered from it once it completes
+        with lock:
+            changes = self._find(key, last_asat, curr_asat)
+            if changes is None:
+                changes = self._fetch(entity_scope, last_date, last_asat)
+                self._keep(key, changes)
+            else:
+                self.hits += 1
+
+        return changes.corrections.get(entity_code)
@@ -0,0 +1,170 @@
+from typing import List, Tuple, Union
+
+import pandas as pd
+from pandas import Timestamp
+
+from config.config import PerformanceConfiguration
+from interfaces import IBlockStore
+from misc import DAY_NS, ONE_DAY
+from pds import PerformanceDataPoint, PerformanceDataSet
+import block_ops
+
+
+class ChunkingPolicy:
+    """
+    Splits the blocks written to a block store into chunks aligned with a fixed calendar, so that no document holds
+    more than one chunk of performance and a restatement only rewrites the chunks it touches.
+
+    Chunks are either calendar months ('M'), calendar quarters ('Q') or a fixed number of days. Chunks of a number of
+    days are aligned with the epoch so that the same dates always fall in the same chunk.
+    """
+
+    def __init__(self, granularity: Union[str, int]):
+        """
+        :param Union[str, int] granularity: 'M' for monthly chunks, 'Q' for quarterly chunks or the number of days in
+        each chunk, either as an int or a string such as '10D'
+        """
+        if isinstance(granularity, str) and granularity.upper() in ('M', 'Q'):
+            self.granularity = granularity.upper()
+            self.days = None
+        else:
+            days = int(str(granularity).upper().rstrip('D'))
+            if days < 1:
+                raise ValueError(f"Invalid chunk granularity: '{granularity}'")
+            self.granularity = f"{days}D"
+            self.days = days
+
+    def __repr__(self):
+        return f"ChunkingPolicy('{self.granularity}')"
+
+    @classmethod
+    def from_config(cls, chunking: 'ChunkingPolicy' = None) -> 'ChunkingPolicy':
+        """
+        Gets the chunking policy to use
+
+        :param ChunkingPolicy chunking: The policy provided by the caller, if any
+
+        :return: ChunkingPolicy: The policy provided, otherwise the one set by the BlockChunking configuration item or
+        None if blocks are not chunked
+        """
+        if chunking is not None:
+            return chunking
+
+        granularity = PerformanceConfiguration.item('BlockChunking', None)
+        return None if granularity in (None, '', 0) else cls(granularity)
+
+    def chunk_start(self, date: Timestamp) -> Timestamp:
+        """
+        Finds the start of the chunk holding a date
+
+        :param Timestamp date: The date
+
+        :return: Timestamp: The first day of the chunk, at midnight
+        """
+        day = pd.Timestamp(date).normalize()
+
+        if self.days is not None:
+            offset = (day.value // DAY_NS) % self.days
+            return day - pd.Timedelta(days=int(offset))
+        if self.granularity == 'Q':
+            return day.replace(month=3 * ((day.month - 1) // 3) + 1, day=1)
+        return day.replace(day=1)
+
+    def next_start(self, date: Timestamp) -> Timestamp:
+        """
+        Finds the start of the chunk after the one holding a date
+
+        :param Timestamp date: The date
+
+        :return: Timestamp: The first day of the next chunk, at midnight
+        """
+        start = self.chunk_start(date)
+
+        if self.days is not None:
+            return start + pd.Timedelta(days=self.days)
+        return start + pd.DateOffset(months=3 if self.granularity == 'Q' else 1)
+
+    def bounds(self, from_date: Timestamp, to_date: Timestamp) -> List[Tuple[Timestamp, Timestamp]]:
+        """
+        Splits a range of dates into chunks
+
+        :param Timestamp from_date: The first date of the range
+        :param Timestamp to_date: The last date of the range
+
+        :return: List[Tuple[Timestamp, Timestamp]]: The first and last date of each chunk, clipped to the range. The
+        last date is the last day of the chunk, at midnight, unless the range ends earlier.
+        """
+        chunks = []
+        start = pd.Timestamp(from_date)
+
+        while start <= to_date:
+            next_start = self.next_start(start)
+            chunks.append((start, min(next_start - ONE_DAY, to_date)))
+            start = next_start
+
+        return chunks
+
+    def extract(self, block: PerformanceDataSet, from_date: Timestamp, to_date: Timestamp) -> List[PerformanceDataSet]:
+        """
+        Extracts the chunks of a block between two dates. The previous record of each chunk is the record of the block
+        before it, so the chunks link on from each other as the block did.
+
+        :param PerformanceDataSet block: The block
+        :param Timestamp from_date: The first date to extract
+        :param Timestamp to_date: The last date to extract
+
+        :return: List[PerformanceDataSet]: The chunks in effectiveAt order
+        """
+        chunks = []
+
+        for start, end in self.bounds(from_date, to_date):
+            # The chunk keeps any data point during its last day, even though it ends at midnight
+            chunk = block.extract(start, min(self.next_start(start) - block_ops.msec, to_date))
+            dates = chunk.get_columns()['date']
+            last = pd.Timestamp(dates[-1]).tz_localize('UTC') if len(dates) > 0 else end
+            chunk.to_date = max(end, last)
+            chunks.append(chunk)
+
+        return chunks
+
+    def split(self, block: PerformanceDataSet) -> List[PerformanceDataSet]:
+        """
+        Splits a block into chunks, a block which is already within a single chunk is kept as it is
+
+        :param PerformanceDataSet block: The block
+
+        :return: List[PerformanceDataSet]: The chunks in effectiveAt order
+        """
+        if len(self.bounds(block.from_date, block.to_date)) == 1:
+            return [block]
+
+        return self.extract(block, block.from_date, block.to_date)
+
+    def get_previous_record(self, block_store: IBlockStore, entity_scope: str, entity_code: str, date: Timestamp,
+                            asat: Timestamp, performance_scope: str = None) -> PerformanceDataPoint:
+        """
+        Finds the record which precedes a date. The chunks of a block share its asAt date, so rather than taking the
+        record from a single block the chunk before the date is combined with any blocks which overlap it.
+
+        :param IBlockStore block_store: The block store
+        :param str entity_scope: The scope of the entity
+        :param str entity_code: The code of the entity
+        :param Timestamp date: The effectiveAt date
+        :param Timestamp asat: The asAt date
+        :param str performance_scope: The scope of the block store to use
+
+        :return: PerformanceDataPoint: The latest record before the date
+        """
+        end = date - block_ops.msec
+        start = self.chunk_start(end)
+        blocks = block_store.find_blocks(entity_scope, entity_code, start, end, asat, performance_scope)
+        latest = None
+
+        for latest in block_ops.combine(blocks, False, start, end, asat):
+            pass
+
+        if latest is None:
+            # There is a gap before the date, so the record is in an earlier chunk
+            latest = block_store.get_previous_record(entity_scope, entity_code, date, asat, performance_scope)
+
+        return latest
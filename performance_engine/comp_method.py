@@ -1,10 +1,11 @@
 from __future__ import annotations
 from typing import Dict
 
-from pandas import Timestamp
+import numpy as np
+from pandas import Timestamp, DataFrame
 
 from interfaces import ICompositeMethod
-from pds import PerformanceDataPoint
+from pds import CompositeMatrix, PerformanceDataPoint
 from misc import *
 
 
@@ -55,6 +56,22 @@ class AssWt(ICompositeMethod):
         self.accum += item.weight * item.ror
         return self
 
+    @classmethod
+    def combine(cls, matrix: CompositeMatrix) -> DataFrame:
+        """
+        Calculates the weighted average return of the members on every date at once
+
+        :param CompositeMatrix matrix: The performance of the members aligned by date
+
+        :return: DataFrame: The performance of the composite, the return is NaN on dates where the members have no
+        weight
+        """
+        wt = matrix.weight.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ror = (matrix.weight * matrix.ror).sum(axis=1) / wt
+
+        return DataFrame({"date": matrix.dates, "wt": wt, "ror": ror}, columns=["date", "wt", "ror"])
+
 
 class EqWt(ICompositeMethod):
     """
@@ -103,6 +120,20 @@ class EqWt(ICompositeMethod):
         self.accum += item.ror
         return self
 
+    @classmethod
+    def combine(cls, matrix: CompositeMatrix) -> DataFrame:
+        """
+        Calculates the average return of the members on every date at once
+
+        :param CompositeMatrix matrix: The performance of the members aligned by date
+
+        :return: DataFrame: The performance of the composite
+        """
+        wt = matrix.present.sum(axis=1).astype(np.float64)
+        ror = matrix.ror.sum(axis=1) / wt
+
+        return DataFrame({"date": matrix.dates, "wt": wt, "ror": ror}, columns=["date", "wt", "ror"])
+
 
 class Agg(ICompositeMethod):
     """
@@ -151,3 +182,19 @@ class Agg(ICompositeMethod):
         # If the weight (typically beginning of day market value is 0, then this is all flows)
         self.net_accum += item.tmv if item.weight == 0 else item.flows
         return self
+
+    @classmethod
+    def combine(cls, matrix: CompositeMatrix) -> DataFrame:
+        """
+        Calculates the total market value and flows of the members on every date at once
+
+        :param CompositeMatrix matrix: The performance of the members aligned by date
+
+        :return: DataFrame: The performance of the composite
+        """
+        mv = matrix.tmv.sum(axis=1)
+        # Members without a weight on a date contribute all of their market value as flows
+        net = np.where(matrix.weight == 0, matrix.tmv, matrix.flows).sum(axis=1)
+
+        return DataFrame({"key": "TOTAL", "date": matrix.dates, "mv": mv, "net": net},
+                         columns=["key", "date", "mv", "net"])
@@ -0,0 +1,182 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import random
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from lusid.exceptions import ApiException
+from lusid.utilities import ApiClientFactory
+
+from config.config import PerformanceConfiguration
+
+# The status codes which are retried, a request is not found in Insights until shortly after it is issued
+RETRY_STATUS_CODES = {404, 429, 500, 502, 503, 504}
+
+
+class InsightsClient:
+    """
+    The responsibility of this class is to retrieve the requests made to LUSID from Insights. Requests share a pooled
+    session and a single executor which is reused across calls, and a request which is retried waits for its backoff
+    on an event loop rather than holding a worker.
+    """
+
+    def __init__(self, api_factory: ApiClientFactory, workers: int = None, retries: int = None,
+                 backoff: float = None, session: requests.Session = None):
+        """
+        :param ApiClientFactory api_factory: The API factory used to connect to LUSID, which the Insights url and
+        access token are taken from
+        :param int workers: The maximum number of requests made at once, defaults to the InsightsWorkers configuration
+        item or 25
+        :param int retries: The number of times a request is retried, defaults to the InsightsRetries configuration
+        item or 5
+        :param float backoff: The number of seconds to wait before the first retry, doubling for each retry after,
+        defaults to the InsightsBackoff configuration item or 0.5
+        :param requests.Session session: The session to make the requests with, defaults to a new session with a
+        connection pool for each worker
+        """
+        self.api_factory = api_factory
+        self.workers = int(workers or PerformanceConfiguration.item('InsightsWorkers', 25))
+        self.retries = int(retries if retries is not None else PerformanceConfiguration.item('InsightsRetries', 5))
+        self.backoff = float(backoff if backoff is not None else PerformanceConfiguration.item('InsightsBackoff', 0.5))
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+
+        self.session = session
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._loop = None
+        self._lock = threading.Lock()
+
+        # The number of seconds taken by each attempt to get a request
+        self.latencies = []
+        self.attempts = 0
+        self.retried = 0
+        self.failures = 0
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        Gets the event loop the requests are made from, starting it in its own thread the first time
+
+        :return: asyncio.AbstractEventLoop: The event loop
+        """
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="insights", daemon=True).start()
+            return self._loop
+
+    def _url(self, request_id: str) -> str:
+        # Get the API URL for the Insights API from the LUSID API URL
+        api_url = self.api_factory.api_client.configuration.host
+        return api_url.rstrip('api') + f"insights/api/requests/{request_id}/request"
+
+    def _get(self, request_id: str) -> Tuple[requests.Response, float]:
+        """
+        Makes a single attempt to get a request, this is called on the executor
+
+        :param str request_id: The id of the request
+
+        :return: Tuple[requests.Response, float]: The response and the number of seconds it took
+        """
+        start = time.perf_counter()
+        response = self.session.get(
+            url=self._url(request_id),
+            headers={"Authorization": f"Bearer {self.api_factory.api_client.configuration.access_token}"}
+        )
+        return response, time.perf_counter() - start
+
+    def _delay(self, retry: int) -> float:
+        """
+        :param int retry: The number of retries made so far
+
+        :return: float: The number of seconds to wait before the next retry, jittered so that requests retried
+        together do not return together
+        """
+        delay = self.backoff * 2 ** retry
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def get_request(self, request_id: str) -> Dict:
+        """
+        Gets a request from Insights, retrying with an exponential backoff if it is not yet available or the call fails
+
+        :param str request_id: The id of the request
+
+        :return: Dict: The request, holding its url and body
+        """
+        loop = asyncio.get_event_loop()
+
+        for retry in range(self.retries + 1):
+            response, latency = await loop.run_in_executor(self.executor, self._get, request_id)
+            self.attempts += 1
+            self.latencies.append(latency)
+
+            logging.debug(f"Status code {response.status_code} and response of {response} with headers "
+                          f"{response.headers} trying to enrich Log for {request_id}")
+
+            if 200 <= response.status_code <= 299:
+                return json.loads(response.text)
+
+            if response.status_code not in RETRY_STATUS_CODES or retry == self.retries:
+                break
+
+            self.retried += 1
+            await asyncio.sleep(self._delay(retry))
+
+        self.failures += 1
+        raise ApiException(status=response.status_code)
+
+    def get_requests(self, request_ids: Iterable[str]) -> List[Dict]:
+        """
+        Gets requests from Insights concurrently
+
+        :param Iterable[str] request_ids: The ids of the requests
+
+        :return: List[Dict]: The requests, in the order of their ids
+        """
+        async def gather():
+            return await asyncio.gather(*[self.get_request(request_id) for request_id in request_ids])
+
+        start = time.time()
+        result = asyncio.run_coroutine_threadsafe(gather(), self._event_loop()).result()
+        logging.debug(f"Getting {len(result)} requests from Insights took: {time.time() - start}")
+        return result
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        :return: Dict[str, float]: The number of attempts, retries and failures along with the mean, median, 95th
+        percentile and maximum latency of the attempts in seconds
+        """
+        latencies = np.array(self.latencies, dtype=np.float64)
+        if len(latencies) == 0:
+            latencies = np.zeros(1)
+
+        return {
+            "attempts": self.attempts,
+            "retries": self.retried,
+            "failures": self.failures,
+            "mean": float(latencies.mean()),
+            "p50": float(np.percentile(latencies, 50)),
+            "p95": float(np.percentile(latencies, 95)),
+            "max": float(latencies.max())
+        }
+
+    def close(self) -> None:
+        """
+        Stops the event loop and executor and closes the session
+        """
+        with self._lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+
+        self.executor.shutdown(wait=False)
+        self.session.close()
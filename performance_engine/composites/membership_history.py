@@ -0,0 +1,200 @@
+from datetime import datetime
+import json
+import os
+import threading
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from config.config import PerformanceConfiguration
+from misc import now
+
+# The key of a composite's membership history: the scope and the code of the Portfolio Group
+CompositeKey = Tuple[str, str]
+
+# A command enriched using Insights: portfolio_scope, portfolio_code, command_type, asat, effective_date
+EnrichedCommand = Tuple[str, str, str, datetime, datetime]
+
+
+class StoredCommand(NamedTuple):
+    """
+    A command issued to a Portfolio Group along with what it did, which never changes once the command is processed
+    """
+    request_id: str
+    description: str
+    processed_time: datetime
+    # The commands enriched from this one, there are none if the command can not be enriched
+    enriched: List[EnrichedCommand]
+
+
+class MembershipHistoryStore:
+    """
+    Holds the commands issued to each composite and what they did. The commands are synced incrementally, only those
+    processed since the last sync are fetched and enriched, so a lookup costs a single request for the commands
+    which are new rather than a request to Insights for every command ever issued.
+    """
+
+    def __init__(self):
+        # The commands of each key by request id, and the asAt date every command up to is known
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._locks = {}
+        self.fetched = 0
+        self.enriched = 0
+
+    @classmethod
+    def from_config(cls, store: 'MembershipHistoryStore' = None) -> 'MembershipHistoryStore':
+        """
+        Gets the membership history store to use
+
+        :param MembershipHistoryStore store: The store provided by the caller, if any
+
+        :return: MembershipHistoryStore: The store provided, otherwise a LocalMembershipHistoryStore if the
+        MembershipHistoryPath configuration item is set or an in memory store if it is not
+        """
+        if store is not None:
+            return store
+
+        path = PerformanceConfiguration.item('MembershipHistoryPath', None)
+        return cls() if path in (None, '') else LocalMembershipHistoryStore(path)
+
+    def _load(self, key: CompositeKey) -> Dict:
+        """
+        Gets the history of a key
+
+        :param CompositeKey key: The key
+
+        :return: Dict: The asAt date the history is synced to and the commands by request id
+        """
+        return self._entries.setdefault(key, {'synced': None, 'commands': {}})
+
+    def _save(self, key: CompositeKey) -> None:
+        """
+        Persists the history of a key, the in memory store has nothing to do
+
+        :param CompositeKey key: The key
+        """
+        pass
+
+    def synced(self, key: CompositeKey) -> datetime:
+        """
+        :param CompositeKey key: The key
+
+        :return: datetime: The asAt date every command of the key is known up to, or None if it has never been synced
+        """
+        return self._load(key)['synced']
+
+    def get_commands(self, key: CompositeKey, fetch: Callable, enrich: Callable,
+                     asat: datetime = None) -> List[StoredCommand]:
+        """
+        Gets the commands issued to a composite up to an asAt date, syncing the commands processed since the last sync
+        first if they are required
+
+        :param CompositeKey key: The key
+        :param Callable fetch: Takes the asAt dates (inclusive) to fetch commands from and to, either may be None, and
+        returns the ProcessedCommand issued between them
+        :param Callable enrich: Takes a list of ProcessedCommand and returns the EnrichedCommand of each keyed by
+        request id
+        :param datetime asat: The asAt date to get the commands at, defaults to now
+
+        :return: List[StoredCommand]: The commands processed at or before the asAt date, in the order they were
+        processed
+        """
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+
+        # A composite is only synced by one caller at a time, the others wait for its commands
+        with lock:
+            history = self._load(key)
+            synced = history['synced']
+
+            if synced is None or asat is None or asat > synced:
+                # The next sync fetches from when this one started, commands which are already held are skipped
+                sync_to = now() if asat is None else min(asat, now())
+                commands = [c for c in fetch(synced, asat) if request_id(c) not in history['commands']]
+                self.fetched += len(commands)
+
+                if len(commands) > 0:
+                    enriched = enrich(commands)
+                    self.enriched += len(commands)
+                    for command in commands:
+                        history['commands'][request_id(command)] = StoredCommand(
+                            request_id(command), command.description, command.processed_time,
+                            enriched.get(request_id(command), []))
+
+                history['synced'] = sync_to if synced is None else max(synced, sync_to)
+                self._save(key)
+
+            stored = sorted(history['commands'].values(), key=lambda c: c.processed_time)
+
+        return [c for c in stored if asat is None or c.processed_time <= asat]
+
+
+class LocalMembershipHistoryStore(MembershipHistoryStore):
+    """
+    Holds the membership history of composites in the local file system, with a file for each composite
+    """
+
+    def __init__(self, path: str = None):
+        """
+        :param str path: The directory to hold the files, defaults to the MembershipHistoryPath configuration item
+        """
+        super().__init__()
+        self.path = path or PerformanceConfiguration.item('MembershipHistoryPath', 'membership')
+
+    def _file(self, key: CompositeKey) -> str:
+        scope, code = key
+        return os.path.join(self.path, scope, f"{code}.json")
+
+    def _load(self, key: CompositeKey) -> Dict:
+        if key in self._entries:
+            return self._entries[key]
+
+        try:
+            with open(self._file(key), 'r') as fp:
+                saved = json.load(fp)
+        except FileNotFoundError:
+            return super()._load(key)  # Nothing has been synced yet
+
+        def as_datetime(value: str) -> datetime:
+            return None if value is None else datetime.fromisoformat(value)
+
+        history = self._entries[key] = {'synced': as_datetime(saved['synced']), 'commands': {}}
+
+        for c in saved['commands']:
+            history['commands'][c['request_id']] = StoredCommand(
+                c['request_id'], c['description'], as_datetime(c['processed_time']),
+                [(scope, code, command_type, as_datetime(asat), as_datetime(effective_date))
+                 for scope, code, command_type, asat, effective_date in c['enriched']])
+
+        return history
+
+    def _save(self, key: CompositeKey) -> None:
+        history = self._entries[key]
+
+        def as_str(value: datetime) -> str:
+            return None if value is None else value.isoformat()
+
+        saved = {
+            'synced': as_str(history['synced']),
+            'commands': [
+                {
+                    'request_id': c.request_id,
+                    'description': c.description,
+                    'processed_time': as_str(c.processed_time),
+                    'enriched': [(scope, code, command_type, as_str(asat), as_str(effective_date))
+                                 for scope, code, command_type, asat, effective_date in c.enriched]
+                }
+                for c in sorted(history['commands'].values(), key=lambda c: c.processed_time)]
+        }
+
+        os.makedirs(os.path.dirname(self._file(key)), exist_ok=True)
+        with open(self._file(key), 'w') as fp:
+            json.dump(saved, fp, indent=2)
+
+
+def request_id(command) -> str:
+    """
+    :param command: The ProcessedCommand
+
+    :return: str: The id of the request which issued the command, used to find the request in Insights
+    """
+    return ":".join(command.path.split("-")[:2])
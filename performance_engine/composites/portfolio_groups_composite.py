@@ -1,10 +1,7 @@
-import asyncio
 from collections import defaultdict
 from datetime import datetime, timedelta
-from functools import reduce
 import json
 import logging
-import requests
 import time
 from typing import Dict, Tuple, List
 import urllib.parse
@@ -14,12 +11,11 @@ from lusid.api import PortfolioGroupsApi
 from lusid.exceptions import ApiException
 from lusid.models import ResourceId, CreatePortfolioGroupRequest, ProcessedCommand, PortfolioGroup
 from lusid.utilities import ApiClientFactory
-from lusidtools.cocoon.async_tools import (
-    run_in_executor, start_event_loop_new_thread, stop_event_loop_new_thread, ThreadPool
-)
 from pandas import Timestamp
 import pytz
 
+from composites.insights_client import InsightsClient
+from composites.membership_history import MembershipHistoryStore, request_id
 from interfaces import IComposite
 from misc import as_dates
 
@@ -49,104 +45,40 @@ class PortfolioGroupComposite(IComposite):
     Portfolio Group
     """
 
-    def __init__(self, api_factory: ApiClientFactory):
+    def __init__(self, api_factory: ApiClientFactory, membership_store: MembershipHistoryStore = None,
+                 insights_client: InsightsClient = None):
         """
         :param ApiClientFactory api_factory: The API factory to use to connect to LUSID
+        :param MembershipHistoryStore membership_store: The store to hold the enriched commands of each composite,
+        defaults to the store from the configuration
+        :param InsightsClient insights_client: The client to get the requests which issued each command from
+        Insights, defaults to a client using the api_factory
         """
         self.api_factory = api_factory
+        self.membership_store = MembershipHistoryStore.from_config(membership_store)
+        self.insights_client = insights_client or InsightsClient(api_factory)
 
-    async def _enrich_commands_using_insights(self, commands: List[ProcessedCommand],
-                                              **kwargs) -> List[Tuple[str, str, str, Timestamp, Timestamp]]:
-        """
-        The responsibility of this function is to enrich a list of ProcessedCommand with details about the command.
-
-        :param List[ProcessedCommand] commands: The commands to enrich
-
-        :return: List[Tuple[str, str, str, Timestamp, Timestamp]] enriched_commands: The enriched commands
-        """
-
-        # The set of commands which can be enriched
-        enrichable_commands = {
-            CommandDescriptions.add_command,
-            CommandDescriptions.remove_command,
-            CommandDescriptions.create_command
-        }
-
-        # Log a warning if a command is provided which can not be enriched
-        [
-            logging.warning(
-                f"Command of type {command.description} with requestId {command.path} will not be enriched as it"
-                f" is not in the enrichable commands of {str(enrichable_commands)}")
-            for command in commands if command.description not in enrichable_commands
-        ]
-
-        # Enrich the commands
-        enriched_commands = await asyncio.gather(
-            *[
-                self._enrich_single_command_using_insights(
-                    request_id=":".join(command.path.split("-")[:2]),
-                    command_type=command.description,
-                    asat=command.processed_time,
-                    **kwargs,
-                )
-                for command in commands if command.description.lower() in enrichable_commands
-            ],
-            return_exceptions=False,
-        )
-
-        # Some commands can return multiple results, this flattens the enriched commands
-        enriched_commands = list(reduce(lambda a, b: a + b, enriched_commands))
-
-        return enriched_commands
-
-    @run_in_executor
-    def _enrich_single_command_using_insights(self, request_id: str, command_type: str, asat: Timestamp,
-                                              **kwargs) -> List[Tuple[str, str, str, Timestamp, Timestamp]]:
+    @staticmethod
+    def _enrich_single_command(request: Dict, command_type: str,
+                               asat: Timestamp) -> List[Tuple[str, str, str, Timestamp, Timestamp]]:
         """
-        The responsibility of this function is that given a request_id and command_type it determines
-        which portfolio was added or removed from a group and at what effectiveAt time.
+        The responsibility of this function is that given the request for a command from Insights and the
+        command_type it determines which portfolio was added or removed from a group and at what effectiveAt time.
 
-        :param str request_id: The request_id for the command
+        :param Dict request: The request which issued the command, from Insights
         :param str command_type: The type of command issued
         :param Timestamp asat: The asAt date of the command
 
         :return: List[Tuple[str, str, str, Timestamp, Timestamp]] portfolio_scope, portfolio_code, command_type,
         asat, effective_date: The identifier for the Portfolio and command type, asAt and effectiveAt date of the command
         """
-        start = time.time()
-        # Get the API URL for the Insights API from the LUSID API URL
-        api_url = self.api_factory.api_client.configuration.host
-        request_url = api_url.rstrip('api') + f"insights/api/requests/{request_id}/request"
-
-        # Get the request payload, it might not be available straight away if the command was just issued
-        status_code = 404
-        retries = 0
-        while status_code == 404:
-
-            raw_response = requests.get(
-                url=request_url,
-                headers={"Authorization": f"Bearer {self.api_factory.api_client.configuration.access_token}"}
-            )
-            status_code = raw_response.status_code
-            logging.debug(f"Status code {raw_response.status_code} and response of {raw_response} with headers "
-                          f"{raw_response.headers} trying to enrich Log for {request_id}")
-
-            if status_code == 404 and retries < 5:
-                retries += 1
-                time.sleep(2)
-            elif 200 <= status_code <= 299:
-                break
-            else:
-                raise ApiException(status=status_code)
-
-        response = json.loads(raw_response.text)
-        request_url = response["url"]
+        request_url = request["url"]
         url_split = request_url.split("/")
         command_type = command_type.lower()
         # Depending on the command type, parse out the relevant information from the request
         if command_type == CommandDescriptions.add_command:
             effective_date = dateutil.parser.parse(urllib.parse.unquote(url_split[-1].split("=")[1]))
-            request_body = json.loads(response["body"])
+            request_body = json.loads(request["body"])
             portfolio_scopes = [request_body["scope"]]
             portfolio_codes = [request_body["code"]]
 
@@ -159,7 +91,7 @@ class PortfolioGroupComposite(IComposite):
 
         elif command_type == CommandDescriptions.create_command:
             # This command is converted into 0 or more Add portfolio to group commands which have the same impact
-            request_body = json.loads(response["body"])
+            request_body = json.loads(request["body"])
             effective_date = dateutil.parser.parse(request_body["created"])
             if "values" in request_body:
                 portfolio_scopes = [resource_id["scope"] for resource_id in request_body["values"]]
@@ -169,43 +101,107 @@ class PortfolioGroupComposite(IComposite):
                 portfolio_codes = []
             command_type = CommandDescriptions.add_command
 
-        logging.debug(f"Getting Insight Log for {request_id} Took: {time.time() - start}")
-
         return [
             (portfolio_scope, portfolio_code, command_type, asat, effective_date)
             for portfolio_scope, portfolio_code in zip(portfolio_scopes, portfolio_codes)
         ]
 
-    def _get_portfolio_group_membership_history(self, composite_scope: str, composite_code: str,
-                                                asat: Timestamp = None) -> Dict[str, List[Tuple[
-                                                str, Timestamp, Timestamp]]]:
+    def _fetch_commands(self, composite_scope: str, composite_code: str, from_asat: Timestamp = None,
+                        to_asat: Timestamp = None) -> List[ProcessedCommand]:
         """
-        The responsibility of this function is to retrieve the membership history of all Portfolios associated with the
-        Portfolio Group
+        The responsibility of this function is to retrieve the commands issued to the Portfolio Group between two asAt
+        datetimes
 
         :param str composite_scope: The scope of the Porfolio Group which represents the composite in LUSID
         :param str composite_code: The code of the Portfolio Group which represents the composite in LUSID. Together
         with the scope this uniquely identifies the Portfolio Group
-        :param Timestamp asat: The asAt datetime at which to look at the group membership
+        :param Timestamp from_asat: The asAt datetime (inclusive) to retrieve the commands from, all commands are
+        retrieved if this is None
+        :param Timestamp to_asat: The asAt datetime (inclusive) to retrieve the commands to, there is no upper bound if
+        this is None
 
-        :return: Dict[str, List[Tuple[str, Timestamp, Timestamp]]] membership_history: The membership history of for
-        each Portfolio
+        :return: List[ProcessedCommand]: The commands issued to the Portfolio Group
         """
         keyword_arguments = {}
 
-        if asat is not None:
-            keyword_arguments["to_as_at"] = asat
+        if from_asat is not None:
+            keyword_arguments["from_as_at"] = from_asat
+
+        if to_asat is not None:
+            keyword_arguments["to_as_at"] = to_asat
 
         start = time.time()
 
-        # Get the commands issued to the Portfolio Group
         commands = self.api_factory.build(PortfolioGroupsApi).get_portfolio_group_commands(
             scope=composite_scope,
             code=composite_code,
             **keyword_arguments
         ).values
 
-        logging.debug(f"Getting Portfolio Commands took: {time.time() - start}")
+        logging.debug(f"Getting {len(commands)} Portfolio Commands took: {time.time() - start}")
+
+        return commands
+
+    def _enrich_commands(self, commands: List[ProcessedCommand]) -> Dict[str, List[Tuple[str, str, str, Timestamp,
+                                                                                        Timestamp]]]:
+        """
+        The responsibility of this function is to enrich a list of ProcessedCommand with details about the command,
+        using the requests which issued them from Insights.
+
+        :param List[ProcessedCommand] commands: The commands to enrich
+
+        :return: Dict[str, List[Tuple[str, str, str, Timestamp, Timestamp]]] enriched_commands: The enriched commands
+        keyed by the request id of the command they were enriched from
+        """
+        # The set of commands which can be enriched
+        enrichable_commands = {
+            CommandDescriptions.add_command,
+            CommandDescriptions.remove_command,
+            CommandDescriptions.create_command
+        }
+
+        # Log a warning if a command is provided which can not be enriched
+        [
+            logging.warning(
+                f"Command of type {command.description} with requestId {command.path} will not be enriched as it"
+                f" is not in the enrichable commands of {str(enrichable_commands)}")
+            for command in commands if command.description not in enrichable_commands
+        ]
+
+        enrichable = [command for command in commands if command.description.lower() in enrichable_commands]
+
+        # Get the requests concurrently, some commands can return multiple results, these are kept together under the
+        # command's request id
+        insights_requests = self.insights_client.get_requests([request_id(command) for command in enrichable])
+
+        return {
+            request_id(command): self._enrich_single_command(request, command.description, command.processed_time)
+            for command, request in zip(enrichable, insights_requests)
+        }
+
+    def _get_portfolio_group_membership_history(self, composite_scope: str, composite_code: str,
+                                                asat: Timestamp = None) -> Dict[str, List[Tuple[
+                                                str, Timestamp, Timestamp]]]:
+        """
+        The responsibility of this function is to retrieve the membership history of all Portfolios associated with the
+        Portfolio Group. Only the commands issued since the membership history was last synced are retrieved and
+        enriched, the rest are read from the membership store.
+
+        :param str composite_scope: The scope of the Porfolio Group which represents the composite in LUSID
+        :param str composite_code: The code of the Portfolio Group which represents the composite in LUSID. Together
+        with the scope this uniquely identifies the Portfolio Group
+        :param Timestamp asat: The asAt datetime at which to look at the group membership
+
+        :return: Dict[str, List[Tuple[str, Timestamp, Timestamp]]] membership_history: The membership history of for
+        each Portfolio
+        """
+        # Get the commands issued to the Portfolio Group, along with what they did
+        commands = self.membership_store.get_commands(
+            key=(composite_scope, composite_code),
+            fetch=lambda from_asat, to_asat: self._fetch_commands(composite_scope, composite_code, from_asat, to_asat),
+            enrich=self._enrich_commands,
+            asat=asat
+        )
 
         # Filter out all those before the most recent creation event, this handles deletion and re-creation of the group
         most_recent_creation = max([
@@ -217,27 +213,13 @@ class PortfolioGroupComposite(IComposite):
         if CommandDescriptions.delete_command in set([command.description.lower() for command in commands]):
             raise ValueError("Portfolio Group does not exist")
 
-        # Enrich the commands using Insights
-        loop = start_event_loop_new_thread()
-        start = time.time()
-        enriched_commands = asyncio.run_coroutine_threadsafe(
-            self._enrich_commands_using_insights(
-                commands=commands,
-                thread_pool=ThreadPool(25).thread_pool,
-            ),
-            loop,
-        ).result()
-
         # Construct the membership history from the enriched commands
         membership_history = defaultdict(list)
 
-        for enriched_command in enriched_commands:
+        for enriched_command in [enriched for command in commands for enriched in command.enriched]:
             membership_history[f"{enriched_command[0]}_{enriched_command[1]}"].append(
                 (enriched_command[2], enriched_command[3], enriched_command[4]))
 
-        logging.debug(f"Getting all Insights for {len(commands)} commands took: {time.time() - start}")
-        stop_event_loop_new_thread(loop)
-
         return membership_history
 
     @staticmethod
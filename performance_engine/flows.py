@@ -1,31 +1,64 @@
+import threading
+from typing import Callable, Dict, NamedTuple
+
 import pandas as pd
 import numpy as np
+from pandas import Timestamp
 
 from lusidtools.lpt import lpt
-from misc import as_dates
-from collections import defaultdict
+from misc import as_dates, concurrently
 
-@as_dates
-def get_flows(api,scope,portfolio,config,from_date,to_date,asat):
+TRADE_TO_PORTFOLIO_RATE = 'Transaction/default/TradeToPortfolioRate'
+
+
+def to_series(flows) -> pd.Series:
+    """
+    Converts flows to a Series of the net flow on each date
+
+    :param flows: The flows as a Series or a dictionary keyed by date
+
+    :return: pd.Series: The flows indexed by UTC date, in date order
+    """
+    if isinstance(flows, pd.Series):
+        return flows.sort_index()
+
+    return pd.Series(list(flows.values()), index=pd.to_datetime(list(flows.keys()), utc=True),
+                     dtype=float).sort_index()
+
+
+def net_flows(transactions, ext_flow_types) -> pd.Series:
+    """
+    Finds the net external flow on each date. Only the total level is supported, the flow amount is the
+    total_consideration of each transaction converted to the portfolio currency.
+
+    :param transactions: The transactions from build_transactions
+    :param ext_flow_types: The transaction types which are external flows
+
+    :return: pd.Series: The net flow on each transaction date, in date order
+    """
+    types = set(ext_flow_types)
+    txns = [t for t in transactions if t.type in types]
+
+    if len(txns) == 0:
+        return pd.Series([], index=pd.DatetimeIndex([], tz='UTC'), dtype=float)
 
+    def trade_to_portfolio_rate(txn) -> float:
+        rate = txn.properties.get(TRADE_TO_PORTFOLIO_RATE)
+        return rate.value.metric_value.value if rate else np.nan
+
+    amounts = np.array([t.total_consideration.amount for t in txns], dtype=float)
+    exchange_rates = np.array([t.exchange_rate for t in txns], dtype=float)
+    trade_rates = np.array([trade_to_portfolio_rate(t) for t in txns], dtype=float)
+    rates = np.where(np.isnan(trade_rates), exchange_rates, trade_rates / exchange_rates)
+
+    flows = pd.Series(np.round(amounts * rates, 2), index=pd.to_datetime([t.transaction_date for t in txns], utc=True))
+    return flows.groupby(level=0).sum()
+
+
+def _build_flows(api, scope, portfolio, config, from_date: Timestamp, to_date: Timestamp, asat: Timestamp) -> pd.Series:
     # Called if build_transactions() succeeds
     def success(result):
-        accum = defaultdict(float)
-
-        for txn in result.content.values:
-            # Proof-of-concept flow logic
-            # TOTAL level only. Flow amount is in the total_consideration field
-            # White-list of valid codes provided in the config
-            if txn.type in config.ext_flow_types:
-               rate = txn.properties.get('Transaction/default/TradeToPortfolioRate')
-               
-               if rate:
-                   rate = rate.value.metric_value.value / txn.exchange_rate
-               else:
-                   rate = txn.exchange_rate
-               accum[txn.transaction_date] += np.round(txn.total_consideration.amount * rate,2)
-
-        return accum
+        return net_flows(result.content.values, config.ext_flow_types)
 
     def failure(error):
         lpt.display_error(error)
@@ -43,17 +76,154 @@ def get_flows(api,scope,portfolio,config,from_date,to_date,asat):
                  as_at = asat
            ).match(failure,success)
 
+
+@as_dates
+def get_flows(api, scope, portfolio, config, from_date: Timestamp, to_date: Timestamp, asat: Timestamp,
+              chunk_days: int = None, workers: int = None) -> pd.Series:
+    """
+    Gets the net external flow on each date of a portfolio. The window is split into chunks of days which are
+    fetched concurrently.
+
+    :param api: The LUSID api
+    :param str scope: The scope of the portfolio
+    :param str portfolio: The code of the portfolio
+    :param config: The configuration of the source, holding the ext_flow_types
+    :param Timestamp from_date: The first effectiveAt date
+    :param Timestamp to_date: The last effectiveAt date
+    :param Timestamp asat: The asAt date
+    :param int chunk_days: The number of days in each chunk, defaults to the flow_chunk_days item of the configuration
+    or 90
+    :param int workers: The maximum number of chunks fetched at once, defaults to the flow_workers item of the
+    configuration or 4
+
+    :return: pd.Series: The net flow on each date, in date order
+    """
+    chunk = pd.Timedelta(days=int(chunk_days or config.get('flow_chunk_days', 90)))
+    workers = int(workers or config.get('flow_workers', 4))
+
+    starts = list(pd.date_range(from_date, to_date, freq=chunk)) if from_date <= to_date else []
+    # Each chunk ends just before the next starts, the transactions are filtered to it as the end date is inclusive
+    bounds = [(start, min(start + chunk - pd.Timedelta(microseconds=1), to_date)) for start in starts]
+
+    def fetch(bound) -> pd.Series:
+        flows = _build_flows(api, scope, portfolio, config, bound[0], bound[1], asat)
+        return flows[(flows.index >= bound[0]) & (flows.index <= bound[1])]
+
+    chunks = concurrently(fetch, bounds, workers)
+
+    if len(chunks) == 0:
+        return net_flows([], [])
+
+    return pd.concat(chunks).groupby(level=0).sum()
+
+
+class CachedFlows(NamedTuple):
+    """
+    The flows of a portfolio over a window of dates, at an asAt date
+    """
+    asat: Timestamp
+    from_date: Timestamp
+    to_date: Timestamp
+    flows: pd.Series
+
+
+class FlowCache:
+    """
+    Caches the daily net flows of each portfolio at the latest asAt date they were fetched at. At a later asAt date
+    the flows before the earliest date which has changed since are reused and only the flows from there are fetched.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @as_dates
+    def get_flows(self, fetch: Callable, get_changes: Callable, scope: str, portfolio: str, from_date: Timestamp,
+                  to_date: Timestamp, asat: Timestamp) -> pd.Series:
+        """
+        Gets the flows of a portfolio, fetching only those which are not in the cache
+
+        :param Callable fetch: Fetches the flows between two dates at the asAt date
+        :param Callable get_changes: Takes the last date and asAt date of the cached flows and returns the earliest
+        date which has changed since, or None
+        :param str scope: The scope of the portfolio
+        :param str portfolio: The code of the portfolio
+        :param Timestamp from_date: The first effectiveAt date
+        :param Timestamp to_date: The last effectiveAt date
+        :param Timestamp asat: The asAt date
+
+        :return: pd.Series: The net flow on each date, in date order
+        """
+        with self._lock:
+            cached = self._entries.get((scope, portfolio))
+
+        fetch_from = from_date
+        known = None
+
+        if cached is not None and cached.asat <= asat and cached.from_date <= from_date <= cached.to_date:
+            # The cached flows are valid up to the end of their window or the earliest date changed since
+            valid_to = min(cached.to_date, to_date) + pd.Timedelta(microseconds=1)
+            if cached.asat < asat:
+                changed = get_changes(cached.to_date, cached.asat, asat)
+                if changed is not None:
+                    valid_to = min(valid_to, changed)
+
+            if valid_to > from_date:
+                known = cached.flows[(cached.flows.index >= from_date) & (cached.flows.index < valid_to)]
+                fetch_from = valid_to
+
+        if known is None:
+            self.misses += 1
+            flows = to_series(fetch(from_date, to_date))
+        elif fetch_from > to_date:
+            self.hits += 1
+            flows = known
+        else:
+            self.hits += 1
+            fetched = to_series(fetch(fetch_from, to_date))
+            flows = pd.concat([known, fetched[fetched.index >= fetch_from]])
+
+        with self._lock:
+            latest = self._entries.get((scope, portfolio))
+            if latest is None or latest.asat <= asat:
+                self._entries[(scope, portfolio)] = CachedFlows(asat, from_date, to_date, flows)
+
+        return flows
+
+
 class FlowCursor():
+    """
+    Accumulates the flows up to each of a series of dates, from a prefix sum of the flows
+    """
     def __init__(self,flows):
-        self.iter = iter(sorted(flows.items()))
-        self.curr = next(self.iter,None)
+        """
+        :param flows: The flows as a Series or a dictionary keyed by date
+        """
+        flows = to_series(flows)
+        self.dates = flows.index.asi8
+        self.totals = np.cumsum(flows.values)
+        # The number of flows accumulated so far
+        self.taken = 0
+
+    def _total(self, taken: int) -> float:
+        return self.totals[taken - 1] if taken > 0 else 0.0
 
     @as_dates
     def upto(self,date):
-        accum = 0.0
+        """
+        Accumulates the flows after the previous date and up to a date
+
+        :param Timestamp date: The date
+
+        :return: float: The sum of the flows
+        """
+        taken = max(int(np.searchsorted(self.dates, pd.Timestamp(date).value, side='right')), self.taken)
 
-        while self.curr != None and self.curr[0] <= date:
-            accum += self.curr[1]
-            self.curr=next(self.iter,None)
+        if taken == self.taken:
+            return 0.0
 
+        accum = self._total(taken) - self._total(self.taken)
+        self.taken = taken
         return accum
@@ -2,10 +2,12 @@ from __future__ import annotations
 import abc
 from typing import List, Dict, Tuple
 
+import numpy as np
 from pandas import Timestamp, DataFrame
 
+from block_stores.checkpoint_index import Checkpoint
 from misc import as_dates
-from pds import PerformanceDataSet, PerformanceDataPoint
+from pds import CompositeMatrix, PerformanceDataSet, PerformanceDataPoint
 
 
 class IBlockStore(metaclass=abc.ABCMeta):
@@ -71,6 +73,33 @@ class IBlockStore(metaclass=abc.ABCMeta):
         """
         raise NotImplementedError
 
+    def add_blocks(self, entity_scope: str, entity_code: str, blocks: Dict[str, PerformanceDataSet],
+                   performance_scope: str = None) -> Tuple[Dict[str, PerformanceDataSet], Dict[str, str]]:
+        """
+        This adds a batch of blocks to the BlockStore. A failure to add one block does not prevent the others from
+        being added. By default each block is added with add_block.
+
+        :param str entity_scope: The scope of the entity to get blocks for. The meaning of this is dependent upon
+        the implementation
+        :param str entity_code: The code of the entity to get blocks for. Together with the entity_scope this uniquely
+        identifies the entity.
+        :param Dict[str, PerformanceDataSet] blocks: The blocks to add to the BlockStore keyed by a correlation id
+        :param str performance_scope: The scope of the BlockStore to use, the meaning of this depends on the implementation
+
+        :return: Tuple[Dict[str, PerformanceDataSet], Dict[str, str]]: The blocks which were added along with the asAt
+        time of the operation and the reason for each block which could not be added, both keyed by correlation id
+        """
+        values = {}
+        failed = {}
+
+        for correlation_id, block in blocks.items():
+            try:
+                values[correlation_id] = self.add_block(entity_scope, entity_code, block, performance_scope)
+            except Exception as e:
+                failed[correlation_id] = str(e)
+
+        return values, failed
+
     @as_dates
     @abc.abstractmethod
     def find_blocks(self, entity_scope: str, entity_code: str, from_date: Timestamp, to_date: Timestamp, asat: Timestamp,
@@ -91,6 +120,77 @@ class IBlockStore(metaclass=abc.ABCMeta):
         """
         raise NotImplementedError
 
+    @as_dates
+    def find_block_metadata(self, entity_scope: str, entity_code: str, from_date: Timestamp, to_date: Timestamp,
+                            asat: Timestamp, performance_scope: str = None) -> List:
+        """
+        Returns the metadata of the PerformanceDataSet blocks in a given bi-temporal period without retrieving the
+        blocks. This is used to work out which blocks are required before retrieving them with fetch_blocks. By
+        default the blocks themselves are used as their metadata.
+
+        :param str entity_scope: The scope of the entity to get blocks for. The meaning of this is dependent upon
+        the implementation
+        :param str entity_code: The code of the entity to get blocks for. Together with the entity_scope this uniquely
+        identifies the entity.
+        :param Timestamp from_date: The effectiveAt start date of the period
+        :param Timestamp to_date: The effectiveAt end date of the period
+        :param Timestamp asat: The asAt date of the period
+        :param str performance_scope: The scope of the block store to use, its meaning is dependent on the block store implementation
+
+        :return: List: The metadata of each relevant block, each has a from_date, to_date and asat
+        """
+        return self.find_blocks(entity_scope, entity_code, from_date, to_date, asat, performance_scope)
+
+    def fetch_blocks(self, entity_scope: str, entity_code: str, metadata: List,
+                     performance_scope: str = None) -> List[PerformanceDataSet]:
+        """
+        Retrieves the blocks for metadata returned by find_block_metadata
+
+        :param str entity_scope: The scope of the entity to get blocks for. The meaning of this is dependent upon
+        the implementation
+        :param str entity_code: The code of the entity to get blocks for. Together with the entity_scope this uniquely
+        identifies the entity.
+        :param List metadata: The metadata of the blocks to retrieve
+        :param str performance_scope: The scope of the block store to use, its meaning is dependent on the block store implementation
+
+        :return: List[PerformanceDataSet]: The blocks in the same order as the metadata
+        """
+        return list(metadata)
+
+    @as_dates
+    def get_checkpoints(self, entity_scope: str, entity_code: str, dates: List[Timestamp], asat: Timestamp,
+                        locked: bool, performance_scope: str = None) -> Dict[Timestamp, Checkpoint]:
+        """
+        Finds the cumulative state of an entity at period ends without retrieving the blocks covering the periods in
+        between. Only the dates which can be answered are returned, by default none are.
+
+        :param str entity_scope: The scope of the entity to get checkpoints for. The meaning of this is dependent upon
+        the implementation
+        :param str entity_code: The code of the entity to get checkpoints for. Together with the entity_scope this
+        uniquely identifies the entity.
+        :param List[Timestamp] dates: The dates of the checkpoints
+        :param Timestamp asat: The asAt date
+        :param bool locked: Whether or not the period is locked
+        :param str performance_scope: The scope of the block store to use, its meaning is dependent on the block store implementation
+
+        :return: Dict[Timestamp, Checkpoint]: The checkpoint of each date which can be answered
+        """
+        return {}
+
+    def remove_blocks(self, entity_scope: str, entity_code: str, blocks: List[PerformanceDataSet],
+                      performance_scope: str = None) -> None:
+        """
+        Removes blocks from the BlockStore, e.g. once they have been compacted. Not every BlockStore supports this.
+
+        :param str entity_scope: The scope of the entity to remove blocks for. The meaning of this is dependent upon
+        the implementation
+        :param str entity_code: The code of the entity to remove blocks for. Together with the entity_scope this
+        uniquely identifies the entity.
+        :param List[PerformanceDataSet] blocks: The blocks to remove, as returned by get_blocks
+        :param str performance_scope: The scope of the block store to use, its meaning is dependent on the block store implementation
+        """
+        raise NotImplementedError
+
     @as_dates
     def get_previous_record(self, entity_scope: str, entity_code: str, date: Timestamp,
                             asat: Timestamp, performance_scope: str = None) -> PerformanceDataPoint:
@@ -197,6 +297,32 @@ class ICompositeMethod(metaclass=abc.ABCMeta):
         """
         raise NotImplementedError
 
+    @classmethod
+    def combine(cls, matrix: CompositeMatrix) -> DataFrame:
+        """
+        Calculates the performance of the composite on every date at once from the aligned performance of its
+        members. Methods override this with reductions over the arrays of the matrix, by default each date is
+        calculated by accumulating a PerformanceDataPoint for each member with performance on it.
+
+        :param CompositeMatrix matrix: The performance of the members aligned by date
+
+        :return: DataFrame: The performance of the composite, with a row for each date
+        """
+        records = []
+
+        for row, date in enumerate(matrix.dates):
+            method = cls(date)
+            for col in np.flatnonzero(matrix.present[row]):
+                method.accumulate(PerformanceDataPoint(
+                    date,
+                    tmv=matrix.tmv[row, col],
+                    flows=matrix.flows[row, col],
+                    weight=matrix.weight[row, col],
+                    ror=matrix.ror[row, col]))
+            records.append(method.result())
+
+        return DataFrame.from_records(records)
+
 
 class IComposite(metaclass=abc.ABCMeta):
     """
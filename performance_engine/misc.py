@@ -2,9 +2,13 @@ import re
 import pandas as pd
 import os
 import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
 
 ONE_DAY=datetime.timedelta(days=1)
 NO_DAYS=datetime.timedelta(days=0)
+# The number of nanoseconds in a day
+DAY_NS=86400 * 10 ** 9
 
 # YYYY-MM-DD matching expression
 rexp = re.compile(r"\d{4}-\d{2}-\d{2}")
@@ -66,3 +70,21 @@ def nicer(df):
         return df[col].dt.date if str(df[col].dtype) == 'datetime64[ns, UTC]' else df[col]
 
     return pd.DataFrame({ col : tweak(col) for col in df.columns })[df.columns]
+
+# Apply a function to each of a list of items using a pool of threads
+def concurrently(fn: Callable, items: List, workers: int) -> List:
+    """
+    Applies a function to each of a list of items using a pool of threads, or in turn if there is only one worker
+    or one item
+
+    :param Callable fn: The function
+    :param List items: The items
+    :param int workers: The maximum number of items processed at once
+
+    :return: List: The result for each item, in the order of the items
+    """
+    if workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as executor:
+        return list(executor.map(fn, items))
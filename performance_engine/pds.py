@@ -1,4 +1,4 @@
-from typing import Iterator, Callable, Dict
+from typing import Iterator, Callable, Dict, List, NamedTuple, Tuple
 
 import numpy as np
 import pandas as pd
@@ -184,38 +184,570 @@ class PerformanceDataPoint:
         return round_dict_values(self.__dict__) == round_dict_values(other.__dict__)
 
 
+def _as_datetime64(date) -> np.datetime64:
+    """
+    Converts a date into the representation used by the date column of a PerformanceDataSet, this is nanoseconds
+    since the epoch in UTC
+
+    :param date: The date to convert
+
+    :return: np.datetime64: The converted date
+    """
+    return np.datetime64(pd.Timestamp(date).value, 'ns')
+
+
+def _as_datetime64_array(dates) -> np.ndarray:
+    """
+    Converts a sequence of dates into the representation used by the date column of a PerformanceDataSet
+
+    :param dates: The dates to convert
+
+    :return: np.ndarray: The converted dates
+    """
+    return pd.DatetimeIndex(pd.to_datetime(dates, utc=True)).tz_convert(None).values
+
+
+def attribute(date_index: np.ndarray, keys, mvs, nets, count: int,
+              previous: Tuple[float, Dict[str, float]]) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """
+    Calculates the unlinked fields of a series of PerformanceDataPoint from the market value and flows of their
+    AttributionDataPoint. This is the vectorised equivalent of PerformanceDataPoint.from_values without the linking.
+
+    :param np.ndarray date_index: The index of the PerformanceDataPoint (in chronological order) that each
+    AttributionDataPoint belongs to
+    :param keys: The key of each AttributionDataPoint, values for the same date and key are summed
+    :param mvs: The end of day market value of each AttributionDataPoint
+    :param nets: The flows of each AttributionDataPoint
+    :param int count: The number of PerformanceDataPoint
+    :param Tuple[float, Dict[str, float]] previous: The total market value and the market value by key of the
+    PerformanceDataPoint preceding the series
+
+    :return: Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]: The tmv, flows, weight, pnl and ror of each
+    PerformanceDataPoint and the attribution columns
+    """
+    # Hash the keys rather than sorting them as objects, the key names are still returned in sorted order
+    key_index, key_names = pd.factorize(np.asarray(keys, dtype=object), sort=True)
+    key_names = np.asarray(key_names, dtype=object)
+    previous_tmv, previous_by_key = previous
+
+    # Pivot the keys into columns, each cell is addressed by its position in the flattened (date, key) matrix
+    shape = (count, len(key_names))
+    cell = np.asarray(date_index, dtype=np.int64) * shape[1] + key_index
+    mv = np.bincount(cell, weights=np.asarray(mvs, dtype=np.float64), minlength=count * shape[1]).reshape(shape)
+    net = np.bincount(cell, weights=np.asarray(nets, dtype=np.float64), minlength=count * shape[1]).reshape(shape)
+    present = np.zeros(count * shape[1], dtype=bool)
+    present[cell] = True
+    present = present.reshape(shape)
+
+    # The beginning of day market value of each key is its market value on the previous day
+    bod = np.vstack([[previous_by_key.get(key, 0.0) for key in key_names], mv[:-1]])
+    pnl = np.where(present, mv - bod - net, 0.0)
+
+    # Sum the keys in a fixed order so that the totals do not depend on how the rows were batched
+    tmv = np.zeros(count)
+    flows = np.zeros(count)
+    total_pnl = np.zeros(count)
+
+    for i in range(len(key_names)):
+        tmv += mv[:, i]
+        flows += net[:, i]
+        total_pnl += pnl[:, i]
+
+    # The beginning of day total market value is the total market value on the previous day
+    weight = np.concatenate([[previous_tmv], tmv[:-1]])
+
+    # Get an alternative profit and loss number using the beginning of day market value
+    alternative_pnl = tmv - weight - flows
+
+    # If the two profit and loss numbers do not match throw
+    mismatched = np.round(alternative_pnl - total_pnl, 2) != 0.0
+    if mismatched.any():
+        # Should never get here. If so, let's take a look ...
+        raise ValueError(f"Flow calculation unexpected error for rows {np.flatnonzero(mismatched).tolist()}")
+
+    # Calculate the rate of return using 0 if there is no starting point
+    ror = np.divide(alternative_pnl, weight, out=np.zeros(count), where=weight != 0)
+
+    rows, columns = np.nonzero(present)
+
+    return {
+        'tmv': tmv,
+        'flows': flows,
+        'weight': weight,
+        'pnl': total_pnl,
+        'ror': ror
+    }, {
+        'row': rows,
+        'key': key_names[columns],
+        'mv': mv[rows, columns],
+        'flows': net[rows, columns],
+        'pnl': pnl[rows, columns]
+    }
+
+
+def link(ror: np.ndarray, flows: np.ndarray, from_returns: np.ndarray = None,
+         previous: Dict = None) -> Dict[str, np.ndarray]:
+    """
+    Geometrically links a series of daily returns. This is the vectorised equivalent of chaining
+    PerformanceDataPoint.from_values or PerformanceDataPoint.from_returns from one day to the next.
+
+    :param np.ndarray ror: The daily rates of return in chronological order
+    :param np.ndarray flows: The daily flows in chronological order
+    :param np.ndarray from_returns: A mask of the days which were constructed from returns rather than values, these
+    do not accumulate flows
+    :param Dict previous: The linked fields of the data point preceding the series, if there is one
+
+    :return: Dict[str, np.ndarray]: The linked fields cum_fctr, cum_flow, cnt, sum_ror and sum_ror_sqr
+    """
+    def accumulate(func, values, field):
+        # Seed the series with the value from the previous data point
+        if previous is None:
+            return func(values)
+        return func(np.concatenate([[previous[field]], values]))[1:]
+
+    linked = {
+        # Cumulative factor for multiplying a consecutive string of returns
+        'cum_fctr': accumulate(np.cumprod, 1 + ror, 'cum_fctr'),
+        # Cumulative flow (i.e. inflows and outflows)
+        'cum_flow': accumulate(np.cumsum, flows, 'cum_flow'),
+        # Count of number of consecutive returns
+        'cnt': np.arange(len(ror), dtype=np.int64) + (0 if previous is None else previous['cnt'] + 1),
+        # A sum of the rate of return
+        'sum_ror': accumulate(np.cumsum, ror, 'sum_ror'),
+        # The squared sum of the rate of return
+        'sum_ror_sqr': accumulate(np.cumsum, ror * ror, 'sum_ror_sqr')
+    }
+
+    if from_returns is not None:
+        # Returns do not carry flows, so there is nothing to accumulate
+        linked['cum_flow'] = np.where(from_returns, 0.0, linked['cum_flow'])
+
+    return linked
+
+
+# The linked fields of the (notional) data point before the first one, chaining onto these leaves the fields unchanged
+unlinked = {'cum_fctr': 1.0, 'cum_flow': 0.0, 'cnt': -1, 'sum_ror': 0.0, 'sum_ror_sqr': 0.0}
+
+
+def chain(base: Dict, relative: Dict, from_returns=False) -> Dict:
+    """
+    Chains linked fields which are relative to the start of a series onto the linked fields of the data point
+    preceding the series. This works on single values or on arrays of values.
+
+    :param Dict base: The linked fields of the data point preceding the series, None if there is no such data point
+    :param Dict relative: The linked fields relative to the start of the series
+    :param from_returns: Whether (or a mask of where) the data points were constructed from returns, these do not
+    accumulate flows
+
+    :return: Dict: The linked fields
+    """
+    base = base or unlinked
+    return {
+        'cum_fctr': base['cum_fctr'] * relative['cum_fctr'],
+        'cum_flow': np.where(from_returns, 0.0, base['cum_flow'] + relative['cum_flow'])[()],
+        'cnt': base['cnt'] + 1 + relative['cnt'],
+        'sum_ror': base['sum_ror'] + relative['sum_ror'],
+        'sum_ror_sqr': base['sum_ror_sqr'] + relative['sum_ror_sqr']
+    }
+
+
+def unchain(linked: Dict, base: Dict) -> Dict:
+    """
+    The reverse of chain, makes linked fields relative to the start of a series given the linked fields of the data
+    point preceding it
+
+    :param Dict linked: The linked fields
+    :param Dict base: The linked fields of the data point preceding the series, None if there is no such data point
+
+    :return: Dict: The linked fields relative to the start of the series
+    """
+    base = base or unlinked
+    cum_fctr = np.asarray(linked['cum_fctr'], dtype=np.float64)
+
+    return {
+        # Once the cumulative factor reaches zero it stays there
+        'cum_fctr': np.divide(cum_fctr, base['cum_fctr'], out=np.zeros_like(cum_fctr),
+                              where=base['cum_fctr'] != 0)[()],
+        'cum_flow': linked['cum_flow'] - base['cum_flow'],
+        'cnt': linked['cnt'] - base['cnt'] - 1,
+        'sum_ror': linked['sum_ror'] - base['sum_ror'],
+        'sum_ror_sqr': linked['sum_ror_sqr'] - base['sum_ror_sqr']
+    }
+
+
 class PerformanceDataSet:
     """
     This class is represents a block of performance data.
+
+    The data points are held in columnar form as NumPy arrays. PerformanceDataPoint (and AttributionDataPoint) objects
+    are only materialised as views over these arrays when get_data_points is called.
+
+    The linked fields of a relative block are relative to the start of the block rather than chained from the
+    previous PerformanceDataPoint, they are chained onto the blocks before it when the blocks are combined. A
+    correction to an earlier block then leaves the later blocks unchanged.
     """
-    version = "0.0.1"
+    version = "0.1.0"
+
+    # The columns held for each PerformanceDataPoint, dates are held as UTC
+    point_columns = {
+        'date': 'datetime64[ns]',
+        'tmv': np.float64,
+        'flows': np.float64,
+        'weight': np.float64,
+        'pnl': np.float64,
+        'ror': np.float64,
+        'cum_fctr': np.float64,
+        'cum_flow': np.float64,
+        'cnt': np.int64,
+        'sum_ror': np.float64,
+        'sum_ror_sqr': np.float64
+    }
+
+    # The columns held for each AttributionDataPoint, the row is the index of the PerformanceDataPoint it belongs to
+    attribution_columns = {
+        'row': np.int64,
+        'key': object,
+        'mv': np.float64,
+        'flows': np.float64,
+        'pnl': np.float64
+    }
+
+    # The linked fields which are derived from the previous PerformanceDataPoint
+    linked_columns = ('cum_fctr', 'cum_flow', 'cnt', 'sum_ror', 'sum_ror_sqr')
 
     @as_dates
-    def __init__(self, from_date, to_date, asat=None, data_points=None, previous: PerformanceDataPoint = None, loader: Callable = None):
+    def __init__(self, from_date, to_date, asat=None, data_points=None, previous: PerformanceDataPoint = None, loader: Callable = None,
+                 relative: bool = False):
         """
         :param from_date: The beginning of the block in effectiveAt time
         :param to_date: The end of the block in effectiveAt time
         :param asat: The asAt time of the block
         :param PerformanceDataPoint previous: The most recent PerformanceDataPoint in effectiveAt time
         :param Callable loader: A loader to load the PerformanceDataSet
+        :param bool relative: Whether the linked fields are relative to the start of the block. The previous
+        PerformanceDataPoint is then only used for the beginning of day market values.
         """
         self.from_date = from_date
         self.to_date = to_date
         self.asat = asat
-        if data_points is None:
-            self.data_points = []
-        else:
+        self.previous = previous
+        self.relative = relative
+        self._clear()
+
+        if data_points is not None:
             self.data_points = data_points
-        self.latest_data_point = previous
 
-        if loader != None:
-           org_data_points=self.get_data_points
-           def lazy_loader():
-               self.data_points = loader()
-               self.get_data_points=org_data_points
-               return self.get_data_points()
+        # The loader is only called the first time that the data points are required
+        self._loader = loader
+
+    def _clear(self) -> None:
+        """
+        Empties the columns of the PerformanceDataSet
+        """
+        self._columns = {name: np.empty(0, dtype=dtype) for name, dtype in self.point_columns.items()}
+        self._attribution = {name: np.empty(0, dtype=dtype) for name, dtype in self.attribution_columns.items()}
+        # Rows which have been added but not yet linked and appended to the columns
+        self._pending = []
+        # The materialised PerformanceDataPoint views
+        self._data_points = None
+        self._loader = None
+
+    def _load(self) -> None:
+        """
+        Calls the loader if there is one and it has not been called yet
+        """
+        if self._loader is not None:
+            loader, self._loader = self._loader, None
+            self.data_points = loader()
+
+    def _consolidate(self) -> None:
+        """
+        Links any pending rows using the latest linked values (or the previous PerformanceDataPoint) as the seed and
+        appends them to the columns
+        """
+        self._load()
+
+        if len(self._pending) == 0:
+            return
+
+        pending, self._pending = self._pending, []
+        dates, tmv, flows, weight, pnl, ror, attribution = zip(*pending)
+
+        entries = [
+            (i, key, mv, net, key_pnl)
+            for i, row_attribution in enumerate(attribution) if row_attribution is not None
+            for key, mv, net, key_pnl in row_attribution
+        ]
+
+        self._extend(
+            rows={
+                'date': np.array([_as_datetime64(d) for d in dates], dtype='datetime64[ns]'),
+                'tmv': np.array(tmv, dtype=np.float64),
+                'flows': np.array(flows, dtype=np.float64),
+                'weight': np.array(weight, dtype=np.float64),
+                'pnl': np.array(pnl, dtype=np.float64),
+                'ror': np.array(ror, dtype=np.float64)
+            },
+            attribution=dict(zip(self.attribution_columns, zip(*entries))) if len(entries) > 0 else None)
+
+    def _extend(self, rows: Dict[str, np.ndarray], attribution: Dict[str, np.ndarray] = None) -> None:
+        """
+        Links a set of rows and appends them to the columns. Any pending rows must already have been consolidated.
+
+        :param Dict[str, np.ndarray] rows: The date, tmv, flows, weight, pnl and ror of each row in chronological
+        order. Rows created from returns have no profit and loss, these are held as NaN.
+        :param Dict[str, np.ndarray] attribution: The attribution columns for the rows, the 'row' column is relative
+        to the first of the new rows
+        """
+        offset = len(self._columns['date'])
+
+        rows = dict(rows)
+        rows.update(link(rows['ror'], rows['flows'], np.isnan(rows['pnl']), self._latest_linked()))
+
+        self._columns = {
+            name: np.concatenate([self._columns[name], np.asarray(rows[name], dtype=dtype)])
+            for name, dtype in self.point_columns.items()
+        }
+
+        if attribution is not None:
+            attribution = dict(attribution)
+            attribution['row'] = np.asarray(attribution['row'], dtype=np.int64) + offset
+            self._attribution = {
+                name: np.concatenate([self._attribution[name], np.asarray(attribution[name], dtype=dtype)])
+                for name, dtype in self.attribution_columns.items()
+            }
+
+        self._data_points = None
+
+    def _latest_linked(self) -> Dict:
+        """
+        Gets the linked fields of the most recent linked PerformanceDataPoint, used to seed the linking of new rows
+
+        :return: Dict: The linked fields or None if there is nothing to link from
+        """
+        if len(self._columns['date']) > 0:
+            return {name: self._columns[name][-1] for name in self.linked_columns}
+        if self.previous is not None and not self.relative:
+            return {name: getattr(self.previous, name) for name in self.linked_columns}
+        return None
+
+    def _latest_values(self) -> Tuple[float, Dict[str, float]]:
+        """
+        Gets the total market value and the market value of each AttributionDataPoint of the most recent
+        PerformanceDataPoint. These are the beginning of day market values for the next PerformanceDataPoint.
+
+        :return: Tuple[float, Dict[str, float]]: The total market value and the market value by key
+        """
+        self._load()
+
+        if len(self._pending) > 0:
+            _, tmv, _, _, _, _, attribution = self._pending[-1]
+            return tmv, {key: mv for key, mv, _, _ in attribution or []}
+
+        count = len(self._columns['date'])
+
+        if count > 0:
+            start = np.searchsorted(self._attribution['row'], count - 1)
+            return float(self._columns['tmv'][-1]), dict(zip(
+                self._attribution['key'][start:].tolist(), self._attribution['mv'][start:].tolist()))
+
+        if self.previous is not None:
+            return self.previous.tmv, {key: adp.mv for key, adp in (self.previous.data or {}).items()}
+
+        return 0.0, {}
+
+    def _append(self, date, tmv: float, flows: float, weight: float, pnl: float, ror: float,
+                attribution: List[Tuple[str, float, float, float]] = None) -> None:
+        """
+        Adds a row to the PerformanceDataSet, the linked fields are calculated when the rows are next required
+
+        :param date: The date of the PerformanceDataPoint
+        :param float tmv: The total market value
+        :param float flows: The flows for the day
+        :param float weight: The weight, typically the beginning of day market value
+        :param float pnl: The profit and loss, None if the row was created from returns
+        :param float ror: The rate of return
+        :param List[Tuple[str, float, float, float]] attribution: The key, market value, flows and profit and loss of
+        each AttributionDataPoint, None if the row was created from returns
+        """
+        self._load()
+        self._pending.append((date, tmv, flows, weight, pnl, ror, attribution))
+        self._data_points = None
+
+    def _materialise(self, start: int, stop: int) -> List[PerformanceDataPoint]:
+        """
+        Creates the PerformanceDataPoint views for a range of rows
+
+        :param int start: The index of the first row
+        :param int stop: The index after the last row
+
+        :return: List[PerformanceDataPoint]: The data points
+        """
+        dates = pd.to_datetime(self._columns['date'][start:stop], utc=True)
+        values = {name: self._columns[name][start:stop].tolist() for name in self.point_columns if name != 'date'}
+
+        # Find the AttributionDataPoint which belong to each row
+        bounds = np.searchsorted(self._attribution['row'], np.arange(start, stop + 1)).tolist()
+        keys = self._attribution['key'].tolist()
+        mvs = self._attribution['mv'].tolist()
+        flows = self._attribution['flows'].tolist()
+        pnls = self._attribution['pnl'].tolist()
+
+        data_points = []
+
+        for i, date in enumerate(dates):
+            from_returns = np.isnan(values['pnl'][i])
+
+            if from_returns:
+                data = None
+            else:
+                data = {
+                    keys[j]: _attribution_view(date, keys[j], mvs[j], flows[j], pnls[j])
+                    for j in range(bounds[i], bounds[i + 1])
+                }
+
+            point = PerformanceDataPoint.__new__(PerformanceDataPoint)
+            point.__dict__.update({
+                'date': date,
+                'tmv': values['tmv'][i],
+                'flows': values['flows'][i],
+                'weight': values['weight'][i],
+                'data': data,
+                'pnl': None if from_returns else values['pnl'][i],
+                'ror': values['ror'][i],
+                'cum_fctr': values['cum_fctr'][i],
+                'cum_flow': values['cum_flow'][i],
+                'cnt': values['cnt'][i],
+                'sum_ror': values['sum_ror'][i],
+                'sum_ror_sqr': values['sum_ror_sqr'][i]
+            })
+            data_points.append(point)
+
+        return data_points
+
+    def _set_columns(self, columns: Dict[str, np.ndarray], attribution: Dict[str, np.ndarray] = None) -> None:
+        """
+        Replaces the contents of the PerformanceDataSet with already linked columns
+
+        :param Dict[str, np.ndarray] columns: The point columns
+        :param Dict[str, np.ndarray] attribution: The attribution columns
+        """
+        self._clear()
+        self._columns = {
+            name: np.asarray(columns[name], dtype=dtype) for name, dtype in self.point_columns.items()
+        }
+        if attribution is not None:
+            self._attribution = {
+                name: np.asarray(attribution[name], dtype=dtype) for name, dtype in self.attribution_columns.items()
+            }
+
+    @classmethod
+    def from_columns(cls, from_date, to_date, asat, columns: Dict[str, np.ndarray],
+                     attribution: Dict[str, np.ndarray] = None,
+                     previous: PerformanceDataPoint = None, relative: bool = False) -> 'PerformanceDataSet':
+        """
+        Creates a PerformanceDataSet from already linked columns e.g. when de-serialising a block
+
+        :param from_date: The beginning of the block in effectiveAt time
+        :param to_date: The end of the block in effectiveAt time
+        :param asat: The asAt time of the block
+        :param Dict[str, np.ndarray] columns: The point columns, as returned by get_columns
+        :param Dict[str, np.ndarray] attribution: The attribution columns, as returned by get_attribution_columns
+        :param PerformanceDataPoint previous: The most recent PerformanceDataPoint before the block in effectiveAt time
+        :param bool relative: Whether the linked fields are relative to the start of the block
+
+        :return: PerformanceDataSet: The block
+        """
+        block = cls(from_date, to_date, asat, previous=previous, relative=relative)
+        block._set_columns(columns, attribution)
+        return block
+
+    @as_dates
+    def extract(self, from_date, to_date, asat=None) -> 'PerformanceDataSet':
+        """
+        Creates a block from the PerformanceDataPoint of this block between two dates. The linked fields of a
+        relative block are made relative to the start of the new block.
 
-           self.get_data_points=lazy_loader
+        :param from_date: The beginning of the new block in effectiveAt time
+        :param to_date: The end of the new block in effectiveAt time
+        :param asat: The asAt time of the new block, defaults to the asAt time of this block
+
+        :return: PerformanceDataSet: The new block
+        """
+        self._consolidate()
+
+        dates = self._columns['date']
+        start, stop = np.searchsorted(dates, [_as_datetime64(from_date), _as_datetime64(to_date)], side='left')
+        stop += int(stop < len(dates) and dates[stop] == _as_datetime64(to_date))
+
+        columns = {name: column[start:stop] for name, column in self._columns.items()}
+        previous = self.previous if start == 0 else self._materialise(start - 1, start)[0]
+
+        if self.relative and start > 0:
+            columns.update(unchain(
+                {name: columns[name] for name in self.linked_columns},
+                {name: self._columns[name][start - 1] for name in self.linked_columns}))
+            columns['cum_flow'] = np.where(np.isnan(columns['pnl']), 0.0, columns['cum_flow'])
+
+        first, last = np.searchsorted(self._attribution['row'], [start, stop])
+        attribution = {name: column[first:last] for name, column in self._attribution.items()}
+        attribution['row'] = attribution['row'] - start
+
+        return PerformanceDataSet.from_columns(
+            from_date, to_date, self.asat if asat is None else asat, columns, attribution, previous, self.relative)
+
+    @property
+    def data_points(self) -> List[PerformanceDataPoint]:
+        return self.get_data_points()
+
+    @data_points.setter
+    def data_points(self, data_points: List[PerformanceDataPoint]):
+        """
+        Replaces the contents of the PerformanceDataSet with already linked PerformanceDataPoint e.g. from a loader
+        """
+        columns = {
+            name: [getattr(p, name) for p in data_points] for name in self.point_columns if name != 'date'
+        }
+        columns['date'] = [_as_datetime64(p.date) for p in data_points]
+
+        attribution = list(zip(*[
+            (row, key, adp.mv, adp.flows, adp.pnl)
+            for row, p in enumerate(data_points) if p.data is not None
+            for key, adp in p.data.items()
+        ]))
+
+        self._set_columns(
+            columns,
+            dict(zip(self.attribution_columns, attribution)) if len(attribution) > 0 else None)
+
+        # The data points are already materialised
+        self._data_points = data_points
+
+    @property
+    def latest_data_point(self) -> PerformanceDataPoint:
+        """
+        The most recent PerformanceDataPoint in effectiveAt time, if the block is empty this is the previous
+        PerformanceDataPoint
+        """
+        self._consolidate()
+        count = len(self._columns['date'])
+
+        if count == 0:
+            return self.previous
+        if self._data_points is not None:
+            return self._data_points[-1]
+        return self._materialise(count - 1, count)[0]
+
+    @latest_data_point.setter
+    def latest_data_point(self, latest_data_point: PerformanceDataPoint):
+        # Blocks serialised before the columnar layout hold the latest data point as an attribute, this is only
+        # meaningful as the previous data point if the block is empty
+        if not hasattr(self, '_columns'):
+            self._clear()
+        if len(self._columns['date']) == 0:
+            self.previous = latest_data_point
+        elif not hasattr(self, 'previous'):
+            self.previous = None
 
     @as_dates
     def add_values(self, date, data_source: pd.Series):
@@ -232,44 +764,253 @@ class PerformanceDataSet:
         :return: PerformanceDataSet self: The instance of the PerformanceDataSet class which has had
         the PerformanceDataPoint added to it
         """
+        keys, mvs, nets = [], [], []
+
+        for row in data_source:
+            keys.append(row[0])
+            mvs.append(row[1])
+            nets.append(row[2])
+
+        rows, attribution = attribute(
+            date_index=np.zeros(len(keys), dtype=np.int64),
+            keys=keys,
+            mvs=mvs,
+            nets=nets,
+            count=1,
+            previous=self._latest_values())
+
+        self._append(
+            date,
+            float(rows['tmv'][0]),
+            float(rows['flows'][0]),
+            float(rows['weight'][0]),
+            float(rows['pnl'][0]),
+            float(rows['ror'][0]),
+            list(zip(
+                attribution['key'].tolist(),
+                attribution['mv'].tolist(),
+                attribution['flows'].tolist(),
+                attribution['pnl'].tolist())))
+        return self
 
-        # Defines a lambda function to use to get the market value of an AttributionDataPoint
-        if self.latest_data_point is None:
-            get_bod = lambda r: 0.0
-        else:
-            get_bod = lambda r: self.latest_data_point.get_mv(r)
+    def add_values_batch(self, dates, keys, mvs, nets):
+        """
+        Adds a PerformanceDataPoint for every date from the market value and flows of each AttributionDataPoint in
+        a single vectorised step. The results are identical to calling add_values for each date in chronological
+        order. All dates must come after the latest PerformanceDataPoint already in the block.
 
-        def knit():
-            """
-            Converts the Pandas Series into a an iterable, enriching each row with the beginning of day market
-            value
+        :param dates: The date of each AttributionDataPoint
+        :param keys: The unique key of each AttributionDataPoint within its date
+        :param mvs: The market value of each AttributionDataPoint
+        :param nets: The flows of each AttributionDataPoint
 
-            :return: iterable(float, float, float, float): The data to populate an AttributionDataPoint
-            """
-            for row in data_source:
-                yield row[0], get_bod(row[0]), row[1], row[2]
+        :return: PerformanceDataSet self: The instance of the PerformanceDataSet class which has had
+        the PerformanceDataPoint added to it
+        """
+        self._consolidate()
 
-        # Using the latest PerformanceDataPoint construct the new latest PerformanceDataPoint and override this value
-        self.latest_data_point = PerformanceDataPoint(date).from_values(
-            data_source=knit(),
-            previous=self.latest_data_point)
+        if len(dates) == 0:
+            return self
 
-        # Add the new PerformanceDataPoint to the data points for the PerformanceDataSet
-        self.data_points.append(self.latest_data_point)
+        date_index, unique_dates = pd.factorize(_as_datetime64_array(dates), sort=True)
+
+        rows, attribution = attribute(
+            date_index=date_index,
+            keys=keys,
+            mvs=mvs,
+            nets=nets,
+            count=len(unique_dates),
+            previous=self._latest_values())
+
+        rows['date'] = unique_dates
+        self._extend(rows, attribution)
         return self
 
     @as_dates
     def add_returns(self, date, weight, ror):
-        self.latest_data_point = PerformanceDataPoint(date).from_returns(weight, ror, self.latest_data_point)
-        self.data_points.append(self.latest_data_point)
+        self._append(date, 0.0, 0.0, weight, None, ror)
+        return self
+
+    def add_returns_batch(self, dates, weights, rors):
+        """
+        Adds a PerformanceDataPoint for every date from the weights and returns in a single vectorised step. The
+        results are identical to calling add_returns for each date in chronological order. All dates must come after
+        the latest PerformanceDataPoint already in the block.
+
+        :param dates: The date of each return
+        :param weights: The weight of each return, typically the beginning of day market value
+        :param rors: The daily rates of return
+
+        :return: PerformanceDataSet self: The instance of the PerformanceDataSet class which has had
+        the PerformanceDataPoint added to it
+        """
+        self._consolidate()
+
+        dates = _as_datetime64_array(dates)
+        order = np.argsort(dates, kind='stable')
+        count = len(dates)
+
+        self._extend({
+            'date': dates[order],
+            'tmv': np.zeros(count),
+            'flows': np.zeros(count),
+            'weight': np.asarray(weights, dtype=np.float64)[order],
+            'pnl': np.full(count, np.nan),
+            'ror': np.asarray(rors, dtype=np.float64)[order]
+        })
         return self
 
-    def get_data_points(self):
-        return self.data_points
+    def get_data_points(self) -> List[PerformanceDataPoint]:
+        """
+        Gets the PerformanceDataPoint in the block in chronological order. These are materialised from the columns
+        the first time they are requested.
+
+        :return: List[PerformanceDataPoint]: The data points
+        """
+        self._consolidate()
+
+        if self._data_points is None:
+            self._data_points = self._materialise(0, len(self._columns['date']))
+
+        return self._data_points
+
+    @as_dates
+    def get_data_point_before(self, date) -> PerformanceDataPoint:
+        """
+        Gets the latest PerformanceDataPoint before a date using a binary search over the dates in the block
+
+        :param date: The date
+
+        :return: PerformanceDataPoint: The latest data point before the date or None if there is no such data point
+        """
+        self._consolidate()
+
+        index = int(np.searchsorted(self._columns['date'], _as_datetime64(date), side='left'))
+
+        if index == 0:
+            return None
+
+        if self._data_points is not None:
+            return self._data_points[index - 1]
+
+        return self._materialise(index - 1, index)[0]
+
+    def get_columns(self) -> Dict[str, np.ndarray]:
+        """
+        Gets the columns of the block, one array per field of PerformanceDataPoint with one element per data point.
+        The date column holds UTC dates.
+
+        :return: Dict[str, np.ndarray]: The columns keyed by field name
+        """
+        self._consolidate()
+        return self._columns
+
+    def get_attribution_columns(self) -> Dict[str, np.ndarray]:
+        """
+        Gets the columns holding the AttributionDataPoint of the block. The 'row' column is the index of the
+        PerformanceDataPoint that each AttributionDataPoint belongs to.
+
+        :return: Dict[str, np.ndarray]: The columns keyed by field name
+        """
+        self._consolidate()
+        return self._attribution
+
+    def __getstate__(self) -> Dict:
+        self._consolidate()
+
+        return {
+            'from_date': self.from_date,
+            'to_date': self.to_date,
+            'asat': self.asat,
+            'previous': self.previous,
+            'relative': self.relative,
+            'columns': {
+                name: (column.astype(np.int64) if name == 'date' else column).tolist()
+                for name, column in self._columns.items()
+            },
+            'attribution': {name: column.tolist() for name, column in self._attribution.items()}
+        }
+
+    def __setstate__(self, state: Dict):
+        self.from_date = state['from_date']
+        self.to_date = state['to_date']
+        self.asat = state['asat']
+        self.previous = state.get('previous')
+        self.relative = state.get('relative', False)
+
+        if 'columns' in state:
+            columns = dict(state['columns'])
+            columns['date'] = np.array(columns['date'], dtype=np.int64).view('datetime64[ns]')
+            self._set_columns(columns, state['attribution'])
+        else:
+            # State from before the columnar layout
+            self._clear()
+            self.data_points = state.get('data_points', [])
+            self.latest_data_point = state.get('latest_data_point')
 
     def __eq__(self, other):
         if not isinstance(other, PerformanceDataSet):
             # don't attempt to compare against unrelated types
             return NotImplemented
 
-        return self.__dict__ == other.__dict__
+        return (self.from_date == other.from_date and
+                self.to_date == other.to_date and
+                self.asat == other.asat and
+                self.latest_data_point == other.latest_data_point and
+                self.get_data_points() == other.get_data_points())
+
+
+def _attribution_view(date, key: str, mv: float, flows: float, pnl: float) -> AttributionDataPoint:
+    """
+    Creates an AttributionDataPoint from already calculated values
+
+    :param date: The date of the data point
+    :param str key: The key for the data point
+    :param float mv: The end of day market value
+    :param float flows: The flows for the day
+    :param float pnl: The profit and loss for the day
+
+    :return: AttributionDataPoint: The data point
+    """
+    adp = AttributionDataPoint.__new__(AttributionDataPoint)
+    adp.__dict__.update({'date': date, 'key': key, 'mv': mv, 'flows': flows, 'pnl': pnl})
+    return adp
+
+
+class CompositeMatrix(NamedTuple):
+    """
+    The performance of the members of a composite aligned by date. Each column array has a row for every date any
+    member has performance on and a column for each member, cells where a member has no performance are 0.
+    """
+    # The UTC dates of the rows, in date order
+    dates: pd.DatetimeIndex
+    # Whether each member has performance on each date
+    present: np.ndarray
+    weight: np.ndarray
+    ror: np.ndarray
+    tmv: np.ndarray
+    flows: np.ndarray
+
+    @classmethod
+    def from_points(cls, members: List[List[PerformanceDataPoint]]) -> 'CompositeMatrix':
+        """
+        Aligns the performance of the members of a composite by date
+
+        :param List[List[PerformanceDataPoint]] members: The performance of each member, in date order
+
+        :return: CompositeMatrix: The aligned performance
+        """
+        member_dates = [_as_datetime64_array([p.date for p in points]) for points in members]
+        dates = np.unique(np.concatenate(member_dates)) if len(members) > 0 else np.array([], dtype='datetime64[ns]')
+
+        shape = (len(dates), len(members))
+        present = np.zeros(shape, dtype=bool)
+        columns = {name: np.zeros(shape) for name in ['weight', 'ror', 'tmv', 'flows']}
+
+        for col, (points, member) in enumerate(zip(member_dates, members)):
+            rows = np.searchsorted(dates, points)
+            present[rows, col] = True
+            for name, values in columns.items():
+                values[rows, col] = np.array([getattr(p, name) for p in member], dtype=np.float64)
+
+        return cls(dates=pd.to_datetime(dates, utc=True), present=present, **columns)
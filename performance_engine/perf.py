@@ -1,14 +1,20 @@
 import calendar
+from collections import deque
 from dateutil.relativedelta import *
 from typing import Iterator, List, Dict
 
 import numpy as np
 from pandas import Timestamp
 
+from business_calendar import BusinessCalendar
+from chunking import ChunkingPolicy
+from config.config import PerformanceConfiguration
 from interfaces import IBlockStore, IPerformanceSource
 from pds import PerformanceDataPoint, PerformanceDataSet
 import block_ops
+import period_calendar
 import periods
+from period_calendar import PeriodCalendar
 from misc import *
 from fields import *
 
@@ -63,6 +69,72 @@ def annualise(d1,d2,r):
     return pow(1.0 + r,exponent) - 1 
 
 
+def date_diffs_array(d1: np.ndarray, d2: np.ndarray):
+    """
+    The vectorised form of date_diffs
+
+    :param np.ndarray d1: The start dates as int64 nanoseconds since the epoch
+    :param np.ndarray d2: The end dates as int64 nanoseconds since the epoch
+
+    :return: The number of whole years, regular days and leap year days between each pair of dates
+    """
+    def components(ns):
+        days = (ns // DAY_NS).astype('datetime64[D]')
+        month_start = days.astype('datetime64[M]')
+        year = month_start.astype('datetime64[Y]')
+        return (year.astype(np.int64) + 1970, month_start.astype(np.int64) % 12 + 1,
+                (days - month_start).astype(np.int64) + 1, (days - year).astype(np.int64) + 1)
+
+    def isleap(year):
+        return (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+
+    y1, m1, day1, _ = components(d1)
+    y2, m2, day2, day_of_year = components(d2)
+
+    # The whole months between the dates as calculated by relativedelta
+    months = (y2 - y1) * 12 + (m2 - m1)
+    months = months - (d2 < periods.shift(d1, months=months))
+    years = months // 12
+    days = (d2 - periods.shift(d1, months=months)) // DAY_NS
+
+    no_days = ((months % 12) == 0) & (days <= 1) & (
+        (days == 0) | (isleap(y2) & (day1 == 28) & (m1 == 2) & (m2 == 2) & (day2 == 29)))
+
+    start_date = periods.shift(d1, years=years)
+    total_days = (d2 - start_date) // DAY_NS
+    start_year = components(start_date)[0]
+
+    reg_days = np.where(
+        isleap(y2),
+        np.where(y2 == start_year, 0, total_days - day_of_year),
+        np.where(isleap(start_year), day_of_year, total_days))
+    lyr_days = np.where(
+        isleap(y2),
+        np.where(y2 == start_year, total_days, day_of_year),
+        np.where(isleap(start_year), total_days - day_of_year, 0))
+
+    return years, np.where(no_days, 0, reg_days), np.where(no_days, 0, lyr_days)
+
+
+def annualise_array(d1: np.ndarray, d2: np.ndarray, r: np.ndarray) -> np.ndarray:
+    """
+    The vectorised form of annualise
+
+    :param np.ndarray d1: The start dates as int64 nanoseconds since the epoch
+    :param np.ndarray d2: The end dates as int64 nanoseconds since the epoch
+    :param np.ndarray r: The return over each period
+
+    :return: np.ndarray: The annualised returns
+    """
+    years, reg_days, lyr_days = date_diffs_array(d1, d2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        exponent = 1 / (years + reg_days / 365 + lyr_days / 366)
+        annualised = np.power(1.0 + r, exponent) - 1
+
+    return np.where((d2 - d1) // DAY_NS < 1, 0.0, annualised)
+
+
 class Performance:
     """
     This class controls getting performance and building reports
@@ -70,7 +142,8 @@ class Performance:
 
     @as_dates
     def __init__(self, entity_scope: str, entity_code: str, src: IPerformanceSource, block_store: IBlockStore,
-                 perf_start: Timestamp=None):
+                 perf_start: Timestamp=None, calendar: PeriodCalendar = None, chunking: ChunkingPolicy = None,
+                 business_calendar: BusinessCalendar = None):
         """
         :param str entity_scope: The scope of the entity that the Performance is for
         :param str entity_code: The code of the entity that the Performance is for, together with the code
@@ -78,6 +151,12 @@ class Performance:
         :param IPerformanceSource src: The source of the data
         :param IBlockStore block_store: The block store where the performance data is to be stored
         :param Timestamp  perf_start: The start date of the performance calculations
+        :param PeriodCalendar calendar: The calendar used to find the start of each period, defaults to the calendar
+        shared by all reports
+        :param ChunkingPolicy chunking: How the blocks written to the block store are split into chunks, defaults to the
+        BlockChunking configuration item
+        :param BusinessCalendar business_calendar: The business days, a period which starts on any other day starts on
+        the business day before it. Defaults to the HolidayCalendarPath configuration item.
         """
         self.entity_scope = entity_scope
         self.entity_code = entity_code
@@ -86,6 +165,11 @@ class Performance:
 
         # If no perf_start is provided and the block_store is empty this resolves to None
         self.perf_start=perf_start or block_store.get_first_date(entity_scope, entity_code)
+        self.calendar = calendar or period_calendar.default_calendar
+        business_calendar = BusinessCalendar.from_config(business_calendar)
+        if business_calendar is not None:
+            self.calendar = self.calendar.with_business_calendar(business_calendar)
+        self.chunking = chunking
 
     @as_dates
     def get_performance(self, locked: bool, start_date: Timestamp, end_date: Timestamp, asat: Timestamp,
@@ -102,8 +186,8 @@ class Performance:
         :return: Iterator[PerformanceDataPoint]: The set of PerformanceDataPoint which make up performance
         """
 
-        # get the blocks required to cover the date range
-        blocks = self.block_store.find_blocks(
+        # get the metadata of the blocks required to cover the date range
+        blocks = self.block_store.find_block_metadata(
             entity_scope=self.entity_scope,
             entity_code=self.entity_code,
             from_date=start_date,
@@ -111,29 +195,88 @@ class Performance:
             asat=asat,
             performance_scope=performance_scope)
 
+        extra = []
+
         if len(blocks) > 0:
            # See if there are any recent updates that
            # must be added to the data set
 
            # find our top block
            top = max(blocks, key=lambda b: b.asat)
+           # A correction to relative blocks only covers the dates which changed, the later blocks still apply
+           # The chunks of a block are written with the same asAt date, so together they end where the block did
+           last_date = max(b.to_date for b in blocks if top.relative or b.asat == top.asat)
 
            # See if the required data set is covered.
            # append any extra blocks to the list
            asat_matters = locked == False or kwargs.get('create', False)
-           if (asat_matters and top.asat < asat) or top.to_date < end_date:
-              blocks.extend(
-                  self.addendum(
-                      last_date=top.to_date,
+           if (asat_matters and top.asat < asat) or last_date < end_date:
+              extra = self.addendum(
+                      last_date=last_date,
                       last_asat=top.asat,
                       end_date=end_date,
-                      asat=asat, **kwargs))
+                      asat=asat, **kwargs)
+              blocks.extend(extra)
         else:
            # No blocks found, read from the source
            blocks = [self.read_block(self.perf_start or start_date,end_date,asat,performance_scope,**kwargs)]
 
-        return block_ops.combine(blocks,locked,start_date,end_date,asat)
-        
+        # Work out which blocks are used from their metadata and only retrieve those from the block store
+        slices = block_ops.plan(blocks,locked,start_date,end_date)
+        earlier = []
+
+        if any(s.block.relative for s in slices):
+           # Relative blocks are chained onto the performance before the start date, this only needs the last
+           # data point of the blocks which are used in full
+           earlier = self._earlier_slices(locked, start_date, asat, performance_scope, extra)
+
+        required = [s.block for s in slices if not isinstance(s.block, PerformanceDataSet)]
+        required += [s.block for s in earlier
+                     if not isinstance(s.block, PerformanceDataSet) and not block_ops.covers_block(s)]
+
+        if len(required) > 0:
+           retrieved = dict(zip(
+               map(id, required),
+               self.block_store.fetch_blocks(self.entity_scope, self.entity_code, required, performance_scope)))
+           slices = [s._replace(block=retrieved.get(id(s.block), s.block)) for s in slices]
+           earlier = [s._replace(block=retrieved.get(id(s.block), s.block)) for s in earlier]
+
+        return block_ops.combine_slices(slices,locked,block_ops.offset(earlier))
+
+    def _earlier_slices(self, locked: bool, start_date: Timestamp, asat: Timestamp, performance_scope: str,
+                        extra: List[PerformanceDataSet]) -> List[block_ops.Slice]:
+        """
+        Plans the blocks which make up the performance before a date
+
+        :param bool locked: Whether or not this is a locked performance period
+        :param Timestamp start_date: The date
+        :param Timestamp asat: The asAt date of the period
+        :param str performance_scope: The scope to use to get the performance data
+        :param List[PerformanceDataSet] extra: The blocks read by the addendum, these may not have been stored
+
+        :return: List[block_ops.Slice]: The slices before the date
+        """
+        first_date = self.block_store.get_first_date(self.entity_scope, self.entity_code, performance_scope)
+        first_date = min([b.from_date for b in extra] + ([first_date] if first_date is not None else [start_date]))
+
+        if first_date >= start_date:
+            return []
+
+        end_date = start_date - block_ops.msec
+        stored = self.block_store.find_block_metadata(
+            entity_scope=self.entity_scope,
+            entity_code=self.entity_code,
+            from_date=first_date,
+            to_date=end_date,
+            asat=asat,
+            performance_scope=performance_scope)
+
+        # Blocks which have been read but not stored are not known to the block store
+        stored_ids = set(map(id, stored))
+        unstored = [b for b in extra if id(b) not in stored_ids and b.from_date <= end_date]
+
+        return block_ops.plan(stored + unstored, locked, first_date, end_date)
+
     @as_dates
     def addendum(self, last_date: Timestamp, last_asat: Timestamp,
                  end_date: Timestamp, asat: Timestamp, **kwargs) -> List[PerformanceDataSet]:
@@ -153,10 +296,96 @@ class Performance:
         # We can return nothing
         if from_date > end_date:
            return []
+        chunking = ChunkingPolicy.from_config(self.chunking)
+
+        if chunking is not None and kwargs.get('create', False):
+           # The chunk holding the change is read again from its start, so the new dates are appended to the open
+           # chunk rather than written as a short block of their own
+           from_date = max(chunking.chunk_start(from_date), min(from_date, self.perf_start or from_date))
+
         # Find the record that precedes the updated data
-        follow_from = self.block_store.get_previous_record(self.entity_scope, self.entity_code, from_date,asat)
+        if chunking is None:
+           follow_from = self.block_store.get_previous_record(self.entity_scope, self.entity_code, from_date,asat)
+        else:
+           follow_from = chunking.get_previous_record(self.block_store, self.entity_scope, self.entity_code, from_date, asat)
+
+        if PerformanceConfiguration.item('RelativeBlocks', False) and from_date <= last_date:
+           # The later blocks are relative to their own start, so only the dates which have changed are replaced
+           return self.correction(from_date, last_date, last_asat, end_date, asat, follow_from, **kwargs)
+
         return [self.read_block(from_date, end_date, asat, previous=follow_from, **kwargs)]
 
+    def correction(self, from_date: Timestamp, last_date: Timestamp, last_asat: Timestamp, end_date: Timestamp,
+                   asat: Timestamp, follow_from: PerformanceDataPoint, **kwargs) -> List[PerformanceDataSet]:
+        """
+        Reads the performance from the date of a change and compares it with the stored performance. Only the dates
+        up to the last one which differs are kept, together with any dates after the stored performance. The blocks
+        after the change are relative to their own start, so they are chained onto the correction when read. Every
+        date from the change to the end date is still read from the source, as the source only reports the earliest
+        date which changed, only the write is reduced.
+
+        :param Timestamp from_date: The effectiveAt date of the change
+        :param Timestamp last_date: The last effectiveAt date of the stored performance
+        :param Timestamp last_asat: The asAt date of the stored performance
+        :param Timestamp end_date: The effectiveAt end date of the performance period of interest
+        :param Timestamp asat: The asAt date of the performance period of interest
+        :param PerformanceDataPoint follow_from: The record preceding the change
+
+        :return: List[PerformanceDataSet]: The blocks holding the correction and the dates after the stored
+        performance
+        """
+        block = self.read_block(from_date, end_date, asat, previous=follow_from, **dict(kwargs, create=False))
+        columns = block.get_columns()
+        dates = pd.to_datetime(columns['date'], utc=True)
+
+        stored_blocks = self.block_store.find_blocks(self.entity_scope, self.entity_code, from_date, last_date, last_asat)
+        stored = {p.date: p for p in block_ops.combine(stored_blocks, False, from_date, last_date, last_asat)}
+        last_stored = max(stored, default=None)
+
+        # Find the dates on which the performance differs from what was stored
+        differs = []
+
+        for i, date in enumerate(dates):
+            if date > last_date:
+               break
+            p = stored.pop(date, None)
+            values = [columns[name][i] for name in ('tmv', 'flows', 'weight', 'ror')]
+            if p is None or not np.allclose([p.tmv, p.flows, p.weight, p.ror], values):
+               differs.append(date)
+
+        # Any dates which are no longer in the source have changed too
+        differs.extend(stored)
+        changed = max(differs, default=None)
+        relative = all(b.relative for b in stored_blocks)
+
+        # The later records of blocks which are not relative were linked from the records which have changed
+        if changed is not None and not relative:
+           changed = max(changed, last_stored)
+
+        blocks = []
+        chunking = ChunkingPolicy.from_config(self.chunking)
+
+        if chunking is None:
+           if changed is not None:
+              blocks.append(block.extract(from_date, changed))
+           if end_date > last_date:
+              blocks.append(block.extract(last_date + ONE_DAY, end_date))
+        else:
+           # Only the chunks holding a change are replaced, together with the open chunk the new dates are appended to
+           for chunk in chunking.extract(block, from_date, end_date):
+              next_start = chunking.next_start(chunk.from_date)
+              if relative:
+                 touched = any(chunk.from_date <= d < next_start for d in differs)
+              else:
+                 touched = changed is not None and min(differs) < next_start and chunk.from_date <= changed
+              if touched or chunk.to_date > last_date:
+                 blocks.append(chunk)
+
+        if kwargs.get('create', False):
+           self._store(blocks, kwargs.get('performance_scope'))
+
+        return blocks
+
     @as_dates
     def read_block(self, start_date: Timestamp, end_date: Timestamp, asat: Timestamp, performance_scope: str = None,
                    **kwargs) -> PerformanceDataSet:
@@ -167,36 +396,65 @@ class Performance:
         :param Timestamp end_date: The effectiveAt end date of the block to read
         :param Timestamp asat: The asAt date of the block to read
         :param str performance_scope: The scope to use to write the performance data to
+        :param Dict source_kwargs: Any further keyword arguments to pass to the source
 
         :return: PerformanceDataSet b: The block which has been read from the source
         """
-        b = PerformanceDataSet(from_date=start_date, to_date=end_date, asat=asat, previous=kwargs.get('previous'))
-
-        for d, g in self.src.get_perf_data(
-                self.entity_scope,
-                self.entity_code,
-                b.from_date,
-                b.to_date,
-                b.asat,
-                performance_scope=performance_scope
-        ).groupby('date'):
-            if 'ror' in g.columns:
-                row = g.iloc[0]
-                b.add_returns(date=d, weight=row['wt'], ror=row['ror'])
+        b = PerformanceDataSet(from_date=start_date, to_date=end_date, asat=asat, previous=kwargs.get('previous'),
+                               relative=PerformanceConfiguration.item('RelativeBlocks', False))
+
+        df = self.src.get_perf_data(
+            self.entity_scope,
+            self.entity_code,
+            b.from_date,
+            b.to_date,
+            b.asat,
+            performance_scope=performance_scope,
+            **kwargs.get('source_kwargs', {})
+        )
+
+        if len(df) > 0:
+            if 'ror' in df.columns:
+                # Only the first return on each date is used
+                df = df.sort_values('date', kind='mergesort').drop_duplicates('date')
+                b.add_returns_batch(dates=df['date'], weights=df['wt'], rors=df['ror'])
             else:
-                b.add_values(date=d, data_source=g.apply(
-                    lambda r: (r['key'], r['mv'], r['net']), axis=1))
+                b.add_values_batch(dates=df['date'], keys=df['key'], mvs=df['mv'], nets=df['net'])
 
         if kwargs.get('create', False):
-            self.block_store.add_block(
-                entity_scope=self.entity_scope,
-                entity_code=self.entity_code,
-                block=b,
-                performance_scope=performance_scope)
+            self._store([b], performance_scope)
             self.perf_start = min(self.perf_start or start_date, start_date)
 
         return b
 
+    def _store(self, blocks: List[PerformanceDataSet], performance_scope: str = None) -> None:
+        """
+        Writes blocks to the block store, splitting them into chunks if there is a chunking policy
+
+        :param List[PerformanceDataSet] blocks: The blocks to write
+        :param str performance_scope: The scope to use to write the performance data to
+        """
+        chunking = ChunkingPolicy.from_config(self.chunking)
+
+        if chunking is None:
+            for b in blocks:
+                self.block_store.add_block(
+                    entity_scope=self.entity_scope,
+                    entity_code=self.entity_code,
+                    block=b,
+                    performance_scope=performance_scope)
+            return
+
+        chunks = [c for b in blocks for c in chunking.split(b)]
+        _, failures = self.block_store.add_blocks(
+            entity_scope=self.entity_scope,
+            entity_code=self.entity_code,
+            blocks={str(i): c for i, c in enumerate(chunks)},
+            performance_scope=performance_scope)
+
+        if len(failures) > 0:
+            raise Exception(f"Failed to store {len(failures)} of {len(chunks)} chunks: {list(failures.values())[0]}")
+
     @as_dates
     def report(self, locked, start_date: Timestamp, end_date: Timestamp, asat: Timestamp, performance_scope: str = None,
                **kwargs) -> List[Dict]:
@@ -208,6 +466,13 @@ class Performance:
         :param Timestamp end_date: The effectiveAt end date of the report
         :param Timestamp asat: The asAt date at which to run the report
         :param str performance_scope: The scope to use to get performance
+        :param bool vectorised: Whether to evaluate the fields for all dates at once (the default) rather than one
+        PerformanceDataPoint at a time
+        :param bool streaming: Whether to evaluate each row as the PerformanceDataPoint are read, holding only the
+        points which may still be the start of a period rather than the whole range. The rows are returned lazily.
+        :param bool checkpoints: Whether to take the PerformanceDataPoint at the start of a period from the period end
+        checkpoints in the block store (the default) rather than reading every date from there to the start date.
+        This does not apply when streaming.
 
         :return: List[Dict]: A list of results which form the performance report
         """
@@ -226,13 +491,38 @@ class Performance:
         # For example of the start_date of the report is 30/01/20 and you ask for a quarter to date (QTD) return
         # then you need to actually go back as far as 31/10/19 to generate the QTD return for 30/01/20
         for f in fields:
-            min_date = periods.start_date(f,start_date,min_date,extensions=ext_fields)
+            min_date = self.calendar.start_date(f,start_date,min_date,extensions=ext_fields)
 
         # ... but don't go earlier than the start date
         min_date=max(min_date,perf_start_date)
 
+        streaming = kwargs.get('streaming', False)
+        checkpoints, read_from = {}, min_date
+
+        if kwargs.get('checkpoints', True) and not streaming and len(fields) > 0:
+            checkpoints, read_from = self._find_checkpoints(
+                locked, start_date, end_date, asat, min_date, fields, ext_fields, performance_scope)
+
+        points = self.get_performance(locked,read_from,end_date,asat, performance_scope)
+
+        if streaming:
+            # Only the points which may still be the start of a period are kept
+            window = {}
+            perf = self._stream_points(points, window, start_date, fields, ext_fields)
+            return self._evaluate_rows(window, perf, perf_start_date, fields, ext_fields)
+
         # Get the basic performance for the range Dict[str, PerformanceDataPoint]
-        lookup = { p.date : p for p in self.get_performance(locked,min_date,end_date,asat, performance_scope)}
+        lookup = { d : p for d, p in checkpoints.items() if p is not None }
+        lookup.update({ p.date : p for p in points})
+
+        # The checkpoints were found for rows at the same time of day as the start date, if there are any other rows
+        # their periods may start on other dates
+        if read_from > min_date and any(
+                (d.value - start_date.value) % DAY_NS != 0 for d in lookup if d >= start_date):
+            return self.report(locked, start_date, end_date, asat, performance_scope, **dict(kwargs, checkpoints=False))
+
+        if kwargs.get('vectorised', True):
+            return self._evaluate_columns(lookup, start_date, perf_start_date, fields, ext_fields)
 
         # Convert the dictionary into a list sorted by date and filter out PerformanceDataPoints before the start date
         perf = sorted(
@@ -240,6 +530,124 @@ class Performance:
                 key=lambda p : p.date
                )
 
+        return self._evaluate_rows(lookup, perf, perf_start_date, fields, ext_fields)
+
+    def _find_checkpoints(self, locked: bool, start_date: Timestamp, end_date: Timestamp, asat: Timestamp,
+                          min_date: Timestamp, fields: List[str], ext_fields: Dict, performance_scope: str = None):
+        """
+        Finds the PerformanceDataPoint at the start of the periods of a report from the period end checkpoints in the
+        block store, so that the performance only needs to be read from the earliest start which is not a checkpoint
+        rather than from the start of the longest period.
+
+        :param bool locked: Whether or not this is for a locked period
+        :param Timestamp start_date: The effectiveAt start date of the report
+        :param Timestamp end_date: The effectiveAt end date of the report
+        :param Timestamp asat: The asAt date at which to run the report
+        :param Timestamp min_date: The date the performance would otherwise be read from
+        :param List[str] fields: The additional fields of the report
+        :param Dict ext_fields: The start dates of any extension fields
+        :param str performance_scope: The scope to use to get performance
+
+        :return: The PerformanceDataPoint found keyed by date, None where there is no data point on a date, and the
+        date to read the performance from
+        """
+        # The start of each period for a row on every day of the report
+        days = pd.date_range(start_date, end_date, freq='D').asi8
+        starts = np.unique(np.concatenate(
+            [self.calendar.start_dates(f, days, extensions=ext_fields) for f in list(fields) + [DAY]]))
+        starts = starts[(starts >= min_date.value) & (starts < start_date.value)]
+
+        if len(starts) == 0:
+            return {}, min_date
+
+        dates = [pd.Timestamp(d, tz='UTC') for d in starts]
+        found = self.block_store.get_checkpoints(
+            self.entity_scope, self.entity_code, dates, asat, locked, performance_scope)
+
+        stale = [c.asat for c in found.values() if c.asat < asat]
+
+        if not locked and len(stale) > 0:
+            # A checkpoint taken before the asAt date is only kept if the source has not changed on or before it since
+            get_changes = getattr(self.src, 'get_changes', None)
+            changed = min(found) if get_changes is None else get_changes(
+                self.entity_scope, self.entity_code, max(found), min(stale), asat)
+
+            if changed is not None:
+                found = {d: c for d, c in found.items() if c.asat >= asat or d < changed}
+
+        read_from = max(min([d for d in dates if d not in found] + [start_date]), min_date)
+
+        return {d: c.point for d, c in found.items() if d < read_from}, read_from
+
+    def _stream_points(self, points: Iterator[PerformanceDataPoint], window: Dict[Timestamp, PerformanceDataPoint],
+                       start_date: Timestamp, fields: List[str], ext_fields: Dict) -> Iterator[PerformanceDataPoint]:
+        """
+        Consumes the PerformanceDataPoint in date order, keeping a window of the points which may still be the start
+        of a period and yielding each point to report once its row can be evaluated from the window. The window only
+        reaches back as far as the longest period, together with the points on the fixed start dates of any extension
+        fields.
+
+        :param Iterator[PerformanceDataPoint] points: The PerformanceDataPoint in date order
+        :param Dict[Timestamp, PerformanceDataPoint] window: The window keyed by date, which is kept up to date
+        :param Timestamp start_date: The effectiveAt start date of the report
+        :param List[str] fields: The additional fields of the report
+        :param Dict ext_fields: The start dates of any extension fields
+
+        :return: Iterator[PerformanceDataPoint]: The PerformanceDataPoint to report
+        """
+        codes = [f for f in list(fields) + [DAY] if self.calendar.is_relative(f)]
+        fixed_dates = {
+            self.calendar.start_date(f, start_date, extensions=ext_fields)
+            for f in fields if not self.calendar.is_relative(f)}
+        latest_fixed = max(fixed_dates) if fixed_dates else None
+
+        # The dates in the window in date order and the points which are waiting to be reported
+        dates = deque()
+        held = deque()
+
+        def evict(date):
+            # The periods of later rows never start before those of this row
+            bound = min(self.calendar.start_date(c, date) for c in codes)
+            while dates and dates[0] < bound:
+                d = dates.popleft()
+                if d not in fixed_dates:
+                    del window[d]
+
+        for p in points:
+            if dates and p.date == dates[-1]:
+                # A later point for the same date replaces the earlier one
+                window[p.date] = p
+                if held and held[-1].date == p.date:
+                    held[-1] = p
+                continue
+
+            # A row is complete once a later point has arrived, unless it may need a point on a later fixed date
+            while held and (latest_fixed is None or held[0].date >= latest_fixed or p.date > latest_fixed):
+                yield held.popleft()
+                evict(held[0].date if held else p.date)
+
+            window[p.date] = p
+            dates.append(p.date)
+            if p.date >= start_date:
+                held.append(p)
+
+        while held:
+            yield held.popleft()
+
+    def _evaluate_rows(self, lookup: Dict[Timestamp, PerformanceDataPoint], perf: Iterator[PerformanceDataPoint],
+                       perf_start_date: Timestamp, fields: List[str], ext_fields: Dict) -> Iterator[Dict]:
+        """
+        Evaluates the fields of a performance report one PerformanceDataPoint at a time
+
+        :param Dict[Timestamp, PerformanceDataPoint] lookup: The PerformanceDataPoint required for the report keyed
+        by date
+        :param Iterator[PerformanceDataPoint] perf: The PerformanceDataPoint to report in date order
+        :param Timestamp perf_start_date: The performance start date
+        :param List[str] fields: The additional fields to evaluate
+        :param Dict ext_fields: The start dates of any extension fields
+
+        :return: Iterator[Dict]: The results which form the performance report
+        """
         # Calculate how many days old the portfolio is
         def age_days(fld,o):
             """
@@ -264,8 +672,7 @@ class Performance:
             :return: The return for the period
             """
             # Check to see if there is a PerformanceDataPoint for the start date required for this calculation
-            nonlocal lookup
-            start_rec = lookup.get(periods.start_date(fld,o.date,extensions=ext_fields))
+            start_rec = lookup.get(self.calendar.start_date(fld,o.date,extensions=ext_fields))
             if start_rec:
                if start_rec.date >= o.date:
                   # If there is a data point for the start date safely divide the cumulative factors
@@ -287,7 +694,7 @@ class Performance:
             if ror == 0.0:
                 return 0.0
 
-            start_rec = lookup.get(periods.start_date(fld,o.date,extensions=ext_fields))
+            start_rec = lookup.get(self.calendar.start_date(fld,o.date,extensions=ext_fields))
             start_date = start_rec.date if start_rec else perf_start_date
 
             return annualise(start_date,o.date,ror)
@@ -316,11 +723,11 @@ class Performance:
             return stddev * ANN_VOL_FCTR if fld.startswith('ann') else stddev
             
         def period_volatility(fld,o):        
-            start_rec = lookup.get(periods.start_date(fld,o.date))
+            start_rec = lookup.get(self.calendar.start_date(fld,o.date))
             return volatility(fld,o,start_rec)
 
         def risk_free_rate(fld,o):
-            start_rec = lookup.get(periods.start_date(fld,o.date))
+            start_rec = lookup.get(self.calendar.start_date(fld,o.date))
             start_date = start_rec.date if start_rec else perf_start_date
 
             days = (o.date - start_date).days
@@ -333,13 +740,13 @@ class Performance:
             if rfr is None:
                return 0
 
-            start_rec = lookup.get(periods.start_date(fld,o.date))
+            start_rec = lookup.get(self.calendar.start_date(fld,o.date))
             vol = volatility("ann",o,start_rec)
 
             return 0.0 if vol == 0.0 else (annualised_return(fld,o) - rfr) / vol
 
         def calculated_flows(o):
-            start_rec = lookup.get(periods.start_date(DAY,o.date))
+            start_rec = lookup.get(self.calendar.start_date(DAY,o.date))
             if start_rec:
                return np.round(o.cum_flow - start_rec.cum_flow,2)
             return o.flows
@@ -394,3 +801,159 @@ class Performance:
 
         # Apply as_dict to every item in perf and return the outcomes as a list of results
         return map(as_dict, perf)
+
+    def _evaluate_columns(self, lookup: Dict[Timestamp, PerformanceDataPoint], start_date: Timestamp,
+                          perf_start_date: Timestamp, fields: List[str], ext_fields: Dict) -> List[Dict]:
+        """
+        Evaluates the fields of a performance report for every PerformanceDataPoint at once. The start of each period
+        is found for all the dates in one step and looked up by binary search, with the returns, volatilities and
+        Sharpe ratios calculated as array expressions. The results are the same as those of _evaluate_rows.
+
+        :param Dict[Timestamp, PerformanceDataPoint] lookup: The PerformanceDataPoint required for the report keyed
+        by date
+        :param Timestamp start_date: The effectiveAt start date of the report
+        :param Timestamp perf_start_date: The performance start date
+        :param List[str] fields: The additional fields to evaluate
+        :param Dict ext_fields: The start dates of any extension fields
+
+        :return: List[Dict]: The results which form the performance report
+        """
+        points = sorted(lookup.values(), key=lambda p: p.date)
+        all_dates = np.array([p.date.value for p in points], dtype=np.int64)
+
+        # The report covers the points from the start date, earlier points are only used as the start of a period
+        first = int(np.searchsorted(all_dates, start_date.value))
+        perf = points[first:]
+
+        if len(perf) == 0:
+            return []
+
+        dates = all_dates[first:]
+        perf_start = perf_start_date.value
+
+        def column(name):
+            return np.array([getattr(p, name) for p in points], dtype=np.float64)
+
+        cum_fctr, cum_flow = column('cum_fctr'), column('cum_flow')
+        cnt, sum_ror, sum_ror_sqr = column('cnt'), column('sum_ror'), column('sum_ror_sqr')
+
+        tmv, flows, weight, ror = (column(name)[first:] for name in ('tmv', 'flows', 'weight', 'ror'))
+        cum, cnt_now, sum_now, sqr_now = cum_fctr[first:], cnt[first:], sum_ror[first:], sum_ror_sqr[first:]
+
+        def find_start(fld, extensions={}):
+            """
+            Finds the PerformanceDataPoint at the start of the period of a field for every date in the report
+
+            :return: The position of each start record and whether it was found
+            """
+            starts = self.calendar.start_dates(fld, dates, extensions=extensions)
+            index = np.searchsorted(all_dates, starts)
+            index = np.minimum(index, len(all_dates) - 1)
+            return index, all_dates[index] == starts
+
+        def age_days(fld):
+            return (dates - perf_start) // DAY_NS
+
+        def period_return(fld):
+            index, found = find_start(fld, ext_fields)
+            ratio = np.divide(cum, cum_fctr[index], out=np.ones_like(cum), where=cum_fctr[index] != 0) - 1
+            return np.where(found, np.where(all_dates[index] >= dates, 0.0, ratio), cum - 1)
+
+        def annualised_inc_return(fld):
+            return np.where(cum == 0.0, 0.0, annualise_array(np.full(len(dates), perf_start), dates, cum - 1))
+
+        def annualised_return(fld):
+            ror_ = period_return(fld)
+            index, found = find_start(fld, ext_fields)
+            period_start = np.where(found, all_dates[index], perf_start)
+            return np.where(ror_ == 0.0, 0.0, annualise_array(period_start, dates, ror_))
+
+        def volatility(fld, index=None, found=None):
+            if index is None:
+                c1, c2, n = sqr_now, sum_now, cnt_now
+            else:
+                c1 = np.where(found, sqr_now - sum_ror_sqr[index], sqr_now)
+                c2 = np.where(found, sum_now - sum_ror[index], sum_now)
+                n = np.where(found, cnt_now - cnt[index], cnt_now)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                c1 = c1 / n
+                c2 = c2 / n
+                stddev = np.where(n < 2, 0.0, np.power(np.abs(c1 - c2 * c2) * n / (n - 1), 0.5))
+
+            return stddev * ANN_VOL_FCTR if fld.startswith('ann') else stddev
+
+        def period_volatility(fld):
+            return volatility(fld, *find_start(fld))
+
+        def risk_free_rate(fld):
+            index, found = find_start(fld)
+            # The source is asked once for each distinct period
+            rates = {}
+            result = []
+            for o, i, f in zip(perf, index.tolist(), found.tolist()):
+                period_start = points[i].date if f else perf_start_date
+                key = (period_start, (o.date - period_start).days)
+                if key not in rates:
+                    rates[key] = self.src.risk_free_rate(*key)
+                result.append(rates[key])
+            return result
+
+        def sharpe_ratio(fld):
+            rfr = risk_free_rate(fld)
+            missing = np.array([r is None for r in rfr], dtype=bool)
+            rfr = np.array([np.nan if r is None else r for r in rfr], dtype=np.float64)
+
+            vol = volatility("ann", *find_start(fld))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = np.where(vol == 0.0, 0.0, (annualised_return(fld) - rfr) / vol)
+            return np.where(missing, 0.0, ratio)
+
+        def calculated_flows():
+            index, found = find_start(DAY)
+            return np.where(found, np.round(cum_flow[first:] - cum_flow[index], 2), flows)
+
+        # If a field is not in this mapping, then it will call period_return
+        evaluation_method = {
+            AGE_DAYS : age_days,
+            VOL_1YR : period_volatility,
+            VOL_3YR : period_volatility,
+            VOL_5YR : period_volatility,
+            VOL_INC : volatility,
+            ANN_VOL_INC : volatility,
+            ANN_VOL_1YR : period_volatility,
+            ANN_VOL_3YR : period_volatility,
+            ANN_VOL_5YR : period_volatility,
+            ANN_INC : annualised_inc_return,
+            ANN_1YR : annualised_return,
+            ANN_3YR : annualised_return,
+            ANN_5YR : annualised_return,
+            RISK_FREE_1YR : risk_free_rate,
+            RISK_FREE_3YR : risk_free_rate,
+            RISK_FREE_5YR : risk_free_rate,
+            SHARPE_1YR : sharpe_ratio,
+            SHARPE_3YR : sharpe_ratio,
+            SHARPE_5YR : sharpe_ratio }
+
+        # Create the default fields
+        columns = {
+            'date': [p.date for p in perf],
+            'mv': tmv,
+            'flows': calculated_flows(),
+            'key': ['TOTAL'] * len(perf),
+            'wt': weight,
+            'inception': cum - 1}
+
+        # Add additional request fields using the appropriate evaluation method
+        for f in fields:
+            columns[f] = evaluation_method.get(f, period_return)(f)
+
+        # Calculate the correction amount
+        day = columns.get(DAY, ror)
+        correction = np.divide(day + 1, 1 + ror, out=np.ones_like(ror), where=(1 + ror) != 0)
+        columns['correction'] = np.round(correction - 1, 6)
+        columns['flow_correction'] = np.round(columns['flows'] - flows, 2)
+
+        names = list(columns)
+        values = [c.tolist() if isinstance(c, np.ndarray) else c for c in columns.values()]
+        return [dict(zip(names, row)) for row in zip(*values)]
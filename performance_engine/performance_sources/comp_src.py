@@ -1,13 +1,14 @@
-from functools import reduce
-from typing import Iterator, Dict
+import time
+from typing import Dict, List, Tuple
 
 from pandas import Timestamp, DataFrame
 
 from apis_performance.portfolio_performance_api import PortfolioPerformanceApi
 import comp_method
+from config.config import PerformanceConfiguration
 from interfaces import IPerformanceSource, IComposite
+from pds import CompositeMatrix, PerformanceDataPoint
 from misc import *
-from merge import Merger
 
 
 class CompositeSource(IPerformanceSource):
@@ -22,23 +23,29 @@ class CompositeSource(IPerformanceSource):
         "agg": comp_method.Agg
     }
 
-    def __init__(self, composite: IComposite, performance_api: PortfolioPerformanceApi, composite_mode: str = "asset"):
+    def __init__(self, composite: IComposite, performance_api: PortfolioPerformanceApi, composite_mode: str = "asset",
+                 workers: int = None):
         """
         :param IComposite composite: The composite implementation to use
         :param PortfolioPerformanceApi performance_api: The performance api to use to get performance of the composite
         :param str composite_mode: The composite method to use e.g. asset, equal weighted etc.
         members
+        :param int workers: The maximum number of members whose performance is fetched at once, defaults to the
+        CompositeWorkers configuration item or 8
         """
         self.comp = composite
         self.performance_api = performance_api
         self.mode = self.modes[composite_mode]
+        self.workers = workers
+        # The number of seconds taken to get the performance of each member in the latest call to get_perf_data
+        self.member_timings = {}
 
     @as_dates
     def get_perf_data(self, entity_scope: str, entity_code: str, start_date: Timestamp, end_date: Timestamp,
                       asat: Timestamp, **kwargs) -> DataFrame:
         """
         The responsibility of this function is to get the performance data for the Composite by retrieving the composite's
-        members, getting the performance for each of them and then merging the results together.
+        members, getting the performance for each of them and then combining the results on each date.
 
         :param str entity_scope: The scope of the composite to get performance data for
         :param str entity_code: The code of the composite to get performance data for
@@ -60,40 +67,103 @@ class CompositeSource(IPerformanceSource):
             asat=asat
         )
 
-        # Create a new merger class to merge the performance from all the Portfolios
-        mrg = Merger(key_fn=lambda r: r.date)
+        # Value the members together where their performance will be read from a source which supports it, the
+        # valuations are passed to the source as each member is read from it
+        valuations = self._prefetch(composite_members, start_date, end_date, asat, performance_scope)
+        source_kwargs = {} if valuations is None else {'valuations': valuations}
 
-        for member_id, member_date_ranges in composite_members.items():
-            # Get the performance for each Portfolio and store the result to be merged
-            [
-                mrg.include(
-                    member_id,
-                    self.performance_api.prepare_portfolio_performance(
-                        portfolio_scope=member_id.split("_")[0],
-                        portfolio_code=member_id.split("_")[1]
-                    ).get_performance(
-                        locked=True,
-                        start_date=max(start_range_date, start_date) + self.mode.start_date_offset,
-                        end_date=min(end_range_date, end_date),
-                        asat=asat,
-                        performance_scope=performance_scope)
-                # Do this for all date ranges that the Portfolio is a member inside the requested window
-                ) for start_range_date, end_range_date in member_date_ranges
-                if start_range_date <= end_date and end_range_date >= start_date
-            ]
+        # The members are fetched concurrently and merged in the order the composite returned them
+        members = [
+            (member_id, [(start_range_date, end_range_date) for start_range_date, end_range_date in member_date_ranges
+                         # Only the date ranges that the Portfolio is a member inside the requested window
+                         if start_range_date <= end_date and end_range_date >= start_date])
+            for member_id, member_date_ranges in composite_members.items()]
 
-        def combine_composite() -> Iterator[Dict]:
+        def fetch(member) -> Tuple[List[List[PerformanceDataPoint]], float]:
             """
-            Using the merger this function merges the performance together across all the members of the composite. It
-            then calculates the performance for each day returning the daily performance via an Iterator.
+            Gets the performance of a member for each of its date ranges, using a single Performance for all of them
+
+            :param member: The id of the member and its date ranges
 
-            :return: Iterator[Dict]: An iterator of the performance for each day
+            :return: Tuple[List[List[PerformanceDataPoint]], float]: The performance of the member in each date range
+            and the number of seconds it took to get
             """
-            nonlocal mrg
-            nonlocal self
+            member_id, date_ranges = member
+            started = time.perf_counter()
+
+            performance = self.performance_api.prepare_portfolio_performance(
+                portfolio_scope=member_id.split("_")[0],
+                portfolio_code=member_id.split("_")[1]
+            )
+
+            points = [
+                list(performance.get_performance(
+                    locked=True,
+                    start_date=max(start_range_date, start_date) + self.mode.start_date_offset,
+                    end_date=min(end_range_date, end_date),
+                    asat=asat,
+                    performance_scope=performance_scope,
+                    source_kwargs=source_kwargs))
+                for start_range_date, end_range_date in date_ranges
+            ]
+
+            return points, time.perf_counter() - started
+
+        workers = int(self.workers or PerformanceConfiguration.item('CompositeWorkers', 8))
+
+        fetched = concurrently(fetch, members, workers)
+        results = [points for points, _ in fetched]
+
+        # The timings are assigned once they are all known so that a concurrent call can not mix in its own
+        self.member_timings = {member_id: timing for (member_id, _), (_, timing) in zip(members, fetched)}
+
+        # Align the performance from all the Portfolios, with a column for each date range of each member
+        matrix = CompositeMatrix.from_points([range_points for points in results for range_points in points])
+
+        # Calculate the performance for every day of the composite at once
+        return self.mode.combine(matrix)
+
+    def _prefetch(self, composite_members: Dict, start_date: Timestamp, end_date: Timestamp, asat: Timestamp,
+                  performance_scope: str = None):
+        """
+        Values the members of the composite together, in batches, when their performance source supports it. Only
+        the dates after the blocks already stored for each member are valued, as those are the dates the performance
+        of the member is read from its source for. Any other dates the source is asked for are valued as they are
+        requested.
+
+        :param Dict composite_members: The date ranges each member is in the composite for, keyed by member id
+        :param Timestamp start_date: The effectiveAt start date of the performance period
+        :param Timestamp end_date: The effectiveAt end date of the performance period
+        :param Timestamp asat: The asAt date of the performance period
+        :param str performance_scope: The scope to use to get performance from the block store
+
+        :return: The valuations returned by the prefetch of the source, or None if the members were not prefetched
+        """
+        src = self.performance_api.portfolio_performance_source
+        if not hasattr(src, 'prefetch'):
+            return None
+
+        block_store = self.performance_api.block_store
+        windows = []
+
+        for member_id, member_date_ranges in composite_members.items():
+            member_scope, member_code = member_id.split("_")[0], member_id.split("_")[1]
+
+            for start_range_date, end_range_date in member_date_ranges:
+                if start_range_date > end_date or end_range_date < start_date:
+                    continue
+
+                from_date = max(start_range_date, start_date) + self.mode.start_date_offset
+                to_date = min(end_range_date, end_date)
+                blocks = block_store.find_block_metadata(
+                    member_scope, member_code, from_date, to_date, asat, performance_scope)
+
+                if len(blocks) > 0:
+                    from_date = max(b.to_date for b in blocks) + ONE_DAY
 
-            for date, members in mrg.merge():
-                yield reduce(self.mode.accumulate, members, self.mode(date)).result()
+                if from_date <= to_date:
+                    windows.append((member_scope, member_code, from_date, to_date))
 
-        # Convert the iterator of Dictionaries into a Pandas DataFrame
-        return pd.DataFrame.from_records(combine_composite())
+        if len(windows) > 1:
+            return src.prefetch(windows, asat)
+        return None
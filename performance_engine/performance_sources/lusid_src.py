@@ -1,12 +1,14 @@
-from lusidtools.lpt import lpt
-
 import pandas as pd
 from pandas import DataFrame, Timestamp
+from typing import Dict, Iterable, List, Tuple
 
 import flows
+from business_calendar import BusinessCalendar
+from change_feed import ChangeFeed
 from interfaces import IPerformanceSource
 from misc import as_dates, ONE_DAY
-from valuation import get_valuation
+from valuation import get_batch_valuations, get_valuations
+from valuation_cache import CacheKey, ValuationCache
 
 
 class LusidSource(IPerformanceSource):
@@ -14,8 +16,23 @@ class LusidSource(IPerformanceSource):
     The responsibility of this class is to source performance data from LUSID
     """
     def __init__(self, api, config, **kwargs):
+        """
+        :param api: The LUSID api
+        :param config: The configuration of the source
+        :param BusinessCalendar calendar: The business days to value the portfolio on, defaults to the
+        HolidayCalendarPath configuration item, otherwise every day is valued
+        :param ValuationCache cache: The cache of valuations, defaults to the ValuationCachePath configuration item,
+        otherwise every valuation is requested from LUSID
+        :param ChangeFeed change_feed: The changes to the portfolios in each scope, share one between sources to fetch
+        the changes to a scope once
+        :param FlowCache flow_cache: The cache of the flows of each portfolio
+        """
         self.api = api
         self.config = config
+        self.calendar = BusinessCalendar.from_config(kwargs.get('calendar'))
+        self.cache = ValuationCache.from_config(kwargs.get('cache'))
+        self.change_feed = kwargs.get('change_feed') or ChangeFeed(api)
+        self.flow_cache = kwargs.get('flow_cache') or flows.FlowCache()
 
     @as_dates
     def get_perf_data(self, entity_scope: str, entity_code: str, start_date: Timestamp, end_date: Timestamp,
@@ -28,72 +45,193 @@ class LusidSource(IPerformanceSource):
         :param Timestamp start_date: The effectiveAt start date of the performance period
         :param Timestamp end_date: The effectiveAt end date of the performance period
         :param Timestamp asat: The asAt date of the performance period
+        :param ValuationCache valuations: The valuations returned by prefetch, used along with the cache of the source
 
         :return: DataFrame df: The DataFrame with performance data
         """
         # Transaction flows cursor. This stores the net in/out-flows. Merged with valuations to get performance.
+        # The flows already fetched at an earlier asAt date are reused up to the earliest date changed since
         crs = flows.FlowCursor(
-                flows.get_flows(
-                  self.api,
+                self.flow_cache.get_flows(
+                  lambda from_date, to_date: flows.get_flows(
+                    self.api, entity_scope, entity_code, self.config, from_date, to_date, asat),
+                  lambda last_date, last_asat, curr_asat: self.get_changes(
+                    entity_scope, entity_code, last_date, last_asat, curr_asat),
                   entity_scope,
                   entity_code,
-                  self.config,
                   start_date,
                   end_date,
                   asat
                 )
               )
 
-        if self.config.get('recipe_code') is not None:
-            recipe = self.api.models.ResourceId(
-                self.config.get('recipe_scope', self.scope),
-                self.config.recipe_code
-            )
+        recipe = self._recipe(entity_scope)
+        dates = self._dates(start_date, end_date)
+
+        def value(dates):
+            # The valuations are requested concurrently, the flows are then merged in date order
+            return get_valuations(
+                     self.api,
+                     entity_scope,
+                     entity_code,
+                     recipe,
+                     dates,
+                     asat,
+                     **self._valuation_options()
+                   )
+
+        cache = kwargs.get('valuations') or self.cache
+
+        if cache is None:
+            valuations = value(dates)
         else:
-            recipe = None  # Use the default recipe
-
-        def reader(start_date):
-            nonlocal end_date
-            while start_date <= end_date:
-                  date,value = get_valuation(
-                                 self.api,
-                                 entity_scope,
-                                 entity_code,
-                                 recipe,
-                                 start_date,
-                                 asat
-                               )
-                  flows = crs.upto(start_date)
-                  yield (date,value,flows)
-
-                  start_date += ONE_DAY # TODO: Use holiday calendar
-
-        df = pd.DataFrame.from_records(reader(start_date),columns=['date','mv','net'])
+            valuations = self._cached_valuations(cache, entity_scope, entity_code, recipe, dates, asat, value)
+
+        def reader():
+            for date,value in valuations:
+                yield (date,value,crs.upto(date))
+
+        df = pd.DataFrame.from_records(reader(),columns=['date','mv','net'])
         df['key']='all' # Not supporting multiple levels at this time.
 
         return df
 
+    def _recipe(self, entity_scope: str):
+        """
+        :param str entity_scope: The scope of the portfolio, which is the scope of the recipe unless one is set
+
+        :return: ResourceId: The recipe set by the configuration, or None to use the default recipe
+        """
+        if self.config.get('recipe_code') is not None:
+            return self.api.models.ResourceId(
+                self.config.get('recipe_scope', entity_scope),
+                self.config.get('recipe_code')
+            )
+        return None  # Use the default recipe
+
+    def _dates(self, start_date: Timestamp, end_date: Timestamp) -> pd.DatetimeIndex:
+        """
+        :param Timestamp start_date: The first date
+        :param Timestamp end_date: The last date
+
+        :return: pd.DatetimeIndex: The dates to value the portfolio on
+        """
+        if self.calendar is not None:
+            return self.calendar.business_days(start_date, end_date)
+        return pd.date_range(start_date, end_date, freq=ONE_DAY)
+
+    def _valuation_options(self) -> Dict:
+        """
+        :return: Dict: The options of the valuation requests, from the configuration of the source
+        """
+        return {
+            'batch_size': int(self.config.get('valuation_batch_size', 500)),
+            'workers': int(self.config.get('valuation_workers', 8)),
+            'retries': int(self.config.get('valuation_retries', 3)),
+            'backoff': float(self.config.get('valuation_backoff', 0.5))
+        }
+
+    def _value(self, portfolios: List[Tuple[str, str]], recipe, dates,
+               asat: Timestamp) -> Dict[Tuple[str, str], List[Tuple[Timestamp, float]]]:
+        """
+        Values portfolios on a number of dates, in batches of portfolios and dates
+
+        :param List[Tuple[str, str]] portfolios: The scope and code of each portfolio
+        :param recipe: The ResourceId of the recipe, None for the default recipe
+        :param dates: The effectiveAt dates of the valuations
+        :param Timestamp asat: The asAt date of the valuations
+
+        :return: Dict[Tuple[str, str], List[Tuple[Timestamp, float]]]: The date and value of each portfolio for each
+        date keyed by the scope and code of the portfolio
+        """
+        return get_batch_valuations(
+                 self.api,
+                 portfolios,
+                 recipe,
+                 dates,
+                 asat,
+                 **self._valuation_options()
+               )
+
+    def _cache_key(self, entity_scope: str, entity_code: str, recipe) -> CacheKey:
+        return entity_scope, entity_code, 'default' if recipe is None else f"{recipe.scope}/{recipe.code}"
+
+    def _refresh(self, cache: ValuationCache, key: CacheKey, asat: Timestamp) -> None:
+        """
+        Extends the cached valuations of a portfolio up to an asAt date, other than those on or after the earliest
+        date which get_changes reports has changed since they were valued
+
+        :param ValuationCache cache: The cache
+        :param CacheKey key: The key of the portfolio in the cache
+        :param Timestamp asat: The asAt date
+        """
+        watermark = cache.watermark(key, asat)
+        if watermark is not None and watermark < asat:
+            changed = self.get_changes(key[0], key[1], cache.latest_date(key), watermark, asat)
+            cache.extend(key, watermark, asat, changed)
+
+    def _cached_valuations(self, cache: ValuationCache, entity_scope: str, entity_code: str, recipe, dates,
+                           asat: Timestamp, value) -> List[Tuple[Timestamp, float]]:
+        """
+        Gets valuations from the cache, only valuing the dates which are not valid in the cache at the asAt date.
+
+        :param ValuationCache cache: The cache
+        :param str entity_scope: The scope of the portfolio
+        :param str entity_code: The code of the portfolio
+        :param recipe: The ResourceId of the recipe, None for the default recipe
+        :param dates: The effectiveAt dates of the valuations
+        :param Timestamp asat: The asAt date of the valuations
+        :param value: The function to value a list of dates with
+
+        :return: List[Tuple[Timestamp, float]]: The date and value of the portfolio for each date, in date order
+        """
+        key = self._cache_key(entity_scope, entity_code, recipe)
+        self._refresh(cache, key, asat)
+
+        found = cache.get(key, dates, asat)
+        valued = value([d for d in dates if d not in found])
+        cache.put(key, valued, asat)
+
+        found.update(valued)
+        # A date without a valuation is left out rather than given a value
+        return [(d, found[d]) for d in dates if d in found]
+
+    @as_dates
+    def prefetch(self, portfolios: Iterable[Tuple[str, str, Timestamp, Timestamp]],
+                 asat: Timestamp) -> ValuationCache:
+        """
+        Values a number of portfolios together, in batches, so that getting the performance data of each portfolio
+        does not value them again. Portfolios which are valued with the same recipe over the same dates are batched
+        together. The valuations are kept in the cache of the source, or if it has none in an in memory cache which
+        only lasts as long as the caller passes it to get_perf_data.
+
+        :param Iterable[Tuple[str, str, Timestamp, Timestamp]] portfolios: The scope and code of each portfolio with
+        the effectiveAt start and end date of the performance data which will be requested
+        :param Timestamp asat: The asAt date of the performance data
+
+        :return: ValuationCache: The cache holding the valuations, to pass to get_perf_data as valuations
+        """
+        cache = self.cache if self.cache is not None else ValuationCache()
+
+        recipes = {}
+        missing = {}
+
+        for entity_scope, entity_code, start_date, end_date in portfolios:
+            recipe = recipes.setdefault(entity_scope, self._recipe(entity_scope))
+            key = self._cache_key(entity_scope, entity_code, recipe)
+            self._refresh(cache, key, asat)
+            dates = tuple(cache.missing(key, self._dates(start_date, end_date), asat))
+            if len(dates) > 0:
+                missing.setdefault((key[2], dates), []).append((entity_scope, entity_code))
+
+        for (_, dates), members in missing.items():
+            recipe = recipes[members[0][0]]
+            for (entity_scope, entity_code), valued in self._value(members, recipe, dates, asat).items():
+                cache.put(self._cache_key(entity_scope, entity_code, recipe), valued, asat)
+
+        return cache
+
     @as_dates
     def get_changes(self,entity_scope, entity_code, last_date,last_asat, curr_asat):
-        # Called if get_aggregation_by_portfolio() succeeds
-        def success(result):
-            for chg in result.content.values:
-                if chg.entity_id.code == entity_code:
-                   # Found the record for our portfolio
-                   # Note, result is by scope so we had to search
-                   # TODO: change api to use scope + portfolio
-                   # TODO: make use of curr_asat in the query 
-                   # So that we can avoid unnecessary work
-                   # when curr_asat != now
-                   return chg.correction_effective_at
-            return None
-
-        def failure(error):
-            lpt.display_error(error)
-            exit()
-
-        return self.api.call.get_portfolio_changes(
-                  scope=entity_scope,
-                  effective_at=last_date,
-                  as_at=last_asat
-               ).match(failure,success)
+        # The changes to the whole scope are fetched once and shared by its portfolios
+        return self.change_feed.get_changes(entity_scope, entity_code, last_date, last_asat, curr_asat)
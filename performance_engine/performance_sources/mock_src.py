@@ -7,6 +7,7 @@ import pandas as pd
 from pandas import DataFrame, Timestamp
 import pytz
 
+from business_calendar import BusinessCalendar
 from interfaces import IPerformanceSource
 from misc import as_date, as_dates
 
@@ -77,17 +78,21 @@ class SimpleSource(IPerformanceSource):
     flow for the same amount at a specified frequency and a consistent daily return.
     """
     @as_dates
-    def __init__(self, start_date: Timestamp, recurring_flow: float = 0.0, recurring_freq: int = 7, ror: float = 0.0001):
+    def __init__(self, start_date: Timestamp, recurring_flow: float = 0.0, recurring_freq: int = 7, ror: float = 0.0001,
+                 calendar: BusinessCalendar = None):
         """
         :param Timestamp start_date: The start date of performance
         :param float recurring_flow: The value of a recurring flow
         :param int recurring_freq: The frequency at which the flow occurs in days
         :param float ror: The daily rate of return which is experienced each day from the start date
+        :param BusinessCalendar calendar: The business days to produce performance for, defaults to the
+        HolidayCalendarPath configuration item, otherwise every day is a business day
         """
         self.start_date = start_date
         self.rec_flow = recurring_flow
         self.rec_freq = recurring_freq
         self.daily_ror = 1.0 + ror
+        self.calendar = BusinessCalendar.from_config(calendar)
 
     @as_dates
     def get_perf_data(self, entity_scope, entity_code, from_date, to_date, asat, **kwargs) -> DataFrame:
@@ -130,16 +135,23 @@ class SimpleSource(IPerformanceSource):
              )
 
         df['key'] = 'all'
+
+        if self.calendar is not None:
+            # The flows on other days are carried to the next business day
+            df = self.calendar.to_business_days(df)
+
         return df
 
 
 class SeededSource(IPerformanceSource):
 
     @as_dates
-    def __init__(self, entities: Dict = None, rfr_func: Callable = None):
+    def __init__(self, entities: Dict = None, rfr_func: Callable = None, calendar: BusinessCalendar = None):
         """
         :param Dict entities: The entities and their seed values to initialise the seeded source with
         :param Callable rfr_func: The risk free rate function
+        :param BusinessCalendar calendar: The business days to produce performance for, defaults to the
+        HolidayCalendarPath configuration item, otherwise every day is a business day
         """
         if entities is None:
             self.entities = {}
@@ -147,6 +159,7 @@ class SeededSource(IPerformanceSource):
             self.entities = entities
 
         self.risk_free_rate = rfr_func
+        self.calendar = BusinessCalendar.from_config(calendar)
 
     @staticmethod
     def _create_id_from_scope_code(scope: str, code: str) -> str:
@@ -202,10 +215,15 @@ class SeededSource(IPerformanceSource):
         if entity_id not in self.entities:
             raise KeyError(f"No perf data for entity with scope {entity_scope} and code {entity_code}")
 
-        keyword_arguments = self.entities[entity_id]
-        keyword_arguments["end_date"] = to_date
+        # The seeded values are copied so that the performance of entities can be produced concurrently
+        keyword_arguments = dict(self.entities[entity_id], end_date=to_date)
+
+        df = self._produce_perf_data(**keyword_arguments)
 
-        return self._produce_perf_data(**keyword_arguments)
+        if self.calendar is not None:
+            df = self.calendar.to_business_days(df)
+
+        return df
 
     @staticmethod
     def _produce_perf_data(seed: int, start_date: Timestamp, end_date: Timestamp, max: float, trend_adj: float,
@@ -234,8 +252,8 @@ class SeededSource(IPerformanceSource):
         # Get the number of days in the DataFrame
         num = len(df)
 
-        # Seed the random number generator
-        rnd.seed(seed)
+        # Seed a random number generator, which gives the same numbers as seeding the global generator
+        random = rnd.RandomState(seed)
 
         '''
         1) Create a series of random returns with size of the DataFrame + 4
@@ -248,7 +266,7 @@ class SeededSource(IPerformanceSource):
         7) Round to 2 decimal places
         '''
         df['mv'] = np.round(pd.Series(
-                data=(rnd.random(num + 4) * max * 2.0) + trend_adj - max
+                data=(random.random_sample(num + 4) * max * 2.0) + trend_adj - max
             ).rolling(5).mean().shift(-3).head(num).fillna(1.0).cumprod() * amt, 2)
 
         # No flows
@@ -0,0 +1,217 @@
+from typing import Callable, Dict, Iterable
+
+import numpy as np
+import pandas as pd
+from pandas import Timestamp
+
+import periods
+from business_calendar import BusinessCalendar
+from misc import DAY_NS, as_dates
+
+
+def fiscal_ytd(start_month: int, start_day: int = 1) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    Creates the definition of a fiscal year to date period. As with YTD the period starts on the last day of the
+    previous fiscal year.
+
+    :param int start_month: The month in which the fiscal year starts
+    :param int start_day: The day of the month on which the fiscal year starts
+
+    :return: Callable[[np.ndarray], np.ndarray]: The definition of the period
+    """
+    def start_dates(dates: np.ndarray) -> np.ndarray:
+        start = periods.shift(dates, month=start_month, day=start_day)
+        start = np.where(start > dates, periods.shift(dates, years=-1, month=start_month, day=start_day), start)
+        return start - DAY_NS
+
+    return start_dates
+
+
+def fiscal_qtd(start_month: int) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    Creates the definition of a fiscal quarter to date period, where the quarters are aligned with a fiscal year
+    starting on the first day of a month. As with QTD the period starts on the last day of the previous quarter.
+
+    :param int start_month: The month in which the fiscal year starts
+
+    :return: Callable[[np.ndarray], np.ndarray]: The definition of the period
+    """
+    def start_dates(dates: np.ndarray) -> np.ndarray:
+        month_of_year = dates.astype('datetime64[ns]').astype('datetime64[M]').astype(np.int64) % 12
+        return periods.shift(dates, months=-((month_of_year - (start_month - 1)) % 3), day=1, days=-1)
+
+    return start_dates
+
+
+class PeriodCalendar:
+    """
+    Precomputes the start date of each period for every day in a range of dates.
+
+    The start dates are held in a table per period code, with one entry per day, which is extended whenever a date
+    outside the range is asked for. Looking up the start dates of a report is then an index into the table rather
+    than calendar arithmetic on each date. Extension periods, which start on a fixed date, are not tabulated.
+
+    As well as the standard period codes in periods.deltas, a calendar can hold its own definitions. A definition is
+    either the arguments of a relativedelta e.g. {'months': -6}, a function which takes an array of dates (int64
+    nanoseconds since the epoch, at midnight) and returns the start date of each, such as fiscal_ytd, or a fixed date.
+
+    With a business calendar a period which starts on a day other than a business day starts at the end of the
+    business day before it instead, as that is the last day with a valuation.
+    """
+
+    def __init__(self, definitions: Dict = None, business_calendar: BusinessCalendar = None):
+        """
+        :param Dict definitions: The definitions of any additional periods keyed by code
+        :param BusinessCalendar business_calendar: The business days, if not provided every day is a business day
+        """
+        self.definitions = {}
+        self.business_calendar = business_calendar
+        # The tables keyed by code, each holds the first day covered and the start dates of each day in nanoseconds
+        self._tables = {}
+
+        for code, definition in (definitions or {}).items():
+            self.define(code, definition)
+
+    def define(self, code: str, definition) -> None:
+        """
+        Adds or replaces the definition of a period
+
+        :param str code: The code of the period
+        :param definition: The arguments of a relativedelta, a function or a fixed date
+        """
+        self.definitions[code] = definition
+        self._tables.pop(code, None)
+
+    def with_business_calendar(self, business_calendar: BusinessCalendar) -> 'PeriodCalendar':
+        """
+        Creates a calendar with the same periods, sharing their tables, which starts periods on business days
+
+        :param BusinessCalendar business_calendar: The business days
+
+        :return: PeriodCalendar: The new calendar
+        """
+        calendar = PeriodCalendar(business_calendar=business_calendar)
+        calendar.definitions = self.definitions
+        calendar._tables = self._tables
+        return calendar
+
+    def is_relative(self, code: str) -> bool:
+        """
+        Whether a period starts relative to each date rather than on a fixed date
+
+        :param str code: The code of the period
+
+        :return: bool: True if the period starts relative to each date
+        """
+        definition = self.definitions.get(code)
+
+        if definition is not None:
+            return isinstance(definition, dict) or callable(definition)
+
+        return code in periods.deltas or code == periods.QTD or code in periods.NO_RANGE_REQUIRED
+
+    def _calculate(self, code: str, days: np.ndarray) -> np.ndarray:
+        """
+        Calculates the start dates of a period which is relative to each date
+
+        :param str code: The code of the period
+        :param np.ndarray days: The dates at midnight as int64 nanoseconds since the epoch
+
+        :return: np.ndarray: The start dates as int64 nanoseconds since the epoch
+        """
+        definition = self.definitions.get(code)
+
+        if definition is None:
+            return periods.start_dates(code, days)
+        if isinstance(definition, dict):
+            return periods.shift(days, **definition)
+        return np.asarray(definition(days), dtype=np.int64)
+
+    def _table(self, code: str, first: int, last: int):
+        """
+        Gets the table of a period, extending it if it does not cover a range of days
+
+        :param str code: The code of the period
+        :param int first: The first day required, as days since the epoch
+        :param int last: The last day required, as days since the epoch
+
+        :return: The first day covered by the table and the table
+        """
+        base, table = self._tables.get(code, (first, np.empty(0, dtype=np.int64)))
+
+        if len(table) == 0 or first < base or last >= base + len(table):
+            if len(table) > 0:
+                first, last = min(first, base), max(last, base + len(table) - 1)
+            days = np.arange(first, last + 1, dtype=np.int64) * DAY_NS
+            base, table = first, self._calculate(code, days)
+            self._tables[code] = (base, table)
+
+        return base, table
+
+    def prepare(self, codes: Iterable[str], from_date: Timestamp, to_date: Timestamp) -> None:
+        """
+        Precomputes the start dates of a set of periods for a range of dates
+
+        :param Iterable[str] codes: The codes of the periods
+        :param Timestamp from_date: The first date of the range
+        :param Timestamp to_date: The last date of the range
+        """
+        first = pd.Timestamp(from_date).value // DAY_NS
+        last = pd.Timestamp(to_date).value // DAY_NS
+
+        for code in codes:
+            if self.is_relative(code):
+                self._table(code, first, last)
+
+    def start_dates(self, code: str, dates, extensions: Dict = {}) -> np.ndarray:
+        """
+        Finds the start of a period for every date in an array
+
+        :param str code: The code of the period
+        :param dates: The dates as an array of datetime64[ns] or int64 nanoseconds since the epoch
+        :param Dict extensions: The start dates of any extension periods
+
+        :return: np.ndarray: The start dates as int64 nanoseconds since the epoch
+        """
+        ns = np.asarray(dates).astype(np.int64)
+
+        if not self.is_relative(code):
+            if code in self.definitions:
+                fixed = self.definitions[code]
+            elif code in extensions:
+                fixed = extensions[code]
+            else:
+                raise Exception(f"Invalid code: '{code}'")
+            starts = np.full(len(ns), pd.Timestamp(fixed).value, dtype=np.int64)
+        elif len(ns) == 0:
+            return ns.copy()
+        else:
+            days = ns // DAY_NS
+            base, table = self._table(code, int(days.min()), int(days.max()))
+
+            # The periods are whole days so the time of day is carried over from each date
+            starts = table[days - base] + (ns - days * DAY_NS)
+
+        if self.business_calendar is not None:
+            starts = self.business_calendar.rollback(starts)
+
+        return starts
+
+    @as_dates
+    def start_date(self, code: str, date: Timestamp, compare: Timestamp = None, extensions: Dict = {}) -> Timestamp:
+        """
+        Finds the start of a period for a single date, as periods.start_date does
+
+        :param str code: The code of the period
+        :param Timestamp date: The date
+        :param Timestamp compare: If provided the earlier of this and the start date is returned
+        :param Dict extensions: The start dates of any extension periods
+
+        :return: Timestamp: The start date
+        """
+        d = pd.Timestamp(self.start_dates(code, [pd.Timestamp(date).value], extensions)[0], tz='UTC')
+        return d if compare is None else min(d, compare)
+
+
+# The calendar shared by every report unless one is provided
+default_calendar = PeriodCalendar()
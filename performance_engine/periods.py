@@ -1,8 +1,11 @@
-from misc import as_dates
+from misc import DAY_NS, as_dates
 
 from datetime import *
 from dateutil.relativedelta import *
 
+import numpy as np
+import pandas as pd
+
 from fields import *
 
 ONE_LESS_DAY=relativedelta(days=-1)
@@ -60,3 +63,72 @@ def start_date(code, date, compare=None, extensions={}):
        raise Exception(f"Invalid code: '{code}'")
 
     return d if compare is None else min(d,compare)
+
+
+def shift(dates, years=0, months=0, weeks=0, days=0, month=None, day=None, weekday=None):
+    """
+    Applies a relativedelta to every date in an array in a single vectorised step. The arguments have the same
+    meaning as for relativedelta, days past the end of a month are clipped to the last day of the month and a weekday
+    moves each date forward to the next matching weekday (or leaves it if it already matches).
+
+    :param dates: The dates as an array of datetime64[ns] or int64 nanoseconds since the epoch
+    :param years: The number of years to add, either a single number or one per date
+    :param months: The number of months to add, either a single number or one per date
+    :param weeks: The number of weeks to add
+    :param days: The number of days to add
+    :param int month: The month to replace the month of each date with
+    :param int day: The day to replace the day of each date with
+    :param weekday: The weekday, e.g. FR, to move each date forward to
+
+    :return: np.ndarray: The shifted dates as int64 nanoseconds since the epoch
+    """
+    ns = np.asarray(dates).astype(np.int64)
+    whole_days = ns // DAY_NS
+    time_of_day = ns - whole_days * DAY_NS
+
+    calendar_days = whole_days.astype('datetime64[D]')
+    month_index = calendar_days.astype('datetime64[M]').astype(np.int64)
+    day_of_month = (calendar_days - calendar_days.astype('datetime64[M]')).astype(np.int64) + 1
+
+    # Months are counted from January 1970 so the month of the year is the remainder
+    if month is not None:
+        month_index = month_index - month_index % 12 + (month - 1)
+    month_index = month_index + np.asarray(years) * 12 + np.asarray(months)
+
+    month_start = month_index.astype('datetime64[M]').astype('datetime64[D]')
+    days_in_month = ((month_index + 1).astype('datetime64[M]').astype('datetime64[D]') - month_start).astype(np.int64)
+    day_of_month = np.minimum(days_in_month, day_of_month if day is None else day)
+
+    shifted = month_start.astype(np.int64) + day_of_month - 1 + weeks * 7 + days
+
+    if weekday is not None:
+        # The first of January 1970 was a Thursday
+        shifted = shifted + (weekday.weekday - (shifted + 3) % 7) % 7
+
+    return shifted * DAY_NS + time_of_day
+
+
+def start_dates(code, dates, extensions={}):
+    """
+    The vectorised form of start_date, finding the start of a period for every date in an array
+
+    :param str code: The code of the period
+    :param dates: The dates as an array of datetime64[ns] or int64 nanoseconds since the epoch
+    :param dict extensions: The start dates of any extension periods
+
+    :return: np.ndarray: The start dates as int64 nanoseconds since the epoch
+    """
+    ns = np.asarray(dates).astype(np.int64)
+    delta = deltas.get(code)
+
+    if delta:
+       return shift(ns, **delta)
+    elif code == QTD:
+       month_of_year = ns.astype('datetime64[ns]').astype('datetime64[M]').astype(np.int64) % 12
+       return shift(ns, months=-(month_of_year % 3), day=1, days=-1)
+    elif code in NO_RANGE_REQUIRED:
+       return ns.copy()
+    elif code in extensions:
+       return np.full(len(ns), pd.Timestamp(extensions[code]).value, dtype=np.int64)
+    else:
+       raise Exception(f"Invalid code: '{code}'")
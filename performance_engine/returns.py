@@ -3,6 +3,7 @@ from pandas import Timestamp
 
 import pds
 from return_sources.mock_src import ReturnSource
+from config.config import PerformanceConfiguration
 from misc import *
 from interfaces import IBlockStore
 
@@ -32,10 +33,14 @@ class Returns:
         :return: Returns: The instance of the class
         """
         prev = self.block_store.get_previous_record(entity_scope, entity_code, start_date, asat)
-        b = pds.PerformanceDataSet(start_date, end_date, asat, previous=prev)
+        b = pds.PerformanceDataSet(start_date, end_date, asat, previous=prev,
+                                   relative=PerformanceConfiguration.item('RelativeBlocks', False))
 
-        for rec in src.get_return_data(entity_scope, entity_code, b.from_date, b.to_date, b.asat):
-            b.add_returns(rec['date'], rec['wt'], rec['ror'])
+        df = pd.DataFrame(
+            list(src.get_return_data(entity_scope, entity_code, b.from_date, b.to_date, b.asat)),
+            columns=['date', 'wt', 'ror'])
+
+        b.add_returns_batch(df['date'], df['wt'], df['ror'])
         self.block_store.add_block(entity_scope, entity_code, b)
 
         return self
@@ -1,6 +1,50 @@
-from typing import Any
+import base64
+import json
+import struct
+import zlib
+from typing import Any, Callable, Dict, NamedTuple
 
 import jsonpickle
+import numpy as np
+import pandas as pd
+
+from config.config import PerformanceConfiguration
+from misc import DAY_NS, as_date
+from pds import AttributionDataPoint, PerformanceDataPoint, PerformanceDataSet
+
+
+class Codec(NamedTuple):
+    """
+    The functions used to serialise and de-serialise a version of a document
+    """
+    encode: Callable[[Any], str]
+    decode: Callable[[str], Any]
+
+
+# The codecs keyed by the version of the document they read and write
+_codecs = {}
+
+
+def register_codec(version: str, encode: Callable[[Any], str], decode: Callable[[str], Any]) -> None:
+    """
+    Registers the codec used for a version of a document
+
+    :param str version: The version of the document, for blocks this is PerformanceDataSet.version
+    :param Callable[[Any], str] encode: The function which serialises an object into a document
+    :param Callable[[str], Any] decode: The function which de-serialises a document into an object
+    """
+    _codecs[version] = Codec(encode, decode)
+
+
+def get_codec(version: str) -> Codec:
+    """
+    Gets the codec for a version of a document. Documents without a registered version were written by jsonpickle.
+
+    :param str version: The version of the document
+
+    :return: Codec: The codec
+    """
+    return _codecs.get(version, _jsonpickle_codec)
 
 
 def serialise(deserialised_object: Any):
@@ -11,6 +55,8 @@ def serialise(deserialised_object: Any):
 
     :return: str: The serialised object
     """
+    if isinstance(deserialised_object, PerformanceDataSet):
+        return get_codec(deserialised_object.version).encode(deserialised_object)
     return jsonpickle.encode(deserialised_object)
 
 
@@ -24,4 +70,188 @@ def deserialise(serialised_object: str, version: str):
 
     :return: Any: The deserialised object (i.e. a Python class)
     """
-    return jsonpickle.decode(serialised_object)
+    return get_codec(version).decode(serialised_object)
+
+
+def _to_native(value: Any) -> Any:
+    """
+    Converts NumPy scalars into the equivalent Python type so that they can be written as JSON
+
+    :param Any value: The value to convert
+
+    :return: Any: The converted value
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def point_to_dict(point: PerformanceDataPoint) -> Dict:
+    """
+    Converts a PerformanceDataPoint into a dictionary which can be written as JSON
+
+    :param PerformanceDataPoint point: The data point, may be None
+
+    :return: Dict: The data point with its AttributionDataPoint held as {key: [mv, flows, pnl]}
+    """
+    if point is None:
+        return None
+
+    result = {field: getattr(point, field) for field in PerformanceDataSet.point_columns if field != 'date'}
+    result['date'] = point.date.isoformat()
+    result['data'] = None if point.data is None else {
+        key: [adp.mv, adp.flows, adp.pnl] for key, adp in point.data.items()
+    }
+    return result
+
+
+def point_from_dict(point: Dict) -> PerformanceDataPoint:
+    """
+    Creates a PerformanceDataPoint from a dictionary created by point_to_dict
+
+    :param Dict point: The data point, may be None
+
+    :return: PerformanceDataPoint: The data point
+    """
+    if point is None:
+        return None
+
+    date = as_date(point['date'])
+    result = PerformanceDataPoint(
+        date, **{field: point[field] for field in PerformanceDataSet.point_columns if field != 'date'})
+
+    if point['data'] is not None:
+        result.data = {}
+        for key, (mv, flows, pnl) in point['data'].items():
+            adp = AttributionDataPoint(date, key, bod=mv - flows - pnl, eod=mv, flows=flows)
+            # Keep the profit and loss exactly as it was calculated rather than re-deriving it
+            adp.pnl = pnl
+            result.data[key] = adp
+
+    return result
+
+
+# The float64 point columns in the order they are written
+_float_columns = tuple(name for name, dtype in PerformanceDataSet.point_columns.items() if dtype is np.float64)
+
+
+def encode_columnar(block: PerformanceDataSet, compress: bool = None) -> str:
+    """
+    Serialises a block into a columnar document.
+
+    The dates are held as offsets from the first date, each delta-encoded against the previous one, in days when all
+    the dates fall on midnight. The numeric columns are held as little-endian arrays, the attribution keys are held
+    once each with every AttributionDataPoint referring to its key by index. The arrays are optionally compressed
+    with zlib and base64 encoded into a JSON document.
+
+    :param PerformanceDataSet block: The block to serialise, the attribution keys must be strings
+    :param bool compress: Whether to compress the arrays, defaults to the BlockCompression configuration item
+
+    :return: str: The document
+    """
+    if compress is None:
+        compress = bool(PerformanceConfiguration.item('BlockCompression', True))
+
+    columns = block.get_columns()
+    attribution = block.get_attribution_columns()
+    count = len(columns['date'])
+
+    dates = columns['date'].astype(np.int64)
+    unit = 'D' if count == 0 or not np.any(dates % DAY_NS) else 'ns'
+    offsets = dates // DAY_NS if unit == 'D' else dates
+    base = int(offsets[0]) if count > 0 else 0
+    deltas = np.diff(offsets, prepend=base)
+
+    # Each AttributionDataPoint refers to its key by its position in the list of keys
+    key_index, keys = pd.factorize(attribution['key'])
+
+    header = json.dumps({
+        'from_date': block.from_date.isoformat(),
+        'to_date': block.to_date.isoformat(),
+        'asat': None if block.asat is None else block.asat.isoformat(),
+        'previous': point_to_dict(block.previous),
+        'relative': block.relative,
+        'count': count,
+        'attribution_count': len(attribution['key']),
+        'unit': unit,
+        'base': base,
+        'keys': list(keys)
+    }, default=_to_native).encode('utf-8')
+
+    arrays = [deltas.astype('<i4' if unit == 'D' else '<i8')]
+    arrays += [columns[name].astype('<f8') for name in _float_columns]
+    arrays += [
+        columns['cnt'].astype('<i8'),
+        np.bincount(attribution['row'], minlength=count).astype('<i4'),
+        key_index.astype('<i4'),
+        attribution['mv'].astype('<f8'),
+        attribution['flows'].astype('<f8'),
+        attribution['pnl'].astype('<f8')
+    ]
+
+    payload = struct.pack('<I', len(header)) + header + b''.join(a.tobytes() for a in arrays)
+
+    return json.dumps({
+        'compression': 'zlib' if compress else None,
+        'data': base64.b64encode(zlib.compress(payload) if compress else payload).decode('ascii')
+    })
+
+
+def decode_columnar(document: str) -> PerformanceDataSet:
+    """
+    De-serialises a block from a document created by encode_columnar
+
+    :param str document: The document
+
+    :return: PerformanceDataSet: The block
+    """
+    document = json.loads(document)
+    payload = base64.b64decode(document['data'])
+    if document['compression'] == 'zlib':
+        payload = zlib.decompress(payload)
+
+    (length,) = struct.unpack_from('<I', payload)
+    header = json.loads(payload[4:4 + length].decode('utf-8'))
+    position = 4 + length
+
+    def read(dtype: str, size: int) -> np.ndarray:
+        nonlocal position
+        array = np.frombuffer(payload, dtype=dtype, count=size, offset=position)
+        position += array.nbytes
+        # Copy so that the columns are writeable and do not hold on to the payload
+        return array.copy()
+
+    count, attribution_count = header['count'], header['attribution_count']
+
+    offsets = header['base'] + np.cumsum(read('<i4' if header['unit'] == 'D' else '<i8', count), dtype=np.int64)
+    dates = offsets * DAY_NS if header['unit'] == 'D' else offsets
+
+    columns = {name: read('<f8', count) for name in _float_columns}
+    columns['date'] = dates.view('datetime64[ns]')
+    columns['cnt'] = read('<i8', count)
+
+    rows = np.repeat(np.arange(count, dtype=np.int64), read('<i4', count))
+    keys = np.array(header['keys'], dtype=object)[read('<i4', attribution_count)]
+    attribution = {
+        'row': rows,
+        'key': keys,
+        'mv': read('<f8', attribution_count),
+        'flows': read('<f8', attribution_count),
+        'pnl': read('<f8', attribution_count)
+    }
+
+    return PerformanceDataSet.from_columns(
+        from_date=as_date(header['from_date']),
+        to_date=as_date(header['to_date']),
+        asat=None if header['asat'] is None else as_date(header['asat']),
+        columns=columns,
+        attribution=attribution,
+        previous=point_from_dict(header['previous']),
+        relative=header.get('relative', False))
+
+
+_jsonpickle_codec = Codec(jsonpickle.encode, jsonpickle.decode)
+
+# The documents written before the columnar encoding
+register_codec("0.0.1", *_jsonpickle_codec)
+register_codec("0.1.0", encode_columnar, decode_columnar)
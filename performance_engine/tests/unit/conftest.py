@@ -0,0 +1,14 @@
+import pytest
+
+from block_stores import block_store_structured_results
+from tests.utilities.structured_results import FakeStructuredResultDataApi
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """
+    Replaces the Structured Result Data API used by the structured results block store with an in memory one
+    """
+    api = FakeStructuredResultDataApi()
+    monkeypatch.setattr(block_store_structured_results, 'StructuredResultDataApi', api)
+    return api
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from block_stores import block_store_structured_results
+from block_stores.block_catalogue import LocalBlockCatalogue
+from block_stores.block_store_in_memory import InMemoryBlockStore
+from block_stores.block_store_local import LocalBlockStore
+from block_stores.block_store_structured_results import BlockStoreStructuredResults
+from config.config import PerformanceConfiguration
+from pds import PerformanceDataSet
+from tests.utilities.structured_results import FakeApiFactory, FakeStructuredResultDataApi
+
+
+def make_blocks(count):
+    blocks = {}
+    for i in range(count):
+        block = PerformanceDataSet(f'2020-01-{i + 1:02d}', f'2020-01-{i + 1:02d}')
+        block.add_returns(f'2020-01-{i + 1:02d}', 100.0, 0.01 * i)
+        blocks[f'block-{i}'] = block
+    return blocks
+
+
+def test_structured_results_upserts_in_batches(monkeypatch, tmp_path):
+    api = FakeStructuredResultDataApi()
+    monkeypatch.setattr(block_store_structured_results, 'StructuredResultDataApi', api)
+    monkeypatch.setitem(PerformanceConfiguration.global_config, 'StructuredResultBatchSize', 2)
+    bs = BlockStoreStructuredResults(FakeApiFactory(), catalogue=LocalBlockCatalogue(str(tmp_path)))
+
+    blocks = make_blocks(5)
+    api.failing_codes.add(bs._create_result_id('SCOPE', 'CODE', blocks['block-3'].from_date, blocks['block-3'].to_date))
+    api.calls.clear()
+
+    values, failed = bs.add_blocks('SCOPE', 'CODE', blocks)
+
+    # Three requests for the blocks, the catalogue is written once it is flushed
+    upserts = [call for call in api.calls if call[0] == 'upsert']
+    assert [len(call[2]) for call in upserts] == [2, 2, 1]
+    assert bs.flush_catalogue() == {}
+    upserts = [call for call in api.calls if call[0] == 'upsert']
+    assert [len(call[2]) for call in upserts] == [2, 2, 1, 1]
+
+    assert sorted(values) == ['block-0', 'block-1', 'block-2', 'block-4']
+    assert list(failed) == ['block-3']
+    assert all(block.asat is not None for block in values.values())
+    assert len(bs.find_block_metadata('SCOPE', 'CODE', '2020-01-01', '2020-01-31', api.clock)) == 4
+
+
+def test_structured_results_keeps_latest_of_same_range(monkeypatch, tmp_path):
+    api = FakeStructuredResultDataApi()
+    monkeypatch.setattr(block_store_structured_results, 'StructuredResultDataApi', api)
+    bs = BlockStoreStructuredResults(FakeApiFactory(), catalogue=LocalBlockCatalogue(str(tmp_path)))
+
+    first, second = PerformanceDataSet('2020-01-01', '2020-01-02'), PerformanceDataSet('2020-01-01', '2020-01-02')
+    second.add_returns('2020-01-01', 100.0, 0.02)
+    values, failed = bs.add_blocks('SCOPE', 'CODE', {'first': first, 'second': second})
+
+    assert len(values) == 2 and len(failed) == 0
+    assert bs.get_blocks('SCOPE', 'CODE')[0].get_data_points()[0].ror == 0.02
+
+
+def test_in_memory_add_blocks():
+    bs = InMemoryBlockStore()
+    values, failed = bs.add_blocks('SCOPE', 'CODE', make_blocks(3))
+
+    assert len(values) == 3 and len(failed) == 0
+    assert bs.get_blocks('SCOPE', 'CODE') == list(values.values())
+
+
+def test_local_add_blocks(monkeypatch, tmp_path):
+    monkeypatch.setitem(PerformanceConfiguration.global_config, 'LocalStorePath', str(tmp_path))
+    bs = LocalBlockStore('SCOPE', 'CODE')
+    values, failed = bs.add_blocks('SCOPE', 'CODE', make_blocks(3))
+
+    assert len(values) == 3 and len(failed) == 0
+    assert sorted(os.listdir(os.path.join(str(tmp_path), 'SCOPE'))) == [
+        'CODE.block-1', 'CODE.block-2', 'CODE.block-3', 'CODE.idx']
+
+    # The blocks can be read back
+    restored = LocalBlockStore('SCOPE', 'CODE').get_blocks('SCOPE', 'CODE')
+    assert [b.get_data_points() for b in restored] == [b.get_data_points() for b in values.values()]
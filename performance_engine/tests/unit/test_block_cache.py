@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from block_stores.block_cache import BlockCache
+from block_stores.block_catalogue import LocalBlockCatalogue
+from block_stores.block_store_structured_results import BlockStoreStructuredResults
+from pds import PerformanceDataSet
+from tests.utilities.structured_results import FakeApiFactory
+
+
+def make_block(from_date, to_date):
+    block = PerformanceDataSet(from_date, to_date)
+    block.add_returns(from_date, 100.0, 0.01)
+    return block
+
+
+def test_lru_eviction_by_count_and_bytes():
+    cache = BlockCache(max_blocks=2, max_bytes=100)
+    cache.put('a', 'block-a', 10)
+    cache.put('b', 'block-b', 10)
+
+    assert cache.get('a') == 'block-a'
+
+    # 'b' is now the least recently used
+    cache.put('c', 'block-c', 10)
+    assert 'b' not in cache
+    assert cache.get('b') is None
+
+    # Exceeding the byte limit evicts until the cache fits
+    cache.put('d', 'block-d', 95)
+    assert len(cache) == 1 and 'd' in cache
+    assert cache.nbytes == 95
+
+    # A block larger than the byte limit is never cached
+    cache.put('e', 'block-e', 101)
+    assert 'e' not in cache
+
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 1, 3)
+
+
+def test_cache_shared_by_threads():
+    cache = BlockCache(max_blocks=4, max_bytes=1000)
+
+    def use(n):
+        for i in range(2000):
+            key = (n + i) % 16
+            if cache.get(key) is None:
+                cache.put(key, f'block-{key}', 10)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(use, range(8)))
+
+    assert len(cache) == 4 and cache.nbytes == 40
+    assert cache.hits + cache.misses == 8 * 2000
+
+
+def test_repeat_reads_are_served_from_cache(api, tmp_path):
+    bs = BlockStoreStructuredResults(FakeApiFactory(), cache=BlockCache(max_blocks=10, max_bytes=10 ** 6),
+                                     catalogue=LocalBlockCatalogue(str(tmp_path)))
+    bs.add_block('SCOPE', 'CODE', make_block('2020-01-01', '2020-01-10'))
+    bs.add_block('SCOPE', 'CODE', make_block('2020-01-11', '2020-01-20'))
+
+    first = bs.get_blocks('SCOPE', 'CODE')
+    second = bs.get_blocks('SCOPE', 'CODE')
+    bs.find_blocks('SCOPE', 'CODE', '2020-01-01', '2020-01-20', '2021-01-01')
+
+    assert api.block_reads() == 1
+    assert [a is b for a, b in zip(first, second)] == [True, True]
+    assert (bs.cache.hits, bs.cache.misses) == (4, 2)
+
+
+def test_add_block_invalidates_replaced_document(api, tmp_path):
+    bs = BlockStoreStructuredResults(FakeApiFactory(), cache=BlockCache(max_blocks=10, max_bytes=10 ** 6),
+                                     catalogue=LocalBlockCatalogue(str(tmp_path)))
+    bs.add_block('SCOPE', 'CODE', make_block('2020-01-01', '2020-01-10'))
+    bs.get_blocks('SCOPE', 'CODE')
+
+    # Upserting the same date range replaces the document
+    replacement = make_block('2020-01-01', '2020-01-10')
+    replacement.add_returns('2020-01-02', 100.0, 0.02)
+    bs.add_block('SCOPE', 'CODE', replacement)
+
+    assert len(bs.cache) == 0
+    assert len(bs.get_blocks('SCOPE', 'CODE')[0].get_data_points()) == 2
@@ -0,0 +1,190 @@
+import pandas as pd
+
+from block_stores.block_catalogue import BlockCatalogue, BlockCatalogueEntry, LocalBlockCatalogue
+from block_stores.block_store_in_memory import InMemoryBlockStore
+from block_stores.block_store_structured_results import BlockStoreStructuredResults
+from config.config import PerformanceConfiguration
+from pds import PerformanceDataSet
+from tests.utilities.structured_results import FakeApiFactory
+
+
+def make_block(from_date, to_date, mv):
+    block = PerformanceDataSet(from_date, to_date)
+    dates = pd.date_range(from_date, to_date, tz='UTC')
+    block.add_values_batch(
+        dates=list(dates) * 2,
+        keys=['a'] * len(dates) + ['b'] * len(dates),
+        mvs=[mv + i for i in range(len(dates))] * 2,
+        nets=[0.0] * len(dates) * 2)
+    return block
+
+
+def populate(bs):
+    blocks = [
+        make_block('2020-01-01', '2020-01-10', 100.0),
+        make_block('2020-01-11', '2020-01-20', 110.0),
+        make_block('2020-01-05', '2020-01-20', 105.0)
+    ]
+    for block in blocks:
+        bs.add_block('SCOPE', 'CODE', block)
+    bs.flush_catalogue()
+    return blocks
+
+
+def test_entry_round_trip():
+    block = make_block('2020-01-01', '2020-01-03', 100.0)
+    entry = BlockCatalogueEntry.from_block('code', block, '2020-02-01')
+
+    restored = BlockCatalogueEntry.from_dict(entry.to_dict())
+
+    assert restored.to_dict() == entry.to_dict()
+    assert restored.last == block.get_data_points()[-1]
+
+
+def test_metadata_is_answered_from_local_catalogue(api, tmp_path):
+    blocks = populate(BlockStoreStructuredResults(FakeApiFactory(), catalogue=LocalBlockCatalogue(str(tmp_path))))
+
+    # A new store, as after a restart, reads the catalogue from the local file system and checks it against the
+    # catalogue document once, without reading any blocks
+    api.calls.clear()
+    bs = BlockStoreStructuredResults(FakeApiFactory(), catalogue=LocalBlockCatalogue(str(tmp_path)))
+
+    assert bs.get_first_date('SCOPE', 'CODE') == pd.Timestamp('2020-01-01', tz='UTC')
+    previous = bs.get_previous_record('SCOPE', 'CODE', '2020-01-25', '2030-01-01')
+    assert previous == blocks[2].get_data_points()[-1]
+    assert len(api.calls) == 1 and api.block_reads() == 0
+
+
+def test_cold_start_rebuilds_from_store(api, tmp_path):
+    populate(BlockStoreStructuredResults(FakeApiFactory(), catalogue=LocalBlockCatalogue(str(tmp_path / 'first'))))
+
+    api.calls.clear()
+    bs = BlockStoreStructuredResults(FakeApiFactory(), catalogue=LocalBlockCatalogue(str(tmp_path / 'second')))
+
+    assert bs.get_first_date('SCOPE', 'CODE') == pd.Timestamp('2020-01-01', tz='UTC')
+    assert len(api.calls) == 1 and api.block_reads() == 0
+
+
+def test_catalogue_is_held_in_memory_unless_configured(api, monkeypatch, tmp_path):
+    assert type(BlockStoreStructuredResults(FakeApiFactory()).catalogue) is BlockCatalogue
+
+    monkeypatch.setitem(PerformanceConfiguration.global_config, 'BlockCataloguePath', str(tmp_path))
+    catalogue = BlockStoreStructuredResults(FakeApiFactory()).catalogue
+    assert type(catalogue) is LocalBlockCatalogue and catalogue.path == str(tmp_path)
+
+
+def test_blocks_are_found_at_their_own_asat(api):
+    bs = BlockStoreStructuredResults(FakeApiFactory())
+    block = make_block('2019-06-01', '2019-06-05', 100.0)
+    block.asat = pd.Timestamp('2019-06-10', tz='UTC')
+    bs.add_block('SCOPE', 'CODE', block)
+
+    assert bs.find_blocks('SCOPE', 'CODE', '2019-06-01', '2019-06-30', '2019-06-11') == [block]
+    assert bs.get_previous_record('SCOPE', 'CODE', '2019-06-20', '2019-06-11') == block.get_data_points()[-1]
+    assert bs.find_blocks('SCOPE', 'CODE', '2019-06-01', '2019-06-30', '2019-06-09') == []
+
+
+def test_catalogue_documents_are_written_when_flushed(api):
+    bs = BlockStoreStructuredResults(FakeApiFactory(), catalogue_flush_size=2)
+    document_id = ('PerformanceBlockStore', 'catalogue_SCOPE_CODE')
+
+    # The catalogue document is written once two entries are waiting
+    bs.add_block('SCOPE', 'CODE', make_block('2020-01-01', '2020-01-10', 100.0))
+    assert document_id not in api.documents
+    bs.add_block('SCOPE', 'CODE', make_block('2020-01-11', '2020-01-20', 110.0))
+    assert len(BlockCatalogue.from_document(api.documents[document_id].document)) == 2
+
+    # A failure to write the catalogue does not fail the add, the entries are written by a later flush
+    api.failing_codes.add('catalogue_SCOPE_CODE')
+    values, failed = bs.add_blocks('SCOPE', 'CODE', {'a': make_block('2020-01-21', '2020-01-31', 120.0),
+                                                     'b': make_block('2020-02-01', '2020-02-10', 130.0)})
+    assert sorted(values) == ['a', 'b'] and failed == {}
+    assert len(BlockCatalogue.from_document(api.documents[document_id].document)) == 2
+
+    api.failing_codes.clear()
+    assert bs.flush_catalogue() == {}
+    assert len(BlockCatalogue.from_document(api.documents[document_id].document)) == 4
+
+
+def test_catalogues_of_other_writers_are_merged(api):
+    first = BlockStoreStructuredResults(FakeApiFactory(), catalogue_refresh=0)
+    second = BlockStoreStructuredResults(FakeApiFactory(), catalogue_refresh=0)
+    document_id = ('PerformanceBlockStore', 'catalogue_SCOPE_CODE')
+
+    first.add_block('SCOPE', 'CODE', make_block('2020-01-01', '2020-01-10', 100.0))
+    first.flush_catalogue()
+    assert second.get_first_date('SCOPE', 'CODE') == pd.Timestamp('2020-01-01', tz='UTC')
+
+    # Each writer keeps the entries of the other when it writes the catalogue document
+    first.add_block('SCOPE', 'CODE', make_block('2020-01-11', '2020-01-20', 110.0))
+    second.add_block('SCOPE', 'CODE', make_block('2020-01-21', '2020-01-31', 120.0))
+    first.flush_catalogue()
+    second.flush_catalogue()
+    assert [e.from_date.day for e in BlockCatalogue.from_document(api.documents[document_id].document)] == [1, 11, 21]
+
+    # The local catalogue of a writer is refreshed from the document once it is older than the refresh interval
+    assert len(first.find_block_metadata('SCOPE', 'CODE', '2020-01-01', '2020-01-31', '2030-01-01')) == 3
+
+    # An entry lost to a writer which wrote the document at the same time is written again by the next flush
+    lost = api.documents[document_id]
+    second.add_block('SCOPE', 'CODE', make_block('2020-02-01', '2020-02-10', 130.0))
+    second.flush_catalogue()
+    api.documents[document_id] = lost
+    assert len(second.find_block_metadata('SCOPE', 'CODE', '2020-01-01', '2020-02-10', '2030-01-01')) == 4
+    second.flush_catalogue()
+    assert len(BlockCatalogue.from_document(api.documents[document_id].document)) == 4
+
+
+def test_local_catalogue_is_used_until_it_is_refreshed(api, tmp_path):
+    writer = BlockStoreStructuredResults(FakeApiFactory(), catalogue_flush_size=1)
+    writer.add_block('SCOPE', 'CODE', make_block('2020-01-01', '2020-01-10', 100.0))
+
+    cached = BlockStoreStructuredResults(FakeApiFactory(), catalogue=LocalBlockCatalogue(str(tmp_path)))
+    assert len(cached.find_block_metadata('SCOPE', 'CODE', '2020-01-01', '2020-01-31', '2030-01-01')) == 1
+
+    writer.add_block('SCOPE', 'CODE', make_block('2020-01-11', '2020-01-20', 110.0))
+    api.calls.clear()
+    assert len(cached.find_block_metadata('SCOPE', 'CODE', '2020-01-01', '2020-01-31', '2030-01-01')) == 1
+    assert api.calls == []
+
+
+def test_queries_match_in_memory_store(api, tmp_path):
+    bs = BlockStoreStructuredResults(FakeApiFactory(), catalogue=LocalBlockCatalogue(str(tmp_path)))
+    blocks = populate(bs)
+
+    memory = InMemoryBlockStore()
+    for block in blocks:
+        memory.add_block('SCOPE', 'CODE', block)
+
+    for date in ['2020-01-01', '2020-01-08', '2020-01-15', '2020-01-21']:
+        for asat in [block.asat for block in blocks]:
+            assert (bs.get_previous_record('SCOPE', 'CODE', date, asat) ==
+                    memory.get_previous_record('SCOPE', 'CODE', date, asat))
+            assert (bs.find_blocks('SCOPE', 'CODE', date, '2020-01-20', asat) ==
+                    memory.find_blocks('SCOPE', 'CODE', date, '2020-01-20', asat))
+
+
+def test_checkpoints_are_answered_from_catalogue(api, tmp_path):
+    blocks = [make_block('2020-01-01', '2020-02-10', 100.0), make_block('2020-01-20', '2020-03-10', 120.0)]
+    populate_with = BlockStoreStructuredResults(FakeApiFactory(), catalogue=LocalBlockCatalogue(str(tmp_path)))
+    for block in blocks:
+        populate_with.add_block('SCOPE', 'CODE', block)
+
+    memory = InMemoryBlockStore()
+    for block in blocks:
+        memory.add_block('SCOPE', 'CODE', block)
+
+    api.calls.clear()
+    bs = BlockStoreStructuredResults(FakeApiFactory(), catalogue=LocalBlockCatalogue(str(tmp_path)))
+    month_ends = [pd.Timestamp(d, tz='UTC') for d in ['2019-12-31', '2020-01-31', '2020-02-29']]
+
+    for locked in [True, False]:
+        checkpoints = bs.get_checkpoints('SCOPE', 'CODE', month_ends, '2030-01-01', locked)
+        assert checkpoints == memory.get_checkpoints('SCOPE', 'CODE', month_ends, '2030-01-01', locked)
+        assert set(checkpoints) == set(month_ends[1:])
+    assert len(api.calls) == 1 and api.block_reads() == 0
+
+    # Catalogues written before checkpoints were kept do not answer any date
+    entry = BlockCatalogueEntry.from_block('code', blocks[0], '2020-04-01').to_dict()
+    del entry['checkpoints']
+    assert BlockCatalogueEntry.from_dict(entry).checkpoints is None
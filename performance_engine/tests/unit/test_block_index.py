@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from block_stores.block_store_in_memory import InMemoryBlockStore
+from pds import PerformanceDataSet
+
+
+def make_blocks(count, seed=0):
+    rnd = np.random.RandomState(seed)
+    start = pd.Timestamp('2020-01-01', tz='UTC')
+    blocks = []
+
+    for i in range(count):
+        from_date = start + pd.Timedelta(days=int(rnd.randint(0, 100)))
+        to_date = from_date + pd.Timedelta(days=int(rnd.randint(0, 30)))
+        # Mostly increasing asAt dates with some ties and some out of order
+        asat = start + pd.Timedelta(days=200 + int(rnd.randint(0, count)))
+        blocks.append(PerformanceDataSet(from_date, to_date, asat))
+
+    return blocks
+
+
+def scan_find_blocks(blocks, from_date, to_date, asat):
+    return [b for b in blocks if b.to_date >= from_date and b.from_date <= to_date and b.asat <= asat]
+
+
+def scan_previous_block(blocks, date, asat):
+    match = None
+    for candidate in blocks:
+        if candidate.asat <= asat and candidate.from_date < date:
+            if match is None or candidate.asat > match.asat:
+                match = candidate
+    return match
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_index_matches_scan(seed):
+    blocks = make_blocks(200, seed)
+    bs = InMemoryBlockStore()
+    for b in blocks:
+        bs.add_block('SCOPE', 'CODE', b)
+
+    rnd = np.random.RandomState(seed + 100)
+    start = pd.Timestamp('2020-01-01', tz='UTC')
+
+    for _ in range(100):
+        from_date = start + pd.Timedelta(days=int(rnd.randint(-10, 140)))
+        to_date = from_date + pd.Timedelta(days=int(rnd.randint(0, 40)))
+        asat = start + pd.Timedelta(days=int(rnd.randint(190, 420)))
+
+        found = bs.find_blocks('SCOPE', 'CODE', from_date, to_date, asat)
+        expected = scan_find_blocks(blocks, from_date, to_date, asat)
+        assert [id(b) for b in found] == [id(b) for b in expected]
+
+        previous = bs._get_index('SCOPE', 'CODE').get_previous_block(from_date, asat)
+        assert previous is scan_previous_block(blocks, from_date, asat)
+
+
+def test_previous_record_uses_latest_block():
+    bs = InMemoryBlockStore()
+
+    first = PerformanceDataSet('2020-01-01', '2020-01-10', '2020-01-10')
+    first.add_returns_batch(pd.date_range('2020-01-01', '2020-01-10', tz='UTC'), [100.0] * 10, [0.01] * 10)
+    bs.add_block('SCOPE', 'CODE', first)
+
+    restated = PerformanceDataSet('2020-01-05', '2020-01-10', '2020-01-11')
+    restated.add_returns_batch(pd.date_range('2020-01-05', '2020-01-10', tz='UTC'), [100.0] * 6, [0.02] * 6)
+    bs.add_block('SCOPE', 'CODE', restated)
+
+    assert bs.get_previous_record('SCOPE', 'CODE', '2020-01-08', '2020-01-10').ror == 0.01
+    assert bs.get_previous_record('SCOPE', 'CODE', '2020-01-08', '2020-01-11').date == pd.Timestamp('2020-01-07', tz='UTC')
+    assert bs.get_previous_record('SCOPE', 'CODE', '2020-01-08', '2020-01-11').ror == 0.02
+    assert bs.get_previous_record('SCOPE', 'CODE', '2020-01-05', '2020-01-11').date == pd.Timestamp('2020-01-04', tz='UTC')
+    assert bs.get_previous_record('SCOPE', 'CODE', '2020-01-01', '2020-01-11') is None
+    assert bs.get_previous_record('SCOPE', 'CODE', '2020-01-08', '2020-01-09') is None
+
+
+def test_index_follows_replaced_blocks():
+    blocks = make_blocks(20)
+    bs = InMemoryBlockStore()
+    bs.add_block('SCOPE', 'CODE', blocks[0])
+
+    bs.blocks = {'SCOPE_CODE': blocks}
+    asat = pd.Timestamp('2021-01-01', tz='UTC')
+
+    assert bs.find_blocks('SCOPE', 'CODE', '2019-01-01', '2021-01-01', asat) == blocks
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from block_stores.block_store_in_memory import InMemoryBlockStore
+from business_calendar import BusinessCalendar
+from config.config import PerformanceConfiguration
+from fields import *
+from misc import as_date
+from perf import Performance
+from performance_sources.mock_src import SimpleSource
+
+
+@pytest.fixture
+def holidays(tmp_path):
+    path = tmp_path / 'holidays.csv'
+    path.write_text("# New Year and Easter\n2020-01-01,New Year's Day\n\n2020-04-10,Good Friday\n2020-04-13\n")
+    return str(path)
+
+
+def test_calendar_from_file(holidays):
+    calendar = BusinessCalendar.from_file(holidays)
+
+    dates = pd.date_range('2019-12-30', '2020-01-06', tz='UTC')
+    np.testing.assert_array_equal(calendar.is_business_day(dates.asi8), [1, 1, 0, 1, 1, 0, 0, 1])
+
+    # The time of day is carried over
+    assert pd.Timestamp(calendar.rollback([as_date('2020-04-13 17:00').value])[0], tz='UTC') == \
+        as_date('2020-04-09 17:00')
+    assert pd.Timestamp(calendar.rollforward([as_date('2020-01-01').value])[0], tz='UTC') == as_date('2020-01-02')
+
+    assert list(calendar.business_days(as_date('2020-04-08'), as_date('2020-04-14'))) == \
+        [as_date('2020-04-08'), as_date('2020-04-09'), as_date('2020-04-14')]
+
+
+def test_sources_only_produce_business_days(holidays):
+    calendar = BusinessCalendar.from_file(holidays)
+    df = SimpleSource('2019-12-30', recurring_flow=100.0, recurring_freq=1, calendar=calendar).get_perf_data(
+        'test', 'simple', '2019-12-30', '2020-01-06', '2020-02-01')
+
+    assert list(df['date']) == [as_date(d) for d in ['2019-12-30', '2019-12-31', '2020-01-02', '2020-01-03',
+                                                     '2020-01-06']]
+    # The flows on the holiday and the weekend are carried to the next business day
+    assert list(df['net']) == [100.0, 100.0, 200.0, 100.0, 300.0]
+
+
+def test_report_periods_start_on_business_days(holidays, monkeypatch):
+    monkeypatch.setitem(PerformanceConfiguration.global_config, 'HolidayCalendarPath', holidays)
+    ror = 0.001
+    performance = Performance('test', 'simple', SimpleSource('2019-12-31', ror=ror), InMemoryBlockStore())
+
+    def report(**kwargs):
+        return pd.DataFrame.from_records(performance.report(
+            False, '2020-01-02', '2020-04-30', '2020-05-01', fields=[DAY, WTD, MTD, QTD], **kwargs)).set_index('date')
+
+    actual = report()
+    assert (actual.index.dayofweek < 5).all()
+    assert as_date('2020-04-10') not in actual.index
+
+    # The return on Monday covers the weekend, and the month ended on a Saturday so March starts on the Friday
+    assert actual.loc[as_date('2020-01-06'), DAY] == pytest.approx(pow(1 + ror, 3) - 1, rel=1e-5)
+    assert actual.loc[as_date('2020-03-02'), MTD] == pytest.approx(pow(1 + ror, 3) - 1, rel=1e-5)
+    assert actual.loc[as_date('2020-04-14'), DAY] == pytest.approx(pow(1 + ror, 5) - 1, rel=1e-5)
+
+    for expected in [report(vectorised=False), report(checkpoints=False), report(streaming=True)]:
+        for f in [DAY, WTD, MTD, QTD]:
+            np.testing.assert_allclose(actual[f], expected[f], rtol=0, atol=1e-12)
@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from change_feed import ChangeFeed
+from misc import as_date
+from performance_sources.lusid_src import LusidSource
+
+
+class FakeResult:
+    def __init__(self, values):
+        self.values = values
+
+    def match(self, failure, success):
+        return success(SimpleNamespace(content=SimpleNamespace(values=self.values)))
+
+
+class FakeApi:
+    """
+    Reports a correction to every portfolio whose code ends in a digit d, effective on the 1d of January
+    """
+
+    def __init__(self, codes):
+        self.codes = codes
+        self.requests = []
+        self.call = SimpleNamespace(get_portfolio_changes=self.get_portfolio_changes)
+
+    def get_portfolio_changes(self, scope, effective_at, as_at):
+        self.requests.append((scope, effective_at, as_at))
+        return FakeResult([
+            SimpleNamespace(entity_id=SimpleNamespace(code=c), correction_effective_at=as_date(f'2020-01-1{c[-1]}'))
+            for c in self.codes if c[-1].isdigit()])
+
+
+def test_scope_changes_are_fetched_once():
+    codes = [f'fund-{i}' for i in range(200)] + ['fund-x']
+    api = FakeApi(codes)
+    feed = ChangeFeed(api)
+    sources = [LusidSource(api, {}, change_feed=feed) for _ in range(4)]
+
+    def changes(code):
+        src = sources[hash(code) % len(sources)]
+        return src.get_changes('test', code, '2020-01-31', '2020-02-01', '2020-02-05')
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        found = dict(zip(codes, executor.map(changes, codes)))
+
+    assert api.requests == [('test', as_date('2020-01-31'), as_date('2020-02-01'))]
+    assert found['fund-17'] == as_date('2020-01-17')
+    assert found['fund-x'] is None
+    assert (feed.calls, feed.hits) == (1, len(codes) - 1)
+
+
+def test_windows_outside_the_fetch_are_fetched_again():
+    api = FakeApi(['fund-1'])
+    feed = ChangeFeed(api)
+
+    assert feed.get_changes('test', 'fund-1', '2020-01-31', '2020-02-01', '2020-02-05') == as_date('2020-01-11')
+
+    # A later window is within the changes fetched since the first asAt date
+    assert feed.get_changes('test', 'fund-1', '2020-01-31', '2020-02-03', '2020-02-05') == as_date('2020-01-11')
+    assert len(api.requests) == 1
+
+    # An earlier start, a different effectiveAt date or an empty window
+    feed.get_changes('test', 'fund-1', '2020-01-31', '2020-01-15', '2020-02-05')
+    feed.get_changes('test', 'fund-1', '2020-02-29', '2020-02-01', '2020-02-05')
+    assert feed.get_changes('test', 'fund-1', '2020-01-31', '2020-02-05', '2020-02-05') is None
+    assert len(api.requests) == 3
+
+
+def test_only_the_latest_fetches_are_kept():
+    api = FakeApi(['fund-1'])
+    feed = ChangeFeed(api, max_entries=2)
+
+    for date in ['2020-01-31', '2020-02-29', '2020-03-31']:
+        feed.get_changes('test', 'fund-1', date, '2020-04-01', '2020-04-05')
+    # A window outside the fetch of the same effectiveAt date replaces it
+    feed.get_changes('test', 'fund-1', '2020-03-31', '2020-03-15', '2020-04-05')
+
+    assert list(feed._changes) == [('test', as_date('2020-02-29')), ('test', as_date('2020-03-31'))]
+    assert feed._changes[('test', as_date('2020-03-31'))].since == as_date('2020-03-15')
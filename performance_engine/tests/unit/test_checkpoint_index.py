@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from block_stores.block_store_in_memory import InMemoryBlockStore
+from block_stores.checkpoint_index import CheckpointIndex, extract_checkpoints
+from config.config import PerformanceConfiguration
+from fields import *
+from misc import as_date
+from pds import PerformanceDataSet
+from perf import Performance
+from performance_sources.mock_src import SeededSource
+
+
+def make_block(from_date, to_date, asat, ror, skip=()):
+    block = PerformanceDataSet(from_date, to_date, asat)
+    dates = [d for d in pd.date_range(from_date, to_date, tz='UTC') if d not in [as_date(s) for s in skip]]
+    block.add_returns_batch(dates=dates, weights=[100.0] * len(dates), rors=[ror] * len(dates))
+    return block
+
+
+def test_checkpoints_are_taken_at_period_ends(monkeypatch):
+    block = make_block('2020-01-15', '2020-04-15', '2020-05-01', 0.001, skip=['2020-02-29'])
+
+    checkpoints = extract_checkpoints(block)
+    assert list(checkpoints) == [as_date(d) for d in ['2020-01-31', '2020-02-29', '2020-03-31']]
+    assert checkpoints[as_date('2020-01-31')] == block.get_data_point_before(as_date('2020-02-01'))
+    assert checkpoints[as_date('2020-01-31')].data is None
+    # A period end without a data point is recorded as such
+    assert checkpoints[as_date('2020-02-29')] is None
+
+    monkeypatch.setitem(PerformanceConfiguration.global_config, 'CheckpointFrequency', 'Q')
+    assert list(extract_checkpoints(block)) == [as_date('2020-03-31')]
+
+
+def test_checkpoints_follow_the_blocks_used_when_combining():
+    first = make_block('2020-01-01', '2020-03-31', '2020-04-01', 0.001)
+    second = make_block('2020-02-15', '2020-04-30', '2020-05-01', 0.002)
+
+    index = CheckpointIndex()
+    index.add_block(first)
+    index.add_block(second)
+    month_ends = [as_date(d) for d in ['2020-01-31', '2020-02-29', '2020-03-31', '2020-04-30']]
+
+    def asats(asat, locked):
+        return {d: c.asat for d, c in index.get(month_ends, as_date(asat), locked).items()}
+
+    # Unlocked, each date comes from the latest block covering it
+    assert asats('2020-05-01', False) == {
+        month_ends[0]: first.asat, month_ends[1]: second.asat, month_ends[2]: second.asat,
+        month_ends[3]: second.asat}
+    # Locked, each date comes from the first block which reaches it
+    assert asats('2020-05-01', True) == {
+        month_ends[0]: first.asat, month_ends[1]: first.asat, month_ends[2]: first.asat, month_ends[3]: second.asat}
+    # Blocks stored after the asAt date are not used
+    assert asats('2020-04-15', False) == {d: first.asat for d in month_ends[:3]}
+
+
+def test_index_matches_scanning_every_block():
+    rng = np.random.RandomState(7)
+    index = CheckpointIndex()
+    records = []
+    days = pd.date_range('2020-01-01', '2020-12-31', tz='UTC')
+
+    for i in range(60):
+        start, length = rng.randint(0, len(days) - 1), rng.randint(0, 90)
+        from_date, to_date = days[start], days[min(start + length, len(days) - 1)]
+        # Several blocks share each asAt date
+        asat = as_date('2021-01-01') + pd.Timedelta(days=int(rng.randint(0, 20)))
+        checkpoints = {d: i for d in days if from_date <= d <= to_date}
+        index.add(from_date, to_date, asat, checkpoints=checkpoints)
+        records.append((from_date, to_date, asat, i))
+
+    def scan(date, asat, locked):
+        ordered = sorted([r for r in records if r[2] <= asat], key=lambda r: r[2], reverse=not locked)
+        if locked:
+            record = next((r for r in ordered if r[1] >= date), None)
+            return None if record is None or record[0] > date else record[3]
+        return next((r[3] for r in ordered if r[0] <= date <= r[1]), None)
+
+    for asat in [as_date('2020-12-31'), as_date('2021-01-05'), as_date('2021-01-10'), as_date('2021-02-01')]:
+        for locked in [True, False]:
+            answers = index.get(days, asat, locked)
+            expected = {d: scan(d, asat, locked) for d in days}
+            assert {d: c.point for d, c in answers.items()} == {d: i for d, i in expected.items() if i is not None}
+
+
+@pytest.fixture
+def performance():
+    src = SeededSource()
+    src.add_seeded_perf_data("test", "checkpoints", '2013-12-31', 24106)
+    # Nothing changes in the source after the blocks are stored
+    src.get_changes = lambda *args: None
+    performance = Performance(entity_scope="test", entity_code="checkpoints", src=src,
+                              block_store=InMemoryBlockStore(), perf_start='2013-12-31')
+
+    # Store the performance in yearly blocks
+    for year in range(2014, 2021):
+        list(performance.get_performance(True, f'{year - 1}-12-31', f'{year}-12-31', f'{year + 1}-01-01',
+                                         create=True))
+    return performance
+
+
+@pytest.mark.parametrize("locked", [True, False])
+def test_report_reads_from_the_checkpoints(performance, monkeypatch, locked):
+    fields = [DAY, MTD, QTD, YTD, ROLL_YEAR, ROLL_3YR, ROLL_5YR, ANN_5YR, VOL_5YR, ANN_VOL_3YR, ANN_INC]
+    get_performance = performance.get_performance
+    read_from = []
+
+    def recording(locked, start_date, *args, **kwargs):
+        read_from.append(start_date)
+        return get_performance(locked, start_date, *args, **kwargs)
+
+    monkeypatch.setattr(performance, 'get_performance', recording)
+
+    def report(**kwargs):
+        return pd.DataFrame.from_records(list(performance.report(
+            locked, '2020-06-30', '2020-06-30', '2021-01-01', fields=fields, **kwargs)))
+
+    actual, expected = report(), report(checkpoints=False)
+    assert read_from == [as_date('2020-06-29'), as_date('2015-06-30')]
+
+    for column in expected.columns:
+        if column == 'date' or column == 'key':
+            assert list(actual[column]) == list(expected[column])
+        else:
+            np.testing.assert_allclose(actual[column], expected[column], rtol=0, atol=1e-10)
+
+
+def test_stale_checkpoints_are_not_used(performance, monkeypatch):
+    read_from = []
+    get_performance = performance.get_performance
+    monkeypatch.setattr(performance, 'get_performance',
+                        lambda locked, start_date, *args: read_from.append(start_date) or get_performance(
+                            locked, start_date, *args))
+
+    # The source has changed from 2019-01-01 so only the earlier checkpoints can be used
+    monkeypatch.setattr(performance.src, 'get_changes', lambda *args: as_date('2019-01-01'))
+    performance.report(False, '2020-06-30', '2020-06-30', '2021-01-01', fields=[DAY, ROLL_YEAR, ROLL_5YR])
+    assert read_from == [as_date('2019-06-30')]
+
+    # Later changes do not apply to a locked period so every checkpoint is used
+    read_from.clear()
+    performance.report(True, '2020-06-30', '2020-06-30', '2021-01-01', fields=[DAY, ROLL_YEAR, ROLL_5YR])
+    assert read_from == [as_date('2020-06-29')]
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import block_ops
+from apis_returns.upsert_returns import upsert_portfolio_returns
+from apis_returns.upsert_returns_models import PerformanceDataPointRequest, PerformanceDataSetRequest
+from block_stores.block_store_in_memory import InMemoryBlockStore
+from chunking import ChunkingPolicy
+from config.config import PerformanceConfiguration
+from misc import as_date
+from pds import PerformanceDataSet
+from perf import Performance
+from tests.utilities.performance import assert_same, make_corrected_source, values
+
+
+def test_chunk_bounds():
+    assert ChunkingPolicy('M').bounds(as_date('2020-01-15'), as_date('2020-03-10')) == [
+        (as_date('2020-01-15'), as_date('2020-01-31')),
+        (as_date('2020-02-01'), as_date('2020-02-29')),
+        (as_date('2020-03-01'), as_date('2020-03-10'))]
+    assert ChunkingPolicy('q').chunk_start(as_date('2020-08-20 10:00')) == as_date('2020-07-01')
+    assert ChunkingPolicy('Q').next_start(as_date('2020-12-31')) == as_date('2021-01-01')
+
+    # Chunks of a number of days are aligned with the epoch
+    assert ChunkingPolicy('10D').chunk_start(as_date('1970-01-15')) == as_date('1970-01-11')
+    assert ChunkingPolicy(10).next_start(as_date('1970-01-15')) == as_date('1970-01-21')
+
+    with pytest.raises(ValueError):
+        ChunkingPolicy(0)
+
+
+def test_chunks_link_on_from_each_other():
+    block = PerformanceDataSet('2020-01-10', '2020-03-05', '2020-04-01')
+    dates = list(pd.date_range('2020-01-10', '2020-03-05', tz='UTC')) + [as_date('2020-01-31 15:00')]
+    block.add_returns_batch(sorted(dates), [100.0] * len(dates), [0.001 * (i % 7 - 3) for i in range(len(dates))])
+
+    chunks = ChunkingPolicy('M').split(block)
+
+    assert [(c.from_date, c.to_date) for c in chunks] == [
+        (as_date('2020-01-10'), as_date('2020-01-31 15:00')),
+        (as_date('2020-02-01'), as_date('2020-02-29')),
+        (as_date('2020-03-01'), as_date('2020-03-05'))]
+    for before, after in zip(chunks, chunks[1:]):
+        assert after.previous == before.latest_data_point
+
+    assert_same(values(block_ops.combine(chunks, True, '2020-01-10', '2020-03-05', '2020-04-01')),
+                values(block.get_data_points()))
+
+    # A block within a single chunk is not split
+    assert ChunkingPolicy('Q').split(chunks[1]) == [chunks[1]]
+
+
+def test_new_dates_are_appended_to_the_open_chunk(monkeypatch):
+    expected = values(Performance('test', 'whole', make_corrected_source(7, '2020-02-15'), InMemoryBlockStore()).get_performance(
+        False, '2019-12-31', '2020-03-31', '2020-04-01'))
+
+    monkeypatch.setitem(PerformanceConfiguration.global_config, 'BlockChunking', 'M')
+    store = InMemoryBlockStore()
+    performance = Performance('test', 'chunked', make_corrected_source(7, '2020-02-15'), store)
+
+    for end_date, asat in [('2020-01-10', '2020-04-01'), ('2020-01-20', '2020-04-02'), ('2020-02-10', '2020-04-03')]:
+        list(performance.get_performance(True, '2019-12-31', end_date, asat, create=True))
+
+    # The open chunk is read again from its start rather than adding a block for the new dates
+    assert [(b.from_date, b.to_date) for b in store.get_blocks('test', 'chunked')] == [
+        (as_date('2019-12-31'), as_date('2019-12-31')),
+        (as_date('2020-01-01'), as_date('2020-01-10')),
+        (as_date('2020-01-01'), as_date('2020-01-20')),
+        (as_date('2020-01-01'), as_date('2020-01-31')),
+        (as_date('2020-02-01'), as_date('2020-02-10'))]
+
+    assert_same(values(performance.get_performance(True, '2019-12-31', '2020-03-31', '2020-04-04', create=True)),
+                expected)
+    assert store.get_blocks('test', 'chunked')[-1].from_date == as_date('2020-03-01')
+
+
+def test_restatements_only_rewrite_the_chunks_they_touch(monkeypatch):
+    expected = values(Performance('test', 'whole', make_corrected_source(7, '2020-02-15'), InMemoryBlockStore()).get_performance(
+        False, '2019-12-31', '2020-03-31', '2020-04-15'))
+
+    monkeypatch.setitem(PerformanceConfiguration.global_config, 'RelativeBlocks', True)
+    monkeypatch.setitem(PerformanceConfiguration.global_config, 'BlockChunking', 'M')
+    store = InMemoryBlockStore()
+    performance = Performance('test', 'chunked', make_corrected_source(7, '2020-02-15'), store)
+    list(performance.get_performance(True, '2019-12-31', '2020-03-31', '2020-04-01', create=True))
+    stored = len(store.get_blocks('test', 'chunked'))
+
+    corrected = values(performance.get_performance(False, '2019-12-31', '2020-03-31', '2020-04-15', create=True))
+
+    assert [(b.from_date, b.to_date) for b in store.get_blocks('test', 'chunked')[stored:]] == [
+        (as_date('2020-02-01'), as_date('2020-02-29'))]
+    assert_same(corrected, expected)
+
+
+def test_upserted_returns_are_chunked():
+    store = InMemoryBlockStore()
+    chunking = ChunkingPolicy('M')
+
+    def upsert(dates, rors):
+        return upsert_portfolio_returns('perf', 'test', 'returns', {
+            'request': PerformanceDataSetRequest([PerformanceDataPointRequest(d, r) for d, r in zip(dates, rors)])
+        }, store, chunking)
+
+    rnd = np.random.RandomState(3)
+    dates = pd.date_range('2020-01-01', '2020-02-20', tz='UTC')
+    rors = rnd.normal(0.0, 0.01, len(dates))
+
+    response = upsert(dates[:40], rors[:40])
+    assert len(response.failures) == 0
+    assert [(b.from_date, b.to_date) for b in store.get_blocks('test', 'returns')] == [
+        (as_date('2020-01-01'), as_date('2020-01-31')),
+        (as_date('2020-02-01'), as_date('2020-02-09'))]
+    assert len(response.values['request'].data_points) == 40
+
+    # The later returns are appended to the returns already stored in February and linked onto January
+    response = upsert(dates[40:], rors[40:])
+    blocks = store.get_blocks('test', 'returns')
+    assert (blocks[-1].from_date, blocks[-1].to_date) == (as_date('2020-02-01'), as_date('2020-02-20'))
+    assert blocks[-1].previous == blocks[0].latest_data_point
+    assert response.values['request'].from_date == as_date('2020-02-01')
+
+    linked = list(block_ops.combine(blocks, False, '2020-01-01', '2020-02-20', '2030-01-01'))
+    assert [p.date for p in linked] == list(dates)
+    assert linked[-1].cum_fctr == pytest.approx(np.prod(1 + rors))
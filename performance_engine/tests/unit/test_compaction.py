@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import block_ops
+from block_stores.block_store_in_memory import InMemoryBlockStore
+from block_stores.block_store_local import LocalBlockStore
+from block_stores.compaction import BlockCompactor, compact_blocks
+from config.config import PerformanceConfiguration
+from pds import PerformanceDataSet
+from tests.utilities.performance import assert_same, values
+
+retention = pd.Timedelta(days=30)
+
+
+def make_block(from_date, to_date, asat, seed, previous=None):
+    dates = pd.date_range(from_date, to_date, tz='UTC')
+    rors = np.random.RandomState(seed).normal(0.0, 0.01, len(dates))
+    block = PerformanceDataSet(from_date, to_date, asat, previous=previous)
+    return block.add_returns_batch(dates, [100.0] * len(dates), rors)
+
+
+def fill(store, scope, code):
+    # A month of returns restated twice, followed by later months
+    for from_date, to_date, asat, seed in [
+            ('2020-01-01', '2020-01-31', '2020-02-01', 1),
+            ('2020-01-10', '2020-02-15', '2020-02-16', 2),
+            ('2020-02-01', '2020-02-29', '2020-03-01', 3),
+            ('2020-01-20', '2020-03-02', '2020-03-05', 4),
+            ('2020-02-20', '2020-03-15', '2020-03-20', 5)]:
+        store.add_block(scope, code, make_block(from_date, to_date, asat, seed))
+
+
+def view(store, scope, code, locked, asat):
+    blocks = store.find_blocks(scope, code, '2020-01-01', '2020-03-15', asat)
+    return values(block_ops.combine(blocks, locked, '2020-01-01', '2020-03-15', asat))
+
+
+def test_queries_in_the_retention_window_are_unchanged():
+    store, archive = InMemoryBlockStore(), InMemoryBlockStore()
+    fill(store, 'test', 'compact')
+    asats = ['2020-03-10', '2020-03-25']
+    before = {(locked, asat): view(store, 'test', 'compact', locked, asat)
+              for locked in [True, False] for asat in asats}
+
+    metrics = compact_blocks(store, 'test', 'compact', retention, asat='2020-04-09', archive=archive)
+
+    # The four restated blocks become a locked and an unlocked snapshot, the block in the window is kept
+    assert (metrics.blocks_before, metrics.blocks_after, metrics.removed, metrics.snapshots) == (5, 3, 4, 2)
+    assert len(archive.get_blocks('test', 'compact')) == 4
+    for (locked, asat), expected in before.items():
+        assert_same(view(store, 'test', 'compact', locked, asat), expected)
+
+    # Compacting again has nothing left to do
+    assert compact_blocks(store, 'test', 'compact', retention, asat='2020-04-09').removed == 0
+
+
+def test_blocks_which_were_never_restated_become_one_snapshot(monkeypatch):
+    monkeypatch.setitem(PerformanceConfiguration.global_config, 'CompactionRetentionDays', 10)
+    store = InMemoryBlockStore()
+    first = make_block('2020-01-01', '2020-01-31', '2020-02-01', 1)
+    store.add_block('test', 'append', first)
+    store.add_block('test', 'append', make_block('2020-02-01', '2020-02-29', '2020-03-01', 2, first.latest_data_point))
+    expected = view(store, 'test', 'append', False, '2020-03-01')
+
+    metrics = compact_blocks(store, 'test', 'append', asat='2020-03-20')
+
+    assert (metrics.blocks_after, metrics.snapshots) == (1, 1)
+    assert_same(view(store, 'test', 'append', True, '2020-03-01'), expected)
+
+
+def test_local_block_store_files_are_kept(tmp_path, monkeypatch):
+    monkeypatch.setitem(PerformanceConfiguration.global_config, 'LocalStorePath', str(tmp_path))
+    fill(LocalBlockStore('test', 'local'), 'test', 'local')
+
+    # The blocks of a store read back from the file system are loaded when they are first used
+    store = LocalBlockStore('test', 'local')
+    expected = view(LocalBlockStore('test', 'local'), 'test', 'local', False, '2020-03-25')
+    found = store.find_blocks('test', 'local', '2020-01-01', '2020-03-15', '2020-03-25')
+
+    compact_blocks(store, 'test', 'local', retention, asat='2020-04-09')
+
+    # The remaining block keeps its file and the snapshots are saved to new ones
+    assert sorted(p.name for p in tmp_path.glob('test/local.block-*')) == [f'local.block-{i}' for i in [5, 6, 7]]
+    assert_same(view(LocalBlockStore('test', 'local'), 'test', 'local', False, '2020-03-25'), expected)
+
+    # The blocks found before compaction can still be loaded
+    combined = list(block_ops.combine(found, False, '2020-01-01', '2020-03-15', '2020-03-25'))
+    assert [p.date for p in combined] == list(expected.index)
+
+
+def test_compactor_records_metrics_and_failures():
+    store = InMemoryBlockStore()
+    fill(store, 'test', 'a')
+    compactor = BlockCompactor(store, [('test', 'a')], retention=pd.Timedelta(0))
+
+    [metrics] = compactor.run_once()
+    assert metrics.blocks_after == 2
+    assert compactor.metrics[('test', 'a')] == metrics
+
+    # A block store which can not remove blocks can not be compacted
+    class AppendOnly(InMemoryBlockStore):
+        remove_blocks = InMemoryBlockStore.__bases__[0].remove_blocks
+
+    compactor = BlockCompactor(AppendOnly(), [('test', 'b')])
+    assert compactor.run_once() == []
+    assert 'does not support' in compactor.failures[('test', 'b')]
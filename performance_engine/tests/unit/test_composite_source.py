@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import comp_method
+from apis_performance.portfolio_performance_api import PortfolioPerformanceApi
+from block_stores.block_store_in_memory import InMemoryBlockStore
+from composites.in_memory_composite import InMemoryComposite
+from interfaces import ICompositeMethod
+from misc import as_date
+from performance_sources.comp_src import CompositeSource
+from performance_sources.mock_src import SeededSource
+from pds import CompositeMatrix, PerformanceDataPoint
+
+
+class RangedComposite(InMemoryComposite):
+    """
+    A composite which one member leaves for February and then rejoins
+    """
+
+    def get_composite_members(self, composite_scope, composite_code, start_date, end_date, asat):
+        members = super().get_composite_members(composite_scope, composite_code, start_date, end_date, asat)
+        members['test_fund-1'] = [(start_date, as_date('2020-01-31')), (as_date('2020-03-01'), end_date)]
+        return members
+
+
+class CountingApi(PortfolioPerformanceApi):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.prepared = []
+
+    def prepare_portfolio_performance(self, portfolio_scope, portfolio_code):
+        self.prepared.append(portfolio_code)
+        return super().prepare_portfolio_performance(portfolio_scope, portfolio_code)
+
+
+def make_source(workers):
+    src = SeededSource()
+    composite = RangedComposite()
+    composite.create_composite('test', 'composite')
+    for i in range(6):
+        src.add_seeded_perf_data('test', f'fund-{i}', '2019-12-01', seed=100 + i)
+        composite.add_composite_member('test', 'composite', 'test', f'fund-{i}', '2019-12-01', None)
+
+    return CompositeSource(composite, CountingApi(InMemoryBlockStore(), src), 'asset', workers=workers)
+
+
+def test_members_are_fetched_concurrently_in_a_deterministic_order():
+    serial, concurrent = make_source(1), make_source(4)
+
+    expected = serial.get_perf_data('test', 'composite', '2020-01-01', '2020-03-31', '2020-04-01')
+    actual = concurrent.get_perf_data('test', 'composite', '2020-01-01', '2020-03-31', '2020-04-01')
+
+    assert list(actual['date']) == list(expected['date'])
+    for column in ['wt', 'ror']:
+        np.testing.assert_array_equal(actual[column], expected[column])
+
+    # The asset weighted returns start the day after the start date, and every date has a row
+    assert list(actual['date']) == list(pd.date_range('2020-01-02', '2020-03-31', tz='UTC'))
+
+    # Both date ranges of the member which left for February are included
+    wt = actual.set_index('date')['wt']
+    assert wt[as_date('2020-01-31')] / wt[as_date('2020-02-15')] > 1.15
+    assert wt[as_date('2020-03-05')] / wt[as_date('2020-02-15')] > 1.15
+
+    # Each member is prepared once for all of its date ranges and timed
+    assert sorted(concurrent.performance_api.prepared) == [f'fund-{i}' for i in range(6)]
+    assert sorted(concurrent.member_timings) == [f'test_fund-{i}' for i in range(6)]
+    assert all(t > 0 for t in concurrent.member_timings.values())
+
+
+@pytest.mark.parametrize("method", [comp_method.AssWt, comp_method.EqWt, comp_method.Agg])
+def test_vectorised_methods_match_accumulating_each_point(method):
+    rng = np.random.RandomState(7)
+    dates = pd.date_range('2020-01-01', '2020-01-20', tz='UTC')
+
+    # Members join and leave on different dates, and one has no weight on its first day
+    members = []
+    for start, end in [(0, 20), (3, 12), (8, 20), (5, 6)]:
+        members.append([
+            PerformanceDataPoint(date, tmv=rng.uniform(50, 150), flows=rng.uniform(-5, 5),
+                                 weight=0.0 if (i == 0 and start == 8) else rng.uniform(50, 150),
+                                 ror=rng.normal(0.0, 0.01))
+            for i, date in enumerate(dates[start:end])])
+
+    matrix = CompositeMatrix.from_points(members)
+    expected = ICompositeMethod.combine.__func__(method, matrix)
+    actual = method.combine(matrix)
+
+    assert list(actual.columns) == list(expected.columns)
+    assert list(actual['date']) == list(dates)
+    for column in expected.columns:
+        if column in ['date', 'key']:
+            assert list(actual[column]) == list(expected[column])
+        else:
+            np.testing.assert_allclose(actual[column], expected[column], rtol=1e-12)
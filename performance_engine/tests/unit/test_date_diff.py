@@ -1,3 +1,4 @@
+import numpy as np
 import pytest
 import perf
 from misc import *
@@ -40,3 +41,17 @@ def test_dates(scenario):
     dates,expectation = scenario
 
     assert perf.date_diffs(*dates) == expectation
+
+    years, reg_days, lyr_days = perf.date_diffs_array(*(np.array([d.value]) for d in dates))
+    assert (years[0], reg_days[0], lyr_days[0]) == expectation
+
+
+def test_vectorised_annualise_matches():
+    rnd = np.random.RandomState(0)
+    days = pd.date_range('2010-01-01', '2025-12-31', tz='UTC')
+    d1 = days[rnd.randint(0, len(days), 2000)]
+    d2 = d1 + pd.to_timedelta(rnd.randint(0, 3000, 2000), unit='D')
+    r = rnd.uniform(-0.5, 2.0, 2000)
+
+    expected = [perf.annualise(a, b, c) for a, b, c in zip(d1, d2, r)]
+    np.testing.assert_allclose(perf.annualise_array(d1.asi8, d2.asi8, r), expected, rtol=1e-10, atol=1e-12)
@@ -0,0 +1,98 @@
+import threading
+from types import SimpleNamespace
+
+import flows
+from misc import as_date
+
+
+class FakeResult:
+    def __init__(self, values):
+        self.values = values
+
+    def match(self, failure, success):
+        return success(SimpleNamespace(content=SimpleNamespace(values=self.values)))
+
+
+def txn(date, amount, type='FundsIn', exchange_rate=1.0, trade_rate=None):
+    properties = {} if trade_rate is None else {
+        flows.TRADE_TO_PORTFOLIO_RATE: SimpleNamespace(value=SimpleNamespace(metric_value=SimpleNamespace(
+            value=trade_rate)))}
+    return SimpleNamespace(type=type, transaction_date=as_date(date), exchange_rate=exchange_rate,
+                           total_consideration=SimpleNamespace(amount=amount), properties=properties)
+
+
+class FakeApi:
+    """
+    Builds the transactions of a portfolio between two dates
+    """
+
+    def __init__(self, transactions):
+        self.transactions = transactions
+        self.requests = []
+        self.lock = threading.Lock()
+        self.models = SimpleNamespace(TransactionQueryParameters=lambda **kwargs: SimpleNamespace(**kwargs))
+        self.call = SimpleNamespace(build_transactions=self.build_transactions)
+
+    def build_transactions(self, scope, code, transaction_query_parameters, as_at):
+        params = transaction_query_parameters
+        with self.lock:
+            self.requests.append((params.start_date, params.end_date, as_at))
+        # The end date is inclusive of the whole day
+        return FakeResult([t for t in self.transactions
+                           if params.start_date <= t.transaction_date <= params.end_date.normalize()])
+
+
+config = SimpleNamespace(ext_flow_types=['FundsIn', 'FundsOut'], get=lambda key, default=None: default)
+
+
+def test_flows_are_fetched_in_chunks():
+    api = FakeApi([
+        txn('2020-01-03', 100.004), txn('2020-01-03', -20.0, 'FundsOut'), txn('2020-01-05', 50.0, 'Buy'),
+        txn('2020-01-12', 10.0, exchange_rate=2.0), txn('2020-01-12', 10.0, exchange_rate=2.0, trade_rate=4.0),
+        txn('2020-01-25', 7.0)])
+
+    result = flows.get_flows(api, 'test', 'fund', config, '2020-01-01', '2020-01-31', '2020-02-01', chunk_days=10,
+                             workers=3)
+
+    assert len(api.requests) == 4
+    assert dict(result) == {as_date('2020-01-03'): 80.0, as_date('2020-01-12'): 40.0, as_date('2020-01-25'): 7.0}
+
+
+def test_flow_cursor_accumulates_up_to_each_date():
+    crs = flows.FlowCursor({as_date('2020-01-02'): 5.0, as_date('2020-01-04'): -2.0, as_date('2020-01-05'): 3.0})
+
+    assert [crs.upto(d) for d in ['2020-01-01', '2020-01-02', '2020-01-03', '2020-01-05', '2020-01-09']] == \
+        [0.0, 5.0, 0.0, 1.0, 0.0]
+
+
+def test_cached_flows_are_fetched_from_the_correction():
+    fetched, changes = [], []
+    by_asat = {
+        as_date('2020-02-01'): {as_date('2020-01-03'): 1.0, as_date('2020-01-08'): 2.0},
+        as_date('2020-02-05'): {as_date('2020-01-03'): 1.0, as_date('2020-01-08'): 5.0, as_date('2020-01-12'): 3.0}}
+    cache = flows.FlowCache()
+
+    def get(from_date, to_date, asat, changed):
+        def fetch(f, t):
+            fetched.append((f, t))
+            return {d: v for d, v in by_asat[as_date(asat)].items() if f <= d <= t}
+
+        def get_changes(last_date, last_asat, curr_asat):
+            changes.append((last_date, last_asat, curr_asat))
+            return changed
+
+        return dict(cache.get_flows(fetch, get_changes, 'test', 'fund', from_date, to_date, asat))
+
+    assert get('2020-01-01', '2020-01-10', '2020-02-01', None) == by_asat[as_date('2020-02-01')]
+    assert get('2020-01-01', '2020-01-10', '2020-02-01', None) == by_asat[as_date('2020-02-01')]
+    assert len(fetched) == 1 and len(changes) == 0
+
+    # At a later asAt date only the flows from the correction are fetched again
+    assert get('2020-01-02', '2020-01-15', '2020-02-05', as_date('2020-01-06')) == by_asat[as_date('2020-02-05')]
+    assert changes == [(as_date('2020-01-10'), as_date('2020-02-01'), as_date('2020-02-05'))]
+    assert fetched[1] == (as_date('2020-01-06'), as_date('2020-01-15'))
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    # An earlier asAt date is fetched as it was
+    assert get('2020-01-01', '2020-01-10', '2020-02-01', None) == by_asat[as_date('2020-02-01')]
+    assert len(fetched) == 3
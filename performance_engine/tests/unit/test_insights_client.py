@@ -0,0 +1,82 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+from lusid.exceptions import ApiException
+
+from composites.insights_client import InsightsClient
+from composites.portfolio_groups_composite import CommandDescriptions, PortfolioGroupComposite
+
+api_factory = SimpleNamespace(api_client=SimpleNamespace(configuration=SimpleNamespace(
+    host="https://test.lusid.com/api", access_token="token")))
+
+
+class FakeSession:
+    """
+    Returns the status codes queued for each request, then the request itself
+    """
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.urls = []
+        self.threads = set()
+        self.lock = threading.Lock()
+
+    def get(self, url, headers):
+        request_id = url.split("/")[-2]
+        with self.lock:
+            self.urls.append(url)
+            self.threads.add(threading.get_ident())
+            queued = self.statuses.get(request_id, [])
+            status = queued.pop(0) if len(queued) > 0 else 200
+
+        body = {"scope": "test", "code": request_id}
+        text = json.dumps({"url": "https://test.lusid.com/api/api/portfoliogroups/test/group?effectiveAt=2020-01-02",
+                           "body": json.dumps(body)})
+        return SimpleNamespace(status_code=status, text=text, headers={})
+
+    def close(self):
+        pass
+
+
+def test_requests_are_retried_with_backoff():
+    session = FakeSession({"a": [404, 503], "b": [404]})
+    client = InsightsClient(api_factory, workers=2, retries=3, backoff=0.001, session=session)
+
+    result = client.get_requests(["a", "b", "c"])
+    assert [json.loads(r["body"])["code"] for r in result] == ["a", "b", "c"]
+    assert session.urls[0] == "https://test.lusid.com/insights/api/requests/a/request"
+
+    # The executor is reused between calls
+    client.get_requests(["d", "e"])
+    assert len(session.threads) <= 2
+
+    metrics = client.metrics()
+    assert (metrics["attempts"], metrics["retries"], metrics["failures"]) == (8, 3, 0)
+    assert 0 <= metrics["p50"] <= metrics["p95"] <= metrics["max"]
+
+    # A request which is still not found after the retries, or which fails, is raised
+    session.statuses = {"f": [404] * 4, "g": [401]}
+    with pytest.raises(ApiException):
+        client.get_requests(["f"])
+    with pytest.raises(ApiException):
+        client.get_requests(["g"])
+    assert client.metrics()["failures"] == 2
+
+    client.close()
+
+
+def test_commands_are_enriched_from_the_client():
+    client = InsightsClient(api_factory, session=FakeSession({}))
+    composite = PortfolioGroupComposite(api_factory=api_factory, insights_client=client)
+    command = SimpleNamespace(path="0HM1-0001-extra", description=CommandDescriptions.add_command,
+                              processed_time="2020-01-05")
+
+    enriched = composite._enrich_commands([command])
+    assert list(enriched) == ["0HM1:0001"]
+    assert [e[:4] for e in enriched["0HM1:0001"]] == [
+        ("test", "0HM1:0001", CommandDescriptions.add_command, "2020-01-05")]
+    assert str(enriched["0HM1:0001"][0][4].date()) == "2020-01-02"
+
+    client.close()
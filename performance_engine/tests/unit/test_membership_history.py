@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+from composites.membership_history import LocalMembershipHistoryStore, MembershipHistoryStore
+from composites.portfolio_groups_composite import CommandDescriptions, PortfolioGroupComposite
+from misc import as_date, now
+
+
+def command(n, description, processed_time):
+    return SimpleNamespace(path=f"0HM{n}-000{n}-extra", description=description,
+                           processed_time=as_date(processed_time).to_pydatetime())
+
+
+class FakeGroupsApi:
+    """
+    Returns the commands of a Portfolio Group processed between two asAt dates
+    """
+
+    def __init__(self, commands):
+        self.commands = commands
+        self.requests = []
+
+    def get_portfolio_group_commands(self, scope, code, from_as_at=None, to_as_at=None):
+        self.requests.append((from_as_at, to_as_at))
+        return SimpleNamespace(values=[c for c in self.commands
+                                       if (from_as_at is None or c.processed_time >= from_as_at) and
+                                       (to_as_at is None or c.processed_time <= to_as_at)])
+
+
+def make_composite(commands, store):
+    api = FakeGroupsApi(commands)
+    composite = PortfolioGroupComposite(api_factory=SimpleNamespace(build=lambda cls: api), membership_store=store)
+    enriched = []
+
+    def enrich(new_commands):
+        enriched.extend(c.path for c in new_commands)
+        return {
+            ":".join(c.path.split("-")[:2]): [] if c.description == CommandDescriptions.create_command else
+            [("test", f"fund-{c.path[3]}", c.description, c.processed_time, as_date('2020-01-01').to_pydatetime())]
+            for c in new_commands}
+
+    composite._enrich_commands = enrich
+    return composite, api, enriched
+
+
+def test_only_new_commands_are_fetched_and_enriched(tmp_path):
+    commands = [command(1, CommandDescriptions.create_command, '2020-01-01'),
+                command(2, CommandDescriptions.add_command, '2020-01-02'),
+                command(3, CommandDescriptions.add_command, '2020-01-03')]
+    composite, api, enriched = make_composite(commands, LocalMembershipHistoryStore(str(tmp_path)))
+
+    members = composite.get_composite_members('test', 'group', '2020-01-01', '2020-02-01', '2020-02-01')
+    assert sorted(members) == ['test_fund-2', 'test_fund-3']
+    assert len(enriched) == 3 and api.requests[0] == (None, None)
+
+    # A later command is the only one fetched and enriched, from the asAt date of the last sync
+    commands.append(command(4, CommandDescriptions.add_command, now()))
+    members = composite.get_composite_members('test', 'group', '2020-01-01', '2020-02-01', '2020-02-01')
+    assert sorted(members) == ['test_fund-2', 'test_fund-3', 'test_fund-4']
+    assert enriched[3:] == [commands[3].path]
+    assert api.requests[1][0] is not None
+
+    # The history is read back from the file system by a new store, the past is not synced again
+    composite, api, enriched = make_composite(commands, LocalMembershipHistoryStore(str(tmp_path)))
+    history = composite._get_portfolio_group_membership_history('test', 'group', as_date('2020-01-03'))
+    assert sorted(history) == ['test_fund-2', 'test_fund-3']
+    assert history['test_fund-2'] == [(CommandDescriptions.add_command, commands[1].processed_time,
+                                       as_date('2020-01-01').to_pydatetime())]
+    assert api.requests == [] and enriched == []
+
+
+def test_store_from_config(monkeypatch, tmp_path):
+    store = MembershipHistoryStore()
+    assert MembershipHistoryStore.from_config(store) is store
+    assert type(MembershipHistoryStore.from_config()) is MembershipHistoryStore
+
+    from config.config import PerformanceConfiguration
+    monkeypatch.setitem(PerformanceConfiguration.global_config, 'MembershipHistoryPath', str(tmp_path))
+    assert MembershipHistoryStore.from_config().path == str(tmp_path)
@@ -1,4 +1,8 @@
-from pds import PerformanceDataSet
+import jsonpickle
+import numpy as np
+import pytest
+
+from pds import PerformanceDataPoint, PerformanceDataSet
 
 
 def test_lazy_loading():
@@ -27,3 +31,93 @@ def test_lazy_loading():
     # and it is the same object we got earlier
     assert r is r2
 
+
+
+def test_columnar_linking_matches_data_points():
+    previous = PerformanceDataPoint('2018-03-04').from_returns(100.0, 0.01)
+
+    pds = PerformanceDataSet('2018-03-05', '2018-03-09', '2018-03-19', previous=previous)
+    rors = [0.02, -0.01, 0.005, 0.0, 0.03]
+
+    expected = []
+    latest = previous
+    for day, ror in enumerate(rors):
+        date = f'2018-03-0{day + 5}'
+        pds.add_returns(date, 100.0, ror)
+        latest = PerformanceDataPoint(date).from_returns(100.0, ror, latest)
+        expected.append(latest)
+
+    assert pds.get_data_points() == expected
+    assert pds.latest_data_point == expected[-1]
+
+    columns = pds.get_columns()
+    assert list(columns['cnt']) == [1, 2, 3, 4, 5]
+    assert columns['cum_fctr'][-1] == pytest.approx(expected[-1].cum_fctr)
+
+
+def test_values_are_attributed():
+    pds = PerformanceDataSet('2018-03-05', '2018-03-06', '2018-03-19')
+    pds.add_values('2018-03-05', [('a', 100.0, 100.0), ('b', 50.0, 50.0)])
+    pds.add_values('2018-03-06', [('a', 110.0, 0.0), ('b', 45.0, 0.0)])
+
+    latest = pds.latest_data_point
+
+    assert latest.tmv == 155.0
+    assert latest.ror == pytest.approx(5.0 / 150.0)
+    assert latest.data['a'].pnl == 10.0
+    assert latest.data['b'].pnl == -5.0
+    assert latest.cum_flow == 150.0
+
+
+def test_serialisation_round_trip():
+    pds = PerformanceDataSet('2018-03-05', '2018-03-06', '2018-03-19')
+    pds.add_values('2018-03-05', [('a', 100.0, 100.0)])
+    pds.add_values('2018-03-06', [('a', 101.0, 0.0)])
+
+    assert jsonpickle.decode(jsonpickle.encode(pds)) == pds
+
+
+def test_values_batch_matches_per_day():
+    previous = PerformanceDataPoint('2018-03-04').from_values([('a', 0.0, 90.0, 90.0)])
+    rows = [
+        ('2018-03-05', 'a', 100.0, 5.0),
+        ('2018-03-05', 'b', 50.0, 50.0),
+        ('2018-03-06', 'b', 45.5, 0.0),
+        ('2018-03-06', 'a', 98.25, -2.0),
+        ('2018-03-07', 'a', 99.0, 0.0),
+        ('2018-03-07', 'b', 47.0, 0.0),
+        ('2018-03-07', 'c', 10.0, 10.0),
+    ]
+
+    per_day = PerformanceDataSet('2018-03-05', '2018-03-07', '2018-03-19', previous=previous)
+    for date in sorted(set(r[0] for r in rows)):
+        per_day.add_values(date, [(key, mv, net) for d, key, mv, net in rows if d == date])
+
+    batch = PerformanceDataSet('2018-03-05', '2018-03-07', '2018-03-19', previous=previous)
+    batch.add_values_batch(*zip(*reversed(rows)))
+
+    for name, column in per_day.get_columns().items():
+        np.testing.assert_array_equal(batch.get_columns()[name], column)
+
+    assert batch.get_data_points() == per_day.get_data_points()
+
+
+def test_returns_batch_matches_per_day():
+    previous = PerformanceDataPoint('2018-03-04').from_returns(100.0, 0.01)
+    dates = ['2018-03-05', '2018-03-06', '2018-03-07']
+    weights = [100.0, 102.0, 101.0]
+    rors = [0.02, -0.01, 0.005]
+
+    per_day = PerformanceDataSet('2018-03-05', '2018-03-07', '2018-03-19', previous=previous)
+    per_day.add_returns(dates[0], weights[0], rors[0])
+    per_day.add_returns(dates[1], weights[1], rors[1])
+    per_day.add_returns(dates[2], weights[2], rors[2])
+
+    batch = PerformanceDataSet('2018-03-05', '2018-03-07', '2018-03-19', previous=previous)
+    batch.add_returns_batch(dates[:2], weights[:2], rors[:2])
+    batch.add_returns(dates[2], weights[2], rors[2])
+
+    for name, column in per_day.get_columns().items():
+        np.testing.assert_array_equal(batch.get_columns()[name], column)
+
+    assert batch.get_data_points() == per_day.get_data_points()
@@ -6,6 +6,7 @@ import pytest
 from perf import Performance
 from fields import *
 from block_stores.block_store_in_memory import InMemoryBlockStore
+import numpy as np
 import pandas as pd
 from performance_sources.mock_src import SeededSource
 
@@ -157,3 +158,63 @@ def test_perf_start_date_is_honoured():
     cum_ror = prf[-1]['inception']
 
     assert cum_ror == pytest.approx(0.187343)
+
+def test_vectorised_report_matches_rows():
+    fields = [DAY, WTD, MTD, QTD, YTD, ROLL_WEEK, ROLL_MONTH, ROLL_QTR, ROLL_YEAR, ROLL_3YR, ROLL_5YR, AGE_DAYS,
+              ANN_INC, ANN_1YR, ANN_3YR, ANN_5YR, VOL_INC, VOL_1YR, VOL_3YR, VOL_5YR, ANN_VOL_INC, ANN_VOL_1YR,
+              ANN_VOL_3YR, ANN_VOL_5YR, RISK_FREE_1YR, RISK_FREE_3YR, RISK_FREE_5YR, SHARPE_1YR, SHARPE_3YR,
+              SHARPE_5YR, 'since-launch']
+
+    src = SeededSource(rfr_func=lambda date, days: None if date.month == 2 else 0.002 * days / 365.0)
+    src.add_seeded_perf_data("test", "vectorised", '2013-12-31', 24106)
+    performance = Performance(entity_scope="test", entity_code="vectorised", src=src,
+                              block_store=InMemoryBlockStore())
+
+    def report(vectorised):
+        return pd.DataFrame.from_records(performance.report(
+            False, '2014-06-30', '2020-03-05', '2020-03-05', fields=fields,
+            ext_fields={'since-launch': as_date('2016-01-01')}, vectorised=vectorised))
+
+    actual, expected = report(True), report(False)
+
+    assert list(actual.columns) == list(expected.columns)
+    assert list(actual['date']) == list(expected['date'])
+    assert list(actual['key']) == list(expected['key'])
+
+    for name in actual.columns.drop(['date', 'key']):
+        np.testing.assert_allclose(
+            actual[name].astype(float), expected[name].astype(float), rtol=1e-10, atol=1e-12, err_msg=name)
+
+
+def test_streaming_report_matches_rows():
+    fields = [DAY, WTD, MTD, QTD, YTD, ROLL_YEAR, ROLL_3YR, ANN_INC, ANN_1YR, VOL_INC, VOL_1YR, ANN_VOL_3YR,
+              RISK_FREE_1YR, SHARPE_1YR, 'since-launch']
+
+    src = SeededSource(rfr_func=lambda date, days: 0.002 * days / 365.0)
+    src.add_seeded_perf_data("test", "streaming", '2013-12-31', 24106)
+    performance = Performance(entity_scope="test", entity_code="streaming", src=src,
+                              block_store=InMemoryBlockStore(), perf_start='2013-12-31')
+
+    def report(**kwargs):
+        return pd.DataFrame.from_records(list(performance.report(
+            False, '2017-06-30', '2019-03-05', '2019-03-05', fields=fields,
+            ext_fields={'since-launch': as_date('2018-01-01')}, **kwargs)))
+
+    pd.testing.assert_frame_equal(report(streaming=True), report(vectorised=False))
+
+
+def test_streaming_window_is_bounded_by_the_longest_period():
+    src = SeededSource()
+    src.add_seeded_perf_data("test", "window", '2010-12-31', 24106)
+    performance = Performance(entity_scope="test", entity_code="window", src=src, block_store=InMemoryBlockStore())
+    points = performance.get_performance(False, '2010-12-31', '2020-03-05', '2020-03-05')
+
+    window = {}
+    largest = 0
+    reported = 0
+    for _ in performance._stream_points(points, window, as_date('2012-01-01'), [DAY, ROLL_YEAR], {}):
+        largest = max(largest, len(window))
+        reported += 1
+
+    assert reported == len(pd.date_range('2012-01-01', '2020-03-05'))
+    assert largest <= 367
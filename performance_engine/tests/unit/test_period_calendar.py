@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import periods
+from block_stores.block_store_in_memory import InMemoryBlockStore
+from fields import *
+from misc import DAY_NS, as_date
+from performance_sources import mock_src
+from perf import Performance
+from period_calendar import PeriodCalendar, fiscal_qtd, fiscal_ytd
+
+days = pd.date_range('2019-01-01', '2021-12-31', tz='UTC')
+
+
+def test_standard_periods_match():
+    calendar = PeriodCalendar()
+
+    for code in list(periods.deltas) + [QTD, ANN_INC]:
+        np.testing.assert_array_equal(calendar.start_dates(code, days.asi8), periods.start_dates(code, days.asi8))
+
+    # The time of day is carried over from each date
+    assert calendar.start_date(MTD, '2020-03-05 13:00') == as_date('2020-02-29 13:00')
+
+
+def test_tables_are_reused_and_extended():
+    calendar = PeriodCalendar()
+    calculated = []
+
+    def definition(dates):
+        calculated.append(len(dates))
+        return dates - DAY_NS
+
+    calendar.define('yesterday', definition)
+    calendar.prepare(['yesterday', DAY], '2020-01-01', '2020-12-31')
+    assert calculated == [366]
+
+    calendar.start_dates('yesterday', days[400:500].asi8)
+    assert calculated == [366]
+
+    # Dates outside the table extend it
+    assert calendar.start_date('yesterday', '2021-01-10') == as_date('2021-01-09')
+    assert calculated == [366, 376]
+
+
+def test_fiscal_periods():
+    calendar = PeriodCalendar({'fytd': fiscal_ytd(4), 'fqtd': fiscal_qtd(4), 'ytd1': fiscal_ytd(1), 'qtd1': fiscal_qtd(1)})
+
+    assert calendar.start_date('fytd', '2020-03-31') == as_date('2019-03-31')
+    assert calendar.start_date('fytd', '2020-04-01') == as_date('2020-03-31')
+    assert calendar.start_date('fqtd', '2020-06-30') == as_date('2020-03-31')
+    assert calendar.start_date('fqtd', '2020-07-01') == as_date('2020-06-30')
+
+    # A fiscal year starting in January is the calendar year
+    np.testing.assert_array_equal(calendar.start_dates('ytd1', days.asi8), periods.start_dates(YTD, days.asi8))
+    np.testing.assert_array_equal(calendar.start_dates('qtd1', days.asi8), periods.start_dates(QTD, days.asi8))
+
+
+def test_custom_and_fixed_periods():
+    calendar = PeriodCalendar({'roll-6m': {'months': -6}, 'launch': as_date('2019-06-30')})
+
+    assert calendar.start_date('roll-6m', '2020-08-31') == as_date('2020-02-29')
+    assert calendar.start_date('launch', '2020-08-31') == as_date('2019-06-30')
+    assert calendar.start_date('since', '2020-08-31', extensions={'since': as_date('2020-01-01')}) == \
+        as_date('2020-01-01')
+    assert calendar.start_date(MTD, '2020-08-31', compare=as_date('2020-01-01')) == as_date('2020-01-01')
+
+    with pytest.raises(Exception):
+        calendar.start_date("Sausage", '2020-08-31')
+
+
+def test_report_with_fiscal_periods():
+    calendar = PeriodCalendar({'fytd': fiscal_ytd(4), 'roll-6m': {'months': -6}})
+    performance = Performance(entity_scope="test", entity_code="calendar", src=mock_src.SimpleSource('2018-03-05'),
+                              block_store=InMemoryBlockStore(), perf_start='2018-03-05', calendar=calendar)
+
+    def report(vectorised):
+        return pd.DataFrame.from_records(performance.report(
+            False, '2019-01-01', '2020-03-19', '2020-03-19', fields=[DAY, 'fytd', 'roll-6m'], vectorised=vectorised))
+
+    actual, expected = report(True), report(False)
+    np.testing.assert_allclose(actual['fytd'], expected['fytd'], rtol=0, atol=1e-10)
+    np.testing.assert_allclose(actual['roll-6m'], expected['roll-6m'], rtol=0, atol=1e-10)
+
+    # The fiscal year starts again on the 1st of April
+    by_date = actual.set_index('date')
+    assert by_date.loc[as_date('2019-04-01'), 'fytd'] == pytest.approx(by_date.loc[as_date('2019-04-01'), DAY])
+    assert by_date.loc[as_date('2019-03-31'), 'fytd'] > 300 * by_date.loc[as_date('2019-03-31'), DAY]
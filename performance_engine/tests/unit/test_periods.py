@@ -2,6 +2,7 @@ from periods import *
 import pytest
 
 from misc import as_date
+import pandas as pd
 
 mar05 = as_date('2020-03-05') # Arbitrary date
 dec11 = as_date('2020-12-11') # A Friday
@@ -82,3 +83,13 @@ def test_feb29():
     assert start_date(ANN_VOL_3YR,feb29) == as_date('2017-02-28')
     assert start_date(ANN_VOL_5YR,feb29) == as_date('2015-02-28')
     assert start_date(ANN_VOL_INC,feb29) == feb29
+
+def test_vectorised_start_dates_match():
+    days = pd.date_range('2019-01-01', '2021-12-31', tz='UTC')
+    # Include times of day which are carried through to the start dates
+    days = days.append(days[::17] + pd.Timedelta(hours=13))
+    extensions = {'since-launch': as_date('2019-06-30')}
+
+    for code in list(deltas) + [QTD, ANN_INC, VOL_INC, 'since-launch']:
+        expected = [start_date(code, d, extensions=extensions).value for d in days]
+        assert list(start_dates(code, days.asi8, extensions=extensions)) == expected, code
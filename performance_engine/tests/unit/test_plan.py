@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from block_ops import combine, msec, plan
+from block_stores import block_store_structured_results
+from block_stores.block_catalogue import LocalBlockCatalogue
+from block_stores.block_store_structured_results import BlockStoreStructuredResults
+from misc import as_date
+from pds import PerformanceDataSet
+from perf import Performance
+from tests.utilities.structured_results import FakeApiFactory, FakeStructuredResultDataApi
+
+
+def reference_combine(blocks, locked, from_date, to_date):
+    # The original combine which walks every block
+    blocks = sorted(blocks, reverse=not locked, key=lambda b: b.asat)
+
+    if locked:
+        limit_date = from_date - msec
+        for b in blocks:
+            for o in b.get_data_points():
+                if o.date > to_date:
+                    return
+                if o.date > limit_date:
+                    yield o
+            limit_date = b.to_date
+    else:
+        slices = []
+        limit_date = as_date('2050-12-31')
+        for b in blocks:
+            slice_start_date = max(from_date, b.from_date)
+            slice_end_date = min(to_date, b.to_date, limit_date)
+            if slice_start_date <= slice_end_date:
+                limit_date = slice_start_date - msec
+                slices.append((slice_start_date, slice_end_date, b))
+            if slice_start_date == from_date:
+                break
+        for slice_start_date, slice_end_date, b in slices[::-1]:
+            for o in b.get_data_points():
+                if o.date > slice_end_date:
+                    break
+                if o.date >= slice_start_date:
+                    yield o
+
+
+def make_blocks(count, seed):
+    rnd = np.random.RandomState(seed)
+    start = as_date('2020-01-01')
+    blocks = []
+
+    for i in range(count):
+        from_date = start + pd.Timedelta(days=int(rnd.randint(0, 60)))
+        to_date = from_date + pd.Timedelta(days=int(rnd.randint(0, 20)))
+        b = PerformanceDataSet(from_date, to_date, start + pd.Timedelta(days=100 + i))
+        dates = pd.date_range(from_date, to_date, tz='UTC')
+        b.add_returns_batch(dates, [100.0] * len(dates), rnd.normal(0, 0.01, len(dates)))
+        blocks.append(b)
+
+    return blocks
+
+
+@pytest.mark.parametrize("locked", [True, False])
+@pytest.mark.parametrize("seed", [0, 1, 2, 3])
+def test_plan_matches_reference(locked, seed):
+    blocks = make_blocks(30, seed)
+    rnd = np.random.RandomState(seed)
+
+    for _ in range(20):
+        from_date = as_date('2020-01-01') + pd.Timedelta(days=int(rnd.randint(0, 60)))
+        to_date = from_date + pd.Timedelta(days=int(rnd.randint(0, 30)))
+
+        expected = list(reference_combine(blocks, locked, from_date, to_date))
+        assert list(combine(blocks, locked, from_date, to_date, None)) == expected
+
+
+def test_superseded_blocks_are_not_planned():
+    blocks = make_blocks(3, 0)
+    # A restatement covering the whole period supersedes the earlier blocks
+    restatement = PerformanceDataSet('2019-12-01', '2020-12-31', '2021-01-01')
+    slices = plan(blocks + [restatement], False, '2020-01-01', '2020-06-30')
+
+    assert [s.block for s in slices] == [restatement]
+
+
+def test_performance_only_fetches_used_blocks(monkeypatch, tmp_path):
+    api = FakeStructuredResultDataApi()
+    monkeypatch.setattr(block_store_structured_results, 'StructuredResultDataApi', api)
+    bs = BlockStoreStructuredResults(FakeApiFactory(), catalogue=LocalBlockCatalogue(str(tmp_path)))
+
+    for i in range(5):
+        # Each block restates the one before it and extends it by a day
+        dates = pd.date_range('2020-01-01', periods=10 + i, tz='UTC')
+        block = PerformanceDataSet(dates[0], dates[-1])
+        block.add_returns_batch(dates, [100.0] * len(dates), [0.01 * i] * len(dates))
+        bs.add_block('SCOPE', 'CODE', block)
+
+    api.calls.clear()
+    asat = bs.catalogue.get_entries('PerformanceBlockStore', 'SCOPE', 'CODE')[-1].asat
+    performance = Performance('SCOPE', 'CODE', None, bs)
+    points = list(performance.get_performance(False, '2020-01-01', '2020-01-10', asat))
+
+    assert [p.ror for p in points] == [0.04] * 10
+    assert api.block_reads() == 1 and len(api.calls[0][2]) == 1
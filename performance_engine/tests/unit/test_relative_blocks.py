@@ -0,0 +1,90 @@
+import pandas as pd
+import pytest
+
+import block_ops
+from block_stores.block_store_in_memory import InMemoryBlockStore
+from config.config import PerformanceConfiguration
+from misc import as_date
+from pds import PerformanceDataSet, chain, unchain
+from perf import Performance
+from serialiser import decode_columnar, encode_columnar
+from tests.utilities.performance import assert_same, make_corrected_source, values
+
+
+def test_chain_reverses_unchain():
+    base = {'cum_fctr': 1.2, 'cum_flow': 100.0, 'cnt': 20, 'sum_ror': 0.1, 'sum_ror_sqr': 0.01}
+    relative = {'cum_fctr': 1.05, 'cum_flow': 5.0, 'cnt': 3, 'sum_ror': 0.02, 'sum_ror_sqr': 0.001}
+
+    linked = chain(base, relative)
+    assert linked['cnt'] == 24
+    assert unchain(linked, base) == pytest.approx(relative)
+    # The first block of the performance is chained onto nothing
+    assert chain(None, relative) == pytest.approx(relative)
+
+
+def test_extract_rebases_relative_blocks():
+    block = PerformanceDataSet('2020-01-01', '2020-01-10', '2020-02-01', relative=True)
+    block.add_returns_batch(pd.date_range('2020-01-01', '2020-01-10', tz='UTC'), [100.0] * 10,
+                            [0.01 * i for i in range(10)])
+
+    tail = block.extract('2020-01-06', '2020-01-10')
+    assert [p.date for p in tail.get_data_points()] == list(pd.date_range('2020-01-06', '2020-01-10', tz='UTC'))
+    assert tail.get_data_points()[0].cnt == 0
+    assert tail.get_data_points()[0].cum_fctr == pytest.approx(1.05)
+
+    # Chaining the tail onto the head gives back the block
+    head = block.extract('2020-01-01', '2020-01-05')
+    assert_same(values(block_ops.combine([head, tail], False, '2020-01-01', '2020-01-10', '2020-02-01')),
+                values(block.get_data_points()))
+
+    assert decode_columnar(encode_columnar(tail)).relative
+
+
+def test_corrections_only_replace_the_dates_which_change(monkeypatch):
+    # The performance as read from the source after the correction
+    expected = values(Performance('test', 'absolute', make_corrected_source(42, '2020-01-15'), InMemoryBlockStore()).get_performance(
+        False, '2019-12-31', '2020-03-31', '2020-04-15'))
+    uncorrected = values(Performance('test', 'absolute', make_corrected_source(42, '2020-01-15'), InMemoryBlockStore()).get_performance(
+        False, '2019-12-31', '2020-03-31', '2020-04-01'))
+
+    monkeypatch.setitem(PerformanceConfiguration.global_config, 'RelativeBlocks', True)
+    store = InMemoryBlockStore()
+    performance = Performance('test', 'relative', make_corrected_source(42, '2020-01-15'), store)
+
+    # Store a block for each month
+    for end_date, asat in [('2020-01-31', '2020-04-01'), ('2020-02-29', '2020-04-02'), ('2020-03-31', '2020-04-03')]:
+        list(performance.get_performance(True, '2019-12-31', end_date, asat, create=True))
+
+    blocks = store.get_blocks('test', 'relative')
+    assert all(b.relative for b in blocks)
+
+    # The correction changes the returns on the 15th and 16th, the later blocks are left as they are
+    corrected = values(performance.get_performance(False, '2019-12-31', '2020-03-31', '2020-04-15', create=True))
+    assert [(b.from_date, b.to_date) for b in blocks[3:]] == [(as_date('2020-01-15'), as_date('2020-01-16'))]
+    assert_same(corrected, expected)
+
+    # The later blocks are chained onto the correction when reading part of the performance
+    assert_same(values(performance.get_performance(False, '2020-02-10', '2020-03-31', '2020-04-20')),
+                expected.loc[as_date('2020-02-10'):])
+
+    # Before the correction, and in the locked period, the performance is unchanged
+    assert_same(values(performance.get_performance(False, '2020-02-10', '2020-03-31', '2020-04-05')),
+                uncorrected.loc[as_date('2020-02-10'):])
+    assert_same(values(performance.get_performance(True, '2020-02-10', '2020-03-31', '2020-04-20')),
+                uncorrected.loc[as_date('2020-02-10'):])
+
+
+def test_corrections_to_absolute_blocks_replace_every_later_date(monkeypatch):
+    expected = values(Performance('test', 'absolute', make_corrected_source(42, '2020-01-15'), InMemoryBlockStore()).get_performance(
+        False, '2019-12-31', '2020-03-31', '2020-04-15'))
+
+    store = InMemoryBlockStore()
+    performance = Performance('test', 'mixed', make_corrected_source(42, '2020-01-15'), store)
+    list(performance.get_performance(True, '2019-12-31', '2020-03-31', '2020-04-01', create=True))
+
+    # Blocks stored before relative blocks were used are linked from the changed records
+    monkeypatch.setitem(PerformanceConfiguration.global_config, 'RelativeBlocks', True)
+    corrected = values(performance.get_performance(False, '2019-12-31', '2020-03-31', '2020-04-15', create=True))
+
+    assert store.get_blocks('test', 'mixed')[-1].to_date == as_date('2020-03-31')
+    assert_same(corrected, expected)
@@ -0,0 +1,79 @@
+import json
+
+import jsonpickle
+import numpy as np
+import pandas as pd
+import pytest
+
+from pds import PerformanceDataSet
+from serialiser import decode_columnar, deserialise, encode_columnar, get_codec, serialise
+
+
+def assert_same_block(actual, expected):
+    assert actual == expected
+    assert actual.previous == expected.previous
+
+    for name, column in expected.get_columns().items():
+        np.testing.assert_array_equal(actual.get_columns()[name], column)
+    for name, column in expected.get_attribution_columns().items():
+        np.testing.assert_array_equal(actual.get_attribution_columns()[name], column)
+
+
+def make_values_block():
+    previous = PerformanceDataSet('2018-03-04', '2018-03-04', '2018-03-19').add_values_batch(
+        dates=['2018-03-04'] * 2, keys=['a', 'b'], mvs=[90.0, 45.0], nets=[0.0, 0.0]).latest_data_point
+
+    block = PerformanceDataSet('2018-03-05', '2018-03-12', '2018-03-19', previous=previous)
+    dates = pd.date_range('2018-03-05', '2018-03-12', tz='UTC')
+    block.add_values_batch(
+        dates=list(dates) * 2 + [dates[-1]],
+        keys=['a'] * len(dates) + ['b'] * len(dates) + ['c'],
+        mvs=[100.0 + i for i in range(len(dates))] + [50.0 - i for i in range(len(dates))] + [10.0],
+        nets=[0.0, 5.0] + [0.0] * (len(dates) - 2) + [0.0] * len(dates) + [10.0])
+    return block
+
+
+def make_returns_block():
+    block = PerformanceDataSet('2018-03-05', '2018-03-09', '2018-03-19')
+    block.add_returns_batch(
+        dates=['2018-03-05', '2018-03-06', '2018-03-07', '2018-03-09'],
+        weights=[100.0] * 4,
+        rors=[0.01, -0.02, 0.003, 0.0])
+    return block
+
+
+@pytest.mark.parametrize("compress", [True, False])
+@pytest.mark.parametrize("make_block", [make_values_block, make_returns_block])
+def test_columnar_round_trip(make_block, compress):
+    block = make_block()
+    document = encode_columnar(block, compress=compress)
+
+    assert json.loads(document)['compression'] == ('zlib' if compress else None)
+    assert_same_block(decode_columnar(document), block)
+
+
+def test_columnar_round_trip_of_intraday_and_empty_blocks():
+    block = PerformanceDataSet('2018-03-05', '2018-03-06', None)
+    block.add_returns_batch(dates=['2018-03-05 10:30', '2018-03-06'], weights=[1.0, 1.0], rors=[0.01, 0.02])
+    assert_same_block(decode_columnar(encode_columnar(block)), block)
+
+    empty = PerformanceDataSet('2018-03-05', '2018-03-06', '2018-03-19')
+    assert_same_block(decode_columnar(encode_columnar(empty)), empty)
+
+
+def test_blocks_are_serialised_with_the_codec_for_their_version():
+    block = make_values_block()
+    document = serialise(block)
+
+    assert document == encode_columnar(block)
+    assert_same_block(deserialise(document, PerformanceDataSet.version), block)
+
+
+def test_legacy_documents_are_read_with_jsonpickle():
+    block = make_values_block()
+    document = jsonpickle.encode(block)
+
+    assert get_codec("0.0.1").decode is jsonpickle.decode
+    assert_same_block(deserialise(document, "0.0.1"), block)
+    # Documents with no known version were written before versions were used
+    assert_same_block(deserialise(document, None), block)
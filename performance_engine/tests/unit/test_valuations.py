@@ -0,0 +1,237 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import flows
+import valuation
+from apis_performance.portfolio_performance_api import PortfolioPerformanceApi
+from block_stores.block_store_in_memory import InMemoryBlockStore
+from business_calendar import BusinessCalendar
+from composites.in_memory_composite import InMemoryComposite
+from misc import as_date
+from performance_sources.comp_src import CompositeSource
+from performance_sources.lusid_src import LusidSource
+from valuation_cache import LocalValuationCache, ValuationCache
+
+
+class FakeResult:
+    def __init__(self, value=None, error=None, rows=None):
+        self.value, self.error, self.rows = value, error, rows
+
+    def match(self, failure, success):
+        if self.error is not None:
+            return failure(self.error)
+        data = [{valuation.AGG_PV: self.value}] if self.rows is None else self.rows
+        return success(SimpleNamespace(content=SimpleNamespace(data=data)))
+
+
+class FakeApi:
+    """
+    Values a portfolio at the day of the month, failing the first request for some dates
+    """
+
+    def __init__(self, failing=(), delay=0.01):
+        self.failing = set(failing)
+        self.delay = delay
+        self.requests = []
+        self.active = 0
+        self.most_active = 0
+        self.lock = threading.Lock()
+        self.models = SimpleNamespace(AggregateSpec=lambda key, op: (key, op))
+        self.call = SimpleNamespace(get_aggregation=self.get_aggregation)
+
+    def get_aggregation(self, scope, code, aggregation_request):
+        date = aggregation_request.effective_at
+        with self.lock:
+            self.requests.append(aggregation_request)
+            self.active += 1
+            self.most_active = max(self.most_active, self.active)
+            fail = date in self.failing
+            self.failing.discard(date)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        return FakeResult(error=Exception("Too many requests") if fail else None, value=float(date.day))
+
+
+def test_valuations_are_concurrent_and_in_date_order(monkeypatch):
+    recipes = []
+    default_recipe = valuation.default_recipe
+    monkeypatch.setattr(valuation, 'default_recipe', lambda scope: recipes.append(scope) or default_recipe(scope))
+
+    dates = pd.date_range('2020-01-01', '2020-01-20', tz='UTC')
+    api = FakeApi(failing=[dates[3], dates[11]])
+
+    values = valuation.get_valuations(api, 'test', 'fund', None, dates, as_date('2020-02-01'), workers=4,
+                                      backoff=0.001)
+
+    assert values == [(d, float(d.day)) for d in dates]
+    assert 1 < api.most_active <= 4
+    # The failed dates were retried
+    assert len(api.requests) == len(dates) + 2
+    # The default recipe is built once for every date
+    assert recipes == ['test']
+    assert all(r.inline_recipe is api.requests[0].inline_recipe for r in api.requests)
+
+
+def test_valuations_give_up_after_the_retries(monkeypatch):
+    monkeypatch.setattr(valuation.lpt, 'display_error', lambda error: None)
+
+    class AlwaysFailing(FakeApi):
+        def get_aggregation(self, scope, code, aggregation_request):
+            self.requests.append(aggregation_request)
+            return FakeResult(error=Exception("Unavailable"))
+
+    api = AlwaysFailing()
+    with pytest.raises(SystemExit):
+        valuation.get_valuations(api, 'test', 'fund', None, [as_date('2020-01-01')], as_date('2020-02-01'),
+                                 retries=2, backoff=0.0)
+    assert len(api.requests) == 3
+
+
+def test_lusid_source_merges_flows_in_date_order(monkeypatch):
+    monkeypatch.setattr(flows, 'get_flows', lambda *args: {as_date('2020-01-02'): 5.0, as_date('2020-01-04'): -2.0})
+    src = LusidSource(FakeApi(), {'valuation_workers': 3})
+
+    df = src.get_perf_data('test', 'fund', '2020-01-01', '2020-01-05', '2020-02-01')
+
+    assert list(df['date']) == list(pd.date_range('2020-01-01', '2020-01-05', tz='UTC'))
+    assert list(df['mv']) == [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert list(df['net']) == [0.0, 5.0, 0.0, -2.0, 0.0]
+
+
+def test_lusid_source_only_values_business_days(monkeypatch):
+    monkeypatch.setattr(flows, 'get_flows', lambda *args: {as_date('2020-01-02'): 5.0, as_date('2020-01-04'): -2.0})
+    api = FakeApi()
+    src = LusidSource(api, {}, calendar=BusinessCalendar(['2020-01-01']))
+
+    df = src.get_perf_data('test', 'fund', '2020-01-01', '2020-01-07', '2020-02-01')
+
+    assert list(df['date']) == [as_date('2020-01-02'), as_date('2020-01-03'), as_date('2020-01-06'),
+                                as_date('2020-01-07')]
+    assert len(api.requests) == 4
+    # The flow on the Saturday is merged into the Monday
+    assert list(df['net']) == [5.0, 0.0, -2.0, 0.0]
+
+
+@pytest.mark.parametrize('local', [False, True])
+def test_cached_valuations_are_extended_to_later_asats(monkeypatch, tmp_path, local):
+    monkeypatch.setattr(flows, 'get_flows', lambda *args: {})
+    api = FakeApi(delay=0.0)
+    cache = LocalValuationCache(str(tmp_path)) if local else ValuationCache()
+    src = LusidSource(api, {}, cache=cache)
+    changes = []
+    src.get_changes = lambda scope, code, last_date, last_asat, asat: changes.append((last_date, last_asat)) or \
+        as_date('2020-01-06')
+
+    dates = list(pd.date_range('2020-01-01', '2020-01-10', tz='UTC'))
+    src.get_perf_data('test', 'fund', '2020-01-01', '2020-01-10', '2020-02-01')
+    src.get_perf_data('test', 'fund', '2020-01-01', '2020-01-10', '2020-02-01')
+    assert len(api.requests) == 10
+    assert (cache.hits, cache.misses) == (10, 10)
+
+    # Only the dates from the correction onwards are valued again at the later asAt date
+    df = src.get_perf_data('test', 'fund', '2020-01-01', '2020-01-12', '2020-02-05')
+    # The cached valuations and flows both ask for the changes since they were fetched
+    assert set(changes) == {(as_date('2020-01-10'), as_date('2020-02-01'))}
+    assert [r.effective_at for r in api.requests[10:]] == dates[5:] + [as_date('2020-01-11'), as_date('2020-01-12')]
+    assert list(df['mv']) == [float(d) for d in range(1, 13)]
+
+    # The earlier asAt date is still answered from the cache
+    if local:
+        src.cache = cache = LocalValuationCache(str(tmp_path))
+    src.get_perf_data('test', 'fund', '2020-01-01', '2020-01-10', '2020-02-01')
+    assert len(api.requests) == 17
+    assert cache.hit_rate == pytest.approx(1.0 if local else 25 / 42)
+
+
+def test_local_valuations_are_appended_and_survive_a_partial_write(tmp_path):
+    key = ('test', 'fund', 'default/recipe')
+    dates = list(pd.date_range('2020-01-01', '2020-01-04', tz='UTC'))
+    cache = LocalValuationCache(str(tmp_path), compact_ratio=3.0)
+    cache.put(key, [(d, float(d.day)) for d in dates], as_date('2020-02-01'))
+    cache.extend(key, as_date('2020-02-01'), as_date('2020-02-05'), changed=as_date('2020-01-03'))
+
+    # The extension is appended rather than the file being rewritten, then a failure leaves a partial row
+    filename = cache._file(key)
+    with open(filename, 'r') as fp:
+        assert len(fp.readlines()) == 7
+    with open(filename, 'a') as fp:
+        fp.write('2020-01-09T00:00:00+00:00,9.')
+
+    cache = LocalValuationCache(str(tmp_path), compact_ratio=3.0)
+    assert cache.get(key, dates, as_date('2020-02-05')) == {dates[0]: 1.0, dates[1]: 2.0}
+    cache.put(key, [(as_date('2020-01-05'), 5.0)], as_date('2020-02-05'))
+
+    cache = LocalValuationCache(str(tmp_path), compact_ratio=3.0)
+    assert cache.get(key, [as_date('2020-01-05')], as_date('2020-02-05')) == {as_date('2020-01-05'): 5.0}
+
+    # Once the file holds many more rows than intervals it is rewritten with a row for each interval
+    for asat in ['2020-02-06', '2020-02-07', '2020-02-08']:
+        cache.extend(key, cache.watermark(key, as_date(asat)), as_date(asat))
+    with open(filename, 'r') as fp:
+        assert len(fp.readlines()) == 6
+    assert LocalValuationCache(str(tmp_path)).get(key, dates, as_date('2020-02-08')) == {dates[0]: 1.0, dates[1]: 2.0}
+
+
+class BatchApi(FakeApi):
+    """
+    Values a portfolio at the day of the month plus its number, for a batch of portfolios and dates
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+        self.models.ResourceId = lambda scope, code: SimpleNamespace(scope=scope, code=code)
+        self.call.get_valuation = self.get_valuation
+
+    def get_valuation(self, valuation_request):
+        portfolios = [(p.scope, p.code) for p in valuation_request.portfolio_entity_ids]
+        dates = valuation_request.valuation_schedule.valuation_date_times
+        with self.lock:
+            self.batches.append((portfolios, dates))
+        return FakeResult(rows=[
+            {valuation.PORTFOLIO_SCOPE: scope, valuation.PORTFOLIO_CODE: code, valuation.VALUATION_DATE: date,
+             valuation.AGG_PV: float(pd.Timestamp(date).day + int(code[-1]))}
+            for scope, code in portfolios for date in dates if code != 'empty-0'])
+
+
+def test_batched_valuations_are_fanned_out_to_each_portfolio():
+    api = BatchApi()
+    portfolios = [('test', f'fund-{i}') for i in range(5)] + [('test', 'empty-0')]
+    dates = pd.date_range('2020-01-01', '2020-01-03', tz='UTC')
+
+    values = valuation.get_batch_valuations(api, portfolios, SimpleNamespace(scope='test', code='recipe'), dates,
+                                            as_date('2020-02-01'), batch_size=7)
+
+    # Each batch holds the three dates for two portfolios
+    assert sorted(len(p) * len(d) for p, d in api.batches) == [6, 6, 6]
+    assert values[('test', 'fund-3')] == [(d, float(d.day + 3)) for d in dates]
+    # The portfolio without holdings has no valuations rather than a value of 0
+    assert values[('test', 'empty-0')] == []
+
+
+def test_composite_members_are_valued_together(monkeypatch):
+    monkeypatch.setattr(flows, 'get_flows', lambda *args: {})
+    api = BatchApi(delay=0.0)
+    src = LusidSource(api, {'recipe_code': 'recipe', 'valuation_batch_size': 100})
+    composite = InMemoryComposite()
+    composite.create_composite('test', 'composite')
+    for i in range(4):
+        composite.add_composite_member('test', 'composite', 'test', f'fund-{i}', '2020-01-01', None)
+
+    block_store = InMemoryBlockStore()
+    performance_api = PortfolioPerformanceApi(block_store, src)
+    comp_src = CompositeSource(composite, performance_api, 'agg')
+
+    df = comp_src.get_perf_data('test', 'composite', '2020-01-01', '2020-01-10', '2020-02-01')
+
+    # A single request valued every member, none were valued on their own
+    assert len(api.batches) == 1 and len(api.requests) == 0
+    # The valuations were only kept for the call, the source still has no cache
+    assert src.cache is None
+    assert sorted(api.batches[0][0]) == [('test', f'fund-{i}') for i in range(4)]
+    assert list(df['mv']) == [4.0 * d + 6.0 for d in range(1, 11)]
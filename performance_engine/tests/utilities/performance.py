@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from misc import as_date
+from performance_sources.mock_src import MockSource
+
+# The fields of a PerformanceDataPoint which are compared between two views of the same performance
+fields = ['tmv', 'flows', 'ror', 'cum_fctr', 'cum_flow', 'cnt', 'sum_ror', 'sum_ror_sqr']
+
+
+def make_corrected_source(seed: int, correction_date: str) -> MockSource:
+    """
+    Creates a source of random market values from the end of 2019 to the end of March 2020 with a flow every ten
+    days, along with a back-dated correction to the market value on one date which is made on 2020-04-10
+
+    :param int seed: The seed of the market values
+    :param str correction_date: The date whose market value is corrected
+
+    :return: MockSource: The source, which reports the corrected date as changed across 2020-04-10
+    """
+    dates = pd.date_range('2019-12-31', '2020-03-31', tz='UTC')
+    rnd = np.random.RandomState(seed)
+    mvs = 1000.0 * np.cumprod(1 + rnd.normal(0.0005, 0.01, len(dates)))
+    nets = np.where(np.arange(len(dates)) % 10 == 5, 50.0, 0.0)
+
+    df = pd.DataFrame({'asat': '2020-01-01', 'date': dates, 'mv.all': mvs + np.cumsum(nets), 'net.all': nets})
+    correction = df[df['date'] == as_date(correction_date)].assign(asat='2020-04-10')
+    correction['mv.all'] += 25.0
+    src = MockSource(pd.concat([df, correction], ignore_index=True))
+    src.get_changes = lambda scope, code, last_date, last_asat, asat: \
+        as_date(correction_date) if last_asat < as_date('2020-04-10') <= asat else None
+    return src
+
+
+def values(points) -> pd.DataFrame:
+    """
+    :param points: The PerformanceDataPoint to compare
+
+    :return: pd.DataFrame: The compared fields of each point, indexed by date
+    """
+    return pd.DataFrame.from_records([[p.date] + [getattr(p, f) for f in fields] for p in points],
+                                     columns=['date'] + fields).set_index('date')
+
+
+def assert_same(actual: pd.DataFrame, expected: pd.DataFrame) -> None:
+    """
+    Asserts that two sets of values created by values hold the same performance
+
+    :param pd.DataFrame actual: The values
+    :param pd.DataFrame expected: The expected values
+    """
+    assert list(actual.index) == list(expected.index)
+    for f in fields:
+        np.testing.assert_allclose(actual[f], expected[f], rtol=1e-12, atol=1e-12)
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytz
+
+
+class FakeStructuredResultDataApi:
+    """
+    An in memory stand in for the LUSID Structured Result Data API. It holds the latest version of each document and
+    records the calls made to it.
+    """
+
+    def __init__(self):
+        self.documents = {}
+        self.calls = []
+        # The codes of any documents which should fail to upsert
+        self.failing_codes = set()
+        self.clock = datetime(2020, 1, 1, tzinfo=pytz.UTC)
+
+    def __call__(self, api_client=None):
+        """
+        Allows an instance to replace the StructuredResultDataApi class, constructing the api returns the instance
+        """
+        return self
+
+    def upsert_structured_result_data(self, scope, request_body):
+        self.calls.append(('upsert', scope, sorted(request_body)))
+        values = {}
+        failed = {}
+        for code, request in request_body.items():
+            if code in self.failing_codes:
+                failed[code] = f"Failed to upsert {code}"
+                continue
+            self.clock += timedelta(seconds=1)
+            self.documents[(scope, code)] = request.data
+            values[code] = self.clock
+        return SimpleNamespace(values=values, failed=failed)
+
+    def get_structured_result_data(self, scope, request_body):
+        self.calls.append(('get', scope, sorted(request_body)))
+        values = {code: self.documents[(scope, code)] for code in request_body if (scope, code) in self.documents}
+        failed = {code: code for code in request_body if (scope, code) not in self.documents}
+        return SimpleNamespace(values=values, failed=failed)
+
+    def block_reads(self):
+        """
+        The number of calls made to get documents other than catalogues
+        """
+        return len([
+            call for call in self.calls if call[0] == 'get' and not all(c.startswith('catalogue') for c in call[2])
+        ])
+
+
+class FakeApiFactory:
+    """
+    An api factory which builds nothing, used with FakeStructuredResultDataApi
+    """
+
+    def build(self, api):
+        return None
@@ -1,5 +1,7 @@
+import time
 import numpy as np
-from typing import Tuple
+import pandas as pd
+from typing import Callable, Dict, Iterable, List, Tuple
 
 from lusid.exceptions import ApiException
 from lusid.models import (
@@ -9,17 +11,25 @@ from lusid.models import (
     MarketContextSuppliers,
     MarketDataKeyRule,
     MarketOptions,
-    ResourceId
+    PortfolioEntityId,
+    ResourceId,
+    ValuationRequest,
+    ValuationSchedule
 )
 from lusidtools.lpt import lpt
 from lusidtools.lpt.lpt import Rec
 from lusidtools.lpt.lse import ExtendedAPI
-from misc import as_dates
+from misc import as_dates, concurrently
 from pandas import Timestamp
 
 PV = 'Holding/default/PV'
 AGG_PV = f'Sum({PV})'
 
+# The keys which a batched valuation is grouped by
+PORTFOLIO_SCOPE = 'Portfolio/default/Scope'
+PORTFOLIO_CODE = 'Portfolio/default/Code'
+VALUATION_DATE = 'Analytic/default/ValuationDate'
+
 
 def default_recipe(scope: str):
     """
@@ -66,7 +76,8 @@ def default_recipe(scope: str):
 
 @as_dates
 def get_valuation(api: ExtendedAPI, scope, portfolio, recipe_id: ResourceId, date: Timestamp,
-                  asat: Timestamp) -> Tuple[Timestamp, float]:
+                  asat: Timestamp, inline_recipe: ConfigurationRecipe = None,
+                  raise_errors: bool = False) -> Tuple[Timestamp, float]:
     """
     The responsibility of this function is to value a Portfolio inside LUSID for a given date.
 
@@ -77,13 +88,16 @@ def get_valuation(api: ExtendedAPI, scope, portfolio, recipe_id: ResourceId, dat
     :param ResourceId recipe_id: The scope and code of the persisted recipe to use
     :param Timestamp date: The effectiveAt date of the valuation
     :param Timestamp asat: The asAt date of the valuation
+    :param ConfigurationRecipe inline_recipe: The inline recipe to use if there is no persisted recipe, defaults to
+    the default recipe for the scope
+    :param bool raise_errors: Whether to raise the error of a failed API call rather than exiting
 
     :return: Tuple[Timestamp, float]: The date of the request and the value of the Portfolio
     """
     if recipe_id:
         args = {'recipe_id': recipe_id}
     else:
-        args = {'inline_recipe':  default_recipe(scope)}
+        args = {'inline_recipe': inline_recipe or default_recipe(scope)}
 
     request = AggregationRequest(
       effective_at=date,
@@ -113,6 +127,8 @@ def get_valuation(api: ExtendedAPI, scope, portfolio, recipe_id: ResourceId, dat
 
         :return: None
         """
+        if raise_errors:
+            raise error if isinstance(error, Exception) else Exception(str(error))
         lpt.display_error(error)
         exit()
 
@@ -121,3 +137,144 @@ def get_valuation(api: ExtendedAPI, scope, portfolio, recipe_id: ResourceId, dat
              code=portfolio,
              aggregation_request=request
     ).match(failure, success)
+
+
+def get_valuations(api: ExtendedAPI, scope, portfolio, recipe_id: ResourceId, dates: Iterable[Timestamp],
+                   asat: Timestamp, batch_size: int = 500, workers: int = 8, retries: int = 3,
+                   backoff: float = 0.5) -> List[Tuple[Timestamp, float]]:
+    """
+    The responsibility of this function is to value a Portfolio inside LUSID for a number of dates. The valuations
+    are requested as get_batch_valuations does for a single Portfolio, concurrently and each failed request is retried
+    with an exponential backoff.
+
+    :param ExtendedAPI api: The extended API to use to call LUSID
+    :param str scope: The scope of the Portfolio in LUSID
+    :param str portfolio: The code of the Portfolio in LUSID. Together with the scope this uniquely identifies the
+    Portfolio
+    :param ResourceId recipe_id: The scope and code of the persisted recipe to use
+    :param Iterable[Timestamp] dates: The effectiveAt dates of the valuations
+    :param Timestamp asat: The asAt date of the valuations
+    :param int batch_size: The maximum number of dates valued by a single request
+    :param int workers: The maximum number of valuations requested at once
+    :param int retries: The number of times a failed valuation is retried
+    :param float backoff: The number of seconds to wait before the first retry, this doubles with each retry
+
+    :return: List[Tuple[Timestamp, float]]: The date and value of the Portfolio for each date it was valued on, in
+    the order of the dates
+    """
+    return get_batch_valuations(api, [(scope, portfolio)], recipe_id, dates, asat, batch_size=batch_size,
+                                workers=workers, retries=retries, backoff=backoff)[(scope, portfolio)]
+
+
+def _with_retries(request: Callable, retries: int, backoff: float):
+    """
+    Makes a request, retrying it with an exponential backoff if it fails. The error is displayed and the program
+    exits once the retries are exhausted.
+
+    :param Callable request: The request
+    :param int retries: The number of times the request is retried
+    :param float backoff: The number of seconds to wait before the first retry, this doubles with each retry
+
+    :return: The result of the request
+    """
+    for attempt in range(retries + 1):
+        try:
+            return request()
+        except Exception as error:
+            if attempt == retries:
+                lpt.display_error(error)
+                exit()
+            time.sleep(backoff * 2 ** attempt)
+
+
+def _utc(date) -> Timestamp:
+    date = pd.Timestamp(date)
+    return date.tz_localize('UTC') if date.tzinfo is None else date.tz_convert('UTC')
+
+
+def get_batch_valuations(api: ExtendedAPI, portfolios: Iterable[Tuple[str, str]], recipe_id: ResourceId,
+                         dates: Iterable[Timestamp], asat: Timestamp, batch_size: int = 500,
+                         workers: int = 8, retries: int = 3,
+                         backoff: float = 0.5) -> Dict[Tuple[str, str], List[Tuple[Timestamp, float]]]:
+    """
+    The responsibility of this function is to value a number of Portfolios inside LUSID for a number of dates. Each
+    request values a batch of Portfolios over a schedule of dates, grouped by Portfolio and date, and the results are
+    fanned back out to each Portfolio. The batches are requested concurrently and each failed request is retried
+    with an exponential backoff.
+
+    A batched valuation needs a persisted recipe, without one each Portfolio is valued on each date with the
+    default recipe of its scope, still requested concurrently.
+
+    :param ExtendedAPI api: The extended API to use to call LUSID
+    :param Iterable[Tuple[str, str]] portfolios: The scope and code of each Portfolio
+    :param ResourceId recipe_id: The scope and code of the persisted recipe to use
+    :param Iterable[Timestamp] dates: The effectiveAt dates of the valuations
+    :param Timestamp asat: The asAt date of the valuations
+    :param int batch_size: The maximum number of Portfolio and date pairs valued by a single request
+    :param int workers: The maximum number of requests made at once
+    :param int retries: The number of times a failed request is retried
+    :param float backoff: The number of seconds to wait before the first retry, this doubles with each retry
+
+    :return: Dict[Tuple[str, str], List[Tuple[Timestamp, float]]]: The date and value of each Portfolio for each
+    date, in the order of the dates, keyed by the scope and code of the Portfolio. A batched valuation has no row for a
+    date a Portfolio holds nothing on, the date is left out rather than given a value.
+    """
+    portfolios, dates = list(dict.fromkeys(portfolios)), list(dates)
+
+    if recipe_id is None:
+        recipes = {scope: default_recipe(scope) for scope, _ in portfolios}
+
+        def value_one(pair) -> Tuple[Timestamp, float]:
+            (scope, code), date = pair
+            return _with_retries(
+                lambda: get_valuation(api, scope, code, None, date, asat, recipes[scope], raise_errors=True),
+                retries, backoff)
+
+        values = iter(concurrently(value_one, [(p, d) for p in portfolios for d in dates], workers))
+        return {p: [next(values) for _ in dates] for p in portfolios}
+
+    # Each batch holds as many dates as it can, and as many Portfolios as fit alongside them
+    dates_per_batch = max(1, min(len(dates), batch_size))
+    portfolios_per_batch = max(1, batch_size // dates_per_batch)
+    batches = [(portfolios[i:i + portfolios_per_batch], dates[j:j + dates_per_batch])
+               for i in range(0, len(portfolios), portfolios_per_batch)
+               for j in range(0, len(dates), dates_per_batch)]
+
+    def value(batch) -> Dict[Tuple[str, str, Timestamp], float]:
+        members, schedule = batch
+        request = ValuationRequest(
+            recipe_id=recipe_id,
+            as_at=asat,
+            metrics=[
+                api.models.AggregateSpec(PORTFOLIO_SCOPE, 'Value'),
+                api.models.AggregateSpec(PORTFOLIO_CODE, 'Value'),
+                api.models.AggregateSpec(VALUATION_DATE, 'Value'),
+                api.models.AggregateSpec(PV, 'Sum')
+            ],
+            group_by=[PORTFOLIO_SCOPE, PORTFOLIO_CODE, VALUATION_DATE],
+            portfolio_entity_ids=[
+                PortfolioEntityId(scope=scope, code=code, portfolio_entity_type='SinglePortfolio')
+                for scope, code in members],
+            # The exact dates override the range of the schedule
+            valuation_schedule=ValuationSchedule(
+                effective_from=schedule[0].isoformat(),
+                effective_at=schedule[-1].isoformat(),
+                valuation_date_times=[d.isoformat() for d in schedule])
+        )
+
+        def success(result: Rec) -> Dict[Tuple[str, str, Timestamp], float]:
+            return {(row[PORTFOLIO_SCOPE], row[PORTFOLIO_CODE], _utc(row[VALUATION_DATE])): np.round(row[AGG_PV], 2)
+                    for row in result.content.data}
+
+        def failure(error: ApiException) -> None:
+            raise error if isinstance(error, Exception) else Exception(str(error))
+
+        return _with_retries(
+            lambda: api.call.get_valuation(valuation_request=request).match(failure, success), retries, backoff)
+
+    values = {}
+    for result in concurrently(value, batches, workers):
+        values.update(result)
+
+    return {(scope, code): [(d, values[(scope, code, _utc(d))]) for d in dates if (scope, code, _utc(d)) in values]
+            for scope, code in portfolios}
@@ -0,0 +1,282 @@
+import csv
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+import pandas as pd
+from pandas import Timestamp
+
+from config.config import PerformanceConfiguration
+
+# The key of a portfolio's valuations: the scope, the code of the portfolio and the recipe
+CacheKey = Tuple[str, str, str]
+
+
+class ValuationCache:
+    """
+    Caches the valuations of portfolios. Each valuation is held with the asAt interval it is valid for, starting at
+    the asAt date it was requested at. When the source reports that a portfolio has not changed before a date since
+    the end of the interval, the valuations before that date are extended to the new asAt date rather than being
+    valued again. The cache may be shared by threads, the valuations and counts are read and changed under a lock.
+    """
+
+    def __init__(self):
+        # The valuations of each key, by date, as a list of [mv, valid_from, valid_to]
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, cache: 'ValuationCache' = None) -> 'ValuationCache':
+        """
+        Gets the valuation cache to use
+
+        :param ValuationCache cache: The cache provided by the caller, if any
+
+        :return: ValuationCache: The cache provided, otherwise a LocalValuationCache if the ValuationCachePath
+        configuration item is set or None if valuations are not cached
+        """
+        if cache is not None:
+            return cache
+
+        path = PerformanceConfiguration.item('ValuationCachePath', None)
+        return None if path in (None, '') else LocalValuationCache(path)
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        :return: float: The proportion of the valuations requested which were found in the cache
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def _load(self, key: CacheKey) -> Dict[Timestamp, List[List]]:
+        """
+        Gets the valuations of a key, the lock must be held by the caller
+
+        :param CacheKey key: The key
+
+        :return: Dict[Timestamp, List[List]]: The valuations by date
+        """
+        return self._entries.setdefault(key, {})
+
+    def _save(self, key: CacheKey, intervals: List[List]) -> None:
+        """
+        Persists the intervals of a key which were added or extended, the in memory cache has nothing to do
+
+        :param CacheKey key: The key
+        :param List[List] intervals: The intervals as [date, mv, valid_from, valid_to]
+        """
+        pass
+
+    def watermark(self, key: CacheKey, asat: Timestamp) -> Timestamp:
+        """
+        Finds the asAt date the valuations of a key are known to be valid up to
+
+        :param CacheKey key: The key
+        :param Timestamp asat: Only intervals starting at or before this asAt date are considered
+
+        :return: Timestamp: The latest end of an interval, or None if there are no valuations
+        """
+        with self._lock:
+            ends = [i[2] for intervals in self._load(key).values() for i in intervals if i[1] <= asat]
+        return max(ends) if len(ends) > 0 else None
+
+    def latest_date(self, key: CacheKey) -> Timestamp:
+        """
+        :param CacheKey key: The key
+
+        :return: Timestamp: The latest date valued, or None if there are no valuations
+        """
+        with self._lock:
+            entries = self._load(key)
+            return max(entries) if len(entries) > 0 else None
+
+    def extend(self, key: CacheKey, watermark: Timestamp, asat: Timestamp, changed: Timestamp = None) -> None:
+        """
+        Extends the valuations which were valid at the watermark up to a later asAt date
+
+        :param CacheKey key: The key
+        :param Timestamp watermark: The end of the intervals to extend
+        :param Timestamp asat: The new end of the intervals
+        :param Timestamp changed: The earliest date which changed between the two asAt dates, valuations on or after
+        it are not extended. None if nothing changed.
+        """
+        with self._lock:
+            extended = []
+
+            for date, intervals in self._load(key).items():
+                if changed is not None and date >= changed:
+                    continue
+                for interval in intervals:
+                    if interval[2] == watermark:
+                        interval[2] = asat
+                        extended.append([date, *interval])
+
+            self._save(key, extended)
+
+    @staticmethod
+    def _find(entries: Dict[Timestamp, List[List]], date: Timestamp, asat: Timestamp) -> List:
+        return next((i for i in entries.get(date, []) if i[1] <= asat <= i[2]), None)
+
+    def missing(self, key: CacheKey, dates: Iterable[Timestamp], asat: Timestamp) -> List[Timestamp]:
+        """
+        Finds the dates which have no valuation valid at an asAt date, without counting them as misses
+
+        :param CacheKey key: The key
+        :param Iterable[Timestamp] dates: The dates to check
+        :param Timestamp asat: The asAt date
+
+        :return: List[Timestamp]: The dates without a valid valuation
+        """
+        with self._lock:
+            entries = self._load(key)
+            return [d for d in dates if self._find(entries, d, asat) is None]
+
+    def get(self, key: CacheKey, dates: Iterable[Timestamp], asat: Timestamp) -> Dict[Timestamp, float]:
+        """
+        Gets the valuations which are valid at an asAt date
+
+        :param CacheKey key: The key
+        :param Iterable[Timestamp] dates: The dates to get
+        :param Timestamp asat: The asAt date
+
+        :return: Dict[Timestamp, float]: The value of each date found
+        """
+        found = {}
+
+        with self._lock:
+            entries = self._load(key)
+            for date in dates:
+                interval = self._find(entries, date, asat)
+                if interval is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    found[date] = interval[0]
+
+        return found
+
+    def put(self, key: CacheKey, valuations: Iterable[Tuple[Timestamp, float]], asat: Timestamp) -> None:
+        """
+        Adds valuations which were requested at an asAt date
+
+        :param CacheKey key: The key
+        :param Iterable[Tuple[Timestamp, float]] valuations: The date and value of each valuation
+        :param Timestamp asat: The asAt date of the valuations
+        """
+        with self._lock:
+            entries = self._load(key)
+            added = []
+
+            for date, mv in valuations:
+                entries.setdefault(date, []).append([mv, asat, asat])
+                added.append([date, mv, asat, asat])
+
+            self._save(key, added)
+
+
+class LocalValuationCache(ValuationCache):
+    """
+    Caches the valuations of portfolios in the local file system, with a file for the valuations of each key. Each file
+    is a log which intervals are appended to as they are added or extended, the latest end of an interval wins. The log
+    is rewritten once it holds many more rows than intervals, to a temporary file which then replaces it.
+    """
+
+    columns = ['date', 'mv', 'valid_from', 'valid_to']
+
+    def __init__(self, path: str = None, compact_ratio: float = 2.0):
+        """
+        :param str path: The directory to hold the files, defaults to the ValuationCachePath configuration item
+        :param float compact_ratio: The number of rows in a file for each interval it holds at which it is rewritten
+        """
+        super().__init__()
+        self.path = path or PerformanceConfiguration.item('ValuationCachePath', 'valuations')
+        self.compact_ratio = compact_ratio
+        # The number of rows in the file of each key
+        self._rows = {}
+
+    def _file(self, key: CacheKey) -> str:
+        scope, portfolio, recipe = key
+        return os.path.join(self.path, scope, f"{portfolio}.{recipe.replace('/', '.')}.csv")
+
+    def _load(self, key: CacheKey) -> Dict[Timestamp, List[List]]:
+        if key in self._entries:
+            return self._entries[key]
+
+        entries = self._entries[key] = {}
+        self._rows[key] = 0
+
+        try:
+            with open(self._file(key), 'r', newline='') as fp:
+                rows = list(csv.reader(fp))
+        except FileNotFoundError:
+            return entries  # Nothing has been cached yet
+
+        for row in rows[1:]:
+            try:
+                date, mv, valid_from, valid_to = pd.Timestamp(row[0]), float(row[1]), pd.Timestamp(row[2]), \
+                                                 pd.Timestamp(row[3])
+            except (IndexError, ValueError):
+                # A row left partly written by a failure is ignored
+                logging.warning(f"Ignoring the invalid row {row} of the valuation cache {self._file(key)}")
+                continue
+
+            self._rows[key] += 1
+            interval = next((i for i in entries.get(date, []) if i[0] == mv and i[1] == valid_from), None)
+            if interval is None:
+                entries.setdefault(date, []).append([mv, valid_from, valid_to])
+            else:
+                interval[2] = max(interval[2], valid_to)
+
+        return entries
+
+    @staticmethod
+    def _format(interval: List) -> List[str]:
+        date, mv, valid_from, valid_to = interval
+        return [date.isoformat(), repr(float(mv)), valid_from.isoformat(), valid_to.isoformat()]
+
+    def _rewrite(self, key: CacheKey) -> None:
+        """
+        Writes the intervals of a key to a new file which then replaces the existing one, so that a failure can not
+        leave a partial file behind
+        """
+        filename = self._file(key)
+        intervals = [[date, *interval] for date, intervals in sorted(self._entries[key].items())
+                     for interval in intervals]
+
+        with open(f'{filename}.tmp', 'w', newline='') as fp:
+            writer = csv.writer(fp, lineterminator='\n')
+            writer.writerow(self.columns)
+            writer.writerows(self._format(i) for i in intervals)
+        os.replace(f'{filename}.tmp', filename)
+
+        self._rows[key] = len(intervals)
+
+    def _save(self, key: CacheKey, intervals: List[List]) -> None:
+        if len(intervals) == 0:
+            return
+
+        filename = self._file(key)
+
+        if not os.path.exists(filename):
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            self._rewrite(key)
+            return
+
+        # Start a new line if a failure left the last row without one
+        with open(filename, 'rb') as fp:
+            fp.seek(0, os.SEEK_END)
+            partial = fp.tell() > 0 and fp.seek(-1, os.SEEK_END) >= 0 and fp.read(1) != b'\n'
+
+        with open(filename, 'a', newline='') as fp:
+            if partial:
+                fp.write('\n')
+            csv.writer(fp, lineterminator='\n').writerows(self._format(i) for i in intervals)
+
+        self._rows[key] += len(intervals)
+
+        if self._rows[key] > self.compact_ratio * sum(len(i) for i in self._entries[key].values()):
+            self._rewrite(key)